@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_asgi_application()
+
+# background threads run in the serving processes only, not in every manage.py command
+from core.apps import start_background_threads  # noqa: E402
+
+start_background_threads()
@@ -23,5 +23,22 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("", views.DefaultView.as_view(), name="default"),
     path("pairs/", views.PairsView.as_view(), name="pairs"),
+    path("pairs/import/", views.PairImportView.as_view(), name="pairs-import"),
     path("price/<str:token_pair>/", views.PriceView.as_view(), name="price"),
+    path("prices/", views.PricesView.as_view(), name="prices"),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
+    path("stream/", views.StreamView.as_view(), name="stream"),
+    path("quote/<str:token_pair>/", views.QuoteView.as_view(), name="quote"),
+    path("route/<str:token_pair>/", views.RouteView.as_view(), name="route"),
+    path("history/<str:token_pair>/", views.HistoryView.as_view(), name="history"),
+    path(
+        "path/<str:from_token>/<str:to_token>/",
+        views.PathView.as_view(),
+        name="path",
+    ),
+    path(
+        "async/price/<str:token_pair>/",
+        views.AsyncPriceView.as_view(),
+        name="async-price",
+    ),
 ]
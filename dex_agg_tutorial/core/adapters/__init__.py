@@ -0,0 +1,23 @@
+from .base import (
+    ENTRY_POINT_GROUP,
+    ExchangeAdapter,
+    TokenInfo,
+    get_adapter,
+    get_adapters,
+    register_adapter,
+)
+
+# importing the built in adapters registers them
+from .hyperion import HyperionAdapter
+from .uniswap import UniswapV3Adapter
+
+__all__ = [
+    "ENTRY_POINT_GROUP",
+    "ExchangeAdapter",
+    "HyperionAdapter",
+    "TokenInfo",
+    "UniswapV3Adapter",
+    "get_adapter",
+    "get_adapters",
+    "register_adapter",
+]
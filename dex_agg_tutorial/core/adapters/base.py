@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from decimal import Decimal
+from importlib.metadata import entry_points
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from ..clients import AsyncNetworkClient, NetworkClient, get_client
+from ..swapmath import PoolLiquidity
+from ..twap import Twap
+from ..validation import Network
+
+if TYPE_CHECKING:  # models need the app registry, only import them for type hints
+    from ..models import Pair
+    from ..sync import PoolSync
+
+# Installed packages can ship extra exchanges by exposing an adapter class under this group:
+# [tool.poetry.plugins."dex_agg_tutorial.adapters"]
+# myexchange = "my_package.adapters:MyExchangeAdapter"
+ENTRY_POINT_GROUP = "dex_agg_tutorial.adapters"
+
+
+@dataclass(frozen=True)
+class TokenInfo:
+    """What a chain says about a token, `address` in the network's canonical form."""
+
+    address: str
+    symbol: str
+    decimals: int
+
+
+class ExchangeAdapter:
+    """
+    Base class for an exchange integration.
+
+    An adapter says on which network the exchange lives and in which fixed-point format its pools
+    store the sqrt price, and knows how to fetch prices for pairs. Only fetch_one is required,
+    fetch_many and fetch_one_async fall back to it. Override them (and flip supports_batch /
+    supports_async) when the exchange can do better, the cache, poller and batch endpoint pick
+    that up for every exchange.
+    """
+
+    exchange_id: str
+    network: Network
+    sqrt_price_bits: int  # 96 for Q64.96 (Uniswap), 64 for Q64.64 (Hyperion)
+    # fetch_many needs fewer upstream calls than fetch_one per pair
+    supports_batch = False
+    # fetch_one_async doesn't block the event loop
+    supports_async = False
+    # fetch_liquidity is implemented, the exchange can be used for /quote/
+    supports_quotes = False
+    # pool_sync is implemented, pools can be followed through chain events instead of polled
+    supports_sync = False
+    # fetch_twap is implemented, the exchange can give time weighted average prices
+    supports_twap = False
+    # fetch_pool_tokens and fetch_tokens are implemented, pairs are oriented and get their
+    # decimals from chain when they are created
+    supports_tokens = False
+
+    def fetch_one(self, pair: Pair, client: NetworkClient) -> Optional[Decimal]:
+        """Price of a single pair, None if the exchange could not give one."""
+        raise NotImplementedError
+
+    def fetch_many(
+        self, pairs: List[Pair], client: NetworkClient
+    ) -> Dict[str, Optional[Decimal]]:
+        """Prices for many pairs keyed by pair_id."""
+        return {pair.pair_id: self.fetch_one(pair, client) for pair in pairs}
+
+    async def fetch_one_async(
+        self, pair: Pair, client: AsyncNetworkClient
+    ) -> Optional[Decimal]:
+        """Async price of a single pair, by default the sync fetch on a worker thread."""
+        return await asyncio.to_thread(self.fetch_one, pair, get_client(self.network))
+
+    def fetch_liquidity(
+        self,
+        pair: Pair,
+        client: NetworkClient,
+        previous: Optional[PoolLiquidity] = None,
+    ) -> Optional[PoolLiquidity]:
+        """
+        Liquidity snapshot of the pair's pool for swap simulation. `previous` is the last
+        snapshot of the same pool, adapters can use it to only read what may have changed.
+        """
+        raise NotImplementedError
+
+    def pool_sync(self, pairs: List[Pair], client: NetworkClient) -> PoolSync:
+        """A sync.PoolSync following the pools of `pairs` through chain events."""
+        raise NotImplementedError
+
+    def fetch_twap(
+        self, pair: Pair, client: NetworkClient, window: int
+    ) -> Optional[Twap]:
+        """Time weighted average price over the last `window` seconds, None if not available."""
+        raise NotImplementedError
+
+    def fetch_pool_tokens(
+        self, pool_addresses: List[str], client: NetworkClient
+    ) -> Dict[str, Optional[Tuple[str, str]]]:
+        """
+        Addresses of the two tokens of many pools, in the order the pool prices them (token0,
+        token1). Keyed by pool address as given, None for pools that could not be read.
+        """
+        raise NotImplementedError
+
+    def fetch_tokens(
+        self, addresses: List[str], client: NetworkClient
+    ) -> Dict[str, Optional[TokenInfo]]:
+        """Symbol and decimals of many tokens keyed by address, None for unreadable tokens."""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.exchange_id} on {self.network.value}>"
+
+
+_adapters: Dict[str, ExchangeAdapter] = {}
+_entry_points_loaded = False
+
+
+def register_adapter(adapter):
+    """
+    Add an adapter (class or instance) to the registry under its exchange_id.
+    Returns its argument so it can be used as a class decorator.
+    """
+    instance = adapter() if isinstance(adapter, type) else adapter
+    _adapters[instance.exchange_id] = instance
+    return adapter
+
+
+def load_entry_point_adapters():
+    """Register the adapters that installed packages expose through entry points."""
+    global _entry_points_loaded
+    _entry_points_loaded = True
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            register_adapter(entry_point.load())
+        # a broken plugin shouldn't take the built in exchanges down
+        except Exception as e:
+            print(f"Error loading exchange adapter {entry_point.name}: {e}")
+
+
+def get_adapters() -> Dict[str, ExchangeAdapter]:
+    """All registered adapters keyed by exchange_id."""
+    if not _entry_points_loaded:
+        load_entry_point_adapters()
+    return dict(_adapters)
+
+
+def get_adapter(exchange_id: str) -> ExchangeAdapter:
+    """Adapter of an exchange, raises KeyError for exchanges nobody registered."""
+    if not _entry_points_loaded:
+        load_entry_point_adapters()
+    return _adapters[exchange_id]
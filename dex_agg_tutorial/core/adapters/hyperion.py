@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from ..clients import (
+    DEFAULT_POOL_SIZE,
+    AsyncNetworkClient,
+    NetworkClient,
+    request_json,
+)
+from ..fixedpoint import sqrt_price_to_decimal
+from ..swapmath import PoolLiquidity
+from ..sync import SYNC_MAX_PAGES, SYNC_PAGE_SIZE, PoolSync
+from ..twap import Twap
+from ..validation import Exchange
+from .base import ExchangeAdapter, TokenInfo, register_adapter
+
+if TYPE_CHECKING:
+    from ..models import Pair
+
+# the pool resource stores sqrt_price as Q64.64
+SQRT_PRICE_BITS = 64
+
+# Move resource holding the state of a Hyperion pool, stored under the pool's address
+POOL_RESOURCE_TYPE = "0x8b4a2c4bb53857c718a04c020b98f8c2e1f99a68b0f57389a8bf5434cd22e05c::pool_v3::LiquidityPoolV3"
+# Hyperion pools hold fungible assets, their symbol and decimals live on the metadata object
+TOKEN_METADATA_TYPE = "0x1::fungible_asset::Metadata"
+
+
+def hyperion_resource_url(rpc_url: str, pool_address: str) -> str:
+    """REST url of the LiquidityPoolV3 resource that holds the state of a Hyperion pool."""
+    return f"{rpc_url}/v1/accounts/{pool_address}/resource/{POOL_RESOURCE_TYPE}"
+
+
+def aptos_address(address: str) -> str:
+    """Long form of an Aptos address, the REST API leaves out leading zeros in some places."""
+    return "0x" + address.lower().removeprefix("0x").zfill(64)
+
+
+def object_address(value) -> str:
+    """Address of a Move Object<T> field, {"inner": "0x.."} in the REST API."""
+    return aptos_address(value["inner"] if isinstance(value, dict) else value)
+
+
+def read_each(addresses: List[str], read: Callable[[str], object]) -> Dict[str, object]:
+    """
+    Run read(address) for many addresses on the client's connection pool. The REST API has no
+    batch read, so this is as batched as it gets. Failed reads come back as None.
+    """
+
+    def safe_read(address: str):
+        try:
+            return read(address)
+        except Exception as e:
+            print(f"Error reading {address} on Aptos: {e}")
+            return None
+
+    if not addresses:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(addresses), DEFAULT_POOL_SIZE)) as pool:
+        return dict(zip(addresses, pool.map(safe_read, addresses)))
+
+
+def hyperion_price_from_sqrt(pair: Pair, sqrt_price: int) -> Decimal:
+    """Turn a Hyperion x64 sqrt_price into the decimal adjusted price of the pair."""
+    # Hyperion uses x64 fixed-point for sqrt_price, not Q64.96 like Uniswap
+    # Formula: (sqrt_price / 2^64)^2 * 10^(base_decimals - quote_decimals), in exact integers
+    # The pool prices token_b in token_a, inverted when the base token is token_b
+    return sqrt_price_to_decimal(
+        sqrt_price,
+        SQRT_PRICE_BITS,
+        pair.base_token_decimals,
+        pair.quote_token_decimals,
+        invert=pair.is_inverted("hyperion"),
+    )
+
+
+def query_hyperion_price(pair: Pair, client: NetworkClient) -> Optional[Decimal]:
+    """Query Hyperion pool resource to get sqrt_price directly."""
+    try:
+        # Get the Hyperion pool contract address
+        pool_address = pair.pool_contracts.get("hyperion")
+        if not pool_address:
+            print(f"No Hyperion pool contract found for pair {pair.pair_id}")
+            return None
+
+        # Query the LiquidityPoolV3 resource directly
+        resource_url = hyperion_resource_url(client.rpc_url, pool_address)
+
+        resource_data = request_json(resource_url, client)
+        # Extract sqrt_price from the resource data (x64 fixed-point)
+        sqrt_price = int(resource_data["data"]["sqrt_price"])
+
+        return hyperion_price_from_sqrt(pair, sqrt_price)
+
+    except Exception as e:  # fails gracefully, no price given
+        print(f"Error querying Hyperion: {e}")
+        return None
+
+
+def hyperion_tick(value) -> int:
+    """Move i32 values come as {"bits": "<u32>"} in two's complement, plain numbers in tests."""
+    if isinstance(value, dict):
+        bits = int(value["bits"])
+        return bits - (1 << 32) if bits >= 1 << 31 else bits
+    return int(value)
+
+
+def hyperion_liquidity_from_resource(data: dict) -> PoolLiquidity:
+    """
+    Liquidity snapshot of a pool from its LiquidityPoolV3 resource. The initialized ticks live in
+    a separate table that the resource doesn't include, so only the in-range liquidity is known.
+    """
+    return PoolLiquidity(
+        sqrt_price=int(data["sqrt_price"]),
+        tick=hyperion_tick(data["tick"]),
+        liquidity=int(data["liquidity"]),
+        fee=int(data.get("fee_rate", 0)),  # same unit as Uniswap, 3000 is 0.3%
+        tick_spacing=int(data.get("tick_spacing", 1)),
+        bits=SQRT_PRICE_BITS,
+    )
+
+
+async def query_hyperion_price_async(
+    pair: Pair, client: AsyncNetworkClient
+) -> Optional[Decimal]:
+    """Query the Hyperion pool resource without blocking the event loop."""
+    try:
+        pool_address = pair.pool_contracts.get("hyperion")
+        if not pool_address:
+            print(f"No Hyperion pool contract found for pair {pair.pair_id}")
+            return None
+
+        resource_data = await client.get_json(
+            hyperion_resource_url(client.rpc_url, pool_address)
+        )
+        return hyperion_price_from_sqrt(pair, int(resource_data["data"]["sqrt_price"]))
+
+    except Exception as e:
+        print(f"Error querying Hyperion: {e}")
+        return None
+
+
+class HyperionTransactionSync(PoolSync):
+    """
+    Follows Hyperion pools through the Aptos transaction stream. Every transaction lists the
+    resources it wrote, a write of a pool's LiquidityPoolV3 resource is that pool's new state.
+    The cursor is a ledger version, so the state is exact as of that transaction. Aptos
+    transactions are final once committed, there are no reorgs to undo.
+
+    The stream holds every transaction of the chain, not only those of our pools, and the
+    fullnode can't filter it. A pass only pages through it while the ledger is at most
+    SYNC_MAX_PAGES pages ahead, otherwise it polls: every pool is read as of the latest
+    version, one request each. On a busy mainnet that is most passes.
+    """
+
+    exchange_id = Exchange.HYPERION.id
+
+    def __init__(self, pairs: List[Pair], client: NetworkClient):
+        super().__init__(pairs, client)
+        self.addresses = {
+            aptos_address(pair.pool_contracts["hyperion"]): pair.pair_id
+            for pair in pairs
+            if pair.pool_contracts.get("hyperion")
+        }
+
+    def ledger_version(self) -> int:
+        return int(
+            request_json(f"{self.client.rpc_url}/v1", self.client)["ledger_version"]
+        )
+
+    def read_pools(self, version: int) -> Dict[str, PoolLiquidity]:
+        """Read every pool as of a ledger version, returns the pools that changed."""
+        rpc_url = self.client.rpc_url
+        changed = {}
+        for address, pair_id in self.addresses.items():
+            try:
+                resource_data = request_json(
+                    f"{hyperion_resource_url(rpc_url, address)}?ledger_version={version}",
+                    self.client,
+                )
+                pool = hyperion_liquidity_from_resource(resource_data["data"])
+            except Exception as e:
+                print(f"Error reading Hyperion pool {address}: {e}")
+                # not known as of the new cursor, leave it out until it can be read
+                self.pools.pop(pair_id, None)
+                continue
+            if self.pools.get(pair_id) != pool:
+                self.pools[pair_id] = changed[pair_id] = pool
+        self.cursor = version
+        return changed
+
+    def bootstrap(self) -> Dict[str, PoolLiquidity]:
+        self.pools = {}
+        return self.read_pools(self.ledger_version())
+
+    def sync(self) -> Dict[str, PoolLiquidity]:
+        version = self.ledger_version()
+        if version - self.cursor > SYNC_PAGE_SIZE * SYNC_MAX_PAGES:
+            return self.read_pools(version)
+
+        changed = {}
+        while self.cursor < version:
+            limit = min(SYNC_PAGE_SIZE, version - self.cursor)
+            transactions = request_json(
+                f"{self.client.rpc_url}/v1/transactions"
+                f"?start={self.cursor + 1}&limit={limit}",
+                self.client,
+            )
+            if not transactions:
+                break
+            for transaction in transactions:
+                for change in transaction.get("changes", []):
+                    if (
+                        change.get("type") != "write_resource"
+                        or change["data"]["type"] != POOL_RESOURCE_TYPE
+                    ):
+                        continue
+                    pair_id = self.addresses.get(aptos_address(change["address"]))
+                    if pair_id is not None:
+                        pool = hyperion_liquidity_from_resource(change["data"]["data"])
+                        self.pools[pair_id] = changed[pair_id] = pool
+                self.cursor = int(transaction["version"])
+        return changed
+
+
+@register_adapter
+class HyperionAdapter(ExchangeAdapter):
+    """Hyperion concentrated liquidity pools on Aptos, read through the fullnode REST API."""
+
+    exchange_id = Exchange.HYPERION.id
+    network = Exchange.HYPERION.network
+    sqrt_price_bits = SQRT_PRICE_BITS
+    supports_async = True
+    supports_quotes = True
+    supports_sync = True
+    supports_twap = True
+    supports_tokens = True
+
+    def fetch_one(self, pair: Pair, client: NetworkClient) -> Optional[Decimal]:
+        return query_hyperion_price(pair, client)
+
+    async def fetch_one_async(
+        self, pair: Pair, client: AsyncNetworkClient
+    ) -> Optional[Decimal]:
+        return await query_hyperion_price_async(pair, client)
+
+    def fetch_liquidity(
+        self,
+        pair: Pair,
+        client: NetworkClient,
+        previous: Optional[PoolLiquidity] = None,
+    ) -> Optional[PoolLiquidity]:
+        # a single REST call, nothing to gain from the previous snapshot
+        pool_address = pair.pool_contracts.get(self.exchange_id)
+        if not pool_address:
+            return None
+        resource_data = request_json(
+            hyperion_resource_url(client.rpc_url, pool_address), client
+        )
+        return hyperion_liquidity_from_resource(resource_data["data"])
+
+    def pool_sync(
+        self, pairs: List[Pair], client: NetworkClient
+    ) -> HyperionTransactionSync:
+        return HyperionTransactionSync(pairs, client)
+
+    def fetch_twap(
+        self, pair: Pair, client: NetworkClient, window: int
+    ) -> Optional[Twap]:
+        # Hyperion pools have no price oracle, average what the price history recorded instead.
+        # The history needs the models, only import it once Django is set up.
+        from ..history import history_twap
+
+        end = time.time()
+        price = history_twap(pair.pair_id, self.exchange_id, end - window, end)
+        if price is None:
+            print(f"Not enough Hyperion price history of {pair.pair_id} for {window}s")
+            return None
+        return Twap(price, window, end)
+
+    def fetch_pool_tokens(
+        self, pool_addresses: List[str], client: NetworkClient
+    ) -> Dict[str, Optional[Tuple[str, str]]]:
+        def read(pool_address: str) -> Tuple[str, str]:
+            data = request_json(
+                hyperion_resource_url(client.rpc_url, pool_address), client
+            )["data"]
+            # the sqrt price is token_b per token_a, token_a plays the part of token0
+            return object_address(data["token_a"]), object_address(data["token_b"])
+
+        return read_each(pool_addresses, read)
+
+    def fetch_tokens(
+        self, addresses: List[str], client: NetworkClient
+    ) -> Dict[str, Optional[TokenInfo]]:
+        def read(address: str) -> TokenInfo:
+            url = (
+                f"{client.rpc_url}/v1/accounts/{address}/resource/{TOKEN_METADATA_TYPE}"
+            )
+            data = request_json(url, client)["data"]
+            return TokenInfo(
+                aptos_address(address), data["symbol"], int(data["decimals"])
+            )
+
+        return read_each(addresses, read)
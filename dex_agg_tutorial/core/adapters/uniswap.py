@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from web3 import Web3
+
+from ..clients import AsyncNetworkClient, NetworkClient
+from ..contracts import get_pool_contract
+from ..fixedpoint import sqrt_price_to_decimal, sqrt_prices_to_decimals
+from ..multicall import (
+    QUOTE_TICK_WORDS,
+    read_erc20_metadata,
+    read_pool_tokens,
+    read_uniswap_liquidity,
+    read_uniswap_observations,
+    read_uniswap_pools,
+    tick_word,
+)
+from ..swapmath import PoolLiquidity, sqrt_ratio_at_tick
+from ..sync import SYNC_BLOCK_RANGE, SYNC_CONFIRMATIONS, PoolSync
+from ..twap import Twap, mean_tick
+from ..validation import Exchange
+from .base import ExchangeAdapter, TokenInfo, register_adapter
+
+if TYPE_CHECKING:
+    from ..models import Pair
+
+# slot0 stores the sqrt price as Q64.96
+SQRT_PRICE_BITS = 96
+
+# Pool events that change the state we price and quote from. Swap carries the new price, tick and
+# in-range liquidity, Mint and Burn add or remove liquidity between two ticks.
+SWAP_TOPIC = Web3.keccak(
+    text="Swap(address,address,int256,int256,uint160,uint128,int24)"
+)
+MINT_TOPIC = Web3.keccak(
+    text="Mint(address,address,int24,int24,uint128,uint256,uint256)"
+)
+BURN_TOPIC = Web3.keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)")
+SWAP_DATA_TYPES = ["int256", "int256", "uint160", "uint128", "int24"]
+MINT_DATA_TYPES = ["address", "uint128", "uint256", "uint256"]
+BURN_DATA_TYPES = ["uint128", "uint256", "uint256"]
+
+
+def uniswap_price_from_sqrt(pair: Pair, sqrt_price_x96: int) -> Decimal:
+    """Turn a Uniswap slot0 sqrtPriceX96 into the decimal adjusted price of the pair."""
+    # sqrt_price is Q64.96 fixed-point: price = (sqrtPriceX96 / 2^96)^2 * 10^(base_decimals - quote_decimals)
+    # This gives us the price of token0 in terms of token1, worked out with exact integers
+
+    # In Uniswap V3, token0 and token1 ordering is based on contract address comparison and the
+    # raw price from sqrt is token1 per token0. When the pair was created we read which of the two
+    # is the base token (core/tokens.py), pools holding it as token1 are inverted.
+    return sqrt_price_to_decimal(
+        sqrt_price_x96,
+        SQRT_PRICE_BITS,
+        pair.base_token_decimals,
+        pair.quote_token_decimals,
+        invert=pair.is_inverted("uniswap"),
+    )
+
+
+def query_uniswap_price(pair: Pair, client: NetworkClient) -> Optional[Decimal]:
+    """Query Uniswap for token pair price."""
+    try:
+        # Get the Uniswap pool contract address
+        pool_address = pair.pool_contracts.get("uniswap")
+        if not pool_address:
+            print(f"No Uniswap pool contract found for pair {pair.pair_id}")
+            return None
+
+        # Pool contract on the network client's Web3, ABI and contract are built once per pool
+        pool_contract = get_pool_contract(client.web3, pool_address)
+
+        # Get current price from slot0
+        slot0 = pool_contract.functions.slot0().call()
+        sqrt_price_x96 = int(slot0[0])  # Cast bigint to int
+
+        return uniswap_price_from_sqrt(pair, sqrt_price_x96)
+
+    except Exception as e:
+        print(f"Error querying Uniswap: {e}")
+        return None
+
+
+def query_uniswap_prices(
+    pairs: List[Pair], client: NetworkClient
+) -> Dict[str, Optional[Decimal]]:
+    """
+    Query Uniswap prices for many pairs at once, all slot0 reads go out in one Multicall3 call.
+    Returns the price per pair_id, None for pairs whose pool could not be read.
+    """
+    prices: Dict[str, Optional[Decimal]] = {pair.pair_id: None for pair in pairs}
+    pools = {
+        pair.pair_id: Web3.to_checksum_address(pair.pool_contracts["uniswap"])
+        for pair in pairs
+        if pair.pool_contracts.get("uniswap")
+    }
+    try:
+        states = read_uniswap_pools(client.web3, pools.values())
+    except Exception as e:
+        print(f"Error querying Uniswap multicall: {e}")
+        return prices
+
+    # convert the whole batch in one go, pools that could not be read are skipped
+    read = [pair for pair in pairs if states.get(pools.get(pair.pair_id)) is not None]
+    converted = sqrt_prices_to_decimals(
+        [states[pools[pair.pair_id]].sqrt_price_x96 for pair in read],
+        SQRT_PRICE_BITS,
+        [pair.base_token_decimals for pair in read],
+        [pair.quote_token_decimals for pair in read],
+        [pair.is_inverted("uniswap") for pair in read],
+    )
+    prices.update(zip((pair.pair_id for pair in read), converted))
+    return prices
+
+
+async def query_uniswap_price_async(
+    pair: Pair, client: AsyncNetworkClient
+) -> Optional[Decimal]:
+    """Query Uniswap for token pair price without blocking the event loop."""
+    try:
+        pool_address = pair.pool_contracts.get("uniswap")
+        if not pool_address:
+            print(f"No Uniswap pool contract found for pair {pair.pair_id}")
+            return None
+
+        web3 = await client.get_web3()
+        pool_contract = get_pool_contract(web3, pool_address)
+        try:
+            slot0 = await pool_contract.functions.slot0().call()
+        except Exception:
+            # the next request goes to the next endpoint
+            client.rotate(web3.provider.endpoint_uri)
+            raise
+        return uniswap_price_from_sqrt(pair, int(slot0[0]))
+
+    except Exception as e:
+        print(f"Error querying Uniswap: {e}")
+        return None
+
+
+def query_uniswap_twap(
+    pair: Pair, client: NetworkClient, window: int
+) -> Optional[Twap]:
+    """TWAP of a pair over `window` seconds from the pool's own oracle."""
+    try:
+        pool_address = pair.pool_contracts.get("uniswap")
+        if not pool_address:
+            print(f"No Uniswap pool contract found for pair {pair.pair_id}")
+            return None
+
+        observations = read_uniswap_observations(client.web3, pool_address, [window, 0])
+        if observations is None:
+            print(f"Uniswap pool of {pair.pair_id} has no observations {window}s back")
+            return None
+
+        # the price at the mean tick, computed like the pool computes prices at ticks
+        tick = mean_tick(observations.tick_cumulatives, window)
+        return Twap(
+            uniswap_price_from_sqrt(pair, sqrt_ratio_at_tick(tick)),
+            window,
+            observations.timestamp,
+            observations.block,
+            tick,
+        )
+
+    except Exception as e:
+        print(f"Error querying Uniswap TWAP: {e}")
+        return None
+
+
+def apply_uniswap_log(pool: PoolLiquidity, log, codec) -> PoolLiquidity:
+    """New state of a pool after one of its Swap, Mint or Burn logs (as returned by eth_getLogs)."""
+    topic = bytes(log["topics"][0])
+    data = bytes(log["data"])
+    if topic == SWAP_TOPIC:
+        _, _, sqrt_price, liquidity, tick = codec.decode(SWAP_DATA_TYPES, data)
+        return replace(pool, sqrt_price=sqrt_price, liquidity=liquidity, tick=tick)
+
+    if topic == MINT_TOPIC:
+        amount = codec.decode(MINT_DATA_TYPES, data)[1]
+    elif topic == BURN_TOPIC:
+        amount = -codec.decode(BURN_DATA_TYPES, data)[0]
+    else:
+        return pool
+    if amount == 0:
+        return pool  # burning 0 just collects fees
+    lower = codec.decode(["int24"], bytes(log["topics"][2]))[0]
+    upper = codec.decode(["int24"], bytes(log["topics"][3]))[0]
+
+    # the position's liquidity counts when the price is inside it, and is added at the lower tick
+    # and taken away at the upper tick when the price crosses them
+    ticks, words = dict(pool.ticks), dict(pool.words)
+    for tick, delta in ((lower, amount), (upper, -amount)):
+        if pool.tick_range is None or not (
+            pool.tick_range[0] <= tick <= pool.tick_range[1]
+        ):
+            continue  # outside the ticks we hold, read when the price gets there
+        ticks[tick] = ticks.get(tick, 0) + delta
+        word = tick_word(tick, pool.tick_spacing)
+        if word in words:
+            words[word] |= 1 << (tick // pool.tick_spacing & 0xFF)
+    liquidity = pool.liquidity
+    if lower <= pool.tick < upper:
+        liquidity += amount
+    return replace(pool, liquidity=liquidity, ticks=ticks, words=words)
+
+
+class UniswapLogSync(PoolSync):
+    """
+    Follows Uniswap pools through their Swap, Mint and Burn logs. One eth_getLogs per
+    SYNC_BLOCK_RANGE blocks covers every pool, only pools whose price moved into tick words we
+    don't hold yet are read again.
+    """
+
+    exchange_id = Exchange.UNISWAP.id
+
+    def __init__(self, pairs: List[Pair], client: NetworkClient):
+        super().__init__(pairs, client)
+        self.addresses = {
+            Web3.to_checksum_address(pair.pool_contracts["uniswap"]): pair.pair_id
+            for pair in pairs
+            if pair.pool_contracts.get("uniswap")
+        }
+
+    def head(self) -> int:
+        return self.client.web3.eth.block_number - SYNC_CONFIRMATIONS
+
+    def read_pool(self, address: str, block: int) -> bool:
+        pair_id = self.addresses[address]
+        try:
+            self.pools[pair_id] = read_uniswap_liquidity(
+                self.client.web3,
+                address,
+                self.pools.get(pair_id),
+                block_identifier=block,
+            )
+            return True
+        except Exception as e:
+            print(f"Error reading Uniswap pool {address}: {e}")
+            return False
+
+    def bootstrap(self) -> Dict[str, PoolLiquidity]:
+        block = self.head()
+        self.pools = {}
+        for address in self.addresses:
+            self.read_pool(address, block)
+        self.cursor = block
+        return dict(self.pools)
+
+    def sync(self) -> Dict[str, PoolLiquidity]:
+        web3 = self.client.web3
+        head = self.head()
+        if head <= self.cursor:
+            return {}
+
+        # fetch everything before applying anything, a failed request leaves the state as it was
+        logs = []
+        for start in range(self.cursor + 1, head + 1, SYNC_BLOCK_RANGE):
+            logs += web3.eth.get_logs(
+                {
+                    "fromBlock": start,
+                    "toBlock": min(start + SYNC_BLOCK_RANGE - 1, head),
+                    "address": list(self.addresses),
+                    "topics": [
+                        [Web3.to_hex(t) for t in (SWAP_TOPIC, MINT_TOPIC, BURN_TOPIC)]
+                    ],
+                }
+            )
+
+        changed = set()
+        for log in sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"])):
+            pair_id = self.addresses.get(Web3.to_checksum_address(log["address"]))
+            if pair_id in self.pools:
+                self.pools[pair_id] = apply_uniswap_log(
+                    self.pools[pair_id], log, web3.codec
+                )
+                changed.add(pair_id)
+
+        # read the tick words around the price again once it gets within a word of the edge of
+        # what we hold (and pools that could not be read before)
+        margin = max(QUOTE_TICK_WORDS - 1, 0)
+        for address, pair_id in self.addresses.items():
+            pool = self.pools.get(pair_id)
+            if pool is not None:
+                word = tick_word(pool.tick, pool.tick_spacing)
+                if all(
+                    w in pool.words for w in range(word - margin, word + margin + 1)
+                ):
+                    continue
+            if self.read_pool(address, head):
+                changed.add(pair_id)
+
+        self.cursor = head
+        return {pair_id: self.pools[pair_id] for pair_id in changed}
+
+
+@register_adapter
+class UniswapV3Adapter(ExchangeAdapter):
+    """Uniswap V3 pools on Ethereum, batches of pools are read with Multicall3."""
+
+    exchange_id = Exchange.UNISWAP.id
+    network = Exchange.UNISWAP.network
+    sqrt_price_bits = SQRT_PRICE_BITS
+    supports_batch = True
+    supports_async = True
+    supports_quotes = True
+    supports_sync = True
+    supports_twap = True
+    supports_tokens = True
+
+    def fetch_one(self, pair: Pair, client: NetworkClient) -> Optional[Decimal]:
+        return query_uniswap_price(pair, client)
+
+    def fetch_many(
+        self, pairs: List[Pair], client: NetworkClient
+    ) -> Dict[str, Optional[Decimal]]:
+        return query_uniswap_prices(pairs, client)
+
+    async def fetch_one_async(
+        self, pair: Pair, client: AsyncNetworkClient
+    ) -> Optional[Decimal]:
+        return await query_uniswap_price_async(pair, client)
+
+    def fetch_liquidity(
+        self,
+        pair: Pair,
+        client: NetworkClient,
+        previous: Optional[PoolLiquidity] = None,
+    ) -> Optional[PoolLiquidity]:
+        pool_address = pair.pool_contracts.get(self.exchange_id)
+        if not pool_address:
+            return None
+        return read_uniswap_liquidity(client.web3, pool_address, previous)
+
+    def pool_sync(self, pairs: List[Pair], client: NetworkClient) -> UniswapLogSync:
+        return UniswapLogSync(pairs, client)
+
+    def fetch_twap(
+        self, pair: Pair, client: NetworkClient, window: int
+    ) -> Optional[Twap]:
+        return query_uniswap_twap(pair, client, window)
+
+    def fetch_pool_tokens(
+        self, pool_addresses: List[str], client: NetworkClient
+    ) -> Dict[str, Optional[Tuple[str, str]]]:
+        # malformed addresses can't be read, they shouldn't fail the batch for the others
+        valid = [address for address in pool_addresses if Web3.is_address(address)]
+        tokens = read_pool_tokens(client.web3, valid) if valid else {}
+        return {
+            address: (
+                tokens.get(Web3.to_checksum_address(address))
+                if address in valid
+                else None
+            )
+            for address in pool_addresses
+        }
+
+    def fetch_tokens(
+        self, addresses: List[str], client: NetworkClient
+    ) -> Dict[str, Optional[TokenInfo]]:
+        metadata = read_erc20_metadata(client.web3, addresses)
+        tokens = {}
+        for address in addresses:
+            checksum = Web3.to_checksum_address(address)
+            found = metadata.get(checksum)
+            tokens[address] = TokenInfo(checksum, *found) if found else None
+        return tokens
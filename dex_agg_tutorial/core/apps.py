@@ -0,0 +1,27 @@
+import os
+
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "core"
+
+
+def start_background_threads():
+    """
+    Start the price history recorder and the poller when opted in. Only the server entry points
+    (config/wsgi.py, config/asgi.py) call this, so migrations, imports, tests and other
+    manage.py commands never poll. runserver serves through config/wsgi.py, in the reloader's
+    child process only.
+    """
+    # importing the poller also loads the .env file through core.queries, so first
+    from .poller import price_poller
+    from .history import PRICE_HISTORY, history_recorder
+
+    # Opt in with PRICE_HISTORY=1, every price put in the book is recorded
+    if PRICE_HISTORY:
+        history_recorder.start()
+    # Opt in with PRICE_POLLER=1
+    if os.getenv("PRICE_POLLER", "").lower() in ("1", "true"):
+        price_poller.start()
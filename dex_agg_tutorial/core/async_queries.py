@@ -0,0 +1,129 @@
+"""
+Async versions of the price queries for the ASGI server.
+
+While a sync view waits for the chain it holds on to a worker thread, an async view hands control
+back to the event loop so a single process can wait on thousands of upstream calls at once.
+Serve config.asgi:application with an ASGI server (e.g. uvicorn) to get the benefit.
+"""
+
+import asyncio
+import time
+import weakref
+from dataclasses import replace
+from decimal import Decimal
+from typing import Dict, Optional, Union
+
+from .adapters import get_adapter
+from .cache import CachedPrice, get_price_ttl, price_cache
+from .clients import get_async_client
+from .metrics import CACHE_REQUESTS, observe_exchange, timed_stage
+from .models import Pair
+from .queries import build_price_response, get_query_deadline
+from .registry import pair_registry
+
+# Upstream fetches in flight per event loop: {loop: {(pair_id, exchange_id): task}},
+# concurrent misses for a key await the same task
+_inflight: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def query_exchange_async(pair: Pair, exchange_id: str) -> Optional[Decimal]:
+    adapter = get_adapter(exchange_id)
+    started = time.perf_counter()
+    price = None
+    try:
+        price = await adapter.fetch_one_async(pair, get_async_client(adapter.network))
+        return price
+    finally:
+        observe_exchange(
+            exchange_id,
+            adapter.network.value,
+            time.perf_counter() - started,
+            failed=price is None,
+        )
+
+
+async def _fetch_and_store(pair: Pair, exchange_id: str) -> Optional[CachedPrice]:
+    key = (pair.pair_id, exchange_id)
+    if price_cache.shared is None:
+        price = await query_exchange_async(pair, exchange_id)
+        return price_cache.put(key, price) if price is not None else None
+
+    # the shared book is file or socket I/O, kept off the event loop
+    ttl = price_cache.read_ttl(get_price_ttl(exchange_id))
+    entry = (await asyncio.to_thread(price_cache.claim, {key: ttl})).get(key)
+    if entry is not None:
+        return entry
+    try:
+        price = await query_exchange_async(pair, exchange_id)
+        if price is None:
+            return None
+        return await asyncio.to_thread(price_cache.put, key, price)
+    finally:
+        await asyncio.to_thread(price_cache.release, [key])
+
+
+async def cached_query_exchange_async(
+    pair: Pair, exchange_id: str
+) -> Optional[CachedPrice]:
+    """Async counterpart of queries.cached_query_exchange, shares the same price cache."""
+    key = (pair.pair_id, exchange_id)
+    entry = price_cache.get(key, price_cache.read_ttl(get_price_ttl(exchange_id)))
+    if entry is not None:
+        CACHE_REQUESTS.inc(exchange=exchange_id, result="hit")
+        return replace(entry, hit=True)
+    CACHE_REQUESTS.inc(exchange=exchange_id, result="miss")
+
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(key)
+    leader = task is None
+    if leader:
+        task = inflight[key] = asyncio.ensure_future(
+            _fetch_and_store(pair, exchange_id)
+        )
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+
+    # shielded so a caller that hits its deadline doesn't cancel the fetch for the others
+    entry = await asyncio.shield(task)
+    if entry is None or leader:
+        return entry
+    return replace(entry, hit=True)
+
+
+async def fetch_exchange_prices_async(pair: Pair) -> Dict[str, CachedPrice]:
+    """Query all exchanges of a pair at once, each one bound by its own deadline."""
+
+    async def with_deadline(exchange_id):
+        try:
+            return await asyncio.wait_for(
+                cached_query_exchange_async(pair, exchange_id),
+                get_query_deadline(exchange_id),
+            )
+        except asyncio.TimeoutError:
+            print(f"Dropping {exchange_id} for {pair.pair_id}: no answer in time")
+            return None
+
+    with timed_stage("upstream"):
+        results = await asyncio.gather(
+            *(with_deadline(exchange_id) for exchange_id in pair.active_exchanges)
+        )
+    return {
+        exchange_id: quote
+        for exchange_id, quote in zip(pair.active_exchanges, results)
+        if quote is not None
+    }
+
+
+async def get_token_price_async(
+    token_pair: Union[str, Pair], precision: Optional[int] = None
+) -> Dict:
+    """Async version of queries.get_token_price, returns the same response body."""
+    if isinstance(token_pair, Pair):
+        pair = token_pair
+    else:
+        pair = await pair_registry.aget(token_pair)
+        if pair is None:
+            return {"error": f"Pair {token_pair} not found"}
+
+    return build_price_response(
+        pair, await fetch_exchange_prices_async(pair), precision
+    )
@@ -0,0 +1,191 @@
+"""
+Measuring tools for `manage.py benchmark`.
+
+Microbenchmarks time a function call by call, the load generator keeps `concurrency` keep-alive
+connections busy against a running server. Both report latency percentiles in milliseconds.
+Results are appended to a JSON lines file, one run per line, so runs can be compared over time.
+"""
+
+import http.client
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+
+BENCHMARK_OUTPUT = os.getenv("BENCHMARK_OUTPUT", "benchmarks.jsonl")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest rank percentile (q between 0 and 100) of sorted samples."""
+    if not samples:
+        return 0.0
+    rank = max(1, -(-len(samples) * q // 100))
+    return samples[int(rank) - 1]
+
+
+def summarize(samples_ms: List[float], elapsed: Optional[float] = None) -> Dict:
+    """Latency summary of samples in milliseconds, with throughput when the wall time is given."""
+    samples = sorted(samples_ms)
+    summary = {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples), 4) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50), 4),
+        "p90_ms": round(percentile(samples, 90), 4),
+        "p99_ms": round(percentile(samples, 99), 4),
+        "max_ms": round(samples[-1], 4) if samples else 0.0,
+    }
+    if elapsed:
+        summary["throughput"] = round(len(samples) / elapsed, 2)
+    return summary
+
+
+def time_calls(function: Callable, repeat: int, warmup: int = 1) -> Dict:
+    """Time `repeat` calls of `function` after `warmup` untimed ones."""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def load_test(base_url: str, paths: List[str], requests: int, concurrency: int) -> Dict:
+    """
+    Send `requests` GET requests spread over `paths` (in turn) from `concurrency` threads with
+    a keep-alive connection each. Connection errors count as errors, like 5xx responses.
+    """
+    url = urlsplit(base_url)
+    samples: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        for index in counter:
+            path = paths[index % len(paths)]
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                status = str(response.status)
+                if response.will_close:
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                status = "error"
+                connection.close()
+            latency = (time.perf_counter() - started) * 1000
+            with lock:
+                samples.append(latency)
+                statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(samples, elapsed)
+    summary["errors"] = sum(
+        count for status, count in statuses.items() if not status.startswith(("2", "3"))
+    )
+    summary["status"] = statuses
+    return summary
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    # headers and body are written separately, don't let them wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def environ(values: Dict[str, str]) -> Iterator[None]:
+    """Set environment variables for the duration of the block, the old values come back after."""
+    old = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@contextmanager
+def live_server() -> Iterator[str]:
+    """
+    Serve the project's WSGI application from a thread on a free local port, yields its url.
+    In-memory SQLite databases (the test database) are shared with the server threads, the same
+    way LiveServerTestCase does it. The application is built here rather than loaded from
+    config/wsgi.py, which would start the poller next to the benchmark.
+    """
+    overrides = {
+        conn.alias: conn
+        for conn in connections.all()
+        if conn.vendor == "sqlite" and conn.is_in_memory_db()
+    }
+    for conn in overrides.values():
+        conn.inc_thread_sharing()
+    server = ThreadedWSGIServer(
+        ("127.0.0.1", 0),
+        QuietWSGIRequestHandler,
+        allow_reuse_address=False,
+        connections_override=overrides,
+    )
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        for conn in overrides.values():
+            conn.dec_thread_sharing()
+
+
+def git_revision() -> Optional[str]:
+    """Commit the code was benchmarked at, None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: str, results: Dict) -> Dict:
+    """Append a run to the results file with when, where and at which commit it ran."""
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **results,
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
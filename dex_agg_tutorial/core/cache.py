@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .adapters import get_adapter
+from .fixedpoint import Price
+from .shared import SharedBook, claim, key_name, shared_book_from_env
+from .validation import Network
+
+# A price can't change faster than the chain produces blocks, so by default we keep a price
+# for about one block time. Override per exchange with e.g. UNISWAP_PRICE_TTL=6 in the .env file.
+NETWORK_PRICE_TTL = {
+    Network.ETHEREUM: 12.0,  # ~12s slots on Ethereum mainnet
+    Network.APTOS: 0.5,  # Aptos produces blocks well below a second
+}
+
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "1024"))
+
+# While the background poller keeps the cache warm we serve prices up to this age (seconds)
+# before falling back to asking the chain ourselves, e.g. when the poller is stuck on a bad RPC.
+PRICE_BOOK_MAX_AGE = float(os.getenv("PRICE_BOOK_MAX_AGE", "60"))
+
+CacheKey = Tuple[str, str]  # (pair_id, exchange_id)
+
+
+@dataclass(frozen=True)
+class CachedPrice:
+    """A price as fetched from an exchange, with the (unix) time it was fetched at."""
+
+    price: Price
+    fetched_at: float
+    hit: bool = False  # True when this request did not have to go to the chain itself
+    # block (or Aptos ledger version) of the price when known
+    block: Optional[int] = None
+    shared: bool = False  # fetched by another worker, read from the shared price book
+
+    @property
+    def age(self) -> float:
+        """Seconds since the price was read from the chain."""
+        return max(time.time() - self.fetched_at, 0.0)
+
+
+def get_price_ttl(exchange_id: str) -> float:
+    """Seconds a price of this exchange stays fresh, roughly the block time of its network."""
+    network = get_adapter(exchange_id).network
+    return float(
+        os.getenv(f"{exchange_id.upper()}_PRICE_TTL", NETWORK_PRICE_TTL[network])
+    )
+
+
+class PriceCache:
+    """
+    In memory LRU cache of exchange prices keyed by (pair_id, exchange_id).
+
+    Concurrent misses for the same key are coalesced: the first caller fetches from the chain
+    and everyone else arriving in the meantime waits for that same result, so there is never
+    more than one upstream call per key in flight.
+
+    With a `shared` book (see core/shared.py) the same goes for all workers: fetched prices are
+    written through to it and misses are claimed there first, so a price another worker is
+    fetching or just fetched is not fetched again.
+    """
+
+    def __init__(
+        self, max_entries: int = PRICE_CACHE_SIZE, shared: Optional[SharedBook] = None
+    ):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[CacheKey, CachedPrice]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # misses answered by another worker through the shared book
+        self.shared_hits = 0
+        # set by the price poller while it keeps every entry refreshed
+        self.warm = False
+        self._subscribers: List[Callable[[CacheKey, CachedPrice], None]] = []
+
+    def get(self, key: CacheKey, ttl: Optional[float] = None) -> Optional[CachedPrice]:
+        """Return the entry for a key if there is one (and it is younger than ttl when given)."""
+        with self._lock:
+            return self._get(key, ttl)
+
+    def _get(self, key: CacheKey, ttl: Optional[float]) -> Optional[CachedPrice]:
+        entry = self._entries.get(key)
+        if entry is None or (ttl is not None and entry.age > ttl):
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(
+        self,
+        key: CacheKey,
+        price: Price,
+        fetched_at: Optional[float] = None,
+        block: Optional[int] = None,
+    ) -> CachedPrice:
+        """Store a freshly fetched price, evicting the least recently used entry when full."""
+        entry = CachedPrice(
+            price, fetched_at if fetched_at is not None else time.time(), block=block
+        )
+        if self.shared is not None:
+            self.shared.write(key, price, entry.fetched_at, block)
+        self._store(key, entry)
+        return entry
+
+    def _store(self, key: CacheKey, entry: CachedPrice):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        for subscriber in self._subscribers:
+            subscriber(key, entry)
+
+    def subscribe(self, subscriber: Callable[[CacheKey, CachedPrice], None]):
+        """
+        Call `subscriber(key, entry)` for every price put in the cache. It runs on the thread
+        that fetched the price, so it has to be quick (e.g. append to a buffer).
+        """
+        if subscriber not in self._subscribers:
+            self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Callable[[CacheKey, CachedPrice], None]):
+        if subscriber in self._subscribers:
+            self._subscribers.remove(subscriber)
+
+    def touch(self, keys, fetched_at: Optional[float] = None):
+        """
+        Mark entries as still current without changing them, e.g. when no chain event touched
+        their pool. Keys that aren't cached are skipped.
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        touched = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries[key] = replace(entry, fetched_at=fetched_at)
+                    touched.append((key, entry))
+        if self.shared is not None:
+            for key, entry in touched:
+                self.shared.write(key, entry.price, fetched_at, entry.block)
+
+    def get_or_fetch(
+        self,
+        key: CacheKey,
+        ttl: float,
+        fetch: Callable[[], Optional[Price]],
+        as_of: Optional[Callable[[Price], float]] = None,
+    ) -> Optional[CachedPrice]:
+        """
+        Return a fresh cached price or call `fetch` to get one.
+        A fetch returning None (exchange failed) is not cached. `as_of` gives the time a fetched
+        value is as of (e.g. its block timestamp), the entry ages from there instead of from now.
+        """
+        with self._lock:
+            entry = self._get(key, ttl)
+            if entry is not None:
+                self.hits += 1
+                return replace(entry, hit=True)
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            entry = future.result()
+            return replace(entry, hit=True) if entry is not None else None
+
+        claimed = False
+        try:
+            if self.shared is not None:
+                entry = self.claim({key: ttl}).get(key)
+                if entry is not None:
+                    future.set_result(entry)
+                    return replace(entry, hit=True)
+                claimed = True
+            price = fetch()
+            entry = None
+            if price is not None:
+                entry = self.put(key, price, as_of(price) if as_of else None)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            if claimed:
+                self.release([key])
+
+    def claim(
+        self, ttls: Dict[CacheKey, float], wait: Optional[float] = None
+    ) -> Dict[CacheKey, CachedPrice]:
+        """
+        Prices of the keys (mapped to their ttl) that other workers fetched, taken from the
+        shared book into this cache, waiting at most `wait` seconds on the workers fetching
+        them. The keys left out are for this worker to fetch, release them afterwards. Only
+        for caches with a shared book.
+        """
+        entries = {}
+        for key, (price, fetched_at, block) in claim(
+            self.shared, ttls, wait=wait
+        ).items():
+            entries[key] = CachedPrice(price, fetched_at, block=block, shared=True)
+            self._store(key, entries[key])
+        with self._lock:
+            self.shared_hits += len(entries)
+        return entries
+
+    def release(self, keys):
+        """Give up the shared book leases of keys claimed and fetched by this worker."""
+        for key in keys:
+            self.shared.release(key_name(key))
+
+    def mirror(self, keys) -> int:
+        """
+        Copy prices another worker keeps in the shared book into this cache, when newer than
+        the cached ones. Returns how many were copied.
+        """
+        copied = 0
+        for key, (price, fetched_at, block) in self.shared.read_many(keys).items():
+            with self._lock:
+                current = self._entries.get(key)
+            if current is not None and current.fetched_at >= fetched_at:
+                continue
+            self._store(key, CachedPrice(price, fetched_at, block=block, shared=True))
+            copied += 1
+        return copied
+
+    def read_ttl(self, ttl: float) -> float:
+        """Age up to which a read is served from the cache, stretched while the poller runs."""
+        return max(ttl, PRICE_BOOK_MAX_AGE) if self.warm else ttl
+
+    def snapshot(self) -> Dict[CacheKey, CachedPrice]:
+        """Copy of all entries, their `age` tells how stale every price is."""
+        with self._lock:
+            return dict(self._entries)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "shared_hits": self.shared_hits,
+        }
+
+    def clear(self):
+        """Forget the prices of this worker, the shared book is left alone."""
+        with self._lock:
+            self._entries.clear()
+
+    def clear_shared(self):
+        """Forget every price in the shared book too, for all workers using it."""
+        self.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+
+# Shared by every request in this process, and with the other workers when PRICE_BOOK_BACKEND is set
+price_cache = PriceCache(shared=shared_book_from_env())
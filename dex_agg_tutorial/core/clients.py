@@ -0,0 +1,339 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import AsyncWeb3, Web3
+
+from . import failover
+from .failover import FailoverSession, FailoverSettings, split_urls
+from .metrics import RPC_ERRORS, RPC_RETRIES, RPC_SECONDS
+from .validation import BadRequestException, Network
+
+# Connection pool defaults, each can be overridden per network with e.g. MAINNET_RPC_POOL_SIZE
+DEFAULT_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "20"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("RPC_CONNECT_TIMEOUT", "3"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("RPC_READ_TIMEOUT", "10"))
+
+
+def network_setting(network: Network, name: str, default):
+    """Read a per-network setting from the environment (MAINNET_RPC_POOL_SIZE etc.)"""
+    return type(default)(os.getenv(f"{network.value.upper()}_{name}", default))
+
+
+class TrackedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps count of the requests it is sending.
+
+    requests keeps at most `pool_maxsize` idle keep-alive connections per host. When more requests
+    than that are in flight at the same time the extra connections are opened (with a full TCP+TLS
+    handshake) and thrown away again afterwards. We count those moments as saturation so you can
+    see when the pool size should go up. Every request is also timed into the RPC metrics.
+    """
+
+    def __init__(self, pool_maxsize: int, network: str = "unknown", **kwargs):
+        self._lock = threading.Lock()
+        self.network = network
+        self.pool_size = pool_maxsize
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        super().__init__(pool_maxsize=pool_maxsize, **kwargs)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if self.in_flight > self.pool_size:
+                self.saturated += 1
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = super().send(request, **kwargs)
+            failed = response.status_code == 429 or response.status_code >= 500
+            return response
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            # host and port only, providers put API keys in the path
+            url = urlsplit(request.url)
+            endpoint = f"{url.hostname}:{url.port}" if url.port else str(url.hostname)
+            RPC_SECONDS.observe(
+                time.perf_counter() - started, network=self.network, endpoint=endpoint
+            )
+            if failed:
+                RPC_ERRORS.inc(network=self.network, endpoint=endpoint)
+
+
+class NetworkClient:
+    """
+    Long-lived HTTP session (and Web3 instance for EVM chains) for a single network.
+
+    Creating these per request means a new TCP+TLS handshake with the RPC provider every time,
+    re-using them lets the connections stay open between price requests.
+
+    `rpc_url` can list several endpoints (comma separated), requests are written against the
+    first one (`rpc_url` afterwards) and failed over between all of them, see core/failover.py.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        rpc_url: Union[str, List[str], None],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: tuple = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+        failover: FailoverSettings = FailoverSettings(),
+    ):
+        urls = split_urls(rpc_url)
+        self.network = network
+        self.rpc_url = urls[0] if urls else None
+        self.timeout = timeout
+        self.adapter = TrackedHTTPAdapter(pool_maxsize=pool_size, network=network.value)
+        self.session = FailoverSession(urls, network.value, failover)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._web3: Optional[Web3] = None
+        self._lock = threading.Lock()
+
+    @property
+    def web3(self) -> Web3:
+        """Web3 instance that sends its JSON-RPC calls over the pooled session."""
+        if self._web3 is None:
+            with self._lock:
+                if self._web3 is None:
+                    # retries happen in the failover session, not once more in web3
+                    provider = Web3.HTTPProvider(
+                        self.rpc_url,
+                        request_kwargs={"timeout": self.timeout},
+                        session=self.session,
+                        exception_retry_configuration=None,
+                    )
+                    self._web3 = Web3(provider)
+        return self._web3
+
+    def get(self, url: str) -> requests.Response:
+        """GET over the pooled session with the network timeouts applied."""
+        return self.session.get(url, timeout=self.timeout)
+
+    def stats(self) -> Dict:
+        """Connection pool usage, saturated counts requests sent while the pool was full."""
+        return {
+            "pool_size": self.adapter.pool_size,
+            "requests": self.adapter.requests,
+            "in_flight": self.adapter.in_flight,
+            "peak_in_flight": self.adapter.peak_in_flight,
+            "saturated": self.adapter.saturated,
+            "endpoints": self.session.stats(),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+# Process wide registry, one client per network
+_clients: Dict[Network, NetworkClient] = {}
+_clients_lock = threading.Lock()
+
+
+def client_settings(network: Network) -> Dict:
+    """RPC urls, pool size, timeouts and failover of a network as configured in the environment."""
+    return {
+        "rpc_url": os.getenv(f"{network.value.upper()}_RPC_URL"),
+        "pool_size": network_setting(network, "RPC_POOL_SIZE", DEFAULT_POOL_SIZE),
+        "timeout": (
+            network_setting(network, "RPC_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+            network_setting(network, "RPC_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+        ),
+        "failover": FailoverSettings(
+            deadline=network_setting(
+                network, "RPC_DEADLINE", failover.DEFAULT_DEADLINE
+            ),
+            retries=network_setting(network, "RPC_RETRIES", failover.DEFAULT_RETRIES),
+            backoff=network_setting(
+                network, "RPC_RETRY_BACKOFF", failover.DEFAULT_BACKOFF
+            ),
+            hedge=bool(network_setting(network, "RPC_HEDGE", failover.DEFAULT_HEDGE)),
+            hedge_delay=network_setting(
+                network, "RPC_HEDGE_DELAY", failover.DEFAULT_HEDGE_DELAY
+            ),
+            breaker_failures=network_setting(
+                network, "RPC_BREAKER_FAILURES", failover.DEFAULT_BREAKER_FAILURES
+            ),
+            breaker_cooldown=network_setting(
+                network, "RPC_BREAKER_COOLDOWN", failover.DEFAULT_BREAKER_COOLDOWN
+            ),
+        ),
+    }
+
+
+def get_client(network: Union[Network, str]) -> NetworkClient:
+    """
+    Return the shared client for a network, accepts the Network enum or its value
+    as returned by Exchange.get_network ("mainnet", "aptosMainnet").
+    """
+    if not isinstance(network, Network):
+        network = Network(network)
+
+    client = _clients.get(network)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(network)
+            if client is None:
+                client = NetworkClient(network, **client_settings(network))
+                _clients[network] = client
+    return client
+
+
+def client_stats() -> Dict[str, Dict]:
+    """Pool usage for every network that has been used so far."""
+    return {network.value: client.stats() for network, client in _clients.items()}
+
+
+def reset_clients():
+    """Close and forget all clients, they get rebuilt (from the environment) on next use."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def request_json(url: str, client: Optional[NetworkClient] = None) -> dict:
+    """
+    simple function to manage direct queries to the chain, re-uses the client connections if given.
+    Retries and failover happen in the client's session, within its deadline.
+    """
+    r = client.get(url) if client else requests.get(url)
+    if r.status_code == 200:
+        return r.json()
+    else:
+        raise BadRequestException(f"Status Code: {r.status_code} | {url}")
+
+
+class AsyncNetworkClient:
+    """
+    aiohttp session (and AsyncWeb3 for EVM chains) with a keep-alive connection pool for one network.
+    aiohttp sessions belong to the event loop they were created on, so a client only lives as long
+    as its loop. Requests go to one endpoint at a time and move on to the next when it fails, the
+    latency based routing, hedging and breakers are up to the sync client. The deadline, retries
+    and backoff of `failover` apply as they do there.
+    """
+
+    def __init__(
+        self,
+        network: Network,
+        rpc_url: Union[str, List[str], None],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: tuple = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+        failover: Optional[FailoverSettings] = None,
+    ):
+        self.network = network
+        self.urls = split_urls(rpc_url)
+        self._current = 0
+        self.failover = failover or FailoverSettings()
+        self._rng = random.Random()
+        # the deadline bounds every request, web3 calls included
+        self.timeout = aiohttp.ClientTimeout(
+            total=self.failover.deadline, sock_connect=timeout[0], sock_read=timeout[1]
+        )
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size), timeout=self.timeout
+        )
+        self._web3: Optional[AsyncWeb3] = None
+
+    @property
+    def rpc_url(self) -> Optional[str]:
+        return self.urls[self._current] if self.urls else None
+
+    def rotate(self, failed_url: str):
+        """
+        Move on to the next endpoint after a request to `failed_url` failed. Requests that failed
+        on an endpoint we already left don't move us again.
+        """
+        if len(self.urls) < 2 or failed_url != self.rpc_url:
+            return
+        self._current = (self._current + 1) % len(self.urls)
+        self._web3 = None  # the provider is bound to the old endpoint
+        print(f"{self.network.value}: {failed_url} failed, switching to {self.rpc_url}")
+
+    async def get_web3(self) -> AsyncWeb3:
+        """AsyncWeb3 instance that sends its JSON-RPC calls over the pooled session."""
+        if self._web3 is None:
+            provider = AsyncWeb3.AsyncHTTPProvider(
+                self.rpc_url, request_kwargs={"timeout": self.timeout}
+            )
+            # without this web3 uses its own session that closes the connection after every call
+            await provider.cache_async_session(self.session)
+            self._web3 = AsyncWeb3(provider)
+        return self._web3
+
+    async def get_json(self, url: str) -> dict:
+        """
+        GET a url of the current endpoint. When the endpoint fails (no answer, 429 or 5xx) the
+        same path is asked of the next endpoint, up to `failover.retries` times after a jittered
+        backoff, and never past `failover.deadline` seconds.
+        """
+        deadline = time.monotonic() + self.failover.deadline
+        error: Exception = asyncio.TimeoutError(f"RPC deadline exceeded for {url}")
+        for attempt in range(self.failover.retries + 1):
+            if attempt:
+                pause = self._rng.uniform(0, self.failover.backoff * 2 ** (attempt - 1))
+                if time.monotonic() + pause >= deadline:
+                    break
+                RPC_RETRIES.inc(network=self.network.value)
+                await asyncio.sleep(pause)
+            base = self.rpc_url
+            timeout = aiohttp.ClientTimeout(
+                total=deadline - time.monotonic(),
+                sock_connect=self.timeout.sock_connect,
+                sock_read=self.timeout.sock_read,
+            )
+            try:
+                async with self.session.get(url, timeout=timeout) as r:
+                    if r.status == 200:
+                        return await r.json()
+                    error = BadRequestException(f"Status Code: {r.status} | {url}")
+                    if r.status != 429 and r.status < 500:
+                        raise error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if base is None or not url.startswith(base):
+                raise error
+            self.rotate(base)
+            url = self.rpc_url + url[len(base) :]
+        raise error
+
+    async def close(self):
+        await self.session.close()
+
+
+# Async clients belong to an event loop, one set per running loop: {loop: {network: client}}
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_async_client(network: Union[Network, str]) -> AsyncNetworkClient:
+    """Return the client of a network for the running event loop, call from within a coroutine."""
+    if not isinstance(network, Network):
+        network = Network(network)
+
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(network)
+    if client is None:
+        client = clients[network] = AsyncNetworkClient(
+            network, **client_settings(network)
+        )
+    return client
+
+
+async def close_async_clients():
+    """Close the clients of the running event loop."""
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.close()
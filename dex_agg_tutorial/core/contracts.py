@@ -0,0 +1,93 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Sequence
+
+from web3 import Web3
+from web3.contract import Contract
+
+# Resolve the ABI next to the project instead of the current working directory,
+# that way the server, tests and management commands can be started from anywhere
+UNISWAP_POOL_ABI_PATH = Path(__file__).resolve().parent.parent / "uniswap_pool_abi.json"
+
+# The parts of the pool ABI we actually call, add a name here when you start using a new function
+UNISWAP_POOL_FUNCTIONS = (
+    "slot0",
+    "token0",
+    "token1",
+    "liquidity",
+    "fee",
+    "tickSpacing",
+    "tickBitmap",
+    "ticks",
+    "observe",
+)
+
+
+def load_abi(path: Path, names: Sequence[str]) -> List[dict]:
+    """Load an ABI file and keep only the entries (functions/events) we use."""
+    with open(path, "r") as abi_file:
+        abi = json.load(abi_file)
+    return [entry for entry in abi if entry.get("name") in names]
+
+
+# Parsed once when the module is imported rather than on every price request
+UNISWAP_POOL_ABI = load_abi(UNISWAP_POOL_ABI_PATH, UNISWAP_POOL_FUNCTIONS)
+
+# Multicall3 is deployed at the same address on Ethereum mainnet and most other EVM chains,
+# it lets us pack many contract reads into a single eth_call. See https://www.multicall3.com
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+
+def output_types(abi: List[dict], name: str) -> List[str]:
+    """ABI types of the return values of a function, used to decode raw call results."""
+    entry = next(e for e in abi if e.get("name") == name and e["type"] == "function")
+    return [output["type"] for output in entry["outputs"]]
+
+
+@lru_cache(maxsize=4096)
+def _pool_contract(web3: Web3, checksum_address: str) -> Contract:
+    return web3.eth.contract(address=checksum_address, abi=UNISWAP_POOL_ABI)
+
+
+@lru_cache(maxsize=16)
+def get_multicall_contract(web3: Web3) -> Contract:
+    return web3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+
+
+def get_pool_contract(web3: Web3, pool_address: str) -> Contract:
+    """
+    Return the (cached) Uniswap pool contract for an address.
+    The address is checksummed first so different spellings of the same pool share a contract object.
+    """
+    return _pool_contract(web3, Web3.to_checksum_address(pool_address))
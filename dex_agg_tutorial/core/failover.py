@@ -0,0 +1,309 @@
+"""
+Failover over several RPC endpoints of a network.
+
+A network can list more than one endpoint, e.g. MAINNET_RPC_URL=https://a.example,https://b.example.
+Every HTTP request of its client, web3 JSON-RPC calls as well as Aptos REST reads, is written
+against the first url and sent by FailoverSession to whichever endpoint is doing best:
+
+    selection   a random endpoint weighted by 1 / its recent latency, so the fast ones get most
+                of the traffic while the others keep being measured
+    hedging     when the answer takes longer than the endpoint's p95 latency the same request also
+                goes to the next endpoint, whichever answers first wins (we only ever read)
+    breaker     an endpoint failing RPC_BREAKER_FAILURES times in a row gets no requests for
+                RPC_BREAKER_COOLDOWN seconds, after that a single request probes whether it's back
+    retries     failed requests (no answer, 429, 5xx) are retried on the next endpoint after a
+                jittered exponential backoff, never past the deadline of the request
+
+Other 4xx answers (a resource that doesn't exist) are answers, not failures of the endpoint.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+
+import requests
+
+from .metrics import RPC_BREAKER_OPENS, RPC_HEDGES, RPC_RETRIES
+
+# Defaults, each can be overridden per network with e.g. MAINNET_RPC_DEADLINE
+DEFAULT_DEADLINE = float(os.getenv("RPC_DEADLINE", "5"))
+DEFAULT_RETRIES = int(os.getenv("RPC_RETRIES", "2"))
+DEFAULT_BACKOFF = float(os.getenv("RPC_RETRY_BACKOFF", "0.1"))
+DEFAULT_HEDGE = int(os.getenv("RPC_HEDGE", "1"))
+DEFAULT_HEDGE_DELAY = float(os.getenv("RPC_HEDGE_DELAY", "0.5"))
+DEFAULT_BREAKER_FAILURES = int(os.getenv("RPC_BREAKER_FAILURES", "5"))
+DEFAULT_BREAKER_COOLDOWN = float(os.getenv("RPC_BREAKER_COOLDOWN", "30"))
+
+# Successful requests an endpoint's latency statistics are taken over
+LATENCY_WINDOW = 100
+# Samples needed before the p95 of an endpoint is trusted as its hedge delay
+MIN_HEDGE_SAMPLES = 10
+
+Result = Union[requests.Response, Exception]
+
+
+@dataclass(frozen=True)
+class FailoverSettings:
+    # seconds per request, retries and hedges included
+    deadline: float = DEFAULT_DEADLINE
+    retries: int = DEFAULT_RETRIES
+    # first backoff (seconds), doubles per retry, jittered
+    backoff: float = DEFAULT_BACKOFF
+    hedge: bool = bool(DEFAULT_HEDGE)
+    hedge_delay: float = DEFAULT_HEDGE_DELAY  # until an endpoint has a p95 of its own
+    breaker_failures: int = DEFAULT_BREAKER_FAILURES
+    breaker_cooldown: float = DEFAULT_BREAKER_COOLDOWN
+
+
+def split_urls(rpc_url: Union[str, List[str], None]) -> List[str]:
+    """Endpoints of a comma separated list (or a list), without trailing slashes."""
+    if not rpc_url:
+        return []
+    urls = rpc_url.split(",") if isinstance(rpc_url, str) else rpc_url
+    return [url.strip().rstrip("/") for url in urls if url.strip()]
+
+
+def is_failure(result: Result) -> bool:
+    if isinstance(result, Exception):
+        return True
+    return result.status_code == 429 or result.status_code >= 500
+
+
+class Endpoint:
+    """One RPC url with its latency statistics and circuit breaker."""
+
+    def __init__(self, url: str, settings: FailoverSettings):
+        self.url = url
+        self.settings = settings
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.ewma: Optional[float] = None
+        self.failures = 0  # in a row
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def may_send(self, now: float) -> bool:
+        """Closed, or open for longer than the cooldown and nobody is probing it yet."""
+        if self.opened_at is None:
+            return True
+        return (
+            now - self.opened_at >= self.settings.breaker_cooldown and not self.probing
+        )
+
+    def acquire(self, now: float) -> bool:
+        """Take the right to send a request, the single probe of a half open breaker included."""
+        with self._lock:
+            if not self.may_send(now):
+                return False
+            if self.opened_at is not None:
+                self.probing = True
+            return True
+
+    def record(self, elapsed: float, failed: bool, now: float) -> bool:
+        """Account for a finished request, returns True when it opened the breaker."""
+        with self._lock:
+            self.probing = False
+            if not failed:
+                self.failures = 0
+                self.opened_at = None
+                self.latencies.append(elapsed)
+                self.ewma = (
+                    elapsed if self.ewma is None else 0.8 * self.ewma + 0.2 * elapsed
+                )
+                return False
+            self.failures += 1
+            # slow failures make the endpoint look slow too
+            self.ewma = max(self.ewma or 0.0, elapsed)
+            if self.opened_at is not None or (
+                self.failures >= self.settings.breaker_failures
+            ):
+                self.opened_at = now
+                return True
+            return False
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for this endpoint before asking another one too, its p95."""
+        if len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return self.settings.hedge_delay
+        latencies = sorted(self.latencies)
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "latency": self.ewma,
+            "failures": self.failures,
+            "open": self.is_open,
+        }
+
+
+class FailoverSession(requests.Session):
+    """
+    requests.Session spreading the requests for the first endpoint over all endpoints, see the
+    module docstring. Requests for other urls are sent as they are.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        network: str = "unknown",
+        settings: FailoverSettings = FailoverSettings(),
+    ):
+        super().__init__()
+        self.network = network
+        self.settings = settings
+        self.endpoints = [Endpoint(url, settings) for url in urls]
+        self.base = self.endpoints[0].url if self.endpoints else None
+        self._rng = random.Random()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if len(self.endpoints) > 1 and settings.hedge:
+            self._executor = ThreadPoolExecutor(
+                max_workers=4 * len(self.endpoints),
+                thread_name_prefix=f"rpc-{network}",
+            )
+
+    def request(self, method, url, *args, **kwargs):
+        path = str(url)[len(self.base or "") :]
+        if (
+            self.base is None
+            or not str(url).startswith(self.base)
+            or path[:1] not in ("", "/", "?")
+        ):
+            return super().request(method, url, *args, **kwargs)
+        deadline = time.monotonic() + self.settings.deadline
+
+        order = self.order()
+        result: Result = requests.Timeout(f"No RPC endpoint answered for {url}")
+        for attempt in range(self.settings.retries + 1):
+            if attempt:
+                pause = self._rng.uniform(0, self.settings.backoff * 2 ** (attempt - 1))
+                if time.monotonic() + pause >= deadline:
+                    break
+                RPC_RETRIES.inc(network=self.network)
+                time.sleep(pause)
+            # every retry starts on the next endpoint
+            shift = attempt % len(order)
+            result = self.attempt(
+                order[shift:] + order[:shift], method, path, args, kwargs, deadline
+            )
+            if not is_failure(result) or time.monotonic() >= deadline:
+                break
+
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def order(self) -> List[Endpoint]:
+        """
+        Endpoints to try: a latency weighted pick first, the rest fastest first. Endpoints with an
+        open breaker are left out, unless all of them are open, then the oldest one is tried.
+        """
+        now = time.monotonic()
+        available = [endpoint for endpoint in self.endpoints if endpoint.may_send(now)]
+        if not available:
+            return [min(self.endpoints, key=lambda endpoint: endpoint.opened_at)]
+        if len(available) == 1:
+            return available
+
+        known = [e.ewma for e in available if e.ewma is not None]
+        # endpoints we haven't heard from yet count as average, so they get measured
+        default = sum(known) / len(known) if known else 1.0
+        latency = {id(e): max(e.ewma or default, 1e-4) for e in available}
+        first = self._rng.choices(
+            available, weights=[1 / latency[id(e)] for e in available]
+        )[0]
+        rest = sorted(
+            (e for e in available if e is not first), key=lambda e: latency[id(e)]
+        )
+        return [first] + rest
+
+    def attempt(
+        self, endpoints: List[Endpoint], method, path, args, kwargs, deadline
+    ) -> Result:
+        """One try: the first endpoint, hedged with the second one if it's slower than usual."""
+        primary = endpoints[0]
+        if self._executor is None or len(endpoints) < 2:
+            return self.send_to(primary, method, path, args, kwargs, deadline)
+
+        futures = {
+            self._executor.submit(
+                self.send_to, primary, method, path, args, kwargs, deadline
+            )
+        }
+        remaining = deadline - time.monotonic()
+        done, _ = wait(futures, timeout=max(min(primary.hedge_delay(), remaining), 0))
+        if not done and time.monotonic() < deadline:
+            RPC_HEDGES.inc(network=self.network)
+            futures.add(
+                self._executor.submit(
+                    self.send_to, endpoints[1], method, path, args, kwargs, deadline
+                )
+            )
+
+        result: Result = requests.Timeout(f"RPC deadline exceeded for {path}")
+        while futures:
+            done, futures = wait(
+                futures,
+                timeout=max(deadline - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                break
+            for future in done:
+                result = future.result()
+                if not is_failure(result):
+                    return result
+        return result
+
+    def send_to(
+        self, endpoint: Endpoint, method, path, args, kwargs, deadline
+    ) -> Result:
+        """Send the request to an endpoint within what is left of the deadline."""
+        started = time.monotonic()
+        if not endpoint.acquire(started) and any(
+            e.may_send(started) for e in self.endpoints
+        ):
+            return requests.ConnectionError(f"Circuit open for {endpoint.url}")
+
+        kwargs = {
+            **kwargs,
+            "timeout": self.clamp_timeout(kwargs.get("timeout"), deadline),
+        }
+        try:
+            result: Result = super().request(
+                method, endpoint.url + path, *args, **kwargs
+            )
+        except requests.RequestException as e:
+            result = e
+        finished = time.monotonic()
+        if endpoint.record(finished - started, is_failure(result), finished):
+            RPC_BREAKER_OPENS.inc(network=self.network)
+        return result
+
+    @staticmethod
+    def clamp_timeout(timeout, deadline: float) -> Tuple[float, float]:
+        remaining = max(deadline - time.monotonic(), 0.001)
+        if timeout is None:
+            return (remaining, remaining)
+        if isinstance(timeout, (tuple, list)):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        return (min(connect or remaining, remaining), min(read or remaining, remaining))
+
+    def stats(self) -> List[dict]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        super().close()
@@ -0,0 +1,389 @@
+"""
+Local stand-ins for the chain endpoints, fake Ethereum and Aptos nodes serving pools from memory
+with optional latency and failures, so tests and `manage.py benchmark` run without an RPC
+provider.
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+
+from .contracts import MULTICALL3_ADDRESS
+
+SELECTORS = {
+    function_signature_to_4byte_selector(signature): name
+    for name, signature in [
+        ("slot0", "slot0()"),
+        ("liquidity", "liquidity()"),
+        ("token0", "token0()"),
+        ("token1", "token1()"),
+        ("fee", "fee()"),
+        ("tickSpacing", "tickSpacing()"),
+        ("tickBitmap", "tickBitmap(int16)"),
+        ("ticks", "ticks(int24)"),
+        ("observe", "observe(uint32[])"),
+        ("symbol", "symbol()"),
+        ("decimals", "decimals()"),
+        ("aggregate3", "aggregate3((address,bool,bytes)[])"),
+        ("getBlockNumber", "getBlockNumber()"),
+        ("getCurrentBlockTimestamp", "getCurrentBlockTimestamp()"),
+    ]
+}
+
+
+class NodeServer(ThreadingHTTPServer):
+    """HTTP server of a fake node, clients hanging up on a slow answer are no error."""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FaultInjection:
+    """
+    Latency and failures of a fake node: every request waits `latency` seconds plus up to
+    `jitter` more, and `failure_rate` of them (0 to 1) are answered with a 503 instead.
+    Draws come from a seeded generator so runs can be repeated.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self.rng = random.Random(0)
+
+    def inject_faults(self) -> bool:
+        """Wait out the latency of a request, True when it should fail."""
+        self.requests += 1
+        time.sleep(
+            self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        )
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            self.failures += 1
+            return True
+        return False
+
+
+class FakeEthereumNode(FaultInjection):
+    """
+    JSON-RPC server answering eth_call for Uniswap V3 pools and Multicall3.
+
+    `pools` maps a pool address to its state, e.g. {"sqrt_price_x96": 2**96, "tick": 0,
+    "liquidity": 10**18, "fee": 3000, "tick_spacing": 60, "ticks": {-60: 10**18, 60: -10**18}}
+    where ticks maps the initialized ticks to their liquidityNet. Pools in `reverting` revert
+    every call, any other address behaves like an account without code. See FaultInjection for
+    latency and failures added to every HTTP request.
+
+    eth_getLogs serves `logs` (in JSON-RPC form, e.g. recorded ones from the test fixtures), filtered
+    by block range, address and first topic. `block_number` is the head of the chain and
+    `timestamp` its time, the wall clock when None.
+
+    `tokens` maps ERC-20 addresses to {"symbol": "USDC", "decimals": 6} for symbol() and
+    decimals(), pools name theirs with "token0" and "token1".
+
+    observe() reads the pool's "observations", a list of (timestamp, tickCumulative) sorted by
+    time, like the pool oracle: between two observations it interpolates, after the last one it
+    extrapolates with the current tick, and before the first one it reverts (OLD).
+    """
+
+    def __init__(self, pools: Optional[Dict[str, dict]] = None, **faults):
+        super().__init__(**faults)
+        self.pools = {Web3.to_checksum_address(a): s for a, s in (pools or {}).items()}
+        self.tokens: Dict[str, dict] = {}
+        self.reverting = set()
+        self.logs: List[dict] = []
+        self.block_number = 20_000_000
+        self.timestamp: Optional[int] = None
+        self.calls: Dict[str, int] = {}
+        self._server: Optional[NodeServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeEthereumNode":
+        node = self
+
+        class Handler(JSONRPCHandler):
+            def answer(self, request):
+                return node.answer(request)
+
+            def inject_faults(self):
+                return node.inject_faults()
+
+        self._server = NodeServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def answer(self, request: dict) -> dict:
+        method, params = request["method"], request.get("params", [])
+        self.calls[method] = self.calls.get(method, 0) + 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if method == "eth_chainId":
+            response["result"] = "0x1"
+        elif method == "eth_blockNumber":
+            response["result"] = hex(self.block_number)
+        elif method == "eth_getLogs":
+            response["result"] = self.get_logs(params[0])
+        elif method == "eth_call":
+            success, data = self.call(params[0]["to"], params[0].get("data", "0x"))
+            if success:
+                response["result"] = "0x" + data.hex()
+            else:
+                response["error"] = {"code": 3, "message": "execution reverted"}
+        else:
+            response["error"] = {"code": -32601, "message": f"{method} not supported"}
+        return response
+
+    def call(self, to: str, data) -> tuple:
+        """Execute a call, returns (success, return data)."""
+        data = bytes.fromhex(data[2:]) if isinstance(data, str) else data
+        to = Web3.to_checksum_address(to)
+        name = SELECTORS.get(data[:4])
+
+        if to == MULTICALL3_ADDRESS and name == "aggregate3":
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            results = [self.call(target, calldata) for target, _, calldata in calls]
+            return True, encode(["(bool,bytes)[]"], [results])
+        if to == MULTICALL3_ADDRESS and name == "getBlockNumber":
+            return True, encode(["uint256"], [self.block_number])
+        if to == MULTICALL3_ADDRESS and name == "getCurrentBlockTimestamp":
+            return True, encode(["uint256"], [self.now()])
+
+        if to in self.reverting:
+            return False, b""
+        token = {Web3.to_checksum_address(a): t for a, t in self.tokens.items()}.get(to)
+        if token is not None and name in ("symbol", "decimals"):
+            return True, encode(
+                ["string" if name == "symbol" else "uint8"], [token[name]]
+            )
+        pool = self.pools.get(to)
+        if pool is None:
+            return True, b""  # no code at this address, calls "succeed" with no data
+        if name == "slot0":
+            return True, encode(
+                ["uint160", "int24", "uint16", "uint16", "uint16", "uint8", "bool"],
+                [pool["sqrt_price_x96"], pool.get("tick", 0), 0, 1, 1, 0, True],
+            )
+        if name == "liquidity":
+            return True, encode(["uint128"], [pool.get("liquidity", 0)])
+        if name in ("token0", "token1"):
+            return True, encode(["address"], [pool[name]])
+        if name == "fee":
+            return True, encode(["uint24"], [pool.get("fee", 3000)])
+        if name == "tickSpacing":
+            return True, encode(["int24"], [pool.get("tick_spacing", 60)])
+        if name == "tickBitmap":
+            (word,) = decode(["int16"], data[4:])
+            return True, encode(["uint256"], [self.bitmap(pool, word)])
+        if name == "ticks":
+            (tick,) = decode(["int24"], data[4:])
+            net = pool.get("ticks", {}).get(tick)
+            return True, encode(
+                [
+                    "uint128",
+                    "int128",
+                    "uint256",
+                    "uint256",
+                    "int56",
+                    "uint160",
+                    "uint32",
+                    "bool",
+                ],
+                [abs(net or 0), net or 0, 0, 0, 0, 0, 0, net is not None],
+            )
+        if name == "observe":
+            (seconds_agos,) = decode(["uint32[]"], data[4:])
+            cumulatives = [self.observe(pool, s) for s in seconds_agos]
+            if None in cumulatives:
+                return False, b""
+            return True, encode(
+                ["int56[]", "uint160[]"], [cumulatives, [0] * len(cumulatives)]
+            )
+        return False, b""
+
+    def now(self) -> int:
+        return self.timestamp if self.timestamp is not None else int(time.time())
+
+    def observe(self, pool: dict, seconds_ago: int) -> Optional[int]:
+        """Tick cumulative `seconds_ago` before the head, None if older than the oracle."""
+        target = self.now() - seconds_ago
+        observations = pool.get("observations", [])
+        if not observations or target < observations[0][0]:
+            return None
+        for (t0, c0), (t1, c1) in zip(observations, observations[1:]):
+            if t0 <= target <= t1:
+                return c0 + (c1 - c0) // (t1 - t0) * (target - t0)
+        t, cumulative = observations[-1]
+        return cumulative + pool.get("tick", 0) * (target - t)
+
+    def get_logs(self, log_filter: dict) -> List[dict]:
+        addresses = log_filter.get("address", [])
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {Web3.to_checksum_address(a) for a in addresses}
+        topics = (log_filter.get("topics") or [None])[0]
+        if isinstance(topics, str):
+            topics = [topics]
+        return [
+            log
+            for log in self.logs
+            if int(log_filter["fromBlock"], 16)
+            <= int(log["blockNumber"], 16)
+            <= int(log_filter["toBlock"], 16)
+            and (not addresses or Web3.to_checksum_address(log["address"]) in addresses)
+            and (not topics or log["topics"][0] in topics)
+        ]
+
+    @staticmethod
+    def bitmap(pool: dict, word: int) -> int:
+        """tickBitmap word of the pool's initialized ticks."""
+        spacing = pool.get("tick_spacing", 60)
+        bitmap = 0
+        for tick in pool.get("ticks", {}):
+            compressed = tick // spacing
+            if compressed >> 8 == word:
+                bitmap |= 1 << (compressed & 0xFF)
+        return bitmap
+
+
+class FakeAptosNode(FaultInjection):
+    """
+    Aptos fullnode REST stand-in serving the Hyperion LiquidityPoolV3 resource of `pools`,
+    e.g. {"0xa7bb...": {"sqrt_price": 2**64, "liquidity": 10**9, "tick": 0}}, and the fungible
+    asset Metadata resource of `tokens`, e.g. {"0xa": {"symbol": "APT", "decimals": 8}}.
+
+    GET /v1/transactions streams `transactions` (dicts with a "version", e.g. recorded ones from the test fixtures),
+    the ledger version is the last of them.
+    """
+
+    def __init__(self, pools: Optional[Dict[str, dict]] = None, **faults):
+        super().__init__(**faults)
+        self.pools = dict(pools or {})
+        self.tokens: Dict[str, dict] = {}
+        self.transactions: List[dict] = []
+        self.base_version = 3_000_000_000
+        self._server: Optional[NodeServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeAptosNode":
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if node.inject_faults():
+                    status, body = 503, {"message": "injected failure"}
+                else:
+                    status, body = node.resource(self.path)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = NodeServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def ledger_version(self) -> int:
+        if self.transactions:
+            return int(self.transactions[-1]["version"])
+        return self.base_version
+
+    def resource(self, path: str) -> tuple:
+        """
+        Answer GET /v1/accounts/{address}/resource/{type}, /v1 (ledger info) and
+        /v1/transactions, returns (status, body).
+        """
+        path, _, query = path.partition("?")
+        params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+        if path.strip("/") == "v1":
+            return 200, {"chain_id": 1, "ledger_version": str(self.ledger_version)}
+        if path.strip("/") == "v1/transactions":
+            start, limit = int(params["start"]), int(params.get("limit", 25))
+            return (
+                200,
+                [t for t in self.transactions if int(t["version"]) >= start][:limit],
+            )
+        parts = path.strip("/").split("/")
+        if len(parts) != 5 or parts[:2] != ["v1", "accounts"]:
+            return 404, {"message": "not found"}
+        if parts[4].endswith("fungible_asset::Metadata"):
+            resource = self.tokens.get(parts[2])
+        else:
+            resource = self.pools.get(parts[2])
+        if resource is None:
+            return 404, {
+                "message": "Resource not found",
+                "error_code": "resource_not_found",
+            }
+        # u64/u128 come as strings from the REST API, structs (Object<T>) as they are
+        data = {
+            key: value if isinstance(value, dict) else str(value)
+            for key, value in resource.items()
+        }
+        return 200, {"type": parts[4], "data": data}
+
+
+class JSONRPCHandler(BaseHTTPRequestHandler):
+    """POST handler for (batched) JSON-RPC requests, subclasses implement `answer`."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't let them wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def answer(self, request: dict) -> dict:
+        raise NotImplementedError
+
+    def inject_faults(self) -> bool:
+        return False
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status = 200
+        if self.inject_faults():
+            status, result = 503, {"message": "injected failure"}
+        elif isinstance(body, list):
+            result = [self.answer(request) for request in body]
+        else:
+            result = self.answer(body)
+        payload = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
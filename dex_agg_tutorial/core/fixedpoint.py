@@ -0,0 +1,125 @@
+"""
+Fixed-point math for pool prices.
+
+Concentrated liquidity pools store the square root of the price as a fixed-point integer,
+Q64.96 on Uniswap (sqrtPriceX96) and Q64.64 on Hyperion. Squaring that as a float throws away
+everything past 53 bits, here we keep the ratio as exact integers and only round once, when it
+is turned into a Decimal (or string) with the precision you ask for.
+"""
+
+import os
+import time
+from decimal import Context, Decimal
+from typing import List, Optional, Sequence, Tuple, Union
+
+from .metrics import observe_stage
+
+# Significant digits of the prices we hand out, 28 matches the default Decimal context
+PRICE_PRECISION = int(os.getenv("PRICE_PRECISION", "28"))
+
+Price = Union[Decimal, float]
+Decimals = Union[int, Sequence[int]]
+Flags = Union[bool, Sequence[bool]]
+
+
+def sqrt_price_ratio(
+    sqrt_price: int,
+    bits: int,
+    base_decimals: int,
+    quote_decimals: int,
+    invert: bool = False,
+) -> Tuple[int, int]:
+    """
+    Exact price of the base token in quote tokens as a (numerator, denominator) pair.
+
+    `bits` is the number of fractional bits of the sqrt price (96 or 64). The pool price is
+    token1 per token0, pass invert=True when the base token of the pair is the pool's token1.
+    """
+    numerator = sqrt_price * sqrt_price
+    denominator = 1 << (2 * bits)
+    if invert:
+        numerator, denominator = denominator, numerator
+    if denominator == 0:
+        raise ZeroDivisionError("Pool has no price (sqrt price is 0)")
+
+    # raw amounts to whole tokens: price * 10^(base_decimals - quote_decimals)
+    shift = base_decimals - quote_decimals
+    if shift >= 0:
+        numerator *= 10**shift
+    else:
+        denominator *= 10**-shift
+    return numerator, denominator
+
+
+def sqrt_price_to_decimal(
+    sqrt_price: int,
+    bits: int,
+    base_decimals: int,
+    quote_decimals: int,
+    invert: bool = False,
+    precision: int = PRICE_PRECISION,
+) -> Decimal:
+    """Price of the base token as a Decimal rounded (once) to `precision` significant digits."""
+    started = time.perf_counter()
+    numerator, denominator = sqrt_price_ratio(
+        sqrt_price, bits, base_decimals, quote_decimals, invert
+    )
+    price = Context(prec=precision).divide(numerator, denominator)
+    observe_stage("math", time.perf_counter() - started)
+    return price
+
+
+def sqrt_prices_to_decimals(
+    sqrt_prices: Sequence[int],
+    bits: int,
+    base_decimals: Decimals,
+    quote_decimals: Decimals,
+    invert: Flags = False,
+    precision: int = PRICE_PRECISION,
+) -> List[Optional[Decimal]]:
+    """
+    Exact conversion of many sqrt prices at once, e.g. the pools of a multicall batch.
+    Decimals and invert can be given per price or once for all of them, pools without a price
+    give None.
+    """
+    started = time.perf_counter()
+    context = Context(prec=precision)
+    prices: List[Optional[Decimal]] = []
+    for sqrt_price, base, quote, inverted in zip(
+        sqrt_prices,
+        _per_price(base_decimals, sqrt_prices),
+        _per_price(quote_decimals, sqrt_prices),
+        _per_price(invert, sqrt_prices),
+    ):
+        try:
+            ratio = sqrt_price_ratio(sqrt_price, bits, base, quote, inverted)
+        except ZeroDivisionError:
+            prices.append(None)
+            continue
+        prices.append(context.divide(*ratio))
+    observe_stage("math", time.perf_counter() - started)
+    return prices
+
+
+def _per_price(value, sqrt_prices: Sequence[int]) -> Sequence:
+    # bools are ints too, so flags go through here as well
+    return [value] * len(sqrt_prices) if isinstance(value, int) else value
+
+
+def format_price(price: Price, precision: Optional[int] = None) -> str:
+    """Price as a plain (non scientific) decimal string, optionally rounded to `precision` digits."""
+    # repr gives the shortest string that round trips, so floats don't show their binary noise
+    value = price if isinstance(price, Decimal) else Decimal(repr(price))
+    if precision is not None:
+        value = Context(prec=precision).plus(value)
+    return f"{value:f}"
+
+
+def serialize_price(price: Price, precision: Optional[int] = None) -> Union[float, str]:
+    """
+    Price for a JSON response, a plain number by default. With a precision the price is
+    returned as a string so the digits survive JSON parsers that read numbers as doubles.
+    """
+    if precision is None:
+        return float(price)
+    return format_price(price, precision)
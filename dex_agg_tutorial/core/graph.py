@@ -0,0 +1,345 @@
+"""
+Prices for token pairs that aren't listed, by chaining the pairs that are.
+
+Every Pair is an edge between its base and quote token, so APT -> WETH can be priced over
+APTUSDC and USDCWETH. Edge weights are -log(rate): a path's weights add up to -log of the
+product of its rates, and the best conversion is the shortest path. Rates can be inconsistent
+between pairs (arbitrage), which makes negative cycles, so the search is a Bellman-Ford bounded
+to `max_hops` layers instead of Dijkstra.
+
+The graph lives in flat arrays (one slot per directed edge) so a layer of the search is a single
+vectorized pass with numpy, or a tight loop over the arrays without it.
+"""
+
+import math
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from .fixedpoint import serialize_price
+from .models import Pair
+from .queries import book_prices, fetch_many_exchange_prices
+from .registry import pair_registry
+
+try:  # numpy is optional, the search falls back to plain Python loops
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Maximum number of pairs chained into one path, and the maximum ?max_hops= of /path/
+PATH_MAX_HOPS = int(os.getenv("PATH_MAX_HOPS", "3"))
+# Most pairs one /path/ request fetches prices for, nearest to the source first. Pairs further
+# out are priced from the price book only.
+PATH_MAX_FETCH = int(os.getenv("PATH_MAX_FETCH", "50"))
+# Pairs added by other workers are only seen after a full rebuild, done at most this often
+TOKEN_GRAPH_TTL = float(os.getenv("TOKEN_GRAPH_TTL", "60"))
+
+INF = float("inf")
+# Going back and forth over the same pair adds up to 0 only up to float rounding
+EPSILON = 1e-12
+
+
+class TokenGraph:
+    """
+    Directed token graph, edge 2i goes base -> quote of pair i and edge 2i + 1 goes back.
+    Weights start out infinite (no price known yet) and are set with set_rate().
+    """
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.token_index: Dict[str, int] = {}
+        self.pairs: List[Pair] = []
+        self.pair_index: Dict[str, int] = {}
+        self.edge_src = array("l")
+        self.edge_dst = array("l")
+        self.weights = array("d")
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+        # adjacency lists and numpy copies of the edge arrays, rebuilt when edges are added
+        self._adjacency = None
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def _token(self, symbol: str) -> int:
+        index = self.token_index.get(symbol)
+        if index is None:
+            index = self.token_index[symbol] = len(self.tokens)
+            self.tokens.append(symbol)
+        return index
+
+    def add_pair(self, pair: Pair):
+        """Add a pair's two edges, or refresh the stored pair if it is already in the graph."""
+        with self._lock:
+            index = self.pair_index.get(pair.pair_id)
+            if index is not None:
+                self.pairs[index] = pair
+                return
+            base, quote = self._token(pair.base_token), self._token(pair.quote_token)
+            self.pair_index[pair.pair_id] = len(self.pairs)
+            self.pairs.append(pair)
+            self.edge_src.extend((base, quote))
+            self.edge_dst.extend((quote, base))
+            self.weights.extend((INF, INF))
+            self._adjacency = self._arrays = None
+
+    def build(self, pairs=None):
+        """(Re)build the graph from all active pairs."""
+        if pairs is None:
+            pairs = pair_registry.active()
+        graph = TokenGraph()
+        for pair in pairs:
+            graph.add_pair(pair)
+        with self._lock:
+            self.tokens, self.token_index = graph.tokens, graph.token_index
+            self.pairs, self.pair_index = graph.pairs, graph.pair_index
+            self.edge_src, self.edge_dst = graph.edge_src, graph.edge_dst
+            self.weights = graph.weights
+            self._adjacency = self._arrays = None
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if time.monotonic() - self.built_at > TOKEN_GRAPH_TTL:
+            self.build()
+
+    def clear(self):
+        self.build(pairs=[])
+        self.built_at = 0.0
+
+    def set_rate(self, pair_id: str, rate: Optional[float]):
+        """Set the quote tokens per base token of a pair, None for no usable price."""
+        index = self.pair_index.get(pair_id)
+        if index is None:
+            return
+        weight = -math.log(rate) if rate and rate > 0 else INF
+        self.weights[2 * index] = weight
+        # exactly the negation, so a round trip over one pair costs nothing
+        self.weights[2 * index + 1] = -weight if weight != INF else INF
+
+    def pairs_near(self, symbol: str, max_hops: int) -> List[Pair]:
+        """Pairs on any path of at most `max_hops` edges starting at `symbol`, nearest first."""
+        start = self.token_index.get(symbol)
+        if start is None:
+            return []
+        adjacency = self.adjacency()
+        hops = {start: 0}
+        # a dict keeps the pairs in the order the breadth first search reaches them
+        found = {}
+        todo = deque([start])
+        while todo:
+            token = todo.popleft()
+            if hops[token] == max_hops:
+                continue
+            for edge in adjacency[token]:
+                found[edge // 2] = None
+                neighbour = self.edge_dst[edge]
+                if neighbour not in hops:
+                    hops[neighbour] = hops[token] + 1
+                    todo.append(neighbour)
+        return [self.pairs[index] for index in found]
+
+    def adjacency(self) -> List[List[int]]:
+        """Outgoing edge ids per token."""
+        if self._adjacency is None:
+            adjacency = [[] for _ in self.tokens]
+            for edge, src in enumerate(self.edge_src):
+                adjacency[src].append(edge)
+            self._adjacency = adjacency
+        return self._adjacency
+
+    def best_path(
+        self, source: str, target: str, max_hops: int = PATH_MAX_HOPS
+    ) -> Optional[Tuple[float, List[int]]]:
+        """
+        Best conversion from `source` to `target` over at most `max_hops` pairs, as
+        (target tokens per source token, [edge ids]). None if there is no priced path.
+        """
+        s, t = self.token_index.get(source), self.token_index.get(target)
+        if s is None or t is None or s == t:
+            return None
+
+        if numpy is not None:
+            dist, preds = self._relax_numpy(s, max_hops)
+        else:
+            dist, preds = self._relax_python(s, max_hops)
+        if dist[t] == INF:
+            return None
+
+        path = self._walk_back(preds, t)
+        visited = [self.edge_src[e] for e in path] + [t]
+        if len(set(visited)) != len(visited):
+            # an arbitrage cycle got into the path, fall back to enumerating simple paths
+            return self._best_simple_path(s, t, max_hops)
+        return math.exp(-dist[t]), path
+
+    def search(
+        self,
+        rates: Dict[str, Optional[float]],
+        source: str,
+        target: str,
+        max_hops: int = PATH_MAX_HOPS,
+    ) -> Optional[Tuple[float, List[Dict]]]:
+        """
+        set_rate() every pair in `rates`, then best_path() with the path's edges described.
+        All under the graph lock, so requests don't search with each other's rates and a rebuild
+        doesn't swap the arrays under a search.
+        """
+        with self._lock:
+            for pair_id, rate in rates.items():
+                self.set_rate(pair_id, rate)
+            found = self.best_path(source, target, max_hops)
+            if found is None:
+                return None
+            price, path = found
+            return price, [self.describe_edge(edge) for edge in path]
+
+    def _relax_numpy(self, s: int, max_hops: int):
+        if self._arrays is None:
+            # copies, a numpy view would keep the arrays from growing
+            self._arrays = (
+                numpy.array(self.edge_src, dtype=numpy.int64),
+                numpy.array(self.edge_dst, dtype=numpy.int64),
+                numpy.arange(len(self.edge_src)),
+            )
+        src, dst, edges = self._arrays
+        weights = numpy.array(self.weights, dtype=numpy.float64)
+
+        dist = numpy.full(len(self.tokens), INF)
+        dist[s] = 0.0
+        preds = []
+        for _ in range(max_hops):
+            candidates = dist[src] + weights
+            relaxed = dist.copy()
+            numpy.minimum.at(relaxed, dst, candidates)
+            # predecessor edge of every token that improved in this layer, -1 for the rest
+            improved = (candidates == relaxed[dst]) & (candidates < dist[dst] - EPSILON)
+            pred = numpy.full(len(self.tokens), -1)
+            pred[dst[improved]] = edges[improved]
+            if not improved.any():
+                break
+            relaxed[pred == -1] = dist[pred == -1]
+            preds.append(pred)
+            dist = relaxed
+        return dist, preds
+
+    def _relax_python(self, s: int, max_hops: int):
+        src, dst, weights = self.edge_src, self.edge_dst, self.weights
+        dist = [INF] * len(self.tokens)
+        dist[s] = 0.0
+        preds = []
+        for _ in range(max_hops):
+            relaxed = list(dist)
+            pred = [-1] * len(self.tokens)
+            for edge in range(len(src)):
+                candidate = dist[src[edge]] + weights[edge]
+                v = dst[edge]
+                if candidate < relaxed[v] and candidate < dist[v] - EPSILON:
+                    relaxed[v] = candidate
+                    pred[v] = edge
+            if pred.count(-1) == len(pred):
+                break
+            preds.append(pred)
+            dist = relaxed
+        return dist, preds
+
+    def _walk_back(self, preds, t: int) -> List[int]:
+        path = []
+        token = t
+        for layer in reversed(preds):
+            edge = layer[token]
+            if edge != -1:
+                path.append(int(edge))
+                token = self.edge_src[edge]
+        return path[::-1]
+
+    def _best_simple_path(
+        self, s: int, t: int, max_hops: int
+    ) -> Optional[Tuple[float, List[int]]]:
+        adjacency = self.adjacency()
+        best: Tuple[float, List[int]] = (INF, [])
+
+        def search(token: int, cost: float, path: List[int], seen: set):
+            nonlocal best
+            if token == t:
+                if cost < best[0]:
+                    best = (cost, list(path))
+                return
+            if len(path) == max_hops:
+                return
+            for edge in adjacency[token]:
+                neighbour = self.edge_dst[edge]
+                if neighbour in seen or self.weights[edge] == INF:
+                    continue
+                path.append(edge)
+                seen.add(neighbour)
+                search(neighbour, cost + self.weights[edge], path, seen)
+                seen.discard(neighbour)
+                path.pop()
+
+        search(s, 0.0, [], {s})
+        if best[0] == INF:
+            return None
+        return math.exp(-best[0]), best[1]
+
+    def describe_edge(self, edge: int) -> Dict:
+        pair = self.pairs[edge // 2]
+        forward = edge % 2 == 0
+        return {
+            "pair_id": pair.pair_id,
+            "from": pair.base_token if forward else pair.quote_token,
+            "to": pair.quote_token if forward else pair.base_token,
+            "rate": math.exp(-self.weights[edge]),
+        }
+
+
+# Graph of all active pairs, shared by the requests of this process
+token_graph = TokenGraph()
+
+
+def get_path_price(
+    source: str,
+    target: str,
+    max_hops: int = PATH_MAX_HOPS,
+    precision: Optional[int] = None,
+) -> Dict:
+    """
+    Price of `source` in `target` tokens over the best chain of listed pairs. The rate of a pair
+    is the geometric mean of its exchange prices, prices come from the price book. Missing or
+    stale prices are fetched for the PATH_MAX_FETCH pairs nearest to `source`, further pairs
+    within reach go without.
+    """
+    token_graph.ensure_built()
+    near = token_graph.pairs_near(source, max_hops)
+    quotes = fetch_many_exchange_prices(near[:PATH_MAX_FETCH])
+    quotes.update(book_prices(near[PATH_MAX_FETCH:]))
+    rates = {}
+    for pair_id, pair_quotes in quotes.items():
+        prices = [float(q.price) for q in pair_quotes.values() if q.price > 0]
+        rates[pair_id] = (
+            math.exp(sum(math.log(p) for p in prices) / len(prices)) if prices else None
+        )
+
+    started = time.perf_counter()
+    found = token_graph.search(rates, source, target, max_hops)
+    search_time = time.perf_counter() - started
+    if found is None:
+        return {
+            "from": source,
+            "to": target,
+            "error": f"No priced path from {source} to {target} within {max_hops} hops",
+        }
+
+    price, path = found
+    return {
+        "from": source,
+        "to": target,
+        # target tokens per source token
+        "price": serialize_price(price, precision),
+        "hops": len(path),
+        "path": path,
+        "search_ms": round(search_time * 1000, 3),
+    }
@@ -0,0 +1,458 @@
+"""
+Price history.
+
+Every price put in the price cache is appended to an in-memory buffer, which costs the /price/
+path next to nothing. A background thread writes the buffer out every PRICE_HISTORY_FLUSH seconds
+with a single bulk insert: one PriceHistoryChunk row per (pair, exchange) with all its points in
+packed arrays, instead of a row per point.
+
+compact_history() keeps the table small. It merges the chunks of many flushes into one chunk per
+span, and turns data that is past the retention of its tier into OHLC bars of the next tier:
+
+    raw points   kept PRICE_HISTORY_RAW_RETENTION seconds (1 day), then 1 minute bars
+    1m bars      kept PRICE_HISTORY_MINUTE_RETENTION seconds (30 days), then 1 hour bars
+    1h bars      kept forever
+
+OHLC buckets for /history/ are computed from the chunks with numpy when installed.
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.db import close_old_connections, transaction
+
+from .cache import CachedPrice, CacheKey, PriceCache, price_cache
+from .models import PriceHistoryChunk
+from .shared import PRICE_BOOK_LEASE
+from .twap import time_weighted_average
+
+try:  # numpy is optional, bucketing falls back to plain Python loops
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Record history (opt in like the poller), flush the buffer every PRICE_HISTORY_FLUSH seconds.
+# At most PRICE_HISTORY_BUFFER points are buffered, the oldest are dropped when the DB can't keep up.
+PRICE_HISTORY = os.getenv("PRICE_HISTORY", "").lower() in ("1", "true")
+PRICE_HISTORY_FLUSH = float(os.getenv("PRICE_HISTORY_FLUSH", "5"))
+PRICE_HISTORY_BUFFER = int(os.getenv("PRICE_HISTORY_BUFFER", "100000"))
+PRICE_HISTORY_COMPACT_EVERY = float(os.getenv("PRICE_HISTORY_COMPACT_EVERY", "300"))
+
+# (seconds per bar, 0 for raw points; seconds kept before moving to the next tier; chunk span)
+HISTORY_TIERS = [
+    (0, float(os.getenv("PRICE_HISTORY_RAW_RETENTION", "86400")), 3600),
+    (60, float(os.getenv("PRICE_HISTORY_MINUTE_RETENTION", "2592000")), 86400),
+    (3600, None, 30 * 86400),
+]
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+NO_BLOCK = -1
+
+
+def parse_interval(interval: str) -> int:
+    """Seconds in an interval like "30s", "1m", "4h" or "1d", ValueError for anything else."""
+    match = re.fullmatch(r"(\d+)([smhd])", interval.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(interval)
+    return int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+
+class Bars(NamedTuple):
+    """Column arrays of a series of OHLC bars, raw points are bars with a count of 1."""
+
+    times: array
+    blocks: array
+    opens: array
+    highs: array
+    lows: array
+    closes: array
+    counts: array
+
+    @classmethod
+    def empty(cls) -> "Bars":
+        return cls(*(array(t) for t in "dqddddq"))
+
+    def extend(self, other: "Bars"):
+        for column, values in zip(self, other):
+            column.extend(values)
+
+    def __len__(self):
+        return len(self.times)
+
+
+def unpack(data, typecode: str) -> array:
+    values = array(typecode)
+    values.frombytes(bytes(data))
+    return values
+
+
+def chunk_bars(chunk: PriceHistoryChunk) -> Bars:
+    """Columns of a chunk, for raw points open, high, low and close are the same array."""
+    times, closes = unpack(chunk.times, "d"), unpack(chunk.closes, "d")
+    if chunk.resolution == 0:
+        return Bars(
+            times,
+            unpack(chunk.blocks, "q"),
+            closes,
+            closes,
+            closes,
+            closes,
+            array("q", [1]) * len(times),
+        )
+    return Bars(
+        times,
+        unpack(chunk.blocks, "q"),
+        unpack(chunk.opens, "d"),
+        unpack(chunk.highs, "d"),
+        unpack(chunk.lows, "d"),
+        closes,
+        unpack(chunk.counts, "q"),
+    )
+
+
+def make_chunk(
+    pair_id: str, exchange_id: str, resolution: int, bars: Bars
+) -> PriceHistoryChunk:
+    """Chunk row holding `bars` (sorted by time), raw chunks only store the closes."""
+    bar_columns = {}
+    if resolution:
+        bar_columns = {
+            "opens": bars.opens.tobytes(),
+            "highs": bars.highs.tobytes(),
+            "lows": bars.lows.tobytes(),
+            "counts": bars.counts.tobytes(),
+        }
+    return PriceHistoryChunk(
+        pair_id=pair_id,
+        exchange_id=exchange_id,
+        resolution=resolution,
+        start=bars.times[0],
+        end=bars.times[-1],
+        count=len(bars),
+        times=bars.times.tobytes(),
+        blocks=bars.blocks.tobytes(),
+        closes=bars.closes.tobytes(),
+        **bar_columns,
+    )
+
+
+def ohlc(
+    bars: Bars,
+    interval: float,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Bars:
+    """
+    Bucket bars into `interval` seconds: first open, highest high, lowest low and last close of
+    every bucket, stamped with the bucket start. Bars outside [start, end] are left out, the
+    input doesn't need to be sorted.
+    """
+    start = -math.inf if start is None else start
+    end = math.inf if end is None else end
+    if numpy is not None:
+        return _ohlc_numpy(bars, interval, start, end)
+    return _ohlc_python(bars, interval, start, end)
+
+
+def _to_array(values, typecode: str) -> array:
+    # array(typecode, bytes) copies the raw buffer, no per element conversion
+    dtype = numpy.float64 if typecode == "d" else numpy.int64
+    return array(typecode, numpy.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+def _ohlc_numpy(bars: Bars, interval: float, start: float, end: float) -> Bars:
+    columns = [
+        numpy.frombuffer(
+            column, dtype=numpy.float64 if column.typecode == "d" else numpy.int64
+        )
+        for column in bars
+    ]
+    times = columns[0]
+    order = numpy.flatnonzero((times >= start) & (times <= end))
+    order = order[numpy.argsort(times[order], kind="stable")]
+    if not len(order):
+        return Bars.empty()
+    times, blocks, opens, highs, lows, closes, counts = (c[order] for c in columns)
+
+    buckets = numpy.floor(times / interval) * interval
+    firsts = numpy.flatnonzero(numpy.r_[True, buckets[1:] != buckets[:-1]])
+    lasts = numpy.r_[firsts[1:], len(times)] - 1
+    return Bars(
+        _to_array(buckets[firsts], "d"),
+        _to_array(blocks[lasts], "q"),
+        _to_array(opens[firsts], "d"),
+        _to_array(numpy.maximum.reduceat(highs, firsts), "d"),
+        _to_array(numpy.minimum.reduceat(lows, firsts), "d"),
+        _to_array(closes[lasts], "d"),
+        _to_array(numpy.add.reduceat(counts, firsts), "q"),
+    )
+
+
+def _ohlc_python(bars: Bars, interval: float, start: float, end: float) -> Bars:
+    result = Bars.empty()
+    current = None
+    for i in sorted(range(len(bars)), key=bars.times.__getitem__):
+        if not start <= bars.times[i] <= end:
+            continue
+        bucket = math.floor(bars.times[i] / interval) * interval
+        if bucket != current:
+            current = bucket
+            result.times.append(bucket)
+            result.blocks.append(bars.blocks[i])
+            result.opens.append(bars.opens[i])
+            result.highs.append(bars.highs[i])
+            result.lows.append(bars.lows[i])
+            result.closes.append(bars.closes[i])
+            result.counts.append(bars.counts[i])
+            continue
+        result.blocks[-1] = bars.blocks[i]
+        result.highs[-1] = max(result.highs[-1], bars.highs[i])
+        result.lows[-1] = min(result.lows[-1], bars.lows[i])
+        result.closes[-1] = bars.closes[i]
+        result.counts[-1] += bars.counts[i]
+    return result
+
+
+def split_by_span(bars: Bars, span: float) -> Iterable[Bars]:
+    """Cut sorted bars into runs falling in the same `span` seconds window."""
+    start = 0
+    for i in range(1, len(bars) + 1):
+        if i == len(bars) or bars.times[i] // span != bars.times[start] // span:
+            yield Bars(*(column[start:i] for column in bars))
+            start = i
+
+
+class HistoryRecorder:
+    """Buffers every price put in the book and bulk writes the buffer from a background thread."""
+
+    def __init__(self, book: PriceCache = price_cache):
+        self.book = book
+        self._buffer = deque(maxlen=PRICE_HISTORY_BUFFER)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_compacted = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def record(self, key: CacheKey, entry: CachedPrice):
+        """Book subscriber, a deque append so it doesn't slow down the request that fetched."""
+        if entry.shared:
+            return  # recorded by the worker that fetched it
+        block = entry.block if entry.block is not None else NO_BLOCK
+        self._buffer.append((key, entry.fetched_at, block, float(entry.price)))
+
+    def pending(self, key: CacheKey) -> List[Tuple[float, float]]:
+        """(time, price) points of a series that are buffered but not written yet."""
+        # list() of a deque runs without giving up the GIL, no lock needed against record()
+        return [(t, price) for k, t, _, price in list(self._buffer) if k == key]
+
+    def flush(self) -> int:
+        """Write out everything buffered, one chunk per (pair, exchange). Returns the point count."""
+        points = []
+        try:
+            while True:
+                points.append(self._buffer.popleft())
+        except IndexError:
+            pass
+        if not points:
+            return 0
+
+        series: Dict[CacheKey, List] = defaultdict(list)
+        for key, fetched_at, block, price in points:
+            series[key].append((fetched_at, block, price))
+        chunks = []
+        for (pair_id, exchange_id), rows in series.items():
+            rows.sort()
+            times, blocks, prices = zip(*rows)
+            closes = array("d", prices)
+            bars = Bars(
+                array("d", times),
+                array("q", blocks),
+                closes,
+                closes,
+                closes,
+                closes,
+                array("q"),
+            )
+            chunks.append(make_chunk(pair_id, exchange_id, 0, bars))
+        PriceHistoryChunk.objects.bulk_create(chunks)
+        return len(points)
+
+    def _run(self):
+        while not self._stop.wait(PRICE_HISTORY_FLUSH):
+            try:
+                self.flush()
+                if time.monotonic() - self.last_compacted > PRICE_HISTORY_COMPACT_EVERY:
+                    self.last_compacted = time.monotonic()
+                    if self.compacts():
+                        compact_history()
+            except Exception as e:
+                # keep recording, a failed write should not end the thread
+                print(f"Error writing price history: {e}")
+            finally:
+                close_old_connections()
+
+    def compacts(self) -> bool:
+        """
+        True when this worker compacts the history: always without a shared book, otherwise
+        while it holds the compaction lease, so the workers don't rewrite the same chunks.
+        """
+        if self.book.shared is None:
+            return True
+        lease = max(3 * PRICE_HISTORY_COMPACT_EVERY, PRICE_BOOK_LEASE)
+        return self.book.shared.acquire("history:compact", lease)
+
+    def start(self):
+        if self.running:
+            return
+        self.book.subscribe(self.record)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="price-history", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.book.unsubscribe(self.record)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+
+history_recorder = HistoryRecorder()
+
+
+def rewrite_chunks(chunk_ids: List[int], resolution: int, span: float) -> int:
+    """
+    Replace chunks by chunks of `resolution` (downsampled when coarser than theirs) of at most
+    `span` seconds each, per (pair, exchange). Returns the number of chunks written.
+
+    The chunks are read and replaced in one transaction. On PostgreSQL their rows are locked
+    first and chunks another transaction holds (or already replaced) are left out, so a chunk is
+    never rewritten twice.
+    """
+    with transaction.atomic():
+        series: Dict[Tuple[str, str], Bars] = defaultdict(Bars.empty)
+        locked = []
+        for chunk in PriceHistoryChunk.objects.select_for_update(
+            skip_locked=True
+        ).filter(id__in=chunk_ids):
+            locked.append(chunk.id)
+            series[(chunk.pair_id, chunk.exchange_id)].extend(chunk_bars(chunk))
+
+        chunks = []
+        for (pair_id, exchange_id), bars in series.items():
+            # raw points stay raw, ohlc over a tiny interval only sorts them
+            bars = ohlc(bars, resolution) if resolution else sort_bars(bars)
+            chunks += [
+                make_chunk(pair_id, exchange_id, resolution, part)
+                for part in split_by_span(bars, span)
+            ]
+        PriceHistoryChunk.objects.filter(id__in=locked).delete()
+        PriceHistoryChunk.objects.bulk_create(chunks)
+    return len(chunks)
+
+
+def sort_bars(bars: Bars) -> Bars:
+    order = sorted(range(len(bars)), key=bars.times.__getitem__)
+    return Bars(
+        *(array(column.typecode, (column[i] for i in order)) for column in bars)
+    )
+
+
+def compact_history(now: Optional[float] = None) -> Dict[str, int]:
+    """
+    Move data past its retention to the next tier and merge the small chunks of closed spans.
+    Returns how many chunks were downsampled and merged.
+    """
+    now = now if now is not None else time.time()
+    stats = {"downsampled": 0, "merged": 0}
+    for tier, (resolution, retention, span) in enumerate(HISTORY_TIERS):
+        if retention is not None:
+            next_resolution, _, next_span = HISTORY_TIERS[tier + 1]
+            expired = list(
+                PriceHistoryChunk.objects.filter(
+                    resolution=resolution, end__lt=now - retention
+                ).values_list("id", flat=True)
+            )
+            if expired:
+                rewrite_chunks(expired, next_resolution, next_span)
+                stats["downsampled"] += len(expired)
+
+        # chunks that ended before the current span are done growing
+        closed = PriceHistoryChunk.objects.filter(
+            resolution=resolution, end__lt=now // span * span
+        ).values_list("id", "pair_id", "exchange_id", "start")
+        groups = defaultdict(list)
+        for chunk_id, pair_id, exchange_id, start in closed:
+            groups[(pair_id, exchange_id, start // span)].append(chunk_id)
+        to_merge = [i for ids in groups.values() if len(ids) > 1 for i in ids]
+        if to_merge:
+            rewrite_chunks(to_merge, resolution, span)
+            stats["merged"] += len(to_merge)
+    return stats
+
+
+def get_history(
+    pair_id: str,
+    interval: int,
+    start: float,
+    end: float,
+    exchange_id: Optional[str] = None,
+) -> Bars:
+    """
+    OHLC buckets of `interval` seconds of a pair between `start` and `end` (unix seconds), from
+    all exchanges or just `exchange_id`. Chunks of every tier overlapping the window are read,
+    data that was already downsampled to bars coarser than the interval comes back at the bar
+    resolution.
+    """
+    chunks = PriceHistoryChunk.objects.filter(
+        pair_id=pair_id, end__gte=start, start__lte=end
+    )
+    if exchange_id:
+        chunks = chunks.filter(exchange_id=exchange_id)
+
+    bars = Bars.empty()
+    for chunk in chunks:
+        bars.extend(chunk_bars(chunk))
+    return ohlc(bars, interval, start, end)
+
+
+def history_twap(
+    pair_id: str,
+    exchange_id: str,
+    start: float,
+    end: float,
+    recorder: Optional[HistoryRecorder] = None,
+) -> Optional[float]:
+    """
+    Time weighted average price of a pair on one exchange from its recorded history, including
+    what the recorder still buffers. None when the history doesn't reach back to `start`.
+    """
+    series = PriceHistoryChunk.objects.filter(pair_id=pair_id, exchange_id=exchange_id)
+    chunks = list(series.filter(start__lte=end, end__gte=start))
+    # the price at the start of the window was recorded before it, in the last chunk ending there
+    before = series.filter(end__lt=start).order_by("-end").first()
+    if before is not None:
+        chunks.append(before)
+
+    points = []
+    for chunk in chunks:
+        bars = chunk_bars(chunk)
+        points += zip(bars.times, bars.closes)
+    points += (recorder or history_recorder).pending((pair_id, exchange_id))
+    if not points:
+        return None
+    points.sort()
+    times, prices = zip(*points)
+    return time_weighted_average(times, prices, start, end)
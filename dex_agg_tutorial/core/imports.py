@@ -0,0 +1,247 @@
+"""
+Bulk pair import.
+
+A file of pairs, a JSON array like tests/sample_pairs.json or one JSON object per line (JSONL), is
+decoded while it is read, so its size doesn't matter. Records are validated, oriented against
+their pools (core/tokens.py, a few batched calls per chunk) and upserted IMPORT_CHUNK_SIZE at a
+time with a single INSERT ... ON CONFLICT (pair_id) DO UPDATE. Existing pairs keep their uid, new
+pairs get a block of uids counted from the highest uid inside the same transaction. When another
+writer takes those uids first the unique constraint rejects the chunk and it is retried.
+"""
+
+import codecs
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import IO, Dict, Iterator, List, Sequence, Set
+
+from django.db import IntegrityError, models, transaction
+
+from .adapters import get_adapters
+from .graph import token_graph
+from .models import Pair
+from .registry import pairs_changed
+from .tokens import DECIMALS_ERROR, orient_pairs
+from .validation import Exchange
+
+# Pairs per upsert (and per orientation batch), and bytes read from the file at a time
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_READ_SIZE = 1 << 16
+# Tries of a chunk whose new uids were taken by a concurrent writer
+UID_ATTEMPTS = 5
+
+# Fields a record can set, uid and inverted_pools are ours to fill in
+PAIR_FIELDS = [
+    "pool_contracts",
+    "base_token",
+    "quote_token",
+    "base_token_decimals",
+    "quote_token_decimals",
+    "active_exchanges",
+]
+
+SEPARATORS = re.compile(r"[\s,\[\]]*")
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    # {"record": index in the file, "pair_id": ..., "error": ...} of every record left out
+    errors: List[Dict] = field(default_factory=list)
+
+    def as_dict(self) -> Dict:
+        return {"created": self.created, "updated": self.updated, "errors": self.errors}
+
+
+def iter_records(stream: IO, read_size: int = IMPORT_READ_SIZE) -> Iterator:
+    """
+    Values of a JSON array or of JSON lines, decoded as the stream is read. The stream can give
+    bytes (UTF-8) or text. Raises ValueError for malformed JSON.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, position, eof = "", 0, False
+    while True:
+        # whatever sits between values: whitespace, commas and the brackets of an array
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Malformed JSON: {e}")
+            else:
+                # a value ending right at the end of the buffer may go on in the next read
+                if end < len(buffer) or eof:
+                    yield value
+                    position = end
+                    continue
+        elif eof:
+            return
+
+        chunk = stream.read(read_size)
+        # a read can end inside a multibyte character and decode to nothing, that's not the end
+        eof = not chunk
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk, final=eof)
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def pair_from_record(record, exchanges: Set[str]) -> Pair:
+    """Unsaved Pair of an import record, raises ValueError when the record isn't usable."""
+    if not isinstance(record, dict):
+        raise ValueError("Record is not an object")
+    for name in ("pair_id", "base_token", "quote_token"):
+        if not isinstance(record.get(name), str) or not record[name]:
+            raise ValueError(f"{name} is required")
+
+    active_exchanges = record.get("active_exchanges", [])
+    pool_contracts = record.get("pool_contracts", {})
+    if not isinstance(active_exchanges, list) or not isinstance(pool_contracts, dict):
+        raise ValueError("active_exchanges must be a list and pool_contracts an object")
+    unknown = sorted(set(active_exchanges).union(pool_contracts) - exchanges)
+    if unknown:
+        raise ValueError(f"Unknown exchanges: {', '.join(unknown)}")
+
+    decimals = {}
+    for name in ("base_token_decimals", "quote_token_decimals"):
+        value = record.get(name)
+        decimals[name] = int(value) if value is not None else None
+
+    pair = Pair(
+        pair_id=record["pair_id"],
+        base_token=record["base_token"],
+        quote_token=record["quote_token"],
+        active_exchanges=active_exchanges,
+        pool_contracts=pool_contracts,
+        **decimals,
+    )
+    for name in ("pair_id", "base_token", "quote_token"):
+        limit = Pair._meta.get_field(name).max_length
+        if len(getattr(pair, name)) > limit:
+            raise ValueError(f"{name} is longer than {limit} characters")
+    return pair
+
+
+def save_pairs(pairs: Sequence[Pair], update_fields: List[str]) -> int:
+    """
+    Upsert pairs by pair_id in one statement, new pairs get the next free uids.
+    Returns the number of pairs that were created.
+    """
+    for attempt in range(UID_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                existing = dict(
+                    Pair.objects.filter(
+                        pair_id__in=[pair.pair_id for pair in pairs]
+                    ).values_list("pair_id", "uid")
+                )
+                next_uid = (
+                    Pair.objects.aggregate(models.Max("uid"))["uid__max"] or 0
+                ) + 1
+                for pair in pairs:
+                    pair.sync_is_active()
+                    if pair.pair_id in existing:
+                        pair.uid = existing[pair.pair_id]
+                    else:
+                        pair.uid, next_uid = next_uid, next_uid + 1
+                Pair.objects.bulk_create(
+                    pairs,
+                    update_conflicts=True,
+                    unique_fields=["pair_id"],
+                    update_fields=[*update_fields, "is_active", "updated_at"],
+                )
+            # bulk_create sends no post_save
+            pairs_changed()
+            return len(pairs) - len(existing)
+        except IntegrityError:
+            if attempt == UID_ATTEMPTS - 1:
+                raise
+    return 0
+
+
+def keep_stored_orientation(pairs: List[Pair]):
+    """
+    Pools whose tokens couldn't be read (RPC down, unreadable pool) keep the orientation stored
+    for them, as long as the record names the same pool. The upsert would reset it otherwise.
+    """
+    stored = {
+        pair_id: (pools, inverted)
+        for pair_id, pools, inverted in Pair.objects.filter(
+            pair_id__in=[pair.pair_id for pair in pairs]
+        ).values_list("pair_id", "pool_contracts", "inverted_pools")
+    }
+    for pair in pairs:
+        pools, inverted = stored.get(pair.pair_id, ({}, {}))
+        kept = {
+            exchange_id: inverted[exchange_id]
+            for exchange_id, address in pair.pool_contracts.items()
+            if exchange_id not in pair.inverted_pools
+            and exchange_id in inverted
+            and pools.get(exchange_id) == address
+        }
+        if kept:
+            pair.inverted_pools = {**kept, **pair.inverted_pools}
+
+
+def import_chunk(pairs: List[Pair], indexes: Dict[str, int], orient: bool, result):
+    """Orient, validate and upsert one chunk of pairs, the last record of a pair_id wins."""
+    pairs = list({pair.pair_id: pair for pair in pairs}.values())
+    if orient:
+        errors = orient_pairs(pairs)
+    else:
+        errors = {
+            pair.pair_id: DECIMALS_ERROR
+            for pair in pairs
+            if None in (pair.base_token_decimals, pair.quote_token_decimals)
+        }
+    for pair_id, error in errors.items():
+        result.errors.append(
+            {"record": indexes[pair_id], "pair_id": pair_id, "error": error}
+        )
+
+    valid = [pair for pair in pairs if pair.pair_id not in errors]
+    if not valid:
+        return
+    # without orienting, keep what earlier imports found out about the pools
+    fields = PAIR_FIELDS
+    if orient:
+        keep_stored_orientation(valid)
+        fields = PAIR_FIELDS + ["inverted_pools"]
+    created = save_pairs(valid, fields)
+    result.created += created
+    result.updated += len(valid) - created
+    for pair in valid:
+        if pair.is_active:
+            token_graph.add_pair(pair)
+
+
+def import_pairs(
+    stream: IO, orient: bool = True, chunk_size: int = IMPORT_CHUNK_SIZE
+) -> ImportResult:
+    """
+    Import the pairs of a JSON or JSONL stream, creating new pairs and updating existing ones.
+    Invalid records are skipped and listed in the result. Malformed JSON stops the import with
+    a ValueError, chunks before it stay imported.
+    """
+    exchanges = set(Exchange.values()) | set(get_adapters())
+    result = ImportResult()
+    chunk: List[Pair] = []
+    indexes: Dict[str, int] = {}
+    for index, record in enumerate(iter_records(stream)):
+        try:
+            pair = pair_from_record(record, exchanges)
+        except (ValueError, TypeError) as e:
+            pair_id = record.get("pair_id") if isinstance(record, dict) else None
+            result.errors.append({"record": index, "pair_id": pair_id, "error": str(e)})
+            continue
+        chunk.append(pair)
+        indexes[pair.pair_id] = index
+        if len(chunk) >= chunk_size:
+            import_chunk(chunk, indexes, orient, result)
+            chunk, indexes = [], {}
+    if chunk:
+        import_chunk(chunk, indexes, orient, result)
+    return result
@@ -0,0 +1,226 @@
+import io
+import random
+from contextlib import redirect_stdout
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from core.adapters import get_adapters
+from core.adapters.hyperion import hyperion_price_from_sqrt
+from core.adapters.uniswap import SQRT_PRICE_BITS, uniswap_price_from_sqrt
+from core.benchmarks import (
+    BENCHMARK_OUTPUT,
+    environ,
+    live_server,
+    load_test,
+    time_calls,
+    write_results,
+)
+from core.cache import price_cache
+from core.clients import get_client, reset_clients
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.fixedpoint import sqrt_prices_to_decimals
+from core.models import Pair
+from core.queries import get_token_price, get_token_prices
+
+
+def fake_pools(count: int, rng: random.Random):
+    """Uniswap and Hyperion pool states and the pairs priced by them."""
+    uniswap, hyperion, pairs = {}, {}, []
+    for i in range(count):
+        uniswap_pool = f"0x{i + 1:040x}"
+        hyperion_pool = f"0x{i + 1:064x}"
+        uniswap[uniswap_pool] = {
+            "sqrt_price_x96": rng.randrange(2**95, 2**97),
+            "liquidity": 10**18,
+        }
+        hyperion[hyperion_pool] = {
+            "sqrt_price": rng.randrange(2**63, 2**65),
+            "liquidity": 10**9,
+            "tick": 0,
+        }
+        pairs.append(
+            Pair(
+                uid=i + 1,
+                pair_id=f"TKN{i}USDC",
+                base_token=f"TKN{i}",
+                quote_token="USDC",
+                base_token_decimals=18,
+                quote_token_decimals=6,
+                active_exchanges=["uniswap", "hyperion"],
+                pool_contracts={"uniswap": uniswap_pool, "hyperion": hyperion_pool},
+            )
+        )
+    return uniswap, hyperion, pairs
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the price math, price queries and the HTTP API against local fake chain "
+        "nodes and append the results to a JSON lines file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pairs", type=int, default=50, help="Pairs to price")
+        parser.add_argument(
+            "--latency", type=float, default=5, help="Milliseconds per RPC request"
+        )
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=0,
+            help="Up to this many extra milliseconds per RPC request",
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0,
+            help="Share of RPC requests (0 to 1) that fail with a 503",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=100, help="Calls per microbenchmark"
+        )
+        parser.add_argument(
+            "--requests", type=int, default=2000, help="HTTP requests per endpoint"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Parallel HTTP connections"
+        )
+        parser.add_argument(
+            "--output", default=BENCHMARK_OUTPUT, help="JSON lines file to append to"
+        )
+        parser.add_argument(
+            "--no-micro", action="store_true", help="Skip the microbenchmarks"
+        )
+        parser.add_argument("--no-load", action="store_true", help="Skip the load test")
+
+    def handle(self, *args, **options):
+        faults = {
+            "latency": options["latency"] / 1000,
+            "jitter": options["jitter"] / 1000,
+            "failure_rate": options["failure_rate"],
+        }
+        uniswap, hyperion, pairs = fake_pools(options["pairs"], random.Random(42))
+        eth = FakeEthereumNode(uniswap, **faults).start()
+        aptos = FakeAptosNode(hyperion, **faults).start()
+        nodes = {"MAINNET_RPC_URL": eth.url, "APTOSMAINNET_RPC_URL": aptos.url}
+
+        # a throwaway database so benchmark pairs never end up next to real ones, and DEBUG off
+        # so the server doesn't record every query it runs
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        reset_clients()
+        # nor benchmark prices in the book other workers share, clearing it between runs
+        # would wipe theirs
+        shared, price_cache.shared = price_cache.shared, None
+        try:
+            with environ(nodes), override_settings(
+                DEBUG=False, ALLOWED_HOSTS=["127.0.0.1"]
+            ), redirect_stdout(io.StringIO()):
+                for pair in pairs:
+                    pair.sync_is_active()
+                Pair.objects.bulk_create(pairs)
+                results = {
+                    "micro": {} if options["no_micro"] else self.micro(pairs, options),
+                    "load": {} if options["no_load"] else self.load(pairs, options),
+                }
+        finally:
+            reset_clients()
+            price_cache.clear()
+            price_cache.shared = shared
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            eth.stop()
+            aptos.stop()
+
+        results["settings"] = {
+            name: options[name]
+            for name in [
+                "pairs",
+                "latency",
+                "jitter",
+                "failure_rate",
+                "repeat",
+                "requests",
+                "concurrency",
+            ]
+        }
+        results["rpc"] = {
+            "ethereum": {"requests": eth.requests, "failures": eth.failures},
+            "aptos": {"requests": aptos.requests, "failures": aptos.failures},
+        }
+        write_results(options["output"], results)
+        self.report(results)
+        self.stdout.write(f"Results appended to {options['output']}")
+
+    def micro(self, pairs, options):
+        repeat = options["repeat"]
+        pair = pairs[0]
+        sqrt_prices = [2**96 + i for i in range(len(pairs))]
+        results = {
+            "uniswap_price_from_sqrt": time_calls(
+                lambda: uniswap_price_from_sqrt(pair, 2**96), repeat
+            ),
+            "hyperion_price_from_sqrt": time_calls(
+                lambda: hyperion_price_from_sqrt(pair, 2**64), repeat
+            ),
+            f"sqrt_prices_to_decimals[{len(pairs)}]": time_calls(
+                lambda: sqrt_prices_to_decimals(sqrt_prices, SQRT_PRICE_BITS, 18, 6),
+                repeat,
+            ),
+        }
+        for exchange_id, adapter in get_adapters().items():
+            client = get_client(adapter.network)
+            results[f"{exchange_id}.fetch_one"] = time_calls(
+                lambda: adapter.fetch_one(pair, client), repeat
+            )
+            results[f"{exchange_id}.fetch_many[{len(pairs)}]"] = time_calls(
+                lambda: adapter.fetch_many(pairs, client), repeat
+            )
+
+        def cold(query):
+            price_cache.clear()
+            return query()
+
+        results["get_token_price (cold)"] = time_calls(
+            lambda: cold(lambda: get_token_price(pair)), repeat
+        )
+        results["get_token_price (warm)"] = time_calls(
+            lambda: get_token_price(pair), repeat
+        )
+        results[f"get_token_prices[{len(pairs)}] (cold)"] = time_calls(
+            lambda: cold(lambda: get_token_prices([p.pair_id for p in pairs])), repeat
+        )
+        return results
+
+    def load(self, pairs, options):
+        price_cache.clear()
+        with live_server() as url:
+            return {
+                "/pairs/": load_test(
+                    url, ["/pairs/"], options["requests"], options["concurrency"]
+                ),
+                "/price/": load_test(
+                    url,
+                    [f"/price/{pair.pair_id}/" for pair in pairs],
+                    options["requests"],
+                    options["concurrency"],
+                ),
+            }
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'benchmark':<36} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>8}"
+        )
+        for group in ("micro", "load"):
+            for name, summary in results[group].items():
+                self.stdout.write(
+                    f"{name:<36} {summary['count']:>6} {summary['p50_ms']:>9.3f}"
+                    f" {summary['p99_ms']:>9.3f} {summary['max_ms']:>9.3f}"
+                    f" {summary.get('throughput', ''):>8}"
+                )
+                if summary.get("errors"):
+                    self.stdout.write(
+                        f"  {summary['errors']} errors: {summary['status']}"
+                    )
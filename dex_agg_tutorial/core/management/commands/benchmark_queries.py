@@ -0,0 +1,118 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.benchmarks import BENCHMARK_OUTPUT, time_calls, write_results
+from core.models import Pair
+from core.registry import PairRegistry
+
+EXCHANGES = ["uniswap", "hyperion"]
+
+
+def synthetic_pairs(count: int, rng: random.Random):
+    """Pairs like imported ones, a tenth of them listed nowhere and so inactive."""
+    for i in range(count):
+        exchanges = [e for e in EXCHANGES if rng.random() < 0.6]
+        if i % 10 == 0:
+            exchanges = []
+        pair = Pair(
+            uid=i + 1,
+            pair_id=f"TKN{i}USDC",
+            base_token=f"TKN{i}",
+            quote_token="USDC",
+            active_exchanges=exchanges,
+            pool_contracts={e: f"0x{i + 1:040x}" for e in exchanges},
+        )
+        pair.sync_is_active()
+        yield pair
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the pair queries against a throwaway database filled with synthetic pairs, "
+        "show their query plans and append the results to a JSON lines file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pairs", type=int, default=100_000, help="Pairs to create"
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Calls per query")
+        parser.add_argument(
+            "--output", default=BENCHMARK_OUTPUT, help="JSON lines file to append to"
+        )
+        parser.add_argument(
+            "--explain", action="store_true", help="Print the query plans"
+        )
+
+    def handle(self, *args, **options):
+        # run against whatever DATABASE_ENGINE selects, in its own database so the benchmark
+        # pairs never end up next to real ones
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            pairs = synthetic_pairs(options["pairs"], random.Random(42))
+            batch = []
+            for pair in pairs:
+                batch.append(pair)
+                if len(batch) == 5000:
+                    Pair.objects.bulk_create(batch)
+                    batch = []
+            Pair.objects.bulk_create(batch)
+            # fresh statistics, so the planner knows how few pairs are inactive
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Pair._meta.db_table}")
+            results, plans = self.queries(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results = {
+            "queries": results,
+            "settings": {
+                "pairs": options["pairs"],
+                "repeat": options["repeat"],
+                "database": connection.vendor,
+            },
+        }
+        write_results(options["output"], results)
+        self.report(results)
+        if options["explain"]:
+            for name, plan in plans.items():
+                self.stdout.write(f"\n{name}\n{plan}")
+        self.stdout.write(f"Results appended to {options['output']}")
+
+    def queries(self, options):
+        repeat = options["repeat"]
+        middle = f"TKN{options['pairs'] // 2 + 1}USDC"
+        querysets = {
+            "get pair_id": Pair.objects.filter(pair_id=middle),
+            "count active": Pair.objects.active().order_by(),
+            "first 100 active": Pair.objects.active()[:100],
+        }
+        results = {
+            "get pair_id": time_calls(lambda: Pair.objects.get(pair_id=middle), repeat),
+            "count active": time_calls(lambda: Pair.objects.active().count(), repeat),
+            "first 100 active": time_calls(
+                lambda: list(Pair.objects.active()[:100]), repeat
+            ),
+        }
+
+        # what a worker pays once to load the registry, and per pair afterwards
+        registry = PairRegistry(ttl=3600)
+        results["registry load"] = time_calls(registry.load, max(repeat // 10, 1))
+        results["registry get"] = time_calls(lambda: registry.get(middle), repeat)
+
+        plans = {name: queryset.explain() for name, queryset in querysets.items()}
+        return results, plans
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'query':<24} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+        )
+        for name, summary in results["queries"].items():
+            self.stdout.write(
+                f"{name:<24} {summary['count']:>6} {summary['p50_ms']:>9.3f}"
+                f" {summary['p99_ms']:>9.3f} {summary['max_ms']:>9.3f}"
+            )
@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.routing import ROUTE_GRANULARITY, split_route
+from core.swapmath import PoolLiquidity, sqrt_ratio_at_tick
+
+
+def synthetic_pool(rng: random.Random, positions: int = 50) -> PoolLiquidity:
+    """Pool around price 1 with `positions` random liquidity positions, like a busy mainnet pool."""
+    spacing = 60
+    ticks = {}
+    liquidity = 0
+    for _ in range(positions):
+        lower = rng.randrange(-200, 0) * spacing
+        upper = rng.randrange(1, 200) * spacing
+        amount = rng.randrange(10**18, 10**20)
+        ticks[lower] = ticks.get(lower, 0) + amount
+        ticks[upper] = ticks.get(upper, 0) - amount
+        liquidity += amount  # every position contains tick 0
+    tick = rng.randrange(-30, 30)
+    return PoolLiquidity(
+        sqrt_price=sqrt_ratio_at_tick(tick),
+        tick=tick,
+        liquidity=liquidity,
+        fee=rng.choice([500, 3000, 10000]),
+        tick_spacing=spacing,
+        ticks=ticks,
+        tick_range=(-256 * 256 * spacing, 256 * 256 * spacing - 1),
+    )
+
+
+class Command(BaseCommand):
+    help = "Time the split route solver from cached pool state for growing venue counts and order sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--granularity",
+            type=int,
+            default=ROUTE_GRANULARITY,
+            help="Number of slices an order is cut into",
+        )
+        parser.add_argument(
+            "--venues",
+            type=int,
+            nargs="+",
+            default=[1, 2, 4, 8, 16],
+            help="Numbers of pools to split over",
+        )
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[17, 19, 21],
+            help="Order sizes as powers of ten in raw token units",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Solves per measurement"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        pools = {f"pool{i}": synthetic_pool(rng) for i in range(max(options["venues"]))}
+
+        self.stdout.write(
+            f"{'venues':>6} {'size':>6} {'median ms':>10} {'max ms':>8} {'pools used':>10}"
+        )
+        for venues in options["venues"]:
+            subset = dict(list(pools.items())[:venues])
+            for size in options["sizes"]:
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    route = split_route(
+                        subset, 10**size, True, granularity=options["granularity"]
+                    )
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f"{venues:>6} {'1e' + str(size):>6} {statistics.median(timings):>10.3f}"
+                    f" {max(timings):>8.3f} {len(route.amounts_in):>10}"
+                )
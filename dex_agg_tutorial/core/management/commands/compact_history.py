@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.history import compact_history
+from core.models import PriceHistoryChunk
+
+
+class Command(BaseCommand):
+    help = "Merge small price history chunks and downsample history past its retention"
+
+    def handle(self, *args, **options):
+        before = PriceHistoryChunk.objects.count()
+        stats = compact_history()
+        self.stdout.write(
+            f"Downsampled {stats['downsampled']} and merged {stats['merged']} chunks,"
+            f" {before} chunks before, {PriceHistoryChunk.objects.count()} after"
+        )
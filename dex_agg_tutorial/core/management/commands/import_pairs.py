@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import IMPORT_CHUNK_SIZE, import_pairs
+
+
+class Command(BaseCommand):
+    help = "Create or update pairs from a JSON array or JSON lines file, - reads stdin"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File of pairs like tests/sample_pairs.json")
+        parser.add_argument(
+            "--no-orient",
+            action="store_true",
+            help="Don't read pool tokens from chain, decimals must be in the file",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help="Pairs per upsert",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        try:
+            result = import_pairs(
+                stream,
+                orient=not options["no_orient"],
+                chunk_size=options["chunk_size"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        for error in result.errors:
+            self.stderr.write(
+                f"record {error['record']} ({error['pair_id']}): {error['error']}"
+            )
+        self.stdout.write(
+            f"Created {result.created} pairs, updated {result.updated},"
+            f" {len(result.errors)} errors"
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Pair
+from core.tokens import orient_pairs
+
+
+class Command(BaseCommand):
+    help = "Read the pool tokens of existing pairs and store which pools are inverted"
+
+    def handle(self, *args, **options):
+        pairs = list(Pair.objects.all())
+        errors = orient_pairs(pairs)
+        oriented = [pair for pair in pairs if pair.pair_id not in errors]
+        # bulk_update leaves auto_now alone, the running servers see the change through it
+        now = timezone.now()
+        for pair in oriented:
+            pair.updated_at = now
+        Pair.objects.bulk_update(oriented, ["inverted_pools", "updated_at"])
+
+        for pair_id, error in errors.items():
+            self.stderr.write(f"{pair_id}: {error}")
+        inverted = sum(any(pair.inverted_pools.values()) for pair in oriented)
+        self.stdout.write(
+            f"Oriented {len(oriented)} pairs, {inverted} with inverted pools,"
+            f" {len(errors)} errors"
+        )
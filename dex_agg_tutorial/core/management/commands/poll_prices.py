@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.history import PRICE_HISTORY, history_recorder
+from core.poller import price_poller
+
+
+class Command(BaseCommand):
+    help = "Refresh the price book for all active pairs and exchanges and show how stale every price is"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Do a single refresh pass and exit"
+        )
+        parser.add_argument(
+            "--report-every",
+            type=float,
+            default=10,
+            help="Seconds between two staleness reports while polling",
+        )
+
+    def handle(self, *args, **options):
+        # record what is polled with PRICE_HISTORY=1, like the servers do
+        if PRICE_HISTORY:
+            history_recorder.start()
+        try:
+            if options["once"]:
+                price_poller.refresh_all()
+                self.report()
+                return
+
+            price_poller.start()
+            self.stdout.write("Polling prices, press CTRL+C to stop")
+            try:
+                while True:
+                    time.sleep(options["report_every"])
+                    self.report()
+            except KeyboardInterrupt:
+                price_poller.stop()
+        finally:
+            if history_recorder.running:
+                history_recorder.stop()
+
+    def report(self):
+        for (pair_id, exchange_id), entry in sorted(
+            price_poller.book.snapshot().items()
+        ):
+            self.stdout.write(
+                f"{pair_id:<12} {exchange_id:<10} {entry.price:<24} {entry.age:.1f}s old"
+            )
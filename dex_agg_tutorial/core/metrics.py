@@ -0,0 +1,327 @@
+"""
+Counters and latency histograms of the hot path, served on /metrics in the Prometheus text format.
+
+    dexagg_stage_duration_seconds{stage}              db lookup, upstream (all exchanges of a
+                                                      request), price math, serialization
+    dexagg_exchange_duration_seconds{exchange,network} one price query of an exchange
+    dexagg_exchange_errors_total{exchange,network}    queries that gave no price
+    dexagg_rpc_duration_seconds{network,endpoint}     every HTTP request to an RPC provider
+    dexagg_rpc_errors_total{network,endpoint}         failed RPC requests (5xx, 429, no answer)
+    dexagg_rpc_retries_total{network}                 requests sent again after a failure
+    dexagg_rpc_hedges_total{network}                  requests also sent to a second endpoint
+    dexagg_rpc_breaker_opens_total{network}           endpoints taken out by their breaker
+    dexagg_cache_requests_total{exchange,result}      price cache hits and misses
+    dexagg_http_request_duration_seconds{view,status} requests to our own API
+
+Metrics live in the process, like the price cache, every worker serves its own. With
+SERVER_TIMING=1 responses also carry a Server-Timing header with the stages of that request,
+and the exchanges it waited on, so a browser or curl shows where the time went.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Seconds, from price math (microseconds) to a stuck RPC provider
+BUCKETS = (
+    0.00001,
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in values
+    )
+    return (
+        "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+    )
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], LabelValues, float]]:
+        """(name suffix, label names, label values, value) of every series."""
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{format_labels(names, values)} {value:.10g}"
+            )
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield "", self.labels, key, value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # per series: observations per bucket (the last one is +Inf), sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), total[0]))
+                for key, (counts, total) in self._series.items()
+            )
+        names = self.labels + ("le",)
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield "_bucket", names, key + (le,), cumulative
+            yield "_sum", self.labels, key, total
+            yield "_count", self.labels, key, cumulative
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.extend(runtime_gauges())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self.metrics:
+            metric.reset()
+
+
+registry = Registry()
+
+STAGE_SECONDS = Histogram(
+    "dexagg_stage_duration_seconds",
+    "Time spent per stage of a price request",
+    ["stage"],
+)
+EXCHANGE_SECONDS = Histogram(
+    "dexagg_exchange_duration_seconds",
+    "Duration of price queries per exchange",
+    ["exchange", "network"],
+)
+EXCHANGE_ERRORS = Counter(
+    "dexagg_exchange_errors_total",
+    "Price queries that gave no price",
+    ["exchange", "network"],
+)
+RPC_SECONDS = Histogram(
+    "dexagg_rpc_duration_seconds",
+    "Duration of HTTP requests to the RPC provider",
+    ["network", "endpoint"],
+)
+RPC_ERRORS = Counter(
+    "dexagg_rpc_errors_total",
+    "RPC requests that failed or were answered with 429 or 5xx",
+    ["network", "endpoint"],
+)
+RPC_RETRIES = Counter(
+    "dexagg_rpc_retries_total",
+    "RPC requests sent again after a failure",
+    ["network"],
+)
+RPC_HEDGES = Counter(
+    "dexagg_rpc_hedges_total",
+    "RPC requests also sent to a second endpoint because the first was slow",
+    ["network"],
+)
+RPC_BREAKER_OPENS = Counter(
+    "dexagg_rpc_breaker_opens_total",
+    "RPC endpoints taken out of rotation by their circuit breaker",
+    ["network"],
+)
+CACHE_REQUESTS = Counter(
+    "dexagg_cache_requests_total",
+    "Price cache lookups by result (hit or miss)",
+    ["exchange", "result"],
+)
+HTTP_SECONDS = Histogram(
+    "dexagg_http_request_duration_seconds",
+    "Duration of requests to the API",
+    ["view", "status"],
+)
+
+
+def runtime_gauges() -> List[str]:
+    """Current connection pool, price cache and stream state, read when the metrics are scraped."""
+    from .cache import price_cache
+    from .clients import client_stats
+    from .stream import price_broadcaster
+
+    lines = []
+    for name, key, help in [
+        ("dexagg_rpc_in_flight", "in_flight", "RPC requests in flight"),
+        ("dexagg_rpc_peak_in_flight", "peak_in_flight", "Most RPC requests in flight"),
+        (
+            "dexagg_rpc_pool_saturated_total",
+            "saturated",
+            "RPC requests sent while the connection pool was full",
+        ),
+    ]:
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        for network, stats in sorted(client_stats().items()):
+            lines.append(f'{name}{{network="{network}"}} {stats[key]}')
+    for key, value in price_cache.stats().items():
+        name = f"dexagg_price_cache_{key}"
+        kind = "gauge" if key == "entries" else "counter"
+        if kind == "counter":
+            name += "_total"
+        lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+    lines += [
+        "# TYPE dexagg_stream_subscribers gauge",
+        f"dexagg_stream_subscribers {price_broadcaster.subscribers}",
+    ]
+    return lines
+
+
+# Durations of the request being served, in seconds per stage, only set with SERVER_TIMING.
+# Worker threads of a request get the same dict through their copied context.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+_timings_lock = threading.Lock()
+
+
+def record_timing(name: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    record_timing(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def observe_exchange(exchange_id: str, network: str, seconds: float, failed: bool):
+    """One upstream price query of an exchange (a single pair or a batch)."""
+    EXCHANGE_SECONDS.observe(seconds, exchange=exchange_id, network=network)
+    if failed:
+        EXCHANGE_ERRORS.inc(exchange=exchange_id, network=network)
+    record_timing(exchange_id, seconds)
+
+
+def start_request_timing():
+    """Collect Server-Timing for the current request, returns a token for stop_request_timing."""
+    return _request_timings.set({}) if SERVER_TIMING else None
+
+
+def stop_request_timing(token) -> Optional[str]:
+    """Server-Timing header value of the request, None when not collected."""
+    if token is None:
+        return None
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items()
+    )
@@ -0,0 +1,39 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import HTTP_SECONDS, start_request_timing, stop_request_timing
+
+
+def finish_request(request, response, started: float, token):
+    """Record the request duration and add the Server-Timing header when it is collected."""
+    elapsed = time.perf_counter() - started
+    match = getattr(request, "resolver_match", None)
+    view = match.url_name if match is not None and match.url_name else "unmatched"
+    HTTP_SECONDS.observe(elapsed, view=view, status=response.status_code)
+    timing = stop_request_timing(token)
+    if timing is not None:
+        total = f"total;dur={elapsed * 1000:.3f}"
+        response["Server-Timing"] = f"{timing}, {total}" if timing else total
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Time every request per view, works for the sync and the async views."""
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            started, token = time.perf_counter(), start_request_timing()
+            response = await get_response(request)
+            return finish_request(request, response, started, token)
+
+    else:
+
+        def middleware(request):
+            started, token = time.perf_counter(), start_request_timing()
+            response = get_response(request)
+            return finish_request(request, response, started, token)
+
+    return middleware
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceHistoryChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pair_id", models.CharField(max_length=40)),
+                ("exchange_id", models.CharField(max_length=20)),
+                ("resolution", models.IntegerField(default=0)),
+                ("start", models.FloatField(help_text="Unix time of the first point")),
+                ("end", models.FloatField(help_text="Unix time of the last point")),
+                (
+                    "count",
+                    models.IntegerField(
+                        help_text="Number of points (or bars) in the chunk"
+                    ),
+                ),
+                ("times", models.BinaryField()),
+                ("blocks", models.BinaryField()),
+                (
+                    "closes",
+                    models.BinaryField(
+                        help_text="Prices of raw points, closes of bars"
+                    ),
+                ),
+                ("opens", models.BinaryField(blank=True, default=b"")),
+                ("highs", models.BinaryField(blank=True, default=b"")),
+                ("lows", models.BinaryField(blank=True, default=b"")),
+                ("counts", models.BinaryField(blank=True, default=b"")),
+            ],
+            options={
+                "ordering": ["start"],
+                "indexes": [
+                    models.Index(
+                        fields=["pair_id", "resolution", "end"],
+                        name="core_priceh_pair_id_9c3462_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_price_history"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pair",
+            name="inverted_pools",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Mapping of exchange IDs to True when the pool holds the base token as token1",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Token",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("network", models.CharField(max_length=20)),
+                ("address", models.CharField(max_length=66)),
+                ("symbol", models.CharField(max_length=32)),
+                ("decimals", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["network", "symbol"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("network", "address"), name="unique_token_address"
+                    )
+                ],
+            },
+        ),
+    ]
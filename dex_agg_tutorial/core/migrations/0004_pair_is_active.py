@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:53
+
+from django.db import migrations, models
+
+
+def fill_is_active(apps, schema_editor):
+    Pair = apps.get_model("core", "Pair")
+    Pair.objects.exclude(active_exchanges=[]).update(is_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_tokens"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pair",
+            name="is_active",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(fill_is_active, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="pair",
+            index=models.Index(
+                fields=["is_active", "uid"], name="core_pair_active_uid_idx"
+            ),
+        ),
+    ]
@@ -1,6 +1,12 @@
 from django.db import models
 
 
+class PairQuerySet(models.QuerySet):
+    def active(self):
+        """Pairs with at least one exchange, an index scan on is_active."""
+        return self.filter(is_active=True)
+
+
 class Pair(models.Model):
     """Model representing a token pair."""
 
@@ -20,18 +26,98 @@ class Pair(models.Model):
         blank=True,
         help_text="List of exchange IDs where this pair is active",
     )
+    inverted_pools = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Mapping of exchange IDs to True when the pool holds the base token as token1",
+    )
+    # A pair is considered active if it has at least one exchange. Stored so listing the
+    # active pairs doesn't have to look into every JSON array, save() keeps it in sync.
+    is_active = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PairQuerySet.as_manager()
+
     # make it so the model orders the pairs by uid for consistent data requests.
     class Meta:
         ordering = ["uid"]
+        indexes = [
+            models.Index(fields=["is_active", "uid"], name="core_pair_active_uid_idx"),
+        ]
 
     def __str__(self):
         return self.pair_id
 
-    # Small QOL item so we can call a pair and immediately check if its active
-    @property
-    def is_active(self):
-        """A pair is considered active if it has at least one exchange."""
-        return len(self.active_exchanges) > 0
+    def save(self, *args, **kwargs):
+        self.sync_is_active()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "active_exchanges" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "is_active"}
+        super().save(*args, **kwargs)
+
+    def sync_is_active(self):
+        """Set is_active from active_exchanges, bulk writes have to call this themselves."""
+        self.is_active = len(self.active_exchanges) > 0
+
+    def is_inverted(self, exchange_id: str) -> bool:
+        """True when the exchange's pool prices the quote token in base tokens, see core/tokens.py."""
+        return bool(self.inverted_pools.get(exchange_id, False))
+
+
+class Token(models.Model):
+    """
+    A token as read from its chain, stored once so pairs can be oriented and their decimals
+    filled in without asking the chain again. `address` is checksummed (EVM) or long form (Aptos).
+    """
+
+    network = models.CharField(max_length=20)
+    address = models.CharField(max_length=66)
+    symbol = models.CharField(max_length=32)
+    decimals = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["network", "symbol"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["network", "address"], name="unique_token_address"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} ({self.network})"
+
+
+class PriceHistoryChunk(models.Model):
+    """
+    A run of price points (or OHLC bars) of one pair on one exchange.
+
+    Points are stored column wise as packed float64/int64 arrays (see core/history.py), so a
+    chunk of thousands of points is a single row. `resolution` is 0 for raw points, or the
+    number of seconds per bar for downsampled chunks.
+    """
+
+    pair_id = models.CharField(max_length=40)
+    exchange_id = models.CharField(max_length=20)
+    resolution = models.IntegerField(default=0)
+    start = models.FloatField(help_text="Unix time of the first point")
+    end = models.FloatField(help_text="Unix time of the last point")
+    count = models.IntegerField(help_text="Number of points (or bars) in the chunk")
+    times = models.BinaryField()
+    blocks = models.BinaryField()
+    closes = models.BinaryField(help_text="Prices of raw points, closes of bars")
+    # only filled for bars, for raw points open, high and low are the price and count is 1
+    opens = models.BinaryField(blank=True, default=b"")
+    highs = models.BinaryField(blank=True, default=b"")
+    lows = models.BinaryField(blank=True, default=b"")
+    counts = models.BinaryField(blank=True, default=b"")
+
+    class Meta:
+        ordering = ["start"]
+        indexes = [
+            models.Index(fields=["pair_id", "resolution", "end"]),
+        ]
+
+    def __str__(self):
+        return f"{self.pair_id} {self.exchange_id} {self.resolution}s x{self.count}"
@@ -0,0 +1,320 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+
+from .contracts import UNISWAP_POOL_ABI, get_multicall_contract, output_types
+from .swapmath import MAX_TICK, MIN_TICK, PoolLiquidity
+
+# Upper bound of pools packed into one eth_call, RPC providers cap the gas and size of a call
+MULTICALL_BATCH_SIZE = int(os.getenv("MULTICALL_BATCH_SIZE", "200"))
+
+# Calldata of a function without arguments is just its 4 byte selector, the same for every pool
+SLOT0_CALL = function_signature_to_4byte_selector("slot0()")
+LIQUIDITY_CALL = function_signature_to_4byte_selector("liquidity()")
+FEE_CALL = function_signature_to_4byte_selector("fee()")
+TICK_SPACING_CALL = function_signature_to_4byte_selector("tickSpacing()")
+TICK_BITMAP_SELECTOR = function_signature_to_4byte_selector("tickBitmap(int16)")
+TICKS_SELECTOR = function_signature_to_4byte_selector("ticks(int24)")
+TOKEN0_CALL = function_signature_to_4byte_selector("token0()")
+TOKEN1_CALL = function_signature_to_4byte_selector("token1()")
+SYMBOL_CALL = function_signature_to_4byte_selector("symbol()")
+DECIMALS_CALL = function_signature_to_4byte_selector("decimals()")
+OBSERVE_SELECTOR = function_signature_to_4byte_selector("observe(uint32[])")
+# Multicall3 helpers, reading them in the same aggregate3 tells which block the other calls saw
+BLOCK_NUMBER_CALL = function_signature_to_4byte_selector("getBlockNumber()")
+BLOCK_TIMESTAMP_CALL = function_signature_to_4byte_selector(
+    "getCurrentBlockTimestamp()"
+)
+SLOT0_TYPES = output_types(UNISWAP_POOL_ABI, "slot0")
+LIQUIDITY_TYPES = output_types(UNISWAP_POOL_ABI, "liquidity")
+TICKS_TYPES = output_types(UNISWAP_POOL_ABI, "ticks")
+OBSERVE_TYPES = output_types(UNISWAP_POOL_ABI, "observe")
+
+# tickBitmap words (256 ticks * tickSpacing each) read on both sides of the current price for quotes
+QUOTE_TICK_WORDS = int(os.getenv("QUOTE_TICK_WORDS", "2"))
+
+
+@dataclass(frozen=True)
+class UniswapPoolState:
+    """The parts of a Uniswap V3 pool's state we read for pricing."""
+
+    sqrt_price_x96: int
+    tick: int
+    liquidity: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class UniswapObservations:
+    """Tick cumulatives of a pool's oracle and the block (number, timestamp) they were read at."""
+
+    tick_cumulatives: Tuple[int, ...]
+    block: int
+    timestamp: int
+
+
+def chunked(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def read_uniswap_pools(
+    web3: Web3,
+    pool_addresses: Iterable[str],
+    with_liquidity: bool = False,
+    batch_size: int = MULTICALL_BATCH_SIZE,
+) -> Dict[str, Optional[UniswapPoolState]]:
+    """
+    Read slot0 (and optionally liquidity) of many Uniswap pools through Multicall3's aggregate3.
+
+    Hundreds of pools cost a single eth_call instead of one per pool. Every sub call is allowed
+    to fail on its own, a broken or non-existing pool comes back as None without affecting the
+    other pools. A failing batch (RPC error) is raised to the caller.
+    Results are keyed by checksum address.
+    """
+    addresses = list(dict.fromkeys(Web3.to_checksum_address(a) for a in pool_addresses))
+    calls = []
+    for address in addresses:
+        calls.append((address, SLOT0_CALL))
+        if with_liquidity:
+            calls.append((address, LIQUIDITY_CALL))
+
+    results = aggregate(web3, calls, batch_size)
+    calls_per_pool = 2 if with_liquidity else 1
+    return {
+        address: decode_pool_state(
+            web3, results[index * calls_per_pool : (index + 1) * calls_per_pool]
+        )
+        for index, address in enumerate(addresses)
+    }
+
+
+def aggregate(
+    web3: Web3,
+    calls: List[Tuple[str, bytes]],
+    batch_size: int = MULTICALL_BATCH_SIZE,
+    block_identifier="latest",
+) -> List[Tuple[bool, bytes]]:
+    """
+    Send (target, calldata) calls through Multicall3's aggregate3, `batch_size` calls per eth_call.
+    Returns (success, returnData) per call in the same order, every call may fail on its own.
+    `block_identifier` pins the calls to a block, like for Contract calls.
+    """
+    multicall = get_multicall_contract(web3)
+    results: List[Tuple[bool, bytes]] = []
+    for batch in chunked(calls, max(batch_size, 1)):
+        results.extend(
+            multicall.functions.aggregate3(
+                [(target, True, data) for target, data in batch]
+            ).call(block_identifier=block_identifier)
+        )
+    return results
+
+
+def decode_pool_state(web3: Web3, results: List) -> Optional[UniswapPoolState]:
+    """Turn the (success, returnData) results of one pool into its state, None if any call failed."""
+    try:
+        (slot0_ok, slot0_data), *rest = results
+        if not slot0_ok:
+            return None
+        slot0 = web3.codec.decode(SLOT0_TYPES, slot0_data)
+        liquidity = None
+        if rest:
+            liquidity_ok, liquidity_data = rest[0]
+            if not liquidity_ok:
+                return None
+            liquidity = web3.codec.decode(LIQUIDITY_TYPES, liquidity_data)[0]
+        return UniswapPoolState(int(slot0[0]), int(slot0[1]), liquidity)
+    except Exception as e:  # e.g. an address without code returns empty data
+        print(f"Error decoding Uniswap pool state: {e}")
+        return None
+
+
+def tick_word(tick: int, tick_spacing: int) -> int:
+    """Position of the tickBitmap word that holds a tick (TickBitmap.position)."""
+    return (tick // tick_spacing) >> 8
+
+
+def read_uniswap_liquidity(
+    web3: Web3,
+    pool_address: str,
+    previous: Optional[PoolLiquidity] = None,
+    tick_words: int = QUOTE_TICK_WORDS,
+    block_identifier="latest",
+) -> PoolLiquidity:
+    """
+    Read what a swap simulation needs of a Uniswap pool: price, in-range liquidity, fee and the
+    initialized ticks within `tick_words` bitmap words of the current price.
+
+    With a `previous` snapshot of the same pool the refresh is incremental: fee and tick spacing
+    never change, and ticks are only read for bitmap words that weren't loaded yet (the price moved).
+    Without it that costs three eth_calls: pool state, bitmap words, and the initialized ticks.
+    All of them read the state as of `block_identifier`.
+    """
+    address = Web3.to_checksum_address(pool_address)
+    calls = [(address, SLOT0_CALL), (address, LIQUIDITY_CALL)]
+    if previous is None:
+        calls += [(address, FEE_CALL), (address, TICK_SPACING_CALL)]
+    results = aggregate(web3, calls, block_identifier=block_identifier)
+    if not all(ok for ok, _ in results):
+        raise ValueError(f"Could not read the state of pool {address}")
+
+    slot0 = web3.codec.decode(SLOT0_TYPES, results[0][1])
+    liquidity = web3.codec.decode(LIQUIDITY_TYPES, results[1][1])[0]
+    if previous is None:
+        fee = web3.codec.decode(["uint24"], results[2][1])[0]
+        tick_spacing = web3.codec.decode(["int24"], results[3][1])[0]
+    else:
+        fee, tick_spacing = previous.fee, previous.tick_spacing
+    tick = int(slot0[1])
+
+    # Keep the words (and their ticks) of the previous snapshot that are still in the window
+    current_word = tick_word(tick, tick_spacing)
+    window = range(current_word - tick_words, current_word + tick_words + 1)
+    words = {
+        w: bitmap
+        for w, bitmap in (previous.words if previous else {}).items()
+        if w in window
+    }
+    ticks = {
+        t: net
+        for t, net in (previous.ticks if previous else {}).items()
+        if tick_word(t, tick_spacing) in words
+    }
+    missing = [w for w in window if w not in words]
+
+    if missing:
+        bitmaps = aggregate(
+            web3,
+            [
+                (address, TICK_BITMAP_SELECTOR + web3.codec.encode(["int16"], [w]))
+                for w in missing
+            ],
+            block_identifier=block_identifier,
+        )
+        new_ticks = []
+        for w, (ok, data) in zip(missing, bitmaps):
+            bitmap = web3.codec.decode(["uint256"], data)[0] if ok else 0
+            words[w] = bitmap
+            new_ticks += [
+                ((w << 8) + bit) * tick_spacing
+                for bit in range(256)
+                if bitmap >> bit & 1
+            ]
+        if new_ticks:
+            tick_results = aggregate(
+                web3,
+                [
+                    (address, TICKS_SELECTOR + web3.codec.encode(["int24"], [t]))
+                    for t in new_ticks
+                ],
+                block_identifier=block_identifier,
+            )
+            for t, (ok, data) in zip(new_ticks, tick_results):
+                if ok:
+                    ticks[t] = web3.codec.decode(TICKS_TYPES, data)[1]  # liquidityNet
+
+    return PoolLiquidity(
+        sqrt_price=int(slot0[0]),
+        tick=tick,
+        liquidity=int(liquidity),
+        fee=int(fee),
+        tick_spacing=int(tick_spacing),
+        ticks=ticks,
+        tick_range=(
+            max(window.start * 256 * tick_spacing, MIN_TICK),
+            min(window.stop * 256 * tick_spacing - 1, MAX_TICK),
+        ),
+        words=words,
+        ticks_fetched_at=previous.ticks_fetched_at if previous else time.time(),
+    )
+
+
+def read_uniswap_observations(
+    web3: Web3, pool_address: str, seconds_agos: List[int]
+) -> Optional[UniswapObservations]:
+    """
+    Call the oracle of a Uniswap pool, observe(seconds_agos), together with the block number and
+    timestamp in one eth_call. None when the pool can't look back that far (observe reverts with
+    OLD once the window is older than the pool's oldest observation).
+    """
+    address = Web3.to_checksum_address(pool_address)
+    multicall = get_multicall_contract(web3).address
+    results = aggregate(
+        web3,
+        [
+            (
+                address,
+                OBSERVE_SELECTOR + web3.codec.encode(["uint32[]"], [seconds_agos]),
+            ),
+            (multicall, BLOCK_NUMBER_CALL),
+            (multicall, BLOCK_TIMESTAMP_CALL),
+        ],
+    )
+    (observe_ok, observe_data), (_, block_data), (_, timestamp_data) = results
+    if not observe_ok or not observe_data:
+        return None
+    tick_cumulatives, _ = web3.codec.decode(OBSERVE_TYPES, observe_data)
+    return UniswapObservations(
+        tuple(int(t) for t in tick_cumulatives),
+        web3.codec.decode(["uint256"], block_data)[0],
+        web3.codec.decode(["uint256"], timestamp_data)[0],
+    )
+
+
+def read_pool_tokens(
+    web3: Web3, pool_addresses: Iterable[str], batch_size: int = MULTICALL_BATCH_SIZE
+) -> Dict[str, Optional[Tuple[str, str]]]:
+    """
+    token0 and token1 of many Uniswap pools in one aggregate3, keyed by checksum address.
+    Pools that don't answer both (no code, not a pool) come back as None.
+    """
+    addresses = list(dict.fromkeys(Web3.to_checksum_address(a) for a in pool_addresses))
+    calls = [(a, call) for a in addresses for call in (TOKEN0_CALL, TOKEN1_CALL)]
+    results = aggregate(web3, calls, batch_size)
+    tokens: Dict[str, Optional[Tuple[str, str]]] = {}
+    for index, address in enumerate(addresses):
+        (ok0, data0), (ok1, data1) = results[2 * index : 2 * index + 2]
+        if not (ok0 and ok1 and data0 and data1):
+            tokens[address] = None
+            continue
+        tokens[address] = (
+            Web3.to_checksum_address(web3.codec.decode(["address"], data0)[0]),
+            Web3.to_checksum_address(web3.codec.decode(["address"], data1)[0]),
+        )
+    return tokens
+
+
+def decode_symbol(web3: Web3, data: bytes) -> str:
+    """ERC-20 symbol, a few old tokens (MKR, SAI) return bytes32 instead of a string."""
+    try:
+        return web3.codec.decode(["string"], data)[0]
+    except Exception:
+        return data[:32].rstrip(b"\0").decode("utf-8", "replace")
+
+
+def read_erc20_metadata(
+    web3: Web3, token_addresses: Iterable[str], batch_size: int = MULTICALL_BATCH_SIZE
+) -> Dict[str, Optional[Tuple[str, int]]]:
+    """(symbol, decimals) of many ERC-20 tokens in one aggregate3, keyed by checksum address."""
+    addresses = list(
+        dict.fromkeys(Web3.to_checksum_address(a) for a in token_addresses)
+    )
+    calls = [(a, call) for a in addresses for call in (SYMBOL_CALL, DECIMALS_CALL)]
+    results = aggregate(web3, calls, batch_size)
+    metadata: Dict[str, Optional[Tuple[str, int]]] = {}
+    for index, address in enumerate(addresses):
+        (symbol_ok, symbol), (decimals_ok, decimals) = results[
+            2 * index : 2 * index + 2
+        ]
+        if not (symbol_ok and decimals_ok and decimals):
+            metadata[address] = None
+            continue
+        metadata[address] = (
+            decode_symbol(web3, symbol),
+            web3.codec.decode(["uint8"], decimals)[0],
+        )
+    return metadata
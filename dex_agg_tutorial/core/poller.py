@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db import close_old_connections
+
+from .cache import NETWORK_PRICE_TTL, PriceCache, price_cache
+from .models import Pair
+from .adapters import get_adapter
+from .clients import get_client
+from .queries import query_exchange
+from .quotes import liquidity_cache
+from .shared import PRICE_BOOK_LEASE
+from .sync import PRICE_SYNC, PoolSync
+from .validation import Network
+
+# Minimum seconds between two upstream calls on the same network so we stay under the
+# RPC provider rate limits. Override with e.g. MAINNET_POLL_SPACING=0.5 in the .env file.
+NETWORK_POLL_SPACING = {
+    Network.ETHEREUM: 0.1,
+    Network.APTOS: 0.05,
+}
+
+
+def get_poll_spacing(network: Network) -> float:
+    return float(
+        os.getenv(
+            f"{network.value.upper()}_POLL_SPACING", NETWORK_POLL_SPACING[network]
+        )
+    )
+
+
+def get_poll_period(network: Network) -> float:
+    """Seconds between two refreshes of the same price, by default one block time."""
+    return float(
+        os.getenv(f"{network.value.upper()}_POLL_PERIOD", NETWORK_PRICE_TTL[network])
+    )
+
+
+class PricePoller:
+    """
+    Keeps the price book (the shared price cache) warm by refreshing every active pair and
+    exchange in the background, one thread per network.
+
+    Requests to /price/ then read from memory instead of waiting on the chain, the number of
+    upstream calls only depends on the number of pairs and not on the number of clients.
+
+    With sync="events" exchanges that support it are followed through their chain events
+    instead (see core.sync), which also keeps the pool snapshots used for quotes current.
+
+    With a shared price book every worker runs a poller, but per network only the one holding
+    its lease polls the chain. The others copy the prices from the shared book, so the upstream
+    calls don't depend on the number of workers either. Pool snapshots stay per worker.
+    """
+
+    def __init__(
+        self,
+        book: PriceCache = price_cache,
+        sync: str = PRICE_SYNC,
+        liquidity: PriceCache = liquidity_cache,
+    ):
+        self.book = book
+        self.sync = sync
+        self.liquidity = liquidity
+        self._syncs: Dict[str, PoolSync] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def targets(self) -> Dict[Network, List[Tuple[Pair, str]]]:
+        """All (pair, exchange) combinations to refresh, grouped by the network they live on."""
+        grouped = defaultdict(list)
+        for pair in Pair.objects.active():
+            for exchange_id in pair.active_exchanges:
+                grouped[get_adapter(exchange_id).network].append((pair, exchange_id))
+        return grouped
+
+    def refresh(self, pair: Pair, exchange_id: str) -> Optional[Decimal]:
+        """Fetch one price from the chain and write it to the book."""
+        price = query_exchange(pair, exchange_id)
+        if price is not None:
+            self.book.put((pair.pair_id, exchange_id), price)
+        return price
+
+    def refresh_batch(self, exchange_id: str, pairs: List[Pair]):
+        """Refresh many pairs of an exchange with one batched upstream call."""
+        adapter = get_adapter(exchange_id)
+        fetched_at = time.time()
+        prices = adapter.fetch_many(pairs, get_client(adapter.network))
+        for pair_id, price in prices.items():
+            if price is not None:
+                self.book.put((pair_id, exchange_id), price, fetched_at)
+
+    def refresh_events(self, exchange_id: str, pairs: List[Pair]):
+        """
+        Bring the pools of an exchange up to date from chain events. Pools that changed get a new
+        price and liquidity snapshot, the others are only marked as current.
+        """
+        adapter = get_adapter(exchange_id)
+        sync = self._syncs.get(exchange_id)
+        if sync is None or sync.pair_ids != {pair.pair_id for pair in pairs}:
+            # first pass, or pairs were added or removed: read every pool once
+            sync = adapter.pool_sync(pairs, get_client(adapter.network))
+            changed = sync.bootstrap()
+            self._syncs[exchange_id] = sync
+        else:
+            changed = sync.sync()
+
+        fetched_at = time.time()
+        for pair_id, pool in changed.items():
+            self.book.put(
+                (pair_id, exchange_id), sync.price(pair_id), fetched_at, sync.cursor
+            )
+            self.liquidity.put((pair_id, exchange_id), pool, fetched_at)
+        unchanged = [
+            (pair_id, exchange_id) for pair_id in sync.pools if pair_id not in changed
+        ]
+        self.book.touch(unchanged, fetched_at)
+        self.liquidity.touch(unchanged, fetched_at)
+
+    def leads(self, network: Network) -> bool:
+        """
+        True when this worker polls the network: always without a shared book, otherwise while
+        it holds the network's lease. The lease outlives a few passes, so a worker that stops
+        polling is replaced within seconds.
+        """
+        if self.book.shared is None:
+            return True
+        lease = max(3 * get_poll_period(network), PRICE_BOOK_LEASE)
+        return self.book.shared.acquire(f"poller:{network.value}", lease)
+
+    def follow(self, targets: List[Tuple[Pair, str]]) -> int:
+        """Copy the prices the polling worker wrote to the shared book into our book."""
+        return self.book.mirror(
+            [(pair.pair_id, exchange_id) for pair, exchange_id in targets]
+        )
+
+    def refresh_network(self, network: Network, targets: List[Tuple[Pair, str]]):
+        """One pass over the targets of a network, spacing the calls out to respect rate limits."""
+        if not self.leads(network):
+            self.follow(targets)
+            return
+        spacing = get_poll_spacing(network)
+
+        if self.sync == "events":
+            by_exchange = defaultdict(list)
+            for pair, exchange_id in targets:
+                by_exchange[exchange_id].append(pair)
+            for exchange_id, pairs in by_exchange.items():
+                if get_adapter(exchange_id).supports_sync:
+                    if self._stop.is_set():
+                        return
+                    self.refresh_events(exchange_id, pairs)
+                    targets = [(p, e) for p, e in targets if e != exchange_id]
+
+        # Exchanges that support batching (Uniswap multicall) get all their pairs read in one go,
+        # that leaves the other exchanges one by one
+        by_exchange = defaultdict(list)
+        for pair, exchange_id in targets:
+            by_exchange[exchange_id].append(pair)
+        for exchange_id, pairs in by_exchange.items():
+            if get_adapter(exchange_id).supports_batch and len(pairs) > 1:
+                if self._stop.is_set():
+                    return
+                self.refresh_batch(exchange_id, pairs)
+                targets = [(p, e) for p, e in targets if e != exchange_id]
+                self._stop.wait(spacing)
+
+        for pair, exchange_id in targets:
+            if self._stop.is_set():
+                return
+            started = time.monotonic()
+            self.refresh(pair, exchange_id)
+            self._stop.wait(max(spacing - (time.monotonic() - started), 0))
+
+    def refresh_all(self):
+        """Refresh every price once, used by the poll_prices command and in tests."""
+        for network, targets in self.targets().items():
+            self.refresh_network(network, targets)
+
+    def _run(self, network: Network):
+        period = get_poll_period(network)
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                targets = self.targets().get(network, [])
+                self.refresh_network(network, targets)
+            except Exception as e:
+                # keep polling, a broken pass should not end the thread
+                print(f"Error polling {network.value}: {e}")
+            finally:
+                close_old_connections()
+            self._stop.wait(max(period - (time.monotonic() - started), 0))
+
+    def start(self):
+        """Start one polling thread per network and let requests read from the book."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(
+                target=self._run,
+                args=(network,),
+                name=f"price-poller-{network.value}",
+                daemon=True,
+            )
+            for network in Network
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.book.warm = True
+
+    def stop(self, timeout: Optional[float] = None):
+        self.book.warm = False
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+price_poller = PricePoller()
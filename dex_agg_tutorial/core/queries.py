@@ -1,149 +1,470 @@
+import math
 import os
-import requests
-import json
-from retry import retry
-from typing import Optional, Dict
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from contextvars import copy_context
+from dataclasses import replace
+from decimal import Decimal
+from typing import Callable, List, Optional, Dict, TypeVar, Union
 from dotenv import load_dotenv
 
-from web3 import Web3
-
-from .validation import BadRequestException, Exchange
+from .adapters import get_adapter
+from .cache import CachedPrice, PriceCache, get_price_ttl, price_cache
+from .clients import get_client
+from .fixedpoint import serialize_price
+from .metrics import CACHE_REQUESTS, observe_exchange, timed_stage
 from .models import Pair
+from .registry import pair_registry
 
 # Load environment variables from .env file
 load_dotenv()
 
+# How long (in seconds) we wait for a single exchange before dropping it from the response.
+# Can be tuned per exchange with e.g. UNISWAP_QUERY_DEADLINE=1.5 in the .env file.
+DEFAULT_QUERY_DEADLINE = float(os.getenv("EXCHANGE_QUERY_DEADLINE", "3"))
 
-@retry(BadRequestException, delay=10, tries=2)
-def request_json(url: str) -> dict:
-    """simple function to manage direct queries to the chain"""
-    r = requests.get(url)
-    if r.status_code == 200:
-        return r.json()
-    else:
-        raise BadRequestException(f"Status Code: {r.status_code} | {url}")
+# Most pairs one /prices/ request can ask for, every pair costs upstream calls on a cold cache.
+# All active pairs (?pairs=all) are served in pages of this many pairs while the poller is off.
+PRICES_MAX_PAIRS = int(os.getenv("PRICES_MAX_PAIRS", "100"))
 
+# One shared pool of worker threads for all price requests, starting threads per request is wasteful
+query_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXCHANGE_QUERY_WORKERS", "16")),
+    thread_name_prefix="exchange-query",
+)
 
-def query_uniswap_price(pair: Pair, rpc_url: str) -> Optional[float]:
-    """Query Uniswap for token pair price."""
-    try:
-        # Get the Uniswap pool contract address
-        pool_address = pair.pool_contracts.get("uniswap")
-        if not pool_address:
-            print(f"No Uniswap pool contract found for pair {pair.pair_id}")
-            return None
 
-        # Set up Web3 provider
-        web3 = Web3(Web3.HTTPProvider(rpc_url))
+T = TypeVar("T")
 
-        # Load Uniswap pool ABI from config
-        with open("uniswap_pool_abi.json", "r") as abi_file:
-            pool_abi = json.load(abi_file)
 
-        pool_contract = web3.eth.contract(
-            address=Web3.to_checksum_address(pool_address), abi=pool_abi
-        )
+def submit(function: Callable, *args) -> Future:
+    """Run a function on the query pool in the caller's context, so its timings count for the request."""
+    return query_executor.submit(copy_context().run, function, *args)
 
-        # Get current price from slot0
-        slot0 = pool_contract.functions.slot0().call()
-        sqrt_price_x96 = int(slot0[0])  # Cast bigint to int
 
-        # Convert sqrt_price (Q64.96 format) to actual price
-        # Formula: (sqrtPriceX96 / 2^96)^2
-        # This gives us the price of token0 in terms of token1
-        raw_price = (sqrt_price_x96 / (2**96)) ** 2
+# TWAPs keyed by (pair_id, "exchange_id/window"), apart from the price book so the poller and the
+# price history never mistake an average for a spot price
+twap_cache = PriceCache()
 
-        # In Uniswap V3, token0 and token1 ordering is based on contract address comparison
-        # The raw price from sqrt gives us token0/token1
-        # So the price of USDC/ETH comes out as dollars priced in ETH. To do smart ordering we
-        # would have to start quering the token0/token1 addresses and do this dynamically.
 
-        # Adjust for token decimals difference
-        # Price = raw_price * 10^(base_decimals - quote_decimals)
-        decimal_adjustment = 10 ** (
-            pair.base_token_decimals - pair.quote_token_decimals
-        )
-        return raw_price * decimal_adjustment
+def get_query_deadline(exchange_id: str) -> float:
+    """Seconds we are willing to wait for an exchange before leaving it out of the prices."""
+    return float(
+        os.getenv(f"{exchange_id.upper()}_QUERY_DEADLINE", DEFAULT_QUERY_DEADLINE)
+    )
 
-    except Exception as e:
-        print(f"Error querying Uniswap: {e}")
-        return None
 
+def query_exchange(pair: Pair, exchange_id: str) -> Optional[Decimal]:
+    """Look up the adapter and network client for an exchange and ask it for the pair price."""
+    adapter = get_adapter(exchange_id)
+    started = time.perf_counter()
+    price = None
+    try:
+        price = adapter.fetch_one(pair, get_client(adapter.network))
+        return price
+    finally:
+        observe_exchange(
+            exchange_id,
+            adapter.network.value,
+            time.perf_counter() - started,
+            failed=price is None,
+        )
 
-def query_hyperion_price(pair: Pair, rpc_url: str) -> Optional[float]:
-    """Query Hyperion pool resource to get sqrt_price directly."""
+
+def query_exchange_many(
+    pairs: List[Pair], exchange_id: str
+) -> Dict[str, Optional[Decimal]]:
+    """Batch counterpart of query_exchange, the batch fails when no pair got a price."""
+    adapter = get_adapter(exchange_id)
+    started = time.perf_counter()
+    prices: Dict[str, Optional[Decimal]] = {}
     try:
-        # Get the Hyperion pool contract address
-        pool_address = pair.pool_contracts.get("hyperion")
-        if not pool_address:
-            print(f"No Hyperion pool contract found for pair {pair.pair_id}")
-            return None
-
-        # Query the LiquidityPoolV3 resource directly
-        resource_url = f"{rpc_url}/v1/accounts/{pool_address}/resource/0x8b4a2c4bb53857c718a04c020b98f8c2e1f99a68b0f57389a8bf5434cd22e05c::pool_v3::LiquidityPoolV3"
-
-        resource_data = request_json(resource_url)
-        # Extract sqrt_price from the resource data (x64 fixed-point)
-        sqrt_price = int(resource_data["data"]["sqrt_price"])
-
-        # Hyperion uses x64 fixed-point for sqrt_price, not Q64.96 like Uniswap
-        # Formula: (sqrt_price / 2^64)^2
-        raw_price = float((sqrt_price / (2**64)) ** 2)
-
-        # Adjust for token decimals difference
-        # Price = raw_price * 10^(base_decimals - quote_decimals)
-        decimal_adjustment = 10 ** (
-            pair.base_token_decimals - pair.quote_token_decimals
+        prices = adapter.fetch_many(pairs, get_client(adapter.network))
+        return prices
+    finally:
+        observe_exchange(
+            exchange_id,
+            adapter.network.value,
+            time.perf_counter() - started,
+            failed=all(price is None for price in prices.values()),
         )
-        return raw_price * decimal_adjustment
 
-    except Exception as e:  # fails gracefully, no price given
-        print(f"Error querying Hyperion: {e}")
-        return None
+
+def cached_query_exchange(
+    pair: Pair, exchange_id: str, use_cache: bool = True
+) -> Optional[CachedPrice]:
+    """
+    Price of a pair on one exchange, served from the price cache while it is younger than the
+    exchange TTL. Concurrent misses for the same pair and exchange share a single chain query.
+    """
+    if not use_cache:
+        price = query_exchange(pair, exchange_id)
+        return CachedPrice(price, time.time()) if price is not None else None
+
+    entry = price_cache.get_or_fetch(
+        (pair.pair_id, exchange_id),
+        price_cache.read_ttl(get_price_ttl(exchange_id)),
+        lambda: query_exchange(pair, exchange_id),
+    )
+    CACHE_REQUESTS.inc(
+        exchange=exchange_id, result="hit" if entry and entry.hit else "miss"
+    )
+    return entry
 
 
-# Map price functions to their exchange ID
-EXCHANGE_QUERY_FUNCTIONS = {
-    Exchange.UNISWAP.id: query_uniswap_price,
-    Exchange.HYPERION.id: query_hyperion_price,
-}
+def cached_query_twap(
+    pair: Pair, exchange_id: str, window: int
+) -> Optional[CachedPrice]:
+    """
+    TWAP of a pair on one exchange. It is cached for a block time counted from the block the
+    window ends in, every request for the same pair and window until the next block shares it.
+    """
+    adapter = get_adapter(exchange_id)
+    return twap_cache.get_or_fetch(
+        (pair.pair_id, f"{exchange_id}/{window}"),
+        get_price_ttl(exchange_id),
+        lambda: adapter.fetch_twap(pair, get_client(adapter.network), window),
+        as_of=lambda twap: twap.end,
+    )
 
 
-def get_token_price(token_pair: str) -> Dict:
+def fetch_exchange_prices(
+    pair: Pair, concurrent: bool = True, use_cache: bool = True
+) -> Dict[str, CachedPrice]:
     """
-    Get token prices from all active exchanges for a pair.
-    Returns the best price and the separate exchange prices.
+    Query every active exchange of a pair and collect the prices that came back,
+    see run_per_exchange for the concurrency and deadlines.
+    """
+    with timed_stage("upstream"):
+        return run_per_exchange(
+            pair,
+            pair.active_exchanges,
+            lambda exchange_id: cached_query_exchange(pair, exchange_id, use_cache),
+            concurrent,
+        )
+
+
+def run_per_exchange(
+    pair: Pair,
+    exchange_ids: List[str],
+    call: Callable[[str], Optional[T]],
+    concurrent: bool = True,
+) -> Dict[str, T]:
+    """
+    Run call(exchange_id) for every exchange and collect the results that aren't None.
+
+    In concurrent mode all exchanges are queried at the same time on the shared thread pool,
+    so the total wait is that of the slowest exchange instead of the sum of all of them.
+    An exchange that does not answer within its deadline is dropped from the result, and so is
+    one that fails. A single exchange goes to the pool as well, for its deadline.
+    """
+    results = {}
+
+    if not concurrent:
+        for exchange_id in exchange_ids:
+            try:
+                result = call(exchange_id)
+            except Exception as e:
+                print(f"Error querying {exchange_id}: {e}")
+                continue
+            if result is not None:
+                results[exchange_id] = result
+        return results
+
+    started = time.monotonic()
+    futures = {exchange_id: submit(call, exchange_id) for exchange_id in exchange_ids}
+
+    for exchange_id, future in futures.items():
+        # Deadlines count from the moment we sent the queries, not from when we start waiting
+        remaining = get_query_deadline(exchange_id) - (time.monotonic() - started)
+        try:
+            result = future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            future.cancel()  # only has effect if it never got a worker thread
+            print(f"Dropping {exchange_id} for {pair.pair_id}: no answer in time")
+            continue
+        except Exception as e:
+            print(f"Error querying {exchange_id}: {e}")
+            continue
+        if result is not None:
+            results[exchange_id] = result
+
+    return results
+
+
+def fetch_many_exchange_prices(
+    pairs: List[Pair], use_cache: bool = True
+) -> Dict[str, Dict[str, CachedPrice]]:
+    """
+    Prices for many pairs at once, returned as {pair_id: {exchange_id: price}}.
+
+    Prices still fresh in the cache are used as is. The misses are grouped per exchange, exchanges
+    whose adapter supports batching (Uniswap multicall) get all their pairs in one upstream call and
+    the rest is queried pair by pair, all of it at the same time on the shared thread pool.
     """
+    quotes: Dict[str, Dict[str, CachedPrice]] = {pair.pair_id: {} for pair in pairs}
+    misses = defaultdict(list)
+    for pair in pairs:
+        for exchange_id in pair.active_exchanges:
+            ttl = price_cache.read_ttl(get_price_ttl(exchange_id))
+            entry = (
+                price_cache.get((pair.pair_id, exchange_id), ttl) if use_cache else None
+            )
+            if entry is not None:
+                quotes[pair.pair_id][exchange_id] = replace(entry, hit=True)
+                CACHE_REQUESTS.inc(exchange=exchange_id, result="hit")
+            else:
+                misses[exchange_id].append(pair)
+
+    started = time.monotonic()
+    claimed = []
+    if use_cache and price_cache.shared is not None and misses:
+        # prices other workers fetched meanwhile, or are fetching, aren't fetched again
+        ttls = {
+            (pair.pair_id, exchange_id): price_cache.read_ttl(
+                get_price_ttl(exchange_id)
+            )
+            for exchange_id, missed in misses.items()
+            for pair in missed
+        }
+        # waiting on the other workers counts against the deadlines of the exchanges
+        wait = min(get_query_deadline(exchange_id) for exchange_id in misses)
+        with timed_stage("upstream"):
+            shared = price_cache.claim(ttls, wait=wait)
+        for (pair_id, exchange_id), entry in shared.items():
+            quotes[pair_id][exchange_id] = replace(entry, hit=True)
+            CACHE_REQUESTS.inc(exchange=exchange_id, result="hit")
+        claimed = [key for key in ttls if key not in shared]
+        for exchange_id in list(misses):
+            misses[exchange_id] = [
+                pair
+                for pair in misses[exchange_id]
+                if (pair.pair_id, exchange_id) not in shared
+            ]
+            if not misses[exchange_id]:
+                del misses[exchange_id]
+
     try:
-        # Get the pair from database
-        pair = Pair.objects.get(pair_id=token_pair)
-    except Pair.DoesNotExist:
-        return {"error": f"Pair {token_pair} not found"}
+        with timed_stage("upstream"):
+            fetch_misses(quotes, misses, use_cache, started)
+    finally:
+        if claimed:
+            price_cache.release(claimed)
+    return quotes
 
-    prices = {}
 
-    # We expect exchange to be defined for the pairs and supported as its admin defined
-    for exchange_id in pair.active_exchanges:
-        query_func = EXCHANGE_QUERY_FUNCTIONS[exchange_id]
-        network = Exchange.get_network(exchange_id)
-        rpc_url = os.getenv(f"{network.upper()}_RPC_URL")
-
-        # Query the exchange
-        price = query_func(pair, rpc_url)
-        if price is not None:
-            prices[exchange_id] = price
-
-    # Return results
-    if not prices:
+def book_prices(pairs: List[Pair]) -> Dict[str, Dict[str, CachedPrice]]:
+    """
+    Prices for many pairs as they are in the price book, returned like
+    fetch_many_exchange_prices. Nothing is fetched, prices missing from the book are left out.
+    """
+    quotes: Dict[str, Dict[str, CachedPrice]] = {pair.pair_id: {} for pair in pairs}
+    for pair in pairs:
+        for exchange_id in pair.active_exchanges:
+            ttl = price_cache.read_ttl(get_price_ttl(exchange_id))
+            entry = price_cache.get((pair.pair_id, exchange_id), ttl)
+            if entry is not None:
+                quotes[pair.pair_id][exchange_id] = replace(entry, hit=True)
+    return quotes
+
+
+def fetch_misses(
+    quotes: Dict[str, Dict[str, CachedPrice]],
+    misses: Dict[str, List[Pair]],
+    use_cache: bool,
+    started: Optional[float] = None,
+):
+    """
+    Query the exchanges for the prices that weren't cached and add them to `quotes`. The
+    deadlines of the exchanges run from `started` (a `time.monotonic()`), or from now.
+    """
+    if started is None:
+        started = time.monotonic()
+    futures = []  # (exchange_id, pair or None for a batch, future)
+    for exchange_id, missed in misses.items():
+        adapter = get_adapter(exchange_id)
+        if adapter.supports_batch and len(missed) > 1:
+            CACHE_REQUESTS.inc(len(missed), exchange=exchange_id, result="miss")
+            future = submit(query_exchange_many, missed, exchange_id)
+            futures.append((exchange_id, None, future))
+            continue
+        for pair in missed:
+            future = submit(cached_query_exchange, pair, exchange_id, use_cache)
+            futures.append((exchange_id, pair, future))
+
+    for exchange_id, pair, future in futures:
+        remaining = get_query_deadline(exchange_id) - (time.monotonic() - started)
+        try:
+            result = future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            future.cancel()
+            print(f"Dropping {exchange_id}: no answer in time")
+            continue
+        except Exception as e:
+            print(f"Error querying {exchange_id}: {e}")
+            continue
+
+        if pair is not None:
+            if result is not None:
+                quotes[pair.pair_id][exchange_id] = result
+            continue
+
+        # batch results come back as plain prices per pair_id
+        fetched_at = time.time()
+        for pair_id, price in result.items():
+            if price is None:
+                continue
+            if use_cache:
+                quotes[pair_id][exchange_id] = price_cache.put(
+                    (pair_id, exchange_id), price, fetched_at
+                )
+            else:
+                quotes[pair_id][exchange_id] = CachedPrice(price, fetched_at)
+
+
+def build_price_response(
+    pair: Pair, quotes: Dict[str, CachedPrice], precision: Optional[int] = None
+) -> Dict:
+    """
+    Response body of a pair, the best price plus the price and cache info per exchange.
+    Prices are numbers, or strings with `precision` significant digits when a precision is given.
+    """
+    with timed_stage("serialize"):
+        prices = {exchange_id: quote.price for exchange_id, quote in quotes.items()}
+
+        # Return results
+        if not prices:
+            return {
+                "token_pair": pair.pair_id,
+                "error": "No prices available from any exchange",
+            }
+
         return {
             "token_pair": pair.pair_id,
-            "error": "No prices available from any exchange",
+            "best_price": serialize_price(
+                min(prices.values()), precision
+            ),  # Assumes pricing order is main/quote meaning lower is a better value (for buyers of base asset)
+            "prices": {
+                exchange_id: serialize_price(price, precision)
+                for exchange_id, price in prices.items()
+            },
+            "cache": {
+                exchange_id: {"hit": quote.hit, "age": round(quote.age, 3)}
+                for exchange_id, quote in quotes.items()
+            },
         }
 
+
+def get_token_price(
+    token_pair: Union[str, Pair],
+    concurrent: bool = True,
+    use_cache: bool = True,
+    precision: Optional[int] = None,
+) -> Dict:
+    """
+    Get token prices from all active exchanges for a pair.
+    Returns the best price and the separate exchange prices, plus for every exchange
+    whether the price came from the cache and how old (in seconds) it is.
+    Accepts the pair_id or an already loaded Pair.
+    """
+    if isinstance(token_pair, Pair):
+        pair = token_pair
+    else:
+        pair = pair_registry.get(token_pair)
+        if pair is None:
+            return {"error": f"Pair {token_pair} not found"}
+
+    # We expect exchange to be defined for the pairs and supported as its admin defined
+    quotes = fetch_exchange_prices(pair, concurrent=concurrent, use_cache=use_cache)
+    return build_price_response(pair, quotes, precision)
+
+
+def get_token_twap(
+    pair: Pair, window: int, concurrent: bool = True, precision: Optional[int] = None
+) -> Dict:
+    """
+    Time weighted average prices of a pair over the last `window` seconds from the exchanges
+    that support them, in the same shape as get_token_price plus where every window ends.
+    """
+    exchange_ids = [
+        exchange_id
+        for exchange_id in pair.active_exchanges
+        if get_adapter(exchange_id).supports_twap
+    ]
+    quotes = run_per_exchange(
+        pair,
+        exchange_ids,
+        lambda exchange_id: cached_query_twap(pair, exchange_id, window),
+        concurrent,
+    )
+    response = build_price_response(
+        pair,
+        {
+            exchange_id: replace(quote, price=quote.price.price)
+            for exchange_id, quote in quotes.items()
+        },
+        precision,
+    )
+    if "error" not in response:
+        response["twap"] = {
+            "window": window,
+            "exchanges": {
+                exchange_id: {
+                    "end": quote.price.end,
+                    "block": quote.price.block,
+                    "tick": quote.price.tick,
+                }
+                for exchange_id, quote in quotes.items()
+            },
+        }
+    return response
+
+
+def get_token_prices(
+    token_pairs: Optional[List[str]] = None,
+    precision: Optional[int] = None,
+    page: int = 1,
+) -> Dict:
+    """
+    Get the prices of many pairs in one go, the pairs come from the registry.
+    Unknown pair ids are listed under not_found.
+
+    Without token_pairs every active pair is priced. While the poller keeps the price book warm
+    they are all read from the book at once, otherwise they are fetched `page` (counting from 1)
+    at a time, PRICES_MAX_PAIRS pairs per page.
+    """
+    with timed_stage("db"):
+        if token_pairs is None:
+            pairs = pair_registry.active()
+        else:
+            pairs = pair_registry.get_many(token_pairs)
+
+    from_book = token_pairs is None and price_cache.warm
+    if token_pairs is None:
+        size = max(len(pairs), 1) if from_book else PRICES_MAX_PAIRS
+        pages = max(math.ceil(len(pairs) / size), 1)
+        pairs = pairs[(page - 1) * size : page * size]
+
+    quotes = book_prices(pairs) if from_book else fetch_many_exchange_prices(pairs)
+
+    results = {}
+    for pair in pairs:
+        if not pair.active_exchanges:
+            results[pair.pair_id] = {
+                "token_pair": pair.pair_id,
+                "error": f"Token pair {pair.pair_id} is not active on any exchange",
+            }
+        else:
+            results[pair.pair_id] = build_price_response(
+                pair, quotes[pair.pair_id], precision
+            )
+
+    if token_pairs is None:
+        return {"pairs": results, "page": page, "pages": pages}
+
+    found = {pair.pair_id for pair in pairs}
     return {
-        "token_pair": pair.pair_id,
-        "best_price": min(
-            prices.values()
-        ),  # Assumes pricing order is main/quote meaning lower is a better value (for buyers of base asset)
-        "prices": prices,
+        "pairs": results,
+        "not_found": [p for p in token_pairs if p not in found],
     }
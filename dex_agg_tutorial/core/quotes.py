@@ -0,0 +1,259 @@
+"""
+Trade size aware quotes.
+
+The spot price only holds for an infinitely small trade. For a real amount we take a snapshot of
+each pool's liquidity (in-range liquidity, fee and the initialized ticks around the price) and
+replay the swap locally with the pool's own math, crossing ticks as the price moves. Snapshots are
+cached for a block time and refreshed incrementally, so most quotes cost no RPC calls at all.
+"""
+
+import os
+import time
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Union
+
+from .adapters import get_adapter
+from .cache import CachedPrice, PriceCache, get_price_ttl
+from .clients import get_client
+from .fixedpoint import serialize_price, sqrt_price_to_decimal
+from .models import Pair
+from .queries import run_per_exchange
+from .registry import pair_registry
+from .routing import ROUTE_GRANULARITY, split_route
+from .swapmath import simulate_swap
+
+# The price and in-range liquidity are refreshed every block time, ticks are re-read in full
+# after QUOTE_TICKS_TTL seconds (and for new bitmap words as soon as the price moves into them)
+QUOTE_TICKS_TTL = float(os.getenv("QUOTE_TICKS_TTL", "60"))
+
+SIDES = ("sell", "buy")
+
+# Pool liquidity snapshots, a second PriceCache so they get the same TTL, LRU and coalescing.
+# Entries hold a swapmath.PoolLiquidity instead of a price.
+liquidity_cache = PriceCache(max_entries=int(os.getenv("LIQUIDITY_CACHE_SIZE", "256")))
+
+
+def trade_decimals(pair: Pair, side: str) -> Tuple[int, int]:
+    """Decimals of the (input, output) token, selling puts base tokens in."""
+    if side == "sell":
+        return pair.base_token_decimals, pair.quote_token_decimals
+    return pair.quote_token_decimals, pair.base_token_decimals
+
+
+def quotable_exchanges(pair: Pair) -> List[str]:
+    return [
+        exchange_id
+        for exchange_id in pair.active_exchanges
+        if get_adapter(exchange_id).supports_quotes
+    ]
+
+
+def get_pool_liquidity(pair: Pair, exchange_id: str) -> Optional[CachedPrice]:
+    """Cached liquidity snapshot of a pair's pool, refreshed from the previous one when stale."""
+    adapter = get_adapter(exchange_id)
+    key = (pair.pair_id, exchange_id)
+
+    previous = liquidity_cache.get(key)
+    snapshot = previous.price if previous is not None else None
+    if (
+        snapshot is not None
+        and time.time() - snapshot.ticks_fetched_at > QUOTE_TICKS_TTL
+    ):
+        snapshot = None  # time for a full read
+
+    return liquidity_cache.get_or_fetch(
+        key,
+        get_price_ttl(exchange_id),
+        lambda: adapter.fetch_liquidity(pair, get_client(adapter.network), snapshot),
+    )
+
+
+def quote_exchange(
+    pair: Pair, exchange_id: str, amount: Decimal, side: str = "sell"
+) -> Optional[Dict]:
+    """
+    Simulate swapping `amount` on one exchange. Selling swaps `amount` base tokens for quote
+    tokens, buying spends `amount` quote tokens on base tokens. All amounts in whole tokens.
+    """
+    entry = get_pool_liquidity(pair, exchange_id)
+    if entry is None:
+        return None
+    pool = entry.price
+
+    sell = side == "sell"
+    inverted = pair.is_inverted(exchange_id)
+    in_decimals, out_decimals = trade_decimals(pair, side)
+    # Selling the base token is zero for one, unless the pool holds it as token1
+    result = simulate_swap(
+        pool, int(amount.scaleb(in_decimals)), zero_for_one=sell != inverted
+    )
+    if result.amount_out == 0:
+        return None
+
+    amount_in = Decimal(result.amount_in).scaleb(-in_decimals)
+    amount_out = Decimal(result.amount_out).scaleb(-out_decimals)
+    spot = sqrt_price_to_decimal(
+        pool.sqrt_price,
+        pool.bits,
+        pair.base_token_decimals,
+        pair.quote_token_decimals,
+        invert=inverted,
+    )
+    after = sqrt_price_to_decimal(
+        result.sqrt_price,
+        pool.bits,
+        pair.base_token_decimals,
+        pair.quote_token_decimals,
+        invert=inverted,
+    )
+    return {
+        "amount_in": amount_in,
+        "amount_out": amount_out,
+        # quote tokens per base token actually paid or received, fees included
+        "price": amount_out / amount_in if sell else amount_in / amount_out,
+        "spot_price": spot,
+        "price_impact": abs(after / spot - 1),
+        "fee": Decimal(result.fee).scaleb(-in_decimals),
+        "ticks_crossed": result.ticks_crossed,
+        # False if the liquidity we know of ran out before the whole amount was swapped
+        "filled": result.filled,
+        # only the in-range liquidity was known, larger trades look better than they are
+        "in_range_only": pool.tick_range is None,
+        "age": round(entry.age, 3),
+    }
+
+
+def get_quote(
+    token_pair: Union[str, Pair],
+    amount: Decimal,
+    side: str = "sell",
+    precision: Optional[int] = None,
+) -> Dict:
+    """
+    Quote a trade of `amount` on every active exchange of a pair that supports quotes.
+    The best exchange is the one giving the most tokens out.
+    """
+    if isinstance(token_pair, Pair):
+        pair = token_pair
+    else:
+        pair = pair_registry.get(token_pair)
+        if pair is None:
+            return {"error": f"Pair {token_pair} not found"}
+
+    quotes = run_per_exchange(
+        pair,
+        quotable_exchanges(pair),
+        lambda exchange_id: quote_exchange(pair, exchange_id, amount, side),
+    )
+    if not quotes:
+        return {
+            "token_pair": pair.pair_id,
+            "error": "No quotes available from any exchange",
+        }
+
+    def serialize(quote: Dict) -> Dict:
+        return {
+            key: (
+                serialize_price(value, precision)
+                if isinstance(value, Decimal)
+                else value
+            )
+            for key, value in quote.items()
+        }
+
+    best = max(quotes, key=lambda exchange_id: quotes[exchange_id]["amount_out"])
+    return {
+        "token_pair": pair.pair_id,
+        "side": side,
+        "amount": serialize_price(amount, precision),
+        "best_exchange": best,
+        "amount_out": serialize_price(quotes[best]["amount_out"], precision),
+        "quotes": {
+            exchange_id: serialize(quote) for exchange_id, quote in quotes.items()
+        },
+    }
+
+
+def get_route(
+    token_pair: Union[str, Pair],
+    amount: Decimal,
+    side: str = "sell",
+    precision: Optional[int] = None,
+    granularity: int = ROUTE_GRANULARITY,
+) -> Dict:
+    """
+    Best split of a trade of `amount` over all exchanges of a pair, worked out from the cached
+    pool snapshots. Compared against sending everything to the best single exchange.
+    """
+    if isinstance(token_pair, Pair):
+        pair = token_pair
+    else:
+        pair = pair_registry.get(token_pair)
+        if pair is None:
+            return {"error": f"Pair {token_pair} not found"}
+
+    snapshots = run_per_exchange(
+        pair,
+        quotable_exchanges(pair),
+        lambda exchange_id: get_pool_liquidity(pair, exchange_id),
+    )
+    if not snapshots:
+        return {
+            "token_pair": pair.pair_id,
+            "error": "No liquidity available from any exchange",
+        }
+
+    sell = side == "sell"
+    in_decimals, out_decimals = trade_decimals(pair, side)
+    amount_in = int(amount.scaleb(in_decimals))
+    pools = {exchange_id: entry.price for exchange_id, entry in snapshots.items()}
+    directions = {
+        exchange_id: sell != pair.is_inverted(exchange_id) for exchange_id in pools
+    }
+
+    started = time.perf_counter()
+    route = split_route(pools, amount_in, directions, granularity=granularity)
+    solve_time = time.perf_counter() - started
+
+    single = {
+        exchange_id: simulate_swap(
+            pool, amount_in, zero_for_one=directions[exchange_id]
+        ).amount_out
+        for exchange_id, pool in pools.items()
+    }
+    best_single = max(single, key=single.get)
+    if route.amount_out == 0:
+        return {
+            "token_pair": pair.pair_id,
+            "error": "Not enough liquidity for this amount",
+        }
+
+    def tokens(raw: int, decimals: int):
+        return serialize_price(Decimal(raw).scaleb(-decimals), precision)
+
+    return {
+        "token_pair": pair.pair_id,
+        "side": side,
+        "amount": serialize_price(amount, precision),
+        "amount_in": tokens(route.amount_in, in_decimals),
+        "amount_out": tokens(route.amount_out, out_decimals),
+        "splits": {
+            exchange_id: {
+                "amount_in": tokens(route.amounts_in[exchange_id], in_decimals),
+                "amount_out": tokens(route.amounts_out[exchange_id], out_decimals),
+                "share": round(route.amounts_in[exchange_id] / amount_in, 4),
+            }
+            for exchange_id in route.amounts_in
+        },
+        "best_single": {
+            "exchange": best_single,
+            "amount_out": tokens(single[best_single], out_decimals),
+        },
+        # extra output of the split over the best single exchange, 0.01 is 1%
+        "improvement": (
+            round(route.amount_out / single[best_single] - 1, 6)
+            if single[best_single]
+            else None
+        ),
+        "solve_ms": round(solve_time * 1000, 3),
+    }
@@ -0,0 +1,202 @@
+"""
+Process local copy of all pairs, so pricing a pair doesn't start with a database query.
+
+Pairs rarely change, so the registry loads them all at once and keeps them until they do. Saves
+and deletes in this process invalidate it through the model signals. Bulk writes don't send
+signals, save_pairs() invalidates it itself. Changes made by other workers are picked up through
+a fingerprint (row count and latest updated_at), checked at most every PAIR_REGISTRY_TTL seconds.
+A pair that isn't in the registry is looked up in the database before it's reported missing.
+
+The registry also keeps the /pairs/ response body with its ETag and Last-Modified, so listing
+the pairs, or answering 304 Not Modified, costs no database query and no serialization.
+Last-Modified is when this process saw the body change, not the latest updated_at, which stays
+put or goes back when pairs are deleted.
+Pairs from the registry are shared between requests, treat them as read-only.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import Pair
+
+PAIR_REGISTRY_TTL = float(os.getenv("PAIR_REGISTRY_TTL", "5"))
+
+Fingerprint = Tuple[int, Optional[datetime]]
+
+
+@dataclass(frozen=True)
+class RegistryState:
+    """One load of the pairs, replaced as a whole on every reload."""
+
+    version: int
+    fingerprint: Fingerprint
+    pairs: Dict[str, Pair] = field(default_factory=dict)
+    active: List[Pair] = field(default_factory=list)
+    payload: bytes = b"[]"  # /pairs/ response body
+    etag: str = ""
+    last_modified: Optional[datetime] = None
+
+
+def pair_values(pair: Pair) -> Dict:
+    """The pair as Pair.objects.values() returns it."""
+    return {f.attname: getattr(pair, f.attname) for f in Pair._meta.concrete_fields}
+
+
+class PairRegistry:
+    def __init__(self, ttl: float = PAIR_REGISTRY_TTL):
+        self.ttl = ttl
+        # bumped by invalidate(), the state is stale when it lags behind
+        self._version = 0
+        self._state: Optional[RegistryState] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def invalidate(self):
+        self._version += 1
+
+    def fingerprint(self) -> Fingerprint:
+        stats = Pair.objects.aggregate(
+            count=models.Count("id"), updated=models.Max("updated_at")
+        )
+        return stats["count"], stats["updated"]
+
+    def load(self) -> RegistryState:
+        version = self._version
+        previous = self._state
+        pairs = list(Pair.objects.all())
+        active = [pair for pair in pairs if pair.is_active]
+        payload = JSONRenderer().render([pair_values(pair) for pair in active])
+        updated = max((pair.updated_at for pair in pairs), default=None)
+        etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+        if previous is not None and previous.etag == etag:
+            last_modified = previous.last_modified
+        elif previous is not None:
+            # a whole second later at least, Last-Modified is compared in whole seconds
+            last_modified = max(
+                timezone.now(), previous.last_modified + timedelta(seconds=1)
+            )
+        else:
+            last_modified = timezone.now()
+        state = RegistryState(
+            version=version,
+            fingerprint=(len(pairs), updated),
+            pairs={pair.pair_id: pair for pair in pairs},
+            active=active,
+            payload=payload,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        self._state = state
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        return state
+
+    def needs_check(self) -> bool:
+        state = self._state
+        return (
+            state is None
+            or state.version != self._version
+            or time.monotonic() - self._checked_at > self.ttl
+        )
+
+    def current(self) -> RegistryState:
+        """The loaded pairs, reloaded first when invalidated or changed by another worker."""
+        state = self._state
+        if not self.needs_check():
+            return state
+        with self._lock:
+            state = self._state
+            if state is None or state.version != self._version:
+                return self.load()
+            if time.monotonic() - self._checked_at > self.ttl:
+                if self.fingerprint() != state.fingerprint:
+                    return self.load()
+                self._checked_at = time.monotonic()
+            return state
+
+    def get(self, pair_id: str) -> Optional[Pair]:
+        pair = self.current().pairs.get(pair_id)
+        if pair is None:
+            pair = self.find_missing([pair_id]).get(pair_id)
+        return pair
+
+    def get_many(self, pair_ids: Iterable[str]) -> List[Pair]:
+        """The pairs of the ids that exist, ordered by uid like Pair.objects."""
+        state = self.current()
+        pair_ids = set(pair_ids)
+        pairs = {
+            pair_id: state.pairs[pair_id]
+            for pair_id in pair_ids
+            if pair_id in state.pairs
+        }
+        missing = pair_ids - set(pairs)
+        if missing:
+            pairs.update(self.find_missing(missing))
+        return sorted(pairs.values(), key=lambda pair: pair.uid)
+
+    def active(self) -> List[Pair]:
+        return self.current().active
+
+    def find_missing(self, pair_ids: Iterable[str]) -> Dict[str, Pair]:
+        """
+        Look up pairs the registry doesn't know, e.g. created by another worker since the last
+        check. Finding any means the registry is behind, it reloads on the next read.
+        """
+        found = {
+            pair.pair_id: pair for pair in Pair.objects.filter(pair_id__in=pair_ids)
+        }
+        if found:
+            self.invalidate()
+        return found
+
+    async def aget(self, pair_id: str) -> Optional[Pair]:
+        """get() for async views, the database is only touched from a thread."""
+        state = self._state
+        if self.needs_check():
+            state = await sync_to_async(self.current)()
+        pair = state.pairs.get(pair_id)
+        if pair is None:
+            pair = (await sync_to_async(self.find_missing)([pair_id])).get(pair_id)
+        return pair
+
+    async def aget_many(self, pair_ids: List[str]) -> List[Pair]:
+        if not self.needs_check():
+            state = self._state
+            if all(pair_id in state.pairs for pair_id in pair_ids):
+                return self.get_many(pair_ids)
+        return await sync_to_async(self.get_many)(pair_ids)
+
+    def clear(self):
+        with self._lock:
+            self._state = None
+            self.invalidate()
+
+
+# Shared by every request in this process
+pair_registry = PairRegistry()
+
+
+def pairs_changed():
+    """Invalidate the registry after writing pairs, call it for writes that send no signals."""
+    # now for this thread, and after the commit for the threads that couldn't see it yet
+    pair_registry.invalidate()
+    transaction.on_commit(pair_registry.invalidate)
+
+
+@receiver(post_save, sender=Pair)
+@receiver(post_delete, sender=Pair)
+def invalidate_pair_registry(sender, **kwargs):
+    pairs_changed()
@@ -0,0 +1,96 @@
+"""
+Split routing of a large order over several pools.
+
+Pool output is concave in the input amount (every extra token moves the price further), so the
+best split can be found greedily: cut the order into `granularity` equal slices and hand every
+slice to the pool whose output grows the most from it. That equalizes the marginal prices of the
+pools up to one slice, and needs at most venues * (granularity + 1) local swap simulations.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, Union
+
+from .swapmath import PoolLiquidity, simulate_swap
+
+# Number of slices an order is cut into, the split is optimal up to amount / granularity
+ROUTE_GRANULARITY = int(os.getenv("ROUTE_GRANULARITY", "20"))
+
+
+@dataclass(frozen=True)
+class Route:
+    """Amounts (raw token units) sent into and coming out of every pool used by a split."""
+
+    amounts_in: Dict[str, int]
+    amounts_out: Dict[str, int]
+
+    @property
+    def amount_in(self) -> int:
+        return sum(self.amounts_in.values())
+
+    @property
+    def amount_out(self) -> int:
+        return sum(self.amounts_out.values())
+
+
+def split_route(
+    pools: Dict[str, PoolLiquidity],
+    amount_in: int,
+    zero_for_one: Union[bool, Dict[str, bool]],
+    granularity: int = ROUTE_GRANULARITY,
+) -> Route:
+    """
+    Output maximizing split of an exact-input swap over `pools` (keyed by exchange_id).
+    The swap direction is the same for every pool, or given per pool when their token order differs.
+    """
+    if isinstance(zero_for_one, bool):
+        zero_for_one = dict.fromkeys(pools, zero_for_one)
+    if len(pools) == 1:
+        # nothing to split, a single simulation will do
+        ((venue, pool),) = pools.items()
+        result = simulate_swap(pool, amount_in, zero_for_one[venue])
+        return Route({venue: result.amount_in}, {venue: result.amount_out})
+
+    granularity = max(1, min(granularity, amount_in))
+    unit = amount_in // granularity
+
+    # (amount out, amount used) of each pool per (slices, extra input), filled lazily
+    outputs = {venue: {(0, 0): (0, 0)} for venue in pools}
+
+    def output(venue: str, count: int, extra: int = 0):
+        key = (count, extra)
+        if key not in outputs[venue]:
+            result = simulate_swap(
+                pools[venue], count * unit + extra, zero_for_one[venue]
+            )
+            outputs[venue][key] = (result.amount_out, result.amount_in)
+        return outputs[venue][key]
+
+    slices = {venue: 0 for venue in pools}
+    for _ in range(granularity):
+        gains = {
+            venue: output(venue, slices[venue] + 1)[0] - output(venue, slices[venue])[0]
+            for venue in pools
+        }
+        venue = max(gains, key=gains.get)
+        if gains[venue] <= 0:
+            break  # no pool has liquidity left for another slice
+        slices[venue] += 1
+
+    # the rounding remainder goes to the pool that took the last (least valuable) slice best
+    remainder = amount_in - granularity * unit
+    if remainder and any(slices.values()):
+        venue = max(
+            (v for v in pools if slices[v]),
+            key=lambda v: output(v, slices[v], remainder)[0] - output(v, slices[v])[0],
+        )
+        extras = {venue: remainder}
+    else:
+        extras = {}
+
+    amounts_in, amounts_out = {}, {}
+    for venue in pools:
+        if slices[venue] or extras.get(venue):
+            out, used = output(venue, slices[venue], extras.get(venue, 0))
+            amounts_in[venue], amounts_out[venue] = used, out
+    return Route(amounts_in, amounts_out)
@@ -0,0 +1,451 @@
+"""
+Price book shared by the workers of a deployment, so a price is read from the chain once and
+not once per worker.
+
+The price cache of every worker writes the prices it fetches through to the shared book and
+reads from it before going to the chain. Who fetches is decided with leases: before fetching a
+(pair, exchange) a worker takes its lease, the others wait for the price to show up in the shared
+book instead of fetching it too. A lease runs out after PRICE_BOOK_LEASE seconds, so a worker
+that dies holding one only delays the others. The price poller takes one lease per network, the
+worker holding it polls and the other pollers copy its prices into their own cache.
+
+Two backends, picked with PRICE_BOOK_BACKEND:
+- "mmap": a fixed size table in a memory mapped file, for the workers of a single host
+- "redis": a Redis (or anything speaking its protocol) server, for workers on several hosts
+
+A backend that fails is treated as empty and every worker falls back to fetching for itself.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .fixedpoint import Price
+
+PRICE_BOOK_BACKEND = os.getenv("PRICE_BOOK_BACKEND", "")
+PRICE_BOOK_PATH = os.getenv(
+    "PRICE_BOOK_PATH", os.path.join(tempfile.gettempdir(), "dex_agg_price_book")
+)
+PRICE_BOOK_SLOTS = int(os.getenv("PRICE_BOOK_SLOTS", "65536"))
+PRICE_BOOK_URL = os.getenv("PRICE_BOOK_URL", "redis://127.0.0.1:6379/0")
+# Seconds a worker may take to fetch a price it holds the lease of, the others wait that long
+# at most before fetching it themselves
+PRICE_BOOK_LEASE = float(os.getenv("PRICE_BOOK_LEASE", "5"))
+PRICE_BOOK_TIMEOUT = float(os.getenv("PRICE_BOOK_TIMEOUT", "0.5"))
+
+# price, fetched_at and block as stored in the shared book
+SharedEntry = Tuple[Price, float, Optional[int]]
+Key = Tuple[str, str]  # (pair_id, exchange_id), like cache.CacheKey
+
+
+def encode_price(price: Price) -> str:
+    """Decimals as their exact digits, floats marked so they come back as floats."""
+    return f"f{price!r}" if isinstance(price, float) else str(price)
+
+
+def decode_price(text: str) -> Price:
+    return float(text[1:]) if text.startswith("f") else Decimal(text)
+
+
+def key_name(key: Key) -> str:
+    return f"{key[0]}/{key[1]}"
+
+
+class SharedBook:
+    """Interface of the shared price book backends."""
+
+    def owner(self) -> str:
+        """Lease owner id of this worker, per process so forked workers don't share one."""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def read(self, key: Key) -> Optional[SharedEntry]:
+        raise NotImplementedError
+
+    def read_many(self, keys: Iterable[Key]) -> Dict[Key, SharedEntry]:
+        entries = {}
+        for key in keys:
+            entry = self.read(key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def write(self, key: Key, price: Price, fetched_at: float, block: Optional[int]):
+        raise NotImplementedError
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        """
+        Take or renew the lease `name` for `ttl` seconds. True when this worker holds it, also
+        when the backend can't tell, so a broken backend never stops prices from being fetched.
+        """
+        raise NotImplementedError
+
+    def release(self, name: str):
+        """Give up a lease before it runs out, e.g. after the price it guarded was written."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MmapBook(SharedBook):
+    """
+    Open addressing hash table in a memory mapped file, shared by every process mapping it.
+    A flock on the file keeps writers apart, readers take it shared so they never see half a
+    write. Slots are never freed, when the table is full new keys are simply not shared.
+    """
+
+    MAGIC = b"DEXAGGPB"
+    HEADER = struct.Struct("<8sI")  # magic, slot count
+    # key hash, key, price, fetched_at, block (-1 for none), lease owner, lease expiry
+    SLOT = struct.Struct("<Q64s64sdq48sd")
+
+    def __init__(self, path: str = PRICE_BOOK_PATH, slots: int = PRICE_BOOK_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Map the file, again after a fork as a flock is shared with the parent otherwise."""
+        if self._pid == os.getpid():
+            return
+        self._file = open(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), "r+b")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            self._file.seek(0)
+            magic, slots = self.HEADER.unpack(
+                self._file.read(self.HEADER.size).ljust(self.HEADER.size, b"\0")
+            )
+            if magic != self.MAGIC:
+                slots = self.slots
+                self._file.truncate(0)
+                self._file.truncate(self.HEADER.size + slots * self.SLOT.size)
+                self._file.seek(0)
+                self._file.write(self.HEADER.pack(self.MAGIC, slots))
+                self._file.flush()
+            # the first worker decides the size, the others follow the file
+            self.slots = slots
+            self._map = mmap.mmap(
+                self._file.fileno(), self.HEADER.size + slots * self.SLOT.size
+            )
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _offset(self, index: int) -> int:
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _find(self, name: str, create: bool) -> Tuple[Optional[int], tuple]:
+        """Offset and fields of the slot of `name`, a free slot when creating."""
+        encoded = name.encode()[:64]
+        digest = (
+            int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little")
+            | 1
+        )
+        for probe in range(self.slots):
+            offset = self._offset((digest + probe) % self.slots)
+            fields = self.SLOT.unpack_from(self._map, offset)
+            if fields[0] == digest and fields[1].rstrip(b"\0") == encoded:
+                return offset, fields
+            if fields[0] == 0:
+                if not create:
+                    return None, ()
+                return offset, (digest, encoded, b"", 0.0, -1, b"", 0.0)
+        return None, ()
+
+    def read(self, key: Key) -> Optional[SharedEntry]:
+        with self._locked(exclusive=False):
+            offset, fields = self._find(key_name(key), create=False)
+        if offset is None or not fields[2].rstrip(b"\0"):
+            return None
+        _, _, price, fetched_at, block, _, _ = fields
+        return (
+            decode_price(price.rstrip(b"\0").decode()),
+            fetched_at,
+            block if block >= 0 else None,
+        )
+
+    def write(self, key: Key, price: Price, fetched_at: float, block: Optional[int]):
+        with self._locked(exclusive=True):
+            offset, fields = self._find(key_name(key), create=True)
+            if offset is None:
+                return
+            digest, name, _, _, _, owner, expires = fields
+            self.SLOT.pack_into(
+                self._map,
+                offset,
+                digest,
+                name,
+                encode_price(price).encode(),
+                fetched_at,
+                block if block is not None else -1,
+                owner,
+                expires,
+            )
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        owner = self.owner().encode()[:48]
+        now = time.time()
+        with self._locked(exclusive=True):
+            offset, fields = self._find(name, create=True)
+            if offset is None:
+                return True
+            digest, encoded, price, fetched_at, block, holder, expires = fields
+            if expires > now and holder.rstrip(b"\0") != owner:
+                return False
+            self.SLOT.pack_into(
+                self._map,
+                offset,
+                digest,
+                encoded,
+                price,
+                fetched_at,
+                block,
+                owner,
+                now + ttl,
+            )
+        return True
+
+    def release(self, name: str):
+        owner = self.owner().encode()[:48]
+        with self._locked(exclusive=True):
+            offset, fields = self._find(name, create=False)
+            if offset is not None and fields[5].rstrip(b"\0") == owner:
+                self.SLOT.pack_into(self._map, offset, *fields[:5], b"", 0.0)
+
+    def clear(self):
+        with self._locked(exclusive=True):
+            size = self.slots * self.SLOT.size
+            self._map[self.HEADER.size : self.HEADER.size + size] = bytes(size)
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBook(SharedBook):
+    """
+    Shared book on a Redis server, spoken to over its wire protocol (RESP) with one connection
+    per worker. Prices are stored as "price fetched_at block" strings and expire when no worker
+    refreshed them for `retention` seconds. Leases are SET NX keys that expire on their own.
+    After a failure the server is left alone for a few seconds, reads miss and every worker
+    fetches for itself in the meantime.
+    """
+
+    def __init__(
+        self,
+        url: str = PRICE_BOOK_URL,
+        timeout: float = PRICE_BOOK_TIMEOUT,
+        retention: int = 600,
+        prefix: str = "dexagg",
+    ):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self.retention = retention
+        self.prefix = prefix
+        self._pid = None
+        self._socket: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+
+    def _connect(self):
+        self._socket = socket.create_connection((self.host, self.port), self.timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile("rb")
+        self._pid = os.getpid()
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", self.db)
+
+    def _disconnect(self):
+        if self._socket is not None and self._pid == os.getpid():
+            self._socket.close()
+        self._socket = self._reader = None
+        self._pid = None
+
+    def _send(self, *args):
+        command = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = str(arg).encode()
+            command.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._socket.sendall(b"".join(command))
+        return self._reply()
+
+    def _reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            if int(rest) < 0:
+                return None
+            data = self._reader.read(int(rest) + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._reply() for _ in range(count)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def command(self, *args):
+        """Run a command, None when the server is unavailable."""
+        with self._lock:
+            if time.monotonic() < self._down_until:
+                return None
+            try:
+                if self._pid != os.getpid():
+                    self._connect()
+                return self._send(*args)
+            except (OSError, RedisError) as e:
+                print(f"Error talking to the shared price book: {e}")
+                self._disconnect()
+                self._down_until = time.monotonic() + 5
+                return None
+
+    def _price_key(self, key: Key) -> str:
+        return f"{self.prefix}:price:{key_name(key)}"
+
+    @staticmethod
+    def _decode(value: Optional[str]) -> Optional[SharedEntry]:
+        if not value:
+            return None
+        price, fetched_at, block = value.split(" ")
+        return (
+            decode_price(price),
+            float(fetched_at),
+            int(block) if block != "-" else None,
+        )
+
+    def read(self, key: Key) -> Optional[SharedEntry]:
+        return self._decode(self.command("GET", self._price_key(key)))
+
+    def read_many(self, keys: Iterable[Key]) -> Dict[Key, SharedEntry]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.command("MGET", *[self._price_key(key) for key in keys]) or []
+        entries = {}
+        for key, value in zip(keys, values):
+            entry = self._decode(value)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def write(self, key: Key, price: Price, fetched_at: float, block: Optional[int]):
+        value = f"{encode_price(price)} {fetched_at!r} {block if block is not None else '-'}"
+        self.command("SET", self._price_key(key), value, "EX", self.retention)
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        lease = f"{self.prefix}:lease:{name}"
+        owner = self.owner()
+        milliseconds = max(int(ttl * 1000), 1)
+        taken = self.command("SET", lease, owner, "NX", "PX", milliseconds)
+        if taken == "OK":
+            return True
+        holder = self.command("GET", lease)
+        if holder is None:
+            # no answer or the lease just ran out, fetching twice is better than not at all
+            return True
+        if holder == owner:
+            self.command("PEXPIRE", lease, milliseconds)
+            return True
+        return False
+
+    def release(self, name: str):
+        # not atomic, if the lease ran out in between another worker may lose theirs and a
+        # price gets fetched twice, which is what happens without leases anyway
+        lease = f"{self.prefix}:lease:{name}"
+        if self.command("GET", lease) == self.owner():
+            self.command("DEL", lease)
+
+    def clear(self):
+        # SCAN in steps instead of KEYS, which blocks the server while it walks every key
+        cursor = "0"
+        while True:
+            reply = self.command(
+                "SCAN", cursor, "MATCH", f"{self.prefix}:*", "COUNT", 1000
+            )
+            if reply is None:
+                return
+            cursor, keys = reply
+            if keys:
+                self.command("DEL", *keys)
+            if cursor == "0":
+                return
+
+
+def shared_book_from_env() -> Optional[SharedBook]:
+    """The backend selected by PRICE_BOOK_BACKEND, None to keep the price book per worker."""
+    if not PRICE_BOOK_BACKEND:
+        return None
+    if PRICE_BOOK_BACKEND == "mmap":
+        return MmapBook()
+    if PRICE_BOOK_BACKEND == "redis":
+        return RedisBook()
+    raise ValueError(
+        f"Unknown PRICE_BOOK_BACKEND {PRICE_BOOK_BACKEND!r}, use mmap or redis"
+    )
+
+
+def claim(
+    book: SharedBook,
+    ttls: Dict[Key, float],
+    lease: float = PRICE_BOOK_LEASE,
+    wait: Optional[float] = None,
+) -> Dict[Key, SharedEntry]:
+    """
+    Split keys between this worker and the others. Returns the entries younger than their ttl
+    (`ttls` maps keys to their ttl), found right away or written while waiting on a worker
+    holding the lease. Every key missing from the result is for the caller to fetch: it holds
+    its lease, or waited `lease` seconds (or `wait`, when shorter) in vain. Release the leases
+    after fetching.
+    """
+    found: Dict[Key, SharedEntry] = {}
+    deadline = time.monotonic() + (lease if wait is None else min(wait, lease))
+    delay = 0.005
+    pending = set(ttls)
+    while True:
+        now = time.time()
+        for key, entry in book.read_many(pending).items():
+            if now - entry[1] <= ttls[key]:
+                found[key] = entry
+        pending -= set(found)
+        # the lease of a worker that gave up (or failed to fetch) becomes free, take it over
+        pending = {key for key in pending if not book.acquire(key_name(key), lease)}
+        if not pending or time.monotonic() >= deadline:
+            return found
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 0.1)
@@ -0,0 +1,206 @@
+"""
+Price updates pushed to clients over Server-Sent Events, GET /stream/?pairs=WBTCUSDC,APTUSDC.
+
+Every price put in the book passes the PriceBroadcaster, which forwards it to the subscribers of
+that pair only when the price of that exchange changed. A subscriber that can't keep up gets the
+latest price per exchange, never a backlog. Subscribed pairs are kept fresh by one refresher
+thread: every exchange price is read from the chain once per TTL, however many clients watch it.
+While the price poller runs it already refreshes everything and the refresher stays idle.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from .cache import CacheKey, CachedPrice, PriceCache, price_cache
+from .fixedpoint import Price, serialize_price
+from .models import Pair
+
+# Seconds between two refresh passes over the subscribed pairs, prices still fresh in the
+# cache aren't read again so this only bounds how late a new price is noticed
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "0.5"))
+# Seconds between keep-alive comments, so proxies don't close quiet streams
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+STREAM_MAX_PAIRS = int(os.getenv("STREAM_MAX_PAIRS", "100"))
+
+
+class Subscription:
+    """
+    The pairs a client streams and the updates it has yet to receive, the latest per exchange.
+    Updates come in on any thread, the client reads them on its event loop.
+    """
+
+    def __init__(self, pairs: Iterable[Pair], loop: asyncio.AbstractEventLoop):
+        self.pairs = {pair.pair_id: pair for pair in pairs}
+        self.loop = loop
+        self.pending: Dict[CacheKey, CachedPrice] = {}
+        self.ready = asyncio.Event()
+        self._lock = threading.Lock()
+
+    def push(self, key: CacheKey, entry: CachedPrice, replace: bool = True):
+        with self._lock:
+            if not replace and key in self.pending:
+                return
+            wake = not self.pending
+            self.pending[key] = entry
+        if wake:
+            try:
+                self.loop.call_soon_threadsafe(self.ready.set)
+            except RuntimeError:
+                pass  # loop closed, the stream is gone
+
+    async def updates(self, timeout: float) -> Dict[str, Dict[str, CachedPrice]]:
+        """Wait up to `timeout` seconds for updates, as {pair_id: {exchange_id: price}}."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        with self._lock:
+            self.ready.clear()
+            pending, self.pending = self.pending, {}
+        updates: Dict[str, Dict[str, CachedPrice]] = {}
+        for (pair_id, exchange_id), entry in pending.items():
+            updates.setdefault(pair_id, {})[exchange_id] = entry
+        return updates
+
+
+class PriceBroadcaster:
+    """Fans the prices put in the book out to the subscriptions of their pair."""
+
+    def __init__(
+        self, book: PriceCache = price_cache, interval: float = STREAM_INTERVAL
+    ):
+        self.book = book
+        self.interval = interval
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._last: Dict[CacheKey, Price] = {}  # last price sent per key
+        self._lock = threading.Lock()
+        self._stop: Optional[threading.Event] = None  # of the running refresher
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(set().union(*self._subscriptions.values()))
+
+    def subscribe(
+        self, pairs: List[Pair], loop: asyncio.AbstractEventLoop
+    ) -> Subscription:
+        """Register a client, it first gets the prices already in the book."""
+        subscription = Subscription(pairs, loop)
+        with self._lock:
+            for pair_id in subscription.pairs:
+                self._subscriptions.setdefault(pair_id, set()).add(subscription)
+            first = self._stop is None
+            if first:
+                self._stop = threading.Event()
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(self._stop,),
+                    name="price-stream",
+                    daemon=True,
+                )
+        if first:
+            self.book.subscribe(self.publish)
+            thread.start()
+
+        # after registering, so a price put in the meantime is not lost, nor overwritten
+        for key, entry in self.book.snapshot().items():
+            if key[0] in subscription.pairs:
+                subscription.push(key, entry, replace=False)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for pair_id in subscription.pairs:
+                subscribers = self._subscriptions.get(pair_id, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscriptions.pop(pair_id, None)
+                    self._last = {
+                        key: price
+                        for key, price in self._last.items()
+                        if key[0] != pair_id
+                    }
+            last = not self._subscriptions and self._stop is not None
+            if last:
+                self._stop.set()
+                self._stop = None
+        if last:
+            self.book.unsubscribe(self.publish)
+
+    def publish(self, key: CacheKey, entry: CachedPrice):
+        """Book subscriber: forward a price to the subscriptions of its pair if it changed."""
+        with self._lock:
+            subscribers = self._subscriptions.get(key[0])
+            if not subscribers or self._last.get(key) == entry.price:
+                return
+            self._last[key] = entry.price
+            subscribers = list(subscribers)
+        for subscription in subscribers:
+            subscription.push(key, entry)
+
+    def watched_pairs(self) -> List[Pair]:
+        with self._lock:
+            subscriptions = set().union(*self._subscriptions.values())
+        pairs = {}
+        for subscription in subscriptions:
+            pairs.update(subscription.pairs)
+        return list(pairs.values())
+
+    def refresh(self):
+        """One read of the subscribed pairs, only prices past their TTL go to the chain."""
+        from .queries import fetch_many_exchange_prices
+
+        pairs = [pair for pair in self.watched_pairs() if pair.active_exchanges]
+        if pairs and not self.book.warm:
+            fetch_many_exchange_prices(pairs)
+
+    def _run(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep streaming, a broken pass should not end the thread
+                print(f"Error refreshing streamed prices: {e}")
+            stop.wait(self.interval)
+
+
+# Shared by every stream in this process
+price_broadcaster = PriceBroadcaster()
+
+
+def format_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def price_events(
+    pairs: List[Pair],
+    precision: Optional[int] = None,
+    heartbeat: float = STREAM_HEARTBEAT,
+    broadcaster: PriceBroadcaster = price_broadcaster,
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of a subscription: a `price` event per pair with the exchanges whose
+    price changed, and a comment every `heartbeat` seconds without one.
+    """
+    subscription = broadcaster.subscribe(pairs, asyncio.get_running_loop())
+    try:
+        while True:
+            updates = await subscription.updates(heartbeat)
+            if not updates:
+                yield ": keep-alive\n\n"
+            for pair_id, entries in updates.items():
+                yield format_event(
+                    "price",
+                    {
+                        "token_pair": pair_id,
+                        "prices": {
+                            exchange_id: serialize_price(entry.price, precision)
+                            for exchange_id, entry in entries.items()
+                        },
+                    },
+                )
+    finally:
+        broadcaster.unsubscribe(subscription)
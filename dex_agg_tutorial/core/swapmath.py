@@ -0,0 +1,247 @@
+"""
+Local swap simulation for concentrated liquidity pools.
+
+A port of the Uniswap V3 TickMath, SqrtPriceMath and SwapMath libraries to Python integers, so
+an exact-input swap can be replayed against a snapshot of a pool's liquidity without asking the
+chain. The same math works for Hyperion, its sqrt prices only have 64 instead of 96 fractional bits.
+"""
+
+import bisect
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+# Fees are given in hundredths of a bip (pips): 3000 is 0.3%
+FEE_DENOMINATOR = 1_000_000
+
+# Multipliers of TickMath.getSqrtRatioAtTick, sqrt(1.0001)^-(2^i) as Q128.128
+_TICK_RATIOS = [
+    0xFFF97272373D413259A46990580E213A,
+    0xFFF2E50F5F656932EF12357CF3C7FDCC,
+    0xFFE5CACA7E10E4E61C3624EAA0941CD0,
+    0xFFCB9843D60F6159C9DB58835C926644,
+    0xFF973B41FA98C081472E6896DFB254C0,
+    0xFF2EA16466C96A3843EC78B326B52861,
+    0xFE5DEE046A99A2A811C461F1969C3053,
+    0xFCBE86C7900A88AEDCFFC83B479AA3A4,
+    0xF987A7253AC413176F2B074CF7815E54,
+    0xF3392B0822B70005940C7A398E4B70F3,
+    0xE7159475A2C29B7443B29C7FA6E889D9,
+    0xD097F3BDFD2022B8845AD8F792AA5825,
+    0xA9F746462D870FDF8A65DC1F90E061E5,
+    0x70D869A156D2A1B890BB3DF62BAF32F7,
+    0x31BE135F97D08FD981231505542FCFA6,
+    0x9AA508B5B7A84E1C677DE54F3E99BC9,
+    0x5D6AF8DEDB81196699C329225EE604,
+    0x2216E584F5FA1EA926041BEDFE98,
+    0x48A170391F7DC42444E8FA2,
+]
+_MAX_UINT256 = (1 << 256) - 1
+
+
+@dataclass(frozen=True)
+class PoolLiquidity:
+    """
+    What a swap simulation needs to know about a pool.
+
+    `ticks` maps every initialized tick inside `tick_range` to its liquidityNet. Without a
+    tick_range only the liquidity around the current price is known and a swap is simulated as
+    if it stays in range.
+    """
+
+    sqrt_price: int
+    tick: int
+    liquidity: int
+    fee: int
+    tick_spacing: int
+    bits: int = 96
+    ticks: Dict[int, int] = field(default_factory=dict)
+    tick_range: Optional[Tuple[int, int]] = None
+    # raw tickBitmap words the ticks were read from, lets a refresh only fetch the new words
+    words: Dict[int, int] = field(default_factory=dict)
+    ticks_fetched_at: float = 0.0
+
+    @cached_property
+    def sorted_ticks(self) -> List[int]:
+        return sorted(self.ticks)
+
+    def next_initialized_tick(self, tick: int, lte: bool) -> Tuple[int, bool]:
+        """
+        Next tick to swap towards: the closest initialized tick at or below `tick` (lte) or above
+        it. Returns (tick, initialized), the edge of the known range when there is none.
+        """
+        initialized = self.sorted_ticks
+        if lte:
+            index = bisect.bisect_right(initialized, tick)
+            if index:
+                return initialized[index - 1], True
+            return (self.tick_range[0] if self.tick_range else MIN_TICK), False
+        index = bisect.bisect_right(initialized, tick)
+        if index < len(initialized):
+            return initialized[index], True
+        return (self.tick_range[1] if self.tick_range else MAX_TICK), False
+
+
+@dataclass(frozen=True)
+class SwapResult:
+    """Outcome of an exact-input swap, amounts in raw token units."""
+
+    amount_in: int  # input actually used, including the fee
+    amount_out: int
+    fee: int
+    sqrt_price: int  # pool price after the swap
+    ticks_crossed: int
+    filled: bool  # False when the known liquidity ran out before all input was used
+
+
+def mul_div_rounding_up(a: int, b: int, denominator: int) -> int:
+    return -((-a * b) // denominator)
+
+
+def sqrt_ratio_at_tick(tick: int, bits: int = 96) -> int:
+    """TickMath.getSqrtRatioAtTick, the sqrt price at a tick with `bits` fractional bits."""
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"Tick {tick} out of range")
+
+    ratio = 0xFFFCB933BD6FAD37AA2D162D1A594001 if abs_tick & 1 else 1 << 128
+    for bit, multiplier in enumerate(_TICK_RATIOS, start=1):
+        if abs_tick & (1 << bit):
+            ratio = (ratio * multiplier) >> 128
+    if tick > 0:
+        ratio = _MAX_UINT256 // ratio
+
+    # Q128.128 to the pool's fixed-point format, rounding up like the contract
+    shift = 128 - bits
+    return (ratio >> shift) + (1 if ratio % (1 << shift) else 0)
+
+
+def amount0_delta(
+    sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool, bits: int = 96
+) -> int:
+    """SqrtPriceMath.getAmount0Delta, token0 needed to move the price between a and b."""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    numerator1 = liquidity << bits
+    numerator2 = sqrt_b - sqrt_a
+    if round_up:
+        return -(-mul_div_rounding_up(numerator1, numerator2, sqrt_b) // sqrt_a)
+    return numerator1 * numerator2 // sqrt_b // sqrt_a
+
+
+def amount1_delta(
+    sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool, bits: int = 96
+) -> int:
+    """SqrtPriceMath.getAmount1Delta, token1 needed to move the price between a and b."""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_b - sqrt_a, 1 << bits)
+    return liquidity * (sqrt_b - sqrt_a) >> bits
+
+
+def next_sqrt_price_from_input(
+    sqrt_price: int, liquidity: int, amount_in: int, zero_for_one: bool, bits: int = 96
+) -> int:
+    """SqrtPriceMath.getNextSqrtPriceFromInput, the price after adding amount_in to the pool."""
+    if zero_for_one:
+        # token0 in pushes the price down, rounded up so the price never moves too far
+        numerator1 = liquidity << bits
+        return mul_div_rounding_up(
+            numerator1, sqrt_price, numerator1 + amount_in * sqrt_price
+        )
+    # token1 in pushes the price up, rounded down
+    return sqrt_price + (amount_in << bits) // liquidity
+
+
+def compute_swap_step(
+    sqrt_price: int,
+    sqrt_target: int,
+    liquidity: int,
+    amount_remaining: int,
+    fee: int,
+    bits: int = 96,
+) -> Tuple[int, int, int, int]:
+    """
+    SwapMath.computeSwapStep for exact input, swap within a single tick range.
+    Returns (sqrt price after the step, amount in, amount out, fee amount).
+    """
+    zero_for_one = sqrt_price >= sqrt_target
+    remaining_less_fee = amount_remaining * (FEE_DENOMINATOR - fee) // FEE_DENOMINATOR
+
+    if zero_for_one:
+        amount_in = amount0_delta(sqrt_target, sqrt_price, liquidity, True, bits)
+    else:
+        amount_in = amount1_delta(sqrt_price, sqrt_target, liquidity, True, bits)
+
+    if remaining_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = next_sqrt_price_from_input(
+            sqrt_price, liquidity, remaining_less_fee, zero_for_one, bits
+        )
+    reached_target = sqrt_next == sqrt_target
+
+    if zero_for_one:
+        if not reached_target:
+            amount_in = amount0_delta(sqrt_next, sqrt_price, liquidity, True, bits)
+        amount_out = amount1_delta(sqrt_next, sqrt_price, liquidity, False, bits)
+    else:
+        if not reached_target:
+            amount_in = amount1_delta(sqrt_price, sqrt_next, liquidity, True, bits)
+        amount_out = amount0_delta(sqrt_price, sqrt_next, liquidity, False, bits)
+
+    if not reached_target:
+        # the rest of the input stays in the pool as fee
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee, FEE_DENOMINATOR - fee)
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+
+def simulate_swap(
+    pool: PoolLiquidity, amount_in: int, zero_for_one: bool
+) -> SwapResult:
+    """
+    Replay an exact-input swap of `amount_in` (raw units of token0 when zero_for_one, token1
+    otherwise) tick range by tick range, crossing initialized ticks like UniswapV3Pool.swap.
+    """
+    bits = pool.bits
+    # the contract never lets the price reach the outermost ticks
+    min_sqrt = sqrt_ratio_at_tick(MIN_TICK, bits) + 1
+    max_sqrt = sqrt_ratio_at_tick(MAX_TICK, bits) - 1
+    sqrt_price, tick, liquidity = pool.sqrt_price, pool.tick, pool.liquidity
+    remaining, amount_out, fees, crossed = amount_in, 0, 0, 0
+
+    while remaining > 0:
+        next_tick, initialized = pool.next_initialized_tick(tick, lte=zero_for_one)
+        sqrt_target = sqrt_ratio_at_tick(min(max(next_tick, MIN_TICK), MAX_TICK), bits)
+        sqrt_target = min(max(sqrt_target, min_sqrt), max_sqrt)
+
+        sqrt_price, step_in, step_out, step_fee = compute_swap_step(
+            sqrt_price, sqrt_target, liquidity, remaining, pool.fee, bits
+        )
+        remaining -= step_in + step_fee
+        amount_out += step_out
+        fees += step_fee
+
+        if sqrt_price != sqrt_target or not initialized:
+            # all input used inside this range, or we ran into the edge of the known ticks
+            break
+        # cross the tick, moving left takes its liquidityNet out again
+        net = pool.ticks[next_tick]
+        liquidity += -net if zero_for_one else net
+        crossed += 1
+        tick = next_tick - 1 if zero_for_one else next_tick
+
+    return SwapResult(
+        amount_in=amount_in - remaining,
+        amount_out=amount_out,
+        fee=fees,
+        sqrt_price=sqrt_price,
+        ticks_crossed=crossed,
+        filled=remaining == 0,
+    )
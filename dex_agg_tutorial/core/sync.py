@@ -0,0 +1,75 @@
+"""
+Event driven pool state sync.
+
+Polling reads every pool every block, changed or not. A pool sync instead holds the state of its
+pools locally and follows what happens on chain (Uniswap Swap/Mint/Burn logs, Hyperion resource
+writes in the Aptos transaction stream) to apply the changes. A pass costs a handful of range
+queries no matter how many pools are followed, and only pools that changed get new state. The
+Aptos stream can't be filtered by pool, a pass that falls too far behind it polls the pools.
+
+Adapters that can be followed like this set supports_sync and return a PoolSync from pool_sync(),
+the poller uses it when PRICE_SYNC=events.
+"""
+
+from __future__ import annotations
+
+import os
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, List
+
+from .fixedpoint import sqrt_price_to_decimal
+from .swapmath import PoolLiquidity
+
+if TYPE_CHECKING:
+    from .models import Pair
+
+# "poll" reads every pool each block, "events" follows pools through their on-chain events
+PRICE_SYNC = os.getenv("PRICE_SYNC", "poll").lower()
+# Blocks (Ethereum) a pass stays behind the head, so it doesn't follow blocks that may be reorged.
+# Aptos has no reorgs and follows the latest ledger version.
+SYNC_CONFIRMATIONS = int(os.getenv("SYNC_CONFIRMATIONS", "2"))
+# Largest block range of one eth_getLogs request, providers cap the range and result size
+SYNC_BLOCK_RANGE = int(os.getenv("SYNC_BLOCK_RANGE", "500"))
+# Transactions per page when streaming Aptos transactions, and the most pages a pass reads. When
+# the ledger is further ahead the pools are polled instead
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "100"))
+SYNC_MAX_PAGES = int(os.getenv("SYNC_MAX_PAGES", "20"))
+
+
+class PoolSync:
+    """
+    Local state of the pools of one exchange, kept up to date from chain events.
+
+    `cursor` is the last block (or ledger version) applied, the state of every pool is exact as
+    of that point. bootstrap() reads all pools once, sync() applies everything after the cursor.
+    Both return the pools that changed keyed by pair_id.
+    """
+
+    exchange_id: str
+
+    def __init__(self, pairs: List[Pair], client):
+        self.client = client
+        self.pairs: Dict[str, Pair] = {pair.pair_id: pair for pair in pairs}
+        self.pools: Dict[str, PoolLiquidity] = {}
+        self.cursor = None
+
+    @property
+    def pair_ids(self):
+        return set(self.pairs)
+
+    def bootstrap(self) -> Dict[str, PoolLiquidity]:
+        raise NotImplementedError
+
+    def sync(self) -> Dict[str, PoolLiquidity]:
+        raise NotImplementedError
+
+    def price(self, pair_id: str) -> Decimal:
+        """Price of a pair from its local pool state."""
+        pair, pool = self.pairs[pair_id], self.pools[pair_id]
+        return sqrt_price_to_decimal(
+            pool.sqrt_price,
+            pool.bits,
+            pair.base_token_decimals,
+            pair.quote_token_decimals,
+            invert=pair.is_inverted(self.exchange_id),
+        )
@@ -0,0 +1,61 @@
+"""
+Test helpers around the fake chains of core.fakes: recorded chain data and stand-ins for the
+fetch methods of the adapters.
+"""
+
+import json
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from unittest import mock
+
+from core.adapters import get_adapter
+from core.models import Pair
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def load_fixture(name: str):
+    """Recorded chain data (eth_getLogs results, Aptos transactions) from tests/fixtures."""
+    return json.loads((FIXTURES / name).read_text())
+
+
+@contextmanager
+def fake_adapters(
+    fetch_one: Optional[Dict[str, Callable]] = None,
+    fetch_many: Optional[Dict[str, Callable]] = None,
+    fetch_one_async: Optional[Dict[str, Callable]] = None,
+):
+    """Swap fetch methods of the registered adapters for stand-ins, keyed by exchange_id."""
+    with ExitStack() as stack:
+        for method, fakes in [
+            ("fetch_one", fetch_one),
+            ("fetch_many", fetch_many),
+            ("fetch_one_async", fetch_one_async),
+        ]:
+            for exchange_id, fake in (fakes or {}).items():
+                stack.enter_context(
+                    mock.patch.object(get_adapter(exchange_id), method, fake)
+                )
+        yield
+
+
+def make_pair(
+    base: str, quote: str, exchanges=("uniswap",), uid: int = 0, **fields
+) -> Pair:
+    """
+    Unsaved pair of two tokens listed on `exchanges`, with a placeholder pool on each. Any other
+    field of the pair can be given as a keyword, e.g. pool_contracts.
+    """
+    pair = Pair(
+        uid=uid,
+        pair_id=base + quote,
+        base_token=base,
+        quote_token=quote,
+        active_exchanges=list(exchanges),
+        pool_contracts={exchange: "0x1" for exchange in exchanges},
+    )
+    for name, value in fields.items():
+        setattr(pair, name, value)
+    pair.sync_is_active()
+    return pair
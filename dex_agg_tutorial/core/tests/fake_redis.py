@@ -0,0 +1,137 @@
+"""
+Local stand-in for a Redis server, answering the commands the shared price book uses over the
+Redis wire protocol, so its tests run without a server.
+"""
+
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class FakeRedis:
+    """
+    Threaded TCP server keeping strings with an optional expiry. Supports PING, AUTH, SELECT,
+    GET, MGET, SET (with NX, EX and PX), PEXPIRE, DEL and SCAN (with MATCH and COUNT), anything
+    else is an error.
+    """
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[str, Optional[float]]] = {}  # key: (value, expires)
+        self.commands = 0
+        self._cursors: Dict[str, str] = {}  # SCAN cursor: last key returned
+        self._lock = threading.Lock()
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self._server.server_address[1]}/0"
+
+    def start(self) -> "FakeRedis":
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    command = fake.read_command(self.rfile)
+                    if command is None:
+                        return
+                    self.wfile.write(fake.execute(command))
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def read_command(rfile):
+        line = rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(rfile.readline()[1:])
+            args.append(rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def _get(self, key: str) -> Optional[str]:
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def execute(self, args) -> bytes:
+        name, args = args[0].upper(), args[1:]
+        with self._lock:
+            self.commands += 1
+            if name in ("PING", "AUTH", "SELECT"):
+                return b"+OK\r\n"
+            if name == "GET":
+                return bulk(self._get(args[0]))
+            if name == "MGET":
+                return b"*%d\r\n" % len(args) + b"".join(
+                    bulk(self._get(key)) for key in args
+                )
+            if name == "SET":
+                key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+                if "NX" in options and self._get(key) is not None:
+                    return b"$-1\r\n"
+                expires = None
+                if "PX" in options:
+                    expires = int(args[2 + options.index("PX") + 1]) / 1000
+                if "EX" in options:
+                    expires = int(args[2 + options.index("EX") + 1])
+                if expires is not None:
+                    expires += time.monotonic()
+                self.data[key] = (value, expires)
+                return b"+OK\r\n"
+            if name == "PEXPIRE":
+                value = self._get(args[0])
+                if value is None:
+                    return b":0\r\n"
+                self.data[args[0]] = (value, time.monotonic() + int(args[1]) / 1000)
+                return b":1\r\n"
+            if name == "DEL":
+                removed = sum(self.data.pop(key, None) is not None for key in args)
+                return b":%d\r\n" % removed
+            if name == "SCAN":
+                return self.scan(args)
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    def scan(self, args) -> bytes:
+        """
+        Keys in name order after the last one of the cursor's previous page, so keys deleted
+        between pages don't make the next page skip any, like a real SCAN.
+        """
+        options = [a.upper() for a in args[1:]]
+        pattern, count = "*", 10
+        if "MATCH" in options:
+            pattern = args[options.index("MATCH") + 2]
+        if "COUNT" in options:
+            count = int(args[options.index("COUNT") + 2])
+        after = self._cursors.pop(args[0], "")
+        page = sorted(k for k in self.data if k > after)[:count]
+        cursor = "0"
+        if len(page) == count:
+            cursor = str(len(self._cursors) + 1 + self.commands)
+            self._cursors[cursor] = page[-1]
+        keys = [k for k in page if fnmatch.fnmatchcase(k, pattern)]
+        return (
+            b"*2\r\n"
+            + bulk(cursor)
+            + b"*%d\r\n" % len(keys)
+            + b"".join(bulk(k) for k in keys)
+        )
+
+
+def bulk(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
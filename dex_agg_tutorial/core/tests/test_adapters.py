@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from core import adapters
+from core.adapters import ExchangeAdapter, get_adapter, get_adapters, register_adapter
+from core.adapters import base
+from core.models import Pair
+from core.queries import get_token_price
+from core.validation import Exchange, Network
+
+
+class AdapterRegistryTest(SimpleTestCase):
+    """Registering exchanges and the defaults of the adapter base class."""
+
+    def setUp(self):
+        registered = dict(base._adapters)
+        self.addCleanup(
+            lambda: base._adapters.clear() or base._adapters.update(registered)
+        )
+
+    def test_builtin_exchanges_are_registered(self):
+        self.assertEqual(set(get_adapters()), set(Exchange.values()))
+        self.assertEqual(get_adapter("uniswap").network, Network.ETHEREUM)
+        self.assertEqual(get_adapter("uniswap").sqrt_price_bits, 96)
+        self.assertEqual(get_adapter("hyperion").network, Network.APTOS)
+        self.assertEqual(get_adapter("hyperion").sqrt_price_bits, 64)
+
+    def test_unknown_exchange_raises(self):
+        with self.assertRaises(KeyError):
+            get_adapter("sushiswap")
+
+    def test_fetch_many_falls_back_to_fetch_one(self):
+        @register_adapter
+        class FixedAdapter(ExchangeAdapter):
+            exchange_id = "fixed"
+            network = Network.ETHEREUM
+            sqrt_price_bits = 96
+
+            def fetch_one(self, pair, client):
+                return 2.0
+
+        pairs = [Pair(pair_id="AB"), Pair(pair_id="CD")]
+        prices = get_adapter("fixed").fetch_many(pairs, client=None)
+        self.assertEqual(prices, {"AB": 2.0, "CD": 2.0})
+        self.assertFalse(get_adapter("fixed").supports_batch)
+
+    def test_entry_point_adapters_are_loaded(self):
+        class PluginAdapter(ExchangeAdapter):
+            exchange_id = "plugin"
+            network = Network.APTOS
+            sqrt_price_bits = 64
+
+        entry_point = mock.Mock()
+        entry_point.load.return_value = PluginAdapter
+        broken = mock.Mock()
+        broken.name = "broken"
+        broken.load.side_effect = ImportError("missing dependency")
+
+        with mock.patch.object(
+            base, "entry_points", return_value=[broken, entry_point]
+        ):
+            base.load_entry_point_adapters()
+
+        self.assertIsInstance(get_adapter("plugin"), PluginAdapter)
+        self.assertIn("hyperion", adapters.get_adapters())
+
+
+class AdapterPricingTest(TestCase):
+    """A newly registered exchange is priced without touching the query code."""
+
+    def setUp(self):
+        registered = dict(base._adapters)
+        self.addCleanup(
+            lambda: base._adapters.clear() or base._adapters.update(registered)
+        )
+
+        @register_adapter
+        class FixedAdapter(ExchangeAdapter):
+            exchange_id = "fixed"
+            network = Network.ETHEREUM
+            sqrt_price_bits = 96
+
+            def fetch_one(self, pair, client):
+                return 42.0
+
+        self.pair = Pair.objects.create(
+            uid=1,
+            pair_id="WETHUSDC",
+            base_token="WETH",
+            quote_token="USDC",
+            active_exchanges=["fixed"],
+            pool_contracts={"fixed": "0x0"},
+        )
+
+    def test_registered_adapter_is_priced(self):
+        result = get_token_price("WETHUSDC", use_cache=False)
+        self.assertEqual(result["prices"], {"fixed": 42.0})
+        self.assertEqual(result["best_price"], 42.0)
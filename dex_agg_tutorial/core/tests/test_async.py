@@ -0,0 +1,86 @@
+import asyncio
+from unittest import mock
+from django.test import TestCase
+
+from core.async_queries import (
+    cached_query_exchange_async,
+    get_token_price_async,
+)
+from core.cache import price_cache
+from core.clients import close_async_clients
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.models import Pair
+
+from .fake_chain import fake_adapters
+
+UNISWAP_POOL = "0x99ac8cA7087fA4A2A1FB6357269965A2014ABc35"
+HYPERION_POOL = "0xa7bb8c9b3215e29a3e2c2370dcbad9c71816d385e7863170b147243724b2da58"
+
+
+class AsyncPricePathTest(TestCase):
+    """The async view and adapters price a pair against the local fake chains."""
+
+    def setUp(self):
+        price_cache.clear()
+        self.ethereum = FakeEthereumNode({UNISWAP_POOL: {"sqrt_price_x96": 2**96}})
+        self.aptos = FakeAptosNode({HYPERION_POOL: {"sqrt_price": 2**65}})
+        self.ethereum.start()
+        self.aptos.start()
+        env = mock.patch.dict(
+            "os.environ",
+            {
+                "MAINNET_RPC_URL": self.ethereum.url,
+                "APTOSMAINNET_RPC_URL": self.aptos.url,
+            },
+        )
+        env.start()
+        self.addCleanup(env.stop)
+        self.pair = Pair.objects.create(
+            uid=1,
+            pair_id="WBTCUSDC",
+            base_token="WBTC",
+            quote_token="USDC",
+            base_token_decimals=6,
+            quote_token_decimals=6,
+            active_exchanges=["uniswap", "hyperion"],
+            pool_contracts={"uniswap": UNISWAP_POOL, "hyperion": HYPERION_POOL},
+        )
+
+    def tearDown(self):
+        self.ethereum.stop()
+        self.aptos.stop()
+
+    async def test_async_view(self):
+        response = await self.async_client.get("/async/price/wbtcusdc/")
+        await close_async_clients()
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["prices"], {"uniswap": 1.0, "hyperion": 4.0})
+        self.assertEqual(body["best_price"], 1.0)
+
+    async def test_async_view_unknown_pair(self):
+        response = await self.async_client.get("/async/price/NOPE/")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        results = await asyncio.gather(
+            *(cached_query_exchange_async(self.pair, "hyperion") for _ in range(10))
+        )
+        await close_async_clients()
+
+        self.assertEqual(self.aptos.requests, 1)
+        self.assertEqual([r.price for r in results], [4.0] * 10)
+        self.assertEqual(sum(not r.hit for r in results), 1)
+
+    async def test_slow_exchange_is_dropped(self):
+        async def never(pair, client):
+            await asyncio.sleep(5)
+
+        with fake_adapters(fetch_one_async={"uniswap": never}), mock.patch.dict(
+            "os.environ", {"UNISWAP_QUERY_DEADLINE": "0.2"}
+        ):
+            result = await get_token_price_async(self.pair)
+        await close_async_clients()
+
+        self.assertEqual(result["prices"], {"hyperion": 4.0})
@@ -0,0 +1,90 @@
+import sys
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.adapters.uniswap import query_uniswap_price
+from core.benchmarks import live_server, load_test, percentile, summarize
+from core.clients import NetworkClient
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.models import Pair
+from core.validation import Network
+
+from .test_quotes import POOL
+
+
+class SummaryTest(SimpleTestCase):
+    def test_percentiles(self):
+        samples = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile(samples, 100), 100)
+        self.assertEqual(percentile([3.0], 99), 3)
+
+        summary = summarize(list(reversed(samples)), elapsed=2)
+        self.assertEqual((summary["p50_ms"], summary["max_ms"]), (50, 100))
+        self.assertEqual(summary["throughput"], 50)
+        self.assertEqual(summarize([])["count"], 0)
+
+
+class FaultInjectionTest(SimpleTestCase):
+    """The fake nodes can be made slow and unreliable."""
+
+    def test_failing_rpc(self):
+        node = FakeEthereumNode(
+            {POOL: {"sqrt_price_x96": 2**96}}, failure_rate=1
+        ).start()
+        self.addCleanup(node.stop)
+        pair = Pair(
+            pair_id="AAABBB",
+            base_token_decimals=18,
+            quote_token_decimals=18,
+            pool_contracts={"uniswap": POOL},
+        )
+        client = NetworkClient(Network.ETHEREUM, node.url)
+        self.assertIsNone(query_uniswap_price(pair, client))
+        self.assertEqual(node.failures, node.requests)
+
+        node.failure_rate = 0
+        self.assertEqual(query_uniswap_price(pair, client), 1)
+
+    def test_latency_and_failures_are_repeatable(self):
+        runs = []
+        for _ in range(2):
+            node = FakeAptosNode(jitter=0.001, failure_rate=0.5).start()
+            self.addCleanup(node.stop)
+            statuses = [requests.get(f"{node.url}/v1").status_code for _ in range(20)]
+            self.assertEqual(statuses.count(503), node.failures)
+            runs.append(statuses)
+        self.assertEqual(runs[0], runs[1])
+        self.assertTrue(0 < runs[0].count(503) < 20)
+
+
+@override_settings(ALLOWED_HOSTS=["127.0.0.1"])
+class LoadTest(TestCase):
+    def test_load_against_the_api(self):
+        Pair.objects.create(
+            uid=1,
+            pair_id="AAABBB",
+            base_token="AAA",
+            quote_token="BBB",
+            active_exchanges=["uniswap"],
+        )
+        with live_server() as url:
+            summary = load_test(url, ["/pairs/", "/nothing/"], 40, 4)
+        self.assertEqual(summary["count"], 40)
+        self.assertEqual(summary["status"], {"200": 20, "404": 20})
+        self.assertEqual(summary["errors"], 20)
+        self.assertGreater(summary["throughput"], 0)
+        self.assertLessEqual(summary["p50_ms"], summary["p99_ms"])
+
+    def test_server_starts_no_background_threads(self):
+        # config/wsgi.py starts the poller when imported, the benchmark server leaves it alone
+        modules = {k: v for k, v in sys.modules.items() if k != "config.wsgi"}
+        with mock.patch.dict(sys.modules, modules, clear=True), mock.patch(
+            "core.apps.start_background_threads"
+        ) as start:
+            with live_server():
+                pass
+        start.assert_not_called()
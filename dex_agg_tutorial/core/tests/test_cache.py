@@ -0,0 +1,114 @@
+import threading
+import time
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+
+from core.cache import PriceCache, get_price_ttl, price_cache
+from core.models import Pair
+from core.queries import get_token_price
+
+from .fake_chain import fake_adapters
+
+
+class PriceCacheTest(SimpleTestCase):
+    """TTL, LRU eviction and coalescing of the price cache."""
+
+    def test_fresh_entry_is_a_hit(self):
+        cache = PriceCache()
+        calls = []
+        fetch = lambda: calls.append(1) or 100.0  # noqa: E731
+
+        first = cache.get_or_fetch(("WBTCUSDC", "uniswap"), 10, fetch)
+        second = cache.get_or_fetch(("WBTCUSDC", "uniswap"), 10, fetch)
+
+        self.assertFalse(first.hit)
+        self.assertTrue(second.hit)
+        self.assertEqual(second.price, 100.0)
+        self.assertEqual(len(calls), 1)
+
+    def test_expired_entry_is_fetched_again(self):
+        cache = PriceCache()
+        cache.put(("WBTCUSDC", "hyperion"), 100.0, fetched_at=time.time() - 5)
+        entry = cache.get_or_fetch(("WBTCUSDC", "hyperion"), 0.5, lambda: 101.0)
+        self.assertFalse(entry.hit)
+        self.assertEqual(entry.price, 101.0)
+
+    def test_failed_fetch_is_not_cached(self):
+        cache = PriceCache()
+        self.assertIsNone(cache.get_or_fetch(("A", "uniswap"), 10, lambda: None))
+        self.assertEqual(
+            cache.get_or_fetch(("A", "uniswap"), 10, lambda: 1.0).price, 1.0
+        )
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PriceCache(max_entries=2)
+        cache.put(("A", "uniswap"), 1.0)
+        cache.put(("B", "uniswap"), 2.0)
+        cache.get(("A", "uniswap"))  # A is now more recent than B
+        cache.put(("C", "uniswap"), 3.0)
+
+        self.assertIsNotNone(cache.get(("A", "uniswap")))
+        self.assertIsNone(cache.get(("B", "uniswap")))
+        self.assertIsNotNone(cache.get(("C", "uniswap")))
+
+    def test_concurrent_misses_share_one_fetch(self):
+        cache = PriceCache()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42.0
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    cache.get_or_fetch(("WBTCUSDC", "uniswap"), 10, fetch)
+                )
+            )
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.price for r in results], [42.0] * 10)
+        self.assertEqual(cache.stats()["coalesced"], 9)
+
+    def test_ttl_follows_block_time(self):
+        self.assertEqual(get_price_ttl("uniswap"), 12.0)
+        self.assertLess(get_price_ttl("hyperion"), 1)
+        with mock.patch.dict("os.environ", {"UNISWAP_PRICE_TTL": "3"}):
+            self.assertEqual(get_price_ttl("uniswap"), 3.0)
+
+
+class CachedPriceResponseTest(TestCase):
+    """get_token_price reports cache hits and age per exchange."""
+
+    def setUp(self):
+        price_cache.clear()
+        Pair.objects.create(
+            uid=1,
+            pair_id="USDCWETH",
+            base_token="USDC",
+            quote_token="WETH",
+            base_token_decimals=6,
+            quote_token_decimals=18,
+            active_exchanges=["uniswap"],
+            pool_contracts={"uniswap": "0x1"},
+        )
+
+    def test_second_request_is_served_from_cache(self):
+        fake = mock.Mock(return_value=0.0004)
+        with fake_adapters(fetch_one={"uniswap": fake}):
+            first = get_token_price("USDCWETH")
+            second = get_token_price("USDCWETH")
+
+        self.assertEqual(fake.call_count, 1)
+        self.assertFalse(first["cache"]["uniswap"]["hit"])
+        self.assertTrue(second["cache"]["uniswap"]["hit"])
+        self.assertGreaterEqual(second["cache"]["uniswap"]["age"], 0)
+        self.assertEqual(second["prices"], {"uniswap": 0.0004})
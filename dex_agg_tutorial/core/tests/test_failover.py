@@ -0,0 +1,219 @@
+import asyncio
+import os
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.adapters.hyperion import hyperion_resource_url
+from core.adapters.uniswap import query_uniswap_price_async
+from core.clients import (
+    AsyncNetworkClient,
+    NetworkClient,
+    client_settings,
+    request_json,
+)
+from core.failover import Endpoint, FailoverSession, FailoverSettings, split_urls
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.metrics import RPC_BREAKER_OPENS, RPC_HEDGES, registry
+from core.models import Pair
+from core.validation import BadRequestException, Network
+
+HYPERION_POOL = "0x" + "a" * 64
+UNISWAP_POOL = "0x99ac8cA7087fA4A2A1FB6357269965A2014ABc35"
+
+
+class SettingsTest(SimpleTestCase):
+    def test_split_urls(self):
+        self.assertEqual(
+            split_urls("https://a.example/, https://b.example"),
+            ["https://a.example", "https://b.example"],
+        )
+        self.assertEqual(split_urls(None), [])
+
+    def test_per_network_settings(self):
+        env = {
+            "MAINNET_RPC_URL": "https://a.example,https://b.example",
+            "MAINNET_RPC_DEADLINE": "2.5",
+            "MAINNET_RPC_HEDGE": "0",
+        }
+        with mock.patch.dict(os.environ, env):
+            settings = client_settings(Network.ETHEREUM)
+            client = NetworkClient(Network.ETHEREUM, **settings)
+        self.assertEqual(settings["failover"].deadline, 2.5)
+        self.assertFalse(settings["failover"].hedge)
+        self.assertEqual(client.rpc_url, "https://a.example")
+        self.assertEqual(len(client.stats()["endpoints"]), 2)
+        client.close()
+
+
+class BreakerTest(SimpleTestCase):
+    def test_opens_and_probes_after_cooldown(self):
+        endpoint = Endpoint(
+            "https://a.example",
+            FailoverSettings(breaker_failures=2, breaker_cooldown=10),
+        )
+        self.assertFalse(endpoint.record(0.1, True, now=0))
+        self.assertTrue(endpoint.record(0.1, True, now=1))
+        self.assertFalse(endpoint.may_send(now=5))
+
+        # a single probe once the cooldown is over, its failure opens the breaker again
+        self.assertTrue(endpoint.acquire(now=11))
+        self.assertFalse(endpoint.acquire(now=11))
+        self.assertTrue(endpoint.record(0.1, True, now=12))
+        self.assertFalse(endpoint.may_send(now=15))
+
+        self.assertTrue(endpoint.acquire(now=22))
+        endpoint.record(0.1, False, now=22)
+        self.assertFalse(endpoint.is_open)
+        self.assertTrue(endpoint.may_send(now=22))
+
+
+class FailoverTest(SimpleTestCase):
+    """Requests against fake nodes, the first of them failing or slow."""
+
+    def setUp(self):
+        registry.reset()
+        self.bad = FakeAptosNode().start()
+        self.good = FakeAptosNode().start()
+        self.addCleanup(self.bad.stop)
+        self.addCleanup(self.good.stop)
+
+    def rpc_client(self, **settings) -> NetworkClient:
+        client = NetworkClient(
+            Network.APTOS,
+            f"{self.bad.url},{self.good.url}",
+            failover=FailoverSettings(**{"backoff": 0, **settings}),
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def test_fails_over_and_opens_the_breaker(self):
+        self.bad.failure_rate = 1
+        client = self.rpc_client(hedge=False, breaker_failures=2)
+        # the first pick is random, every request still gets its answer
+        for _ in range(50):
+            request_json(f"{client.rpc_url}/v1", client)
+            if RPC_BREAKER_OPENS.value(network="aptosMainnet"):
+                break
+        self.assertEqual(self.bad.requests, 2)
+
+        for _ in range(10):
+            request_json(f"{client.rpc_url}/v1", client)
+        self.assertEqual(self.bad.requests, 2)
+        self.assertEqual(
+            [e["open"] for e in client.stats()["endpoints"]], [True, False]
+        )
+
+    def test_not_found_is_an_answer(self):
+        client = self.rpc_client(hedge=False)
+        response = client.get(f"{client.rpc_url}/v1/accounts/0x1/resource/0x1::a::B")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.bad.requests + self.good.requests, 1)
+
+    def test_slow_endpoint_is_hedged(self):
+        self.bad.latency = 0.5
+        client = self.rpc_client(hedge_delay=0.05)
+        session: FailoverSession = client.session
+        slow, fast = session.endpoints
+
+        started = time.monotonic()
+        response = session.attempt(
+            [slow, fast], "GET", "/v1", (), {}, deadline=started + 5
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(RPC_HEDGES.value(network="aptosMainnet"), 1)
+        self.assertEqual(self.good.requests, 1)
+
+    def test_deadline_bounds_retries(self):
+        self.bad.latency = self.good.latency = 0.3
+        self.bad.failure_rate = self.good.failure_rate = 1
+        client = self.rpc_client(deadline=0.4, retries=5, hedge=False)
+        started = time.monotonic()
+        with self.assertRaises(Exception):
+            request_json(f"{client.rpc_url}/v1", client)
+        self.assertLess(time.monotonic() - started, 0.6)
+
+    def test_web3_fails_over(self):
+        bad, good = FakeEthereumNode(failure_rate=1).start(), FakeEthereumNode().start()
+        self.addCleanup(bad.stop)
+        self.addCleanup(good.stop)
+        client = NetworkClient(
+            Network.ETHEREUM,
+            [bad.url, good.url],
+            failover=FailoverSettings(backoff=0, hedge=False),
+        )
+        self.addCleanup(client.close)
+        for _ in range(3):
+            self.assertEqual(client.web3.eth.block_number, good.block_number)
+
+
+class AsyncFailoverTest(SimpleTestCase):
+    """The async client moves on to the next endpoint when one fails."""
+
+    async def test_get_json_moves_on(self):
+        bad = FakeAptosNode(
+            {HYPERION_POOL: {"sqrt_price": 2**65}}, failure_rate=1
+        ).start()
+        good = FakeAptosNode({HYPERION_POOL: {"sqrt_price": 2**65}}).start()
+        self.addCleanup(bad.stop)
+        self.addCleanup(good.stop)
+        client = AsyncNetworkClient(Network.APTOS, [bad.url, good.url])
+        try:
+            with mock.patch("builtins.print"):
+                data = await client.get_json(
+                    hyperion_resource_url(client.rpc_url, HYPERION_POOL)
+                )
+            self.assertEqual(int(data["data"]["sqrt_price"]), 2**65)
+            self.assertEqual(client.rpc_url, good.url)
+
+            await client.get_json(hyperion_resource_url(client.rpc_url, HYPERION_POOL))
+            self.assertEqual((bad.requests, good.requests), (1, 2))
+        finally:
+            await client.close()
+
+    async def test_get_json_retries_and_deadline(self):
+        down = FakeAptosNode(failure_rate=1).start()
+        slow = FakeAptosNode({HYPERION_POOL: {"sqrt_price": 2**65}}, latency=1).start()
+        self.addCleanup(down.stop)
+        self.addCleanup(slow.stop)
+        settings = FailoverSettings(deadline=0.3, retries=2, backoff=0)
+
+        client = AsyncNetworkClient(Network.APTOS, [down.url], failover=settings)
+        try:
+            with self.assertRaises(BadRequestException):
+                await client.get_json(hyperion_resource_url(down.url, HYPERION_POOL))
+            self.assertEqual(down.requests, 3)
+        finally:
+            await client.close()
+
+        client = AsyncNetworkClient(Network.APTOS, [slow.url], failover=settings)
+        try:
+            started = time.monotonic()
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.get_json(hyperion_resource_url(slow.url, HYPERION_POOL))
+            self.assertLess(time.monotonic() - started, 0.9)
+        finally:
+            await client.close()
+
+    async def test_web3_moves_on(self):
+        bad = FakeEthereumNode(
+            {UNISWAP_POOL: {"sqrt_price_x96": 2**96}}, failure_rate=1
+        )
+        good = FakeEthereumNode({UNISWAP_POOL: {"sqrt_price_x96": 2**96}})
+        for node in (bad.start(), good.start()):
+            self.addCleanup(node.stop)
+        client = AsyncNetworkClient(Network.ETHEREUM, [bad.url, good.url])
+        pair = Pair(
+            pair_id="AAABBB",
+            base_token_decimals=6,
+            quote_token_decimals=6,
+            pool_contracts={"uniswap": UNISWAP_POOL},
+        )
+        try:
+            with mock.patch("builtins.print"):
+                self.assertIsNone(await query_uniswap_price_async(pair, client))
+            self.assertEqual(await query_uniswap_price_async(pair, client), 1)
+        finally:
+            await client.close()
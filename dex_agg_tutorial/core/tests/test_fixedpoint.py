@@ -0,0 +1,128 @@
+from decimal import Decimal
+from fractions import Fraction
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.adapters.hyperion import hyperion_price_from_sqrt
+from core.adapters.uniswap import uniswap_price_from_sqrt
+from core.cache import price_cache
+from core.fixedpoint import (
+    format_price,
+    serialize_price,
+    sqrt_price_ratio,
+    sqrt_price_to_decimal,
+    sqrt_prices_to_decimals,
+)
+from core.models import Pair
+
+from .fake_chain import fake_adapters
+
+# sqrtPriceX96 of a USDC/WETH pool with ETH at about 2500 USDC,
+# token0 USDC (6 decimals), token1 WETH (18 decimals)
+USDC_WETH_SQRT_PRICE = 1584563250285286875327668130176789
+
+
+class FixedPointTest(SimpleTestCase):
+    """Exact conversion of fixed-point sqrt prices."""
+
+    def test_ratio_is_exact(self):
+        numerator, denominator = sqrt_price_ratio(USDC_WETH_SQRT_PRICE, 96, 6, 18)
+        expected = Fraction(USDC_WETH_SQRT_PRICE**2, 2**192) / 10**12
+        self.assertEqual(Fraction(numerator, denominator), expected)
+
+    def test_decimal_is_rounded_once(self):
+        price = sqrt_price_to_decimal(USDC_WETH_SQRT_PRICE, 96, 6, 18, precision=40)
+        expected = Fraction(USDC_WETH_SQRT_PRICE**2, 2**192) / 10**12
+        self.assertEqual(len(price.as_tuple().digits), 40)
+        self.assertLess(abs(Fraction(price) - expected), expected / 10**39)
+
+    def test_both_token_orderings(self):
+        price = sqrt_price_to_decimal(USDC_WETH_SQRT_PRICE, 96, 6, 18)
+        inverted = sqrt_price_to_decimal(USDC_WETH_SQRT_PRICE, 96, 18, 6, invert=True)
+        # WETH priced in USDC is the inverse of USDC priced in WETH
+        self.assertAlmostEqual(float(price * inverted), 1.0, places=20)
+        self.assertAlmostEqual(float(inverted), 2500.0, places=6)
+
+    def test_q64_64(self):
+        self.assertEqual(sqrt_price_to_decimal(2**64, 64, 8, 8), Decimal(1))
+        self.assertEqual(sqrt_price_to_decimal(2**65, 64, 8, 6), Decimal(400))
+
+    def test_zero_price_cannot_be_inverted(self):
+        with self.assertRaises(ZeroDivisionError):
+            sqrt_price_ratio(0, 96, 18, 18, invert=True)
+        self.assertEqual(
+            sqrt_prices_to_decimals([2**96, 0], 96, 18, 18, invert=True),
+            [Decimal(1), None],
+        )
+
+    def test_batch_matches_single(self):
+        sqrt_prices = [USDC_WETH_SQRT_PRICE, 2**96, 3 * 2**95]
+        decimals = [(6, 18), (18, 18), (8, 6)]
+        batch = sqrt_prices_to_decimals(
+            sqrt_prices, 96, [d[0] for d in decimals], [d[1] for d in decimals]
+        )
+        self.assertEqual(
+            batch,
+            [sqrt_price_to_decimal(s, 96, *d) for s, d in zip(sqrt_prices, decimals)],
+        )
+
+    def test_format_price(self):
+        self.assertEqual(
+            format_price(Decimal("1.23456789E-12"), 4), "0.000000000001235"
+        )
+        self.assertEqual(format_price(0.1), "0.1")
+        self.assertEqual(serialize_price(Decimal("2.5")), 2.5)
+        self.assertEqual(serialize_price(Decimal("2.5"), 1), "2")
+
+    def test_adapters_use_exact_math(self):
+        usdc_weth = Pair(base_token_decimals=6, quote_token_decimals=18)
+        self.assertEqual(
+            uniswap_price_from_sqrt(usdc_weth, USDC_WETH_SQRT_PRICE),
+            sqrt_price_to_decimal(USDC_WETH_SQRT_PRICE, 96, 6, 18),
+        )
+        apt_usdc = Pair(base_token_decimals=8, quote_token_decimals=6)
+        self.assertEqual(hyperion_price_from_sqrt(apt_usdc, 2**64), Decimal(100))
+
+
+class PricePrecisionTest(APITestCase):
+    """?precision= returns prices as strings with the requested significant digits."""
+
+    def setUp(self):
+        price_cache.clear()
+        self.addCleanup(price_cache.clear)
+        Pair.objects.create(
+            uid=1,
+            pair_id="USDCWETH",
+            base_token="USDC",
+            quote_token="WETH",
+            base_token_decimals=6,
+            quote_token_decimals=18,
+            active_exchanges=["uniswap"],
+            pool_contracts={"uniswap": "0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640"},
+        )
+        exact = sqrt_price_to_decimal(USDC_WETH_SQRT_PRICE, 96, 6, 18)
+        fakes = fake_adapters(fetch_one={"uniswap": lambda pair, client: exact})
+        fakes.__enter__()
+        self.addCleanup(fakes.__exit__, None, None, None)
+
+    def test_numbers_by_default(self):
+        response = self.client.get(reverse("price", args=["USDCWETH"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(response.json()["best_price"], 0.0004)
+
+    def test_strings_with_precision(self):
+        response = self.client.get(
+            reverse("price", args=["USDCWETH"]), {"precision": 6}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["best_price"], "0.000400000")
+        self.assertEqual(response.json()["prices"]["uniswap"], "0.000400000")
+
+    def test_invalid_precision(self):
+        for precision in ["0", "abc", "500"]:
+            response = self.client.get(
+                reverse("price", args=["USDCWETH"]), {"precision": precision}
+            )
+            self.assertEqual(response.status_code, 400)
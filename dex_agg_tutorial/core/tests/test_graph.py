@@ -0,0 +1,175 @@
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.cache import CachedPrice, price_cache
+from core.graph import TokenGraph, token_graph
+from core.models import Pair
+
+from .fake_chain import make_pair
+
+
+class TokenGraphTest(SimpleTestCase):
+    """The bounded-hop search over the token graph."""
+
+    def setUp(self):
+        self.graph = TokenGraph()
+        for base, quote, rate in [
+            ("APT", "USDC", 5.0),
+            ("WETH", "USDC", 2500.0),
+            ("APT", "WBTC", 0.00005),
+            ("WBTC", "WETH", 30.0),
+        ]:
+            self.graph.add_pair(make_pair(base, quote))
+            self.graph.set_rate(base + quote, rate)
+
+    def test_chains_pairs_both_ways(self):
+        rate, path = self.graph.best_path("APT", "WETH")
+        # APT -> USDC -> WETH gives 5 / 2500, APT -> WBTC -> WETH only 0.00005 * 30
+        self.assertAlmostEqual(rate, 0.002)
+        self.assertEqual(
+            [self.graph.describe_edge(e)["pair_id"] for e in path],
+            ["APTUSDC", "WETHUSDC"],
+        )
+        # the other way round WETH -> WBTC -> APT is better, 1 / 0.0015 over 1 / 0.002
+        rate, _ = self.graph.best_path("WETH", "APT")
+        self.assertAlmostEqual(rate, 1 / 0.0015)
+
+    def test_search_sets_rates(self):
+        rate, path = self.graph.search({"APTUSDC": 10.0}, "APT", "WETH")
+        self.assertAlmostEqual(rate, 0.004)
+        self.assertEqual([hop["pair_id"] for hop in path], ["APTUSDC", "WETHUSDC"])
+
+    def test_max_hops(self):
+        self.assertIsNone(self.graph.best_path("APT", "WETH", max_hops=1))
+        self.assertIsNotNone(self.graph.best_path("APT", "USDC", max_hops=1))
+
+    def test_unpriced_and_unknown_tokens(self):
+        self.graph.add_pair(make_pair("DOGE", "USDC"))
+        self.assertIsNone(self.graph.best_path("DOGE", "WETH"))
+        self.assertIsNone(self.graph.best_path("APT", "XYZ"))
+
+    def test_arbitrage_cycle_is_not_taken(self):
+        # USDC -> WETH -> WBTC -> USDC returns more than it started with
+        self.graph.add_pair(make_pair("WBTC", "USDC"))
+        self.graph.set_rate("WBTCUSDC", 200000.0)
+        rate, path = self.graph.best_path("APT", "WETH", max_hops=4)
+
+        tokens = [self.graph.describe_edge(e)["from"] for e in path] + ["WETH"]
+        self.assertEqual(len(tokens), len(set(tokens)))
+        # APT -> WBTC -> USDC -> WETH, without looping through the cycle again
+        self.assertAlmostEqual(rate, 0.00005 * 200000 / 2500)
+
+    def test_python_search_matches_numpy(self):
+        expected = self.graph.best_path("APT", "WETH")
+        with mock.patch("core.graph.numpy", None):
+            self.assertEqual(self.graph.best_path("APT", "WETH"), expected)
+
+    def test_pairs_near(self):
+        near = {pair.pair_id for pair in self.graph.pairs_near("APT", 1)}
+        self.assertEqual(near, {"APTUSDC", "APTWBTC"})
+        self.assertEqual(len(self.graph.pairs_near("APT", 2)), 4)
+
+
+class PathAPITest(APITestCase):
+    """/path/ prices tokens over pairs from the database, new pairs join the graph right away."""
+
+    PRICES = {"APTUSDC": Decimal(5), "WETHUSDC": Decimal(2500), "LINKUSDC": Decimal(20)}
+
+    def setUp(self):
+        token_graph.clear()
+        self.addCleanup(token_graph.clear)
+        for uid, (base, quote) in enumerate([("APT", "USDC"), ("WETH", "USDC")], 1):
+            Pair.objects.create(
+                uid=uid,
+                pair_id=base + quote,
+                base_token=base,
+                quote_token=quote,
+                active_exchanges=["uniswap"],
+            )
+        patcher = mock.patch(
+            "core.graph.fetch_many_exchange_prices", side_effect=self.fake_prices
+        )
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_prices(self, pairs):
+        return {
+            pair.pair_id: {
+                "uniswap": CachedPrice(self.PRICES[pair.pair_id], time.time())
+            }
+            for pair in pairs
+        }
+
+    def test_path(self):
+        response = self.client.get(reverse("path", args=["apt", "weth"]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertAlmostEqual(data["price"], 0.002)
+        self.assertEqual(data["hops"], 2)
+        self.assertEqual([hop["to"] for hop in data["path"]], ["USDC", "WETH"])
+
+    def test_far_pairs_priced_from_the_book(self):
+        price_cache.clear()
+        self.addCleanup(price_cache.clear)
+        price_cache.put(("WETHUSDC", "uniswap"), Decimal(2000))
+        with mock.patch("core.graph.PATH_MAX_FETCH", 1):
+            response = self.client.get(reverse("path", args=["APT", "WETH"]))
+
+        # only APTUSDC, the nearest pair, was fetched
+        self.assertEqual(
+            [pair.pair_id for pair in self.fetch.call_args.args[0]], ["APTUSDC"]
+        )
+        self.assertAlmostEqual(response.json()["price"], 0.0025)
+
+        # without a price in the book the far pair is left unpriced
+        price_cache.clear()
+        with mock.patch("core.graph.PATH_MAX_FETCH", 1):
+            response = self.client.get(reverse("path", args=["APT", "WETH"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_pair_added_through_the_api(self):
+        self.client.get(reverse("path", args=["APT", "WETH"]))  # builds the graph
+        admin = User.objects.create_user("admin", password="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        self.client.post(
+            "/pairs/",
+            {
+                "pair_id": "LINKUSDC",
+                "base_token": "LINK",
+                "quote_token": "USDC",
+                "base_token_decimals": 18,
+                "quote_token_decimals": 6,
+                "active_exchanges": ["uniswap"],
+            },
+            format="json",
+        )
+
+        response = self.client.get(reverse("path", args=["LINK", "APT"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(response.json()["price"], 4)
+
+    def test_errors(self):
+        self.assertEqual(
+            self.client.get(reverse("path", args=["APT", "DOGE"])).status_code, 404
+        )
+        self.assertEqual(
+            self.client.get(reverse("path", args=["APT", "APT"])).status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("path", args=["APT", "WETH"]), {"max_hops": "1"}
+            ).status_code,
+            404,
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("path", args=["APT", "WETH"]), {"max_hops": "9"}
+            ).status_code,
+            400,
+        )
@@ -0,0 +1,193 @@
+import os
+import tempfile
+from array import array
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.cache import PriceCache
+from core.history import (
+    Bars,
+    HistoryRecorder,
+    chunk_bars,
+    compact_history,
+    ohlc,
+    parse_interval,
+)
+from core.models import Pair, PriceHistoryChunk
+from core.shared import MmapBook
+
+# 2025-01-01 00:00:00 UTC, a whole day so buckets line up
+T0 = 1735689600.0
+
+
+def record(book: PriceCache, points, key=("AAABBB", "uniswap")):
+    for offset, price in points:
+        book.put(key, price, fetched_at=T0 + offset, block=int(offset))
+
+
+class RecorderMixin:
+    def setUp(self):
+        self.book = PriceCache()
+        self.recorder = HistoryRecorder(self.book)
+        self.book.subscribe(self.recorder.record)
+
+
+class OHLCTest(SimpleTestCase):
+    """Bucketing bars, with and without numpy."""
+
+    def bars(self):
+        closes = array("d", [10, 12, 9, 11, 20, 18])
+        return Bars(
+            array("d", [T0 + t for t in (5, 0, 30, 59, 61, 90)]),
+            array("q", [5, 0, 30, 59, 61, 90]),
+            closes,
+            closes,
+            closes,
+            closes,
+            array("q", [1] * 6),
+        )
+
+    def test_buckets(self):
+        bars = ohlc(self.bars(), 60)
+        self.assertEqual(list(bars.times), [T0, T0 + 60])
+        # sorted by time the first minute goes 12, 10, 9, 11
+        self.assertEqual(list(bars.opens), [12, 20])
+        self.assertEqual(list(bars.highs), [12, 20])
+        self.assertEqual(list(bars.lows), [9, 18])
+        self.assertEqual(list(bars.closes), [11, 18])
+        self.assertEqual(list(bars.counts), [4, 2])
+        self.assertEqual(list(bars.blocks), [59, 90])
+
+    def test_bounds(self):
+        bars = ohlc(self.bars(), 60, start=T0 + 10, end=T0 + 61)
+        self.assertEqual(list(bars.counts), [2, 1])
+
+    def test_python_matches_numpy(self):
+        expected = ohlc(self.bars(), 30)
+        with mock.patch("core.history.numpy", None):
+            self.assertEqual(ohlc(self.bars(), 30), expected)
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval("1m"), 60)
+        self.assertEqual(parse_interval("4h"), 14400)
+        for invalid in ["0m", "1w", "m", "-1s"]:
+            with self.assertRaises(ValueError):
+                parse_interval(invalid)
+
+
+class HistoryRecorderTest(RecorderMixin, TestCase):
+    """Prices put in the book are buffered and written as one chunk per series."""
+
+    def test_flush_is_one_bulk_insert(self):
+        record(self.book, [(0, 1.0), (12, 1.5), (24, 2.0)])
+        record(self.book, [(0, 3.0)], key=("AAABBB", "hyperion"))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.recorder.flush(), 4)
+        self.assertEqual(PriceHistoryChunk.objects.count(), 2)
+
+        chunk = PriceHistoryChunk.objects.get(exchange_id="uniswap")
+        self.assertEqual((chunk.start, chunk.end, chunk.count), (T0, T0 + 24, 3))
+        self.assertEqual(list(chunk_bars(chunk).closes), [1.0, 1.5, 2.0])
+        self.assertEqual(self.recorder.flush(), 0)
+
+    def test_cache_hits_are_not_recorded(self):
+        self.book.get_or_fetch(("AAABBB", "uniswap"), 60, lambda: 1.0)
+        self.book.get_or_fetch(("AAABBB", "uniswap"), 60, lambda: 2.0)
+        self.assertEqual(self.recorder.flush(), 1)
+
+
+class CompactionTest(RecorderMixin, TestCase):
+    """Old raw points become minute bars, small chunks of a closed hour are merged."""
+
+    def test_merge_closed_hours(self):
+        for minute in range(3):
+            record(self.book, [(minute * 60, 1.0 + minute), (minute * 60 + 30, 1.0)])
+            self.recorder.flush()
+
+        stats = compact_history(now=T0 + 7200)
+        self.assertEqual(stats["merged"], 3)
+        chunk = PriceHistoryChunk.objects.get()
+        self.assertEqual((chunk.resolution, chunk.count), (0, 6))
+
+    def test_downsample_past_retention(self):
+        record(self.book, [(0, 1.0), (20, 3.0), (40, 2.0), (70, 5.0)])
+        self.recorder.flush()
+
+        compact_history(now=T0 + 2 * 86400)
+        chunk = PriceHistoryChunk.objects.get()
+        self.assertEqual(chunk.resolution, 60)
+        bars = chunk_bars(chunk)
+        self.assertEqual(list(bars.opens), [1.0, 5.0])
+        self.assertEqual(list(bars.highs), [3.0, 5.0])
+        self.assertEqual(list(bars.closes), [2.0, 5.0])
+        self.assertEqual(list(bars.counts), [3, 1])
+
+    def test_one_worker_compacts(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "book")
+        first, second = (MmapBook(path, slots=16) for _ in range(2))
+        # as seen from two worker processes
+        first.owner, second.owner = (lambda: "first"), (lambda: "second")
+        first = HistoryRecorder(PriceCache(shared=first))
+        second = HistoryRecorder(PriceCache(shared=second))
+
+        self.assertTrue(first.compacts())
+        self.assertFalse(second.compacts())
+        self.assertTrue(first.compacts())
+        self.assertTrue(self.recorder.compacts())
+
+
+class HistoryAPITest(RecorderMixin, APITestCase):
+    """/history/ buckets what was recorded."""
+
+    def setUp(self):
+        super().setUp()
+        Pair.objects.create(
+            uid=1,
+            pair_id="AAABBB",
+            base_token="AAA",
+            quote_token="BBB",
+            active_exchanges=["uniswap", "hyperion"],
+        )
+        record(self.book, [(0, 1.0), (30, 2.0), (60, 1.5), (150, 1.2)])
+        record(self.book, [(10, 1.1)], key=("AAABBB", "hyperion"))
+        self.recorder.flush()
+
+    def get(self, **params):
+        params.setdefault("start", T0)
+        params.setdefault("end", T0 + 600)
+        return self.client.get(reverse("history", args=["AAABBB"]), params)
+
+    def test_history(self):
+        response = self.get(interval="1m")
+        self.assertEqual(response.status_code, 200)
+        buckets = response.json()["buckets"]
+
+        self.assertEqual([b["time"] for b in buckets], [T0, T0 + 60, T0 + 120])
+        self.assertEqual(buckets[0]["open"], 1.0)
+        self.assertEqual(buckets[0]["high"], 2.0)
+        self.assertEqual(buckets[0]["count"], 3)
+        self.assertEqual(buckets[2]["block"], 150)
+
+    def test_single_exchange_and_limit(self):
+        data = self.get(interval="1m", exchange="uniswap", limit=2).json()
+        self.assertEqual(data["exchange"], "uniswap")
+        self.assertEqual([b["count"] for b in data["buckets"]], [1, 1])
+
+    def test_invalid_requests(self):
+        for params in [
+            {"interval": "1w"},
+            {"limit": "0"},
+            {"start": "abc"},
+            {"exchange": "nope"},
+            {"interval": "1s", "start": 0},
+        ]:
+            self.assertEqual(self.get(**params).status_code, 400, params)
+        self.assertEqual(
+            self.client.get(reverse("history", args=["XXXYYY"])).status_code, 404
+        )
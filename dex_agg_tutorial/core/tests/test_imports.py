@@ -0,0 +1,226 @@
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from core.adapters import get_adapter
+from core.imports import import_pairs, iter_records
+from core.models import Pair
+
+from .test_tokens import USDC_WETH_POOL, TokenNodesMixin
+
+SAMPLE_PAIRS = os.path.join(os.path.dirname(__file__), "sample_pairs.json")
+
+
+def record(pair_id: str, **fields) -> dict:
+    return {
+        "pair_id": pair_id,
+        "base_token": pair_id[:3],
+        "quote_token": pair_id[3:],
+        "base_token_decimals": 18,
+        "quote_token_decimals": 6,
+        "active_exchanges": ["uniswap"],
+        "pool_contracts": {"uniswap": "0x" + "1" * 40},
+        **fields,
+    }
+
+
+def jsonl(*records) -> io.BytesIO:
+    return io.BytesIO("\n".join(json.dumps(r) for r in records).encode())
+
+
+class IterRecordsTest(SimpleTestCase):
+    """Records come out while the file is read, whatever the read boundaries."""
+
+    def test_array_and_lines(self):
+        records = [record("AAABBB"), record("CCCDDD", base_token="Ç")]
+        array = json.dumps(records, indent=2, ensure_ascii=False).encode()
+        lines = b"\n".join(json.dumps(r).encode() for r in records) + b"\n"
+        for data in [array, lines, b"[]" + b" " * 10, b""]:
+            for read_size in [1, 7, 1 << 16]:
+                expected = records if len(data) > 12 else []
+                self.assertEqual(
+                    list(iter_records(io.BytesIO(data), read_size)), expected
+                )
+        self.assertEqual(list(iter_records(io.StringIO("[1, 2]"), 1)), [1, 2])
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            list(iter_records(io.BytesIO(b'[{"pair_id": "AAA"'), 4))
+
+
+class ImportPairsTest(TestCase):
+    def test_creates_and_updates(self):
+        Pair.objects.create(uid=7, **record("AAABBB"))
+        result = import_pairs(
+            jsonl(
+                record("AAABBB", active_exchanges=[]),
+                record("CCCDDD"),
+                record("EEEFFF"),
+                record("CCCDDD", quote_token_decimals=8),
+            ),
+            orient=False,
+        )
+        self.assertEqual((result.created, result.updated, result.errors), (2, 1, []))
+
+        pairs = {pair.pair_id: pair for pair in Pair.objects.all()}
+        self.assertEqual(pairs["AAABBB"].uid, 7)
+        self.assertEqual(pairs["AAABBB"].active_exchanges, [])
+        # new pairs count on from the highest uid, the last record of a pair wins
+        self.assertEqual({pairs["CCCDDD"].uid, pairs["EEEFFF"].uid}, {8, 9})
+        self.assertEqual(pairs["CCCDDD"].quote_token_decimals, 8)
+
+    def test_invalid_records_are_skipped(self):
+        result = import_pairs(
+            jsonl(
+                record("AAABBB", active_exchanges=["sushiswap"]),
+                record("CCCDDD", pool_contracts={"curve": "0x"}),
+                record("EEEFFF", base_token_decimals=None),
+                {"pair_id": "GGGHHH"},
+                "not a pair",
+                record("IIIJJJ"),
+            ),
+            orient=False,
+        )
+        self.assertEqual(result.created, 1)
+        errors = {error["record"]: error for error in result.errors}
+        self.assertEqual(sorted(errors), [0, 1, 2, 3, 4])
+        self.assertIn("sushiswap", errors[0]["error"])
+        self.assertIn("curve", errors[1]["error"])
+        self.assertIn("decimals", errors[2]["error"])
+        self.assertEqual(errors[3]["pair_id"], "GGGHHH")
+        self.assertEqual(
+            list(Pair.objects.values_list("pair_id", flat=True)), ["IIIJJJ"]
+        )
+
+    def test_ten_thousand_pools(self):
+        records = [record(f"T{i:05d}USDC") for i in range(10000)]
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            result = import_pairs(jsonl(*records), orient=False, chunk_size=1000)
+        self.assertEqual(result.created, 10000)
+        # a handful of statements per chunk (SQLite splits inserts by its variable limit),
+        # not one per pair
+        self.assertLess(len(queries), 200)
+        self.assertLess(time.perf_counter() - started, 30)
+        self.assertEqual(Pair.objects.count(), 10000)
+
+
+class ImportOrientTest(TokenNodesMixin, TestCase):
+    def test_pools_are_read_per_chunk(self):
+        result = import_pairs(
+            jsonl(
+                record(
+                    "WETHUSDC",
+                    base_token="WETH",
+                    quote_token="USDC",
+                    base_token_decimals=None,
+                    quote_token_decimals=None,
+                    pool_contracts={"uniswap": USDC_WETH_POOL},
+                ),
+                record(
+                    "LINKDAI",
+                    base_token="LINK",
+                    pool_contracts={"uniswap": USDC_WETH_POOL},
+                ),
+            )
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.errors[0]["pair_id"], "LINKDAI")
+        pair = Pair.objects.get(pair_id="WETHUSDC")
+        self.assertEqual((pair.base_token_decimals, pair.quote_token_decimals), (18, 6))
+        self.assertTrue(pair.is_inverted("uniswap"))
+        self.assertEqual(self.eth.calls["eth_call"], 2)
+
+    def test_unread_pools_keep_their_orientation(self):
+        weth = record(
+            "WETHUSDC",
+            base_token="WETH",
+            quote_token="USDC",
+            pool_contracts={"uniswap": USDC_WETH_POOL},
+        )
+        import_pairs(jsonl(weth))
+        self.assertTrue(Pair.objects.get(pair_id="WETHUSDC").is_inverted("uniswap"))
+
+        # RPC down
+        down = mock.patch.object(
+            get_adapter("uniswap"),
+            "fetch_pool_tokens",
+            side_effect=ConnectionError("RPC down"),
+        )
+        with down, mock.patch("builtins.print"):
+            result = import_pairs(jsonl(weth))
+        self.assertEqual(result.as_dict(), {"created": 0, "updated": 1, "errors": []})
+        self.assertTrue(Pair.objects.get(pair_id="WETHUSDC").is_inverted("uniswap"))
+
+        # another pool doesn't inherit the orientation of the old one
+        with mock.patch("builtins.print"):
+            import_pairs(
+                jsonl({**weth, "pool_contracts": {"uniswap": "0x" + "2" * 40}})
+            )
+        self.assertFalse(Pair.objects.get(pair_id="WETHUSDC").is_inverted("uniswap"))
+
+
+class ImportCommandTest(TestCase):
+    def test_sample_pairs(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            "import_pairs", SAMPLE_PAIRS, "--no-orient", stdout=out, stderr=err
+        )
+        with open(SAMPLE_PAIRS) as f:
+            count = len(json.load(f))
+        self.assertIn(f"Created {count} pairs", out.getvalue())
+        self.assertEqual(Pair.objects.count(), count)
+
+        # importing again updates in place
+        call_command("import_pairs", SAMPLE_PAIRS, "--no-orient", stdout=out)
+        self.assertIn(f"updated {count}", out.getvalue())
+        self.assertEqual(
+            sorted(Pair.objects.values_list("uid", flat=True)),
+            list(range(1, count + 1)),
+        )
+
+    def test_lines_file(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".jsonl", delete=False) as f:
+            f.write(
+                jsonl(record("AAABBB"), record("CCCDDD", active_exchanges=["x"])).read()
+            )
+        self.addCleanup(os.remove, f.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_pairs", f.name, "--no-orient", stdout=out, stderr=err)
+        self.assertIn("Created 1 pairs", out.getvalue())
+        self.assertIn("record 1 (CCCDDD)", err.getvalue())
+
+
+class ImportAPITest(APITestCase):
+    def post(self, body: bytes, **params):
+        return self.client.generic(
+            "POST",
+            "/pairs/import/?" + "&".join(f"{k}={v}" for k, v in params.items()),
+            body,
+            content_type="application/x-ndjson",
+        )
+
+    def test_admin_only(self):
+        self.assertEqual(self.post(jsonl(record("AAABBB")).read()).status_code, 403)
+
+    def test_import(self):
+        admin = User.objects.create_user("admin", password="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+
+        response = self.post(jsonl(record("AAABBB"), record("CCCDDD")).read(), orient=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"created": 2, "updated": 0, "errors": []})
+        self.assertEqual(self.client.get("/pairs/").json()[1]["pair_id"], "CCCDDD")
+
+        response = self.post(b'{"pair_id": ', orient=0)
+        self.assertEqual(response.status_code, 400)
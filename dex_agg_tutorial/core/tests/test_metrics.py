@@ -0,0 +1,148 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from core.cache import price_cache
+from core.clients import NetworkClient, request_json
+from core.failover import FailoverSettings
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.metrics import (
+    CACHE_REQUESTS,
+    EXCHANGE_ERRORS,
+    EXCHANGE_SECONDS,
+    RPC_ERRORS,
+    RPC_RETRIES,
+    STAGE_SECONDS,
+    Counter,
+    Histogram,
+    Registry,
+    registry,
+)
+from core.models import Pair
+from core.validation import Network
+
+from .test_quotes import POOL
+
+
+class RenderTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("core.metrics.registry", Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counter(self):
+        counter = Counter("requests_total", "Requests", ["exchange"])
+        counter.inc(exchange="uniswap")
+        counter.inc(2, exchange='say "hi"')
+        self.assertEqual(
+            counter.render(),
+            [
+                "# HELP requests_total Requests",
+                "# TYPE requests_total counter",
+                'requests_total{exchange="say \\"hi\\""} 2',
+                'requests_total{exchange="uniswap"} 1',
+            ],
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("duration_seconds", "Duration", buckets=[0.1, 1])
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value)
+        self.assertEqual(
+            histogram.render()[2:],
+            [
+                'duration_seconds_bucket{le="0.1"} 2',
+                'duration_seconds_bucket{le="1"} 3',
+                'duration_seconds_bucket{le="+Inf"} 4',
+                "duration_seconds_sum 3.65",
+                "duration_seconds_count 4",
+            ],
+        )
+        self.assertEqual(histogram.count(), 4)
+
+
+class InstrumentationTest(APITestCase):
+    """Every stage of a price request ends up in the metrics and, if asked, Server-Timing."""
+
+    def setUp(self):
+        registry.reset()
+        price_cache.clear()
+        self.addCleanup(price_cache.clear)
+        self.node = FakeEthereumNode({POOL: {"sqrt_price_x96": 2**96}}).start()
+        self.addCleanup(self.node.stop)
+        client = NetworkClient(Network.ETHEREUM, self.node.url)
+        patcher = mock.patch("core.queries.get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Pair.objects.create(
+            uid=1,
+            pair_id="AAABBB",
+            base_token="AAA",
+            quote_token="BBB",
+            active_exchanges=["uniswap"],
+            pool_contracts={"uniswap": POOL},
+        )
+
+    def test_price_request(self):
+        self.assertEqual(self.client.get("/price/AAABBB/").status_code, 200)
+        self.assertEqual(self.client.get("/price/AAABBB/").status_code, 200)
+
+        for stage in ["db", "upstream", "math", "serialize"]:
+            self.assertEqual(STAGE_SECONDS.count(stage=stage), 2 - (stage == "math"))
+        self.assertEqual(
+            EXCHANGE_SECONDS.count(exchange="uniswap", network="mainnet"), 1
+        )
+        self.assertEqual(CACHE_REQUESTS.value(exchange="uniswap", result="miss"), 1)
+        self.assertEqual(CACHE_REQUESTS.value(exchange="uniswap", result="hit"), 1)
+
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            'dexagg_exchange_duration_seconds_count{exchange="uniswap",network="mainnet"} 1',
+            metrics,
+        )
+        self.assertIn(
+            'dexagg_http_request_duration_seconds_count{view="price",status="200"} 2',
+            metrics,
+        )
+        self.assertIn("dexagg_price_cache_hits_total", metrics)
+
+    def test_upstream_errors(self):
+        self.node.failure_rate = 1
+        self.assertEqual(self.client.get("/price/AAABBB/").status_code, 503)
+        self.assertEqual(
+            EXCHANGE_ERRORS.value(exchange="uniswap", network="mainnet"), 1
+        )
+        endpoint = self.node.url.removeprefix("http://")
+        self.assertEqual(
+            RPC_ERRORS.value(network="mainnet", endpoint=endpoint), self.node.requests
+        )
+
+    def test_server_timing(self):
+        self.assertNotIn("Server-Timing", self.client.get("/price/AAABBB/"))
+        price_cache.clear()
+        with mock.patch("core.metrics.SERVER_TIMING", True):
+            response = self.client.get("/price/AAABBB/")
+        timings = dict(
+            part.split(";dur=") for part in response["Server-Timing"].split(", ")
+        )
+        self.assertEqual(
+            set(timings), {"db", "upstream", "uniswap", "math", "serialize", "total"}
+        )
+        self.assertLessEqual(float(timings["uniswap"]), float(timings["total"]))
+
+
+class RetryMetricsTest(SimpleTestCase):
+    def test_retries_are_counted(self):
+        registry.reset()
+        node = FakeAptosNode(failure_rate=1).start()
+        self.addCleanup(node.stop)
+        client = NetworkClient(
+            Network.APTOS, node.url, failover=FailoverSettings(retries=1, backoff=0)
+        )
+        with self.assertRaises(Exception):
+            request_json(f"{node.url}/v1", client)
+        endpoint = node.url.removeprefix("http://")
+        self.assertEqual(node.requests, 2)
+        self.assertEqual(RPC_RETRIES.value(network="aptosMainnet"), 1)
+        self.assertEqual(RPC_ERRORS.value(network="aptosMainnet", endpoint=endpoint), 2)
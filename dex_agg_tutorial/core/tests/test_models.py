@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from core.models import Pair
+
+from .fake_chain import make_pair
+
+
+class PairQuerySetTest(TestCase):
+    def setUp(self):
+        make_pair("AAA", "BBB", uid=1).save()
+        make_pair("CCC", "DDD", ["uniswap", "hyperion"], uid=2).save()
+        make_pair("EEE", "FFF", (), uid=3).save()
+
+    def ids(self, queryset):
+        return [pair.pair_id for pair in queryset]
+
+    def test_active(self):
+        self.assertEqual(self.ids(Pair.objects.active()), ["AAABBB", "CCCDDD"])
+
+    def test_save_keeps_is_active_in_sync(self):
+        pair = Pair.objects.get(pair_id="EEEFFF")
+        self.assertFalse(pair.is_active)
+        pair.active_exchanges = ["uniswap"]
+        pair.save(update_fields=["active_exchanges"])
+        self.assertTrue(Pair.objects.get(pair_id="EEEFFF").is_active)
+
+        pair.active_exchanges = []
+        pair.save()
+        self.assertFalse(Pair.objects.get(pair_id="EEEFFF").is_active)
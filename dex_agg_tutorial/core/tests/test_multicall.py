@@ -0,0 +1,98 @@
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from web3 import Web3
+
+from core.cache import PriceCache
+from core.clients import NetworkClient
+from core.fakes import FakeEthereumNode
+from core.models import Pair
+from core.multicall import read_uniswap_pools
+from core.poller import PricePoller
+from core.adapters.uniswap import query_uniswap_prices
+from core.validation import Network
+
+POOL_A = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+POOL_B = "0x99ac8cA7087fA4A2A1FB6357269965A2014ABc35"
+POOL_BROKEN = Web3.to_checksum_address("0x0000000000000000000000000000000000000bad")
+POOL_EMPTY = Web3.to_checksum_address("0x0000000000000000000000000000000000000e00")
+
+
+class MulticallReaderTest(SimpleTestCase):
+    """slot0 and liquidity of many pools come back from a single eth_call."""
+
+    def setUp(self):
+        self.node = FakeEthereumNode(
+            {
+                POOL_A: {"sqrt_price_x96": 2**96, "tick": 0, "liquidity": 5},
+                POOL_B: {"sqrt_price_x96": 2**97, "tick": 13863, "liquidity": 7},
+                POOL_BROKEN: {"sqrt_price_x96": 1},
+            }
+        ).start()
+        self.node.reverting.add(POOL_BROKEN)
+        self.web3 = NetworkClient(Network.ETHEREUM, self.node.url).web3
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_reads_all_pools_in_one_call(self):
+        states = read_uniswap_pools(self.web3, [POOL_A, POOL_B], with_liquidity=True)
+
+        self.assertEqual(self.node.calls["eth_call"], 1)
+        self.assertEqual(states[POOL_A].sqrt_price_x96, 2**96)
+        self.assertEqual(states[POOL_B].tick, 13863)
+        self.assertEqual(states[POOL_B].liquidity, 7)
+
+    def test_failures_are_isolated_per_pool(self):
+        states = read_uniswap_pools(self.web3, [POOL_A, POOL_BROKEN, POOL_EMPTY])
+
+        self.assertIsNotNone(states[POOL_A])
+        self.assertIsNone(states[POOL_A].liquidity)
+        self.assertIsNone(states[POOL_BROKEN])
+        self.assertIsNone(states[POOL_EMPTY])
+
+    def test_large_sets_are_chunked(self):
+        states = read_uniswap_pools(self.web3, [POOL_A, POOL_B], batch_size=1)
+        self.assertEqual(self.node.calls["eth_call"], 2)
+        self.assertEqual(len(states), 2)
+
+
+class BatchedUniswapPricesTest(TestCase):
+    """The poller refreshes all Uniswap pairs with one multicall."""
+
+    def setUp(self):
+        self.node = FakeEthereumNode(
+            {
+                POOL_A: {"sqrt_price_x96": 2**96},
+                POOL_B: {"sqrt_price_x96": 2**97},
+            }
+        ).start()
+        self.client = NetworkClient(Network.ETHEREUM, self.node.url)
+        for uid, (pair_id, pool) in enumerate(
+            [("AAABBB", POOL_A), ("CCCDDD", POOL_B), ("EEEFFF", POOL_EMPTY)], 1
+        ):
+            Pair.objects.create(
+                uid=uid,
+                pair_id=pair_id,
+                base_token=pair_id[:3],
+                quote_token=pair_id[3:],
+                active_exchanges=["uniswap"],
+                pool_contracts={"uniswap": pool},
+            )
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_query_uniswap_prices(self):
+        prices = query_uniswap_prices(list(Pair.objects.all()), self.client)
+        self.assertEqual(prices, {"AAABBB": 1.0, "CCCDDD": 4.0, "EEEFFF": None})
+        self.assertEqual(self.node.calls["eth_call"], 1)
+
+    def test_poller_uses_multicall(self):
+        book = PriceCache()
+        poller = PricePoller(book)
+        with mock.patch("core.poller.get_client", return_value=self.client):
+            poller.refresh_all()
+
+        self.assertEqual(self.node.calls["eth_call"], 1)
+        self.assertEqual(book.get(("CCCDDD", "uniswap")).price, 4.0)
+        self.assertIsNone(book.get(("EEEFFF", "uniswap")))
@@ -0,0 +1,129 @@
+import os
+import time
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from core.apps import start_background_threads
+from core.cache import PriceCache, price_cache
+from core.history import history_recorder
+from core.models import Pair, PriceHistoryChunk
+from core.poller import PricePoller, price_poller
+from core.queries import get_token_price
+from core.validation import Network
+
+from .fake_chain import fake_adapters
+
+
+class PricePollerTest(TestCase):
+    """The poller fills the price book and requests read from it."""
+
+    def setUp(self):
+        price_cache.clear()
+        Pair.objects.create(
+            uid=1,
+            pair_id="WBTCUSDC",
+            base_token="WBTC",
+            quote_token="USDC",
+            base_token_decimals=8,
+            quote_token_decimals=6,
+            active_exchanges=["uniswap", "hyperion"],
+            pool_contracts={"uniswap": "0x1", "hyperion": "0x2"},
+        )
+        Pair.objects.create(
+            uid=2,
+            pair_id="APTUSDC",
+            base_token="APT",
+            quote_token="USDC",
+            base_token_decimals=8,
+            quote_token_decimals=6,
+            active_exchanges=["hyperion"],
+            pool_contracts={"hyperion": "0x3"},
+        )
+        self.fakes = {
+            "uniswap": mock.Mock(return_value=100.0),
+            "hyperion": mock.Mock(return_value=101.0),
+        }
+
+    def test_targets_grouped_per_network(self):
+        targets = PricePoller().targets()
+        self.assertEqual(len(targets[Network.ETHEREUM]), 1)
+        self.assertEqual(len(targets[Network.APTOS]), 2)
+
+    def test_refresh_all_fills_book(self):
+        book = PriceCache()
+        with fake_adapters(fetch_one=self.fakes):
+            PricePoller(book).refresh_all()
+
+        self.assertEqual(book.get(("WBTCUSDC", "uniswap")).price, 100.0)
+        self.assertEqual(book.get(("APTUSDC", "hyperion")).price, 101.0)
+
+    def test_calls_spaced_per_network(self):
+        with fake_adapters(fetch_one=self.fakes), mock.patch.dict(
+            "os.environ", {"APTOSMAINNET_POLL_SPACING": "0.2"}
+        ):
+            started = time.monotonic()
+            PricePoller(PriceCache()).refresh_all()
+            elapsed = time.monotonic() - started
+        self.assertGreaterEqual(elapsed, 0.4)
+
+    def test_requests_read_stale_book_while_warm(self):
+        price_cache.put(("APTUSDC", "hyperion"), 7.5, fetched_at=time.time() - 5)
+        price_cache.warm = True
+        try:
+            with fake_adapters(fetch_one=self.fakes):
+                result = get_token_price("APTUSDC")
+        finally:
+            price_cache.warm = False
+
+        self.fakes["hyperion"].assert_not_called()
+        self.assertEqual(result["prices"], {"hyperion": 7.5})
+        self.assertGreaterEqual(result["cache"]["hyperion"]["age"], 5)
+
+    def test_background_threads_refresh(self):
+        poller = PricePoller(PriceCache())
+        # load the targets up front, the test database is not shared with other threads
+        targets = poller.targets()
+        with fake_adapters(fetch_one=self.fakes), mock.patch.object(
+            poller, "targets", return_value=targets
+        ):
+            poller.start()
+            try:
+                deadline = time.monotonic() + 2
+                while len(poller.book.snapshot()) < 3 and time.monotonic() < deadline:
+                    time.sleep(0.05)
+            finally:
+                poller.stop(timeout=2)
+
+        self.assertEqual(len(poller.book.snapshot()), 3)
+        self.assertFalse(poller.running)
+
+    def test_poll_prices_records_history(self):
+        with fake_adapters(fetch_one=self.fakes), mock.patch(
+            "core.management.commands.poll_prices.PRICE_HISTORY", True
+        ):
+            call_command("poll_prices", "--once", stdout=StringIO())
+
+        self.assertFalse(history_recorder.running)
+        self.assertEqual(
+            PriceHistoryChunk.objects.filter(pair_id="APTUSDC").get().count, 1
+        )
+
+
+class StartupTest(SimpleTestCase):
+    def test_only_servers_start_background_threads(self):
+        with mock.patch.dict(os.environ, {"PRICE_POLLER": "1"}), mock.patch(
+            "core.history.PRICE_HISTORY", True
+        ), mock.patch.object(price_poller, "start") as poller, mock.patch.object(
+            history_recorder, "start"
+        ) as recorder:
+            apps.get_app_config("core").ready()  # every manage.py command
+            poller.assert_not_called()
+            recorder.assert_not_called()
+
+            start_background_threads()  # config/wsgi.py and config/asgi.py
+            poller.assert_called_once()
+            recorder.assert_called_once()
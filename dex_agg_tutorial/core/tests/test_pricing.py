@@ -31,10 +31,10 @@ class PairAPITest(APITestCase):
         """Test GET /pairs/ returns all sample pairs."""
         response = self.client.get("/pairs/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), len(self.sample_pairs))
+        self.assertEqual(len(response.json()), len(self.sample_pairs))
 
         # Check that all our sample pairs are present
-        pair_ids = [pair["pair_id"] for pair in response.data]
+        pair_ids = [pair["pair_id"] for pair in response.json()]
         expected_ids = [pair["pair_id"] for pair in self.sample_pairs]
         for expected_id in expected_ids:
             self.assertIn(expected_id, pair_ids)
@@ -62,12 +62,12 @@ class PairAPITest(APITestCase):
         self.assertEqual(get_response.status_code, status.HTTP_200_OK)
 
         # Check that LINKUSDC is now in the list
-        pair_ids = [pair["pair_id"] for pair in get_response.data]
+        pair_ids = [pair["pair_id"] for pair in get_response.json()]
         self.assertIn("LINKUSDC", pair_ids)
 
         # Find the created pair and verify its attributes
         created_pair = next(
-            (p for p in get_response.data if p["pair_id"] == "LINKUSDC"), None
+            (p for p in get_response.json() if p["pair_id"] == "LINKUSDC"), None
         )
         self.assertIsNotNone(created_pair)
         self.assertEqual(created_pair["base_token"], "LINK")
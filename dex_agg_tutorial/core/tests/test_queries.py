@@ -0,0 +1,262 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APITestCase
+
+from core.cache import price_cache
+from core.clients import NetworkClient, get_client, request_json, reset_clients
+from core.contracts import UNISWAP_POOL_ABI, UNISWAP_POOL_FUNCTIONS, get_pool_contract
+from core.models import Pair
+from core.queries import get_token_price, run_per_exchange
+from core.registry import pair_registry
+from core.validation import Network
+
+from .fake_chain import fake_adapters
+
+
+def slow_price(delay: float, price: float):
+    """Build a stand-in query function that answers after `delay` seconds."""
+
+    def query(pair, client):
+        time.sleep(delay)
+        return price
+
+    return query
+
+
+class ConcurrentFetchTest(TestCase):
+    """Exchange queries for a pair run side by side and slow venues get dropped."""
+
+    def setUp(self):
+        price_cache.clear()
+        Pair.objects.create(
+            uid=1,
+            pair_id="WBTCUSDC",
+            base_token="WBTC",
+            quote_token="USDC",
+            base_token_decimals=8,
+            quote_token_decimals=6,
+            active_exchanges=["uniswap", "hyperion"],
+            pool_contracts={"uniswap": "0x1", "hyperion": "0x2"},
+        )
+
+    def test_latency_is_slowest_not_sum(self):
+        fakes = {"uniswap": slow_price(0.3, 100.0), "hyperion": slow_price(0.3, 101.0)}
+        with fake_adapters(fetch_one=fakes):
+            started = time.monotonic()
+            result = get_token_price("WBTCUSDC")
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(result["prices"], {"uniswap": 100.0, "hyperion": 101.0})
+        self.assertEqual(result["best_price"], 100.0)
+        self.assertLess(elapsed, 0.55)
+
+    def test_slow_exchange_is_dropped(self):
+        fakes = {"uniswap": slow_price(0.0, 100.0), "hyperion": slow_price(1.0, 99.0)}
+        with fake_adapters(fetch_one=fakes), mock.patch.dict(
+            "os.environ", {"HYPERION_QUERY_DEADLINE": "0.2"}
+        ):
+            started = time.monotonic()
+            result = get_token_price("WBTCUSDC")
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(result["prices"], {"uniswap": 100.0})
+        self.assertLess(elapsed, 0.8)
+
+    def test_sequential_mode(self):
+        fakes = {"uniswap": slow_price(0.0, 100.0), "hyperion": slow_price(0.0, 99.0)}
+        with fake_adapters(fetch_one=fakes):
+            result = get_token_price("WBTCUSDC", concurrent=False)
+        self.assertEqual(result["best_price"], 99.0)
+
+    def test_single_exchange_has_deadline_and_errors_dropped(self):
+        pair = Pair.objects.get(pair_id="WBTCUSDC")
+
+        def fail(exchange_id):
+            raise ConnectionError("RPC down")
+
+        with mock.patch.dict("os.environ", {"HYPERION_QUERY_DEADLINE": "0.2"}):
+            started = time.monotonic()
+            slow = run_per_exchange(pair, ["hyperion"], lambda e: time.sleep(1) or 1)
+            self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(slow, {})
+        with mock.patch("builtins.print"):
+            self.assertEqual(run_per_exchange(pair, ["hyperion"], fail), {})
+            self.assertEqual(
+                run_per_exchange(pair, ["hyperion"], fail, concurrent=False), {}
+            )
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a small JSON body and counts the TCP connections it sees."""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def do_GET(self):
+        body = json.dumps({"data": {"sqrt_price": "18446744073709551616"}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NetworkClientTest(SimpleTestCase):
+    """Clients are shared per network and keep their connections open."""
+
+    def setUp(self):
+        KeepAliveHandler.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        reset_clients()
+
+    def test_connection_is_reused(self):
+        client = NetworkClient(Network.APTOS, self.url, pool_size=2)
+        for _ in range(5):
+            self.assertIn("data", request_json(f"{self.url}/v1/resource", client))
+
+        self.assertEqual(KeepAliveHandler.connections, 1)
+        self.assertEqual(client.stats()["requests"], 5)
+        self.assertEqual(client.stats()["saturated"], 0)
+
+    def test_registry_returns_one_client_per_network(self):
+        with mock.patch.dict("os.environ", {"APTOSMAINNET_RPC_URL": self.url}):
+            client = get_client("aptosMainnet")
+            self.assertIs(client, get_client(Network.APTOS))
+            self.assertEqual(client.rpc_url, self.url)
+            self.assertIsNot(client, get_client(Network.ETHEREUM))
+
+
+class PoolContractTest(SimpleTestCase):
+    """The pool ABI is trimmed once and contracts are shared per pool address."""
+
+    def test_abi_only_holds_used_functions(self):
+        names = {entry["name"] for entry in UNISWAP_POOL_ABI}
+        self.assertEqual(names, set(UNISWAP_POOL_FUNCTIONS))
+
+    def test_contract_cached_per_checksum_address(self):
+        web3 = NetworkClient(Network.ETHEREUM, "http://127.0.0.1:1").web3
+        address = "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+        contract = get_pool_contract(web3, address)
+        self.assertIs(contract, get_pool_contract(web3, address.lower()))
+        self.assertEqual(contract.address, address)
+
+
+class BatchPricesTest(APITestCase):
+    """GET /prices/ prices many pairs with one database query and batched upstream calls."""
+
+    def setUp(self):
+        price_cache.clear()
+        for uid, (pair_id, exchanges) in enumerate(
+            [
+                ("WBTCUSDC", ["uniswap", "hyperion"]),
+                ("USDCWETH", ["uniswap"]),
+                ("APTUSDC", ["hyperion"]),
+                ("DEADPAIR", []),
+            ],
+            1,
+        ):
+            Pair.objects.create(
+                uid=uid,
+                pair_id=pair_id,
+                base_token=pair_id[:4],
+                quote_token=pair_id[4:],
+                active_exchanges=exchanges,
+                pool_contracts={e: f"0x{uid}" for e in exchanges},
+            )
+        self.uniswap_batch = mock.Mock(
+            side_effect=lambda pairs, client: {p.pair_id: 2.0 for p in pairs}
+        )
+        self.uniswap = mock.Mock(return_value=2.0)
+        self.hyperion = mock.Mock(return_value=3.0)
+
+    def get(self, url):
+        with fake_adapters(
+            fetch_many={"uniswap": self.uniswap_batch},
+            fetch_one={"uniswap": self.uniswap, "hyperion": self.hyperion},
+        ):
+            return self.client.get(url)
+
+    def test_requested_pairs(self):
+        pair_registry.current()
+        # the known pairs come from the registry, only NOPE is looked up
+        with self.assertNumQueries(1):
+            response = self.get("/prices/?pairs=wbtcusdc,APTUSDC,DEADPAIR,NOPE")
+
+        self.assertEqual(response.status_code, 200)
+        pairs = response.data["pairs"]
+        self.assertEqual(pairs["WBTCUSDC"]["prices"], {"uniswap": 2.0, "hyperion": 3.0})
+        self.assertEqual(pairs["APTUSDC"]["best_price"], 3.0)
+        self.assertIn("not active", pairs["DEADPAIR"]["error"])
+        self.assertEqual(response.data["not_found"], ["NOPE"])
+        self.assertEqual(self.hyperion.call_count, 2)
+
+    def test_all_pairs_paged(self):
+        with mock.patch("core.queries.PRICES_MAX_PAIRS", 2):
+            first = self.get("/prices/").data
+            second = self.get("/prices/?pairs=all&page=2").data
+            past = self.get("/prices/?pairs=all&page=3").data
+
+        self.assertEqual((first["page"], first["pages"]), (1, 2))
+        self.assertEqual(list(first["pairs"]), ["WBTCUSDC", "USDCWETH"])
+        self.assertEqual(list(second["pairs"]), ["APTUSDC"])
+        self.assertEqual(past["pairs"], {})
+        self.assertEqual(self.get("/prices/?page=0").status_code, 400)
+
+    def test_all_pairs_from_warm_book(self):
+        price_cache.put(("WBTCUSDC", "uniswap"), 2.5, fetched_at=time.time() - 20)
+        price_cache.warm = True
+        try:
+            with mock.patch("core.queries.PRICES_MAX_PAIRS", 1):
+                response = self.get("/prices/?pairs=all")
+        finally:
+            price_cache.warm = False
+
+        self.assertEqual(response.data["pages"], 1)
+        self.assertEqual(len(response.data["pairs"]), 3)
+        self.assertEqual(response.data["pairs"]["WBTCUSDC"]["prices"], {"uniswap": 2.5})
+        self.assertIn("error", response.data["pairs"]["APTUSDC"])
+        # nothing missing from the book was fetched
+        self.uniswap_batch.assert_not_called()
+        self.hyperion.assert_not_called()
+
+    def test_pairs_are_capped(self):
+        self.assertEqual(self.get("/prices/?pairs=,").status_code, 400)
+        with mock.patch("core.views.PRICES_MAX_PAIRS", 2):
+            response = self.get("/prices/?pairs=WBTCUSDC,USDCWETH,APTUSDC")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+        self.uniswap_batch.assert_not_called()
+
+    def test_uniswap_pairs_batched(self):
+        response = self.get("/prices/?pairs=WBTCUSDC,USDCWETH,APTUSDC")
+
+        self.assertEqual(
+            set(response.data["pairs"]), {"WBTCUSDC", "USDCWETH", "APTUSDC"}
+        )
+        # both Uniswap pairs went out in a single batch call
+        self.assertEqual(self.uniswap_batch.call_count, 1)
+        self.assertEqual(len(self.uniswap_batch.call_args.args[0]), 2)
+
+    def test_second_request_served_from_cache(self):
+        self.get("/prices/?pairs=WBTCUSDC,USDCWETH")
+        response = self.get("/prices/?pairs=USDCWETH")
+
+        self.assertEqual(self.uniswap_batch.call_count, 1)
+        self.assertTrue(response.data["pairs"]["USDCWETH"]["cache"]["uniswap"]["hit"])
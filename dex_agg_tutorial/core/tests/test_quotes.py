@@ -0,0 +1,255 @@
+from unittest import mock
+
+import requests
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from web3 import Web3
+
+from core.adapters import get_adapter
+from core.clients import NetworkClient
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.models import Pair
+from core.multicall import read_uniswap_liquidity
+from core.quotes import liquidity_cache
+from core.swapmath import (
+    MAX_TICK,
+    MIN_TICK,
+    PoolLiquidity,
+    simulate_swap,
+    sqrt_ratio_at_tick,
+)
+from core.validation import Network
+
+POOL = Web3.to_checksum_address("0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640")
+HYPERION_POOL = "0xa7bb8c9b3215e29a3e2c2370dcbad9c71816d385e7863170b147243724b2da58"
+L = 10**18
+
+# A wide position over [-600, 600] and a narrow one over [-60, 60], price at tick 0
+TWO_POSITIONS = {-600: L, -60: L, 60: -L, 600: -L}
+
+
+class SwapMathTest(SimpleTestCase):
+    """The local swap replay against known values and closed form results."""
+
+    def test_sqrt_ratio_at_tick(self):
+        self.assertEqual(sqrt_ratio_at_tick(0), 2**96)
+        self.assertEqual(sqrt_ratio_at_tick(MIN_TICK), 4295128739)
+        self.assertEqual(
+            sqrt_ratio_at_tick(MAX_TICK),
+            1461446703485210103287273052203988822378723970342,
+        )
+        self.assertEqual(sqrt_ratio_at_tick(0, bits=64), 2**64)
+
+    def test_swap_within_range_matches_constant_product(self):
+        pool = PoolLiquidity(2**96, 0, L, fee=0, tick_spacing=60)
+        result = simulate_swap(pool, 10**15, zero_for_one=True)
+        # in range the pool behaves like x * y = k with x = y = L
+        self.assertAlmostEqual(result.amount_out, L * 10**15 / (L + 10**15), delta=1)
+        self.assertTrue(result.filled)
+        self.assertEqual(result.ticks_crossed, 0)
+
+    def test_fee_is_taken_from_the_input(self):
+        no_fee = PoolLiquidity(2**96, 0, L, fee=0, tick_spacing=60)
+        with_fee = PoolLiquidity(2**96, 0, L, fee=3000, tick_spacing=60)
+        result = simulate_swap(with_fee, 10**15, zero_for_one=False)
+        expected = simulate_swap(no_fee, 10**15 * 997 // 1000, zero_for_one=False)
+        self.assertAlmostEqual(result.amount_out, expected.amount_out, delta=1)
+        self.assertAlmostEqual(result.fee, 3 * 10**12, delta=1)
+
+    def test_crossing_ticks_changes_liquidity(self):
+        pool = PoolLiquidity(
+            2**96, 0, 2 * L, 0, 60, ticks=TWO_POSITIONS, tick_range=(-15360, 15359)
+        )
+        small = simulate_swap(pool, 10**15, zero_for_one=True)
+        large = simulate_swap(pool, 10**16, zero_for_one=True)
+
+        self.assertEqual(small.ticks_crossed, 0)
+        self.assertEqual(large.ticks_crossed, 1)
+        # past tick -60 only half the liquidity is left, so the average price gets worse
+        self.assertLess(large.amount_out / 10**16, small.amount_out / 10**15)
+        self.assertTrue(large.filled)
+
+    def test_running_out_of_liquidity(self):
+        pool = PoolLiquidity(
+            2**96, 0, 2 * L, 0, 60, ticks=TWO_POSITIONS, tick_range=(-15360, 15359)
+        )
+        result = simulate_swap(pool, 10**20, zero_for_one=False)
+
+        self.assertEqual(result.ticks_crossed, 2)
+        self.assertFalse(result.filled)
+        self.assertLess(result.amount_in, 10**20)
+        self.assertEqual(result.sqrt_price, sqrt_ratio_at_tick(15359))
+
+
+class UniswapLiquidityReaderTest(SimpleTestCase):
+    """Pool liquidity and ticks are read with a few multicalls and refreshed incrementally."""
+
+    def setUp(self):
+        self.pool = {
+            "sqrt_price_x96": 2**96,
+            "tick": 0,
+            "liquidity": 2 * L,
+            "fee": 500,
+            "tick_spacing": 10,
+            "ticks": {-600: L, -60: L, 60: -L, 600: -L, 20000: 5},
+        }
+        self.node = FakeEthereumNode({POOL: self.pool}).start()
+        self.web3 = NetworkClient(Network.ETHEREUM, self.node.url).web3
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_full_read(self):
+        pool = read_uniswap_liquidity(self.web3, POOL, tick_words=1)
+
+        self.assertEqual(self.node.calls["eth_call"], 3)
+        self.assertEqual(
+            (pool.fee, pool.tick_spacing, pool.liquidity), (500, 10, 2 * L)
+        )
+        # words -1, 0 and 1 cover ticks -2560 up to 5119, tick 20000 is outside the window
+        self.assertEqual(pool.ticks, {-600: L, -60: L, 60: -L, 600: -L})
+        self.assertEqual(pool.tick_range, (-2560, 5119))
+
+    def test_incremental_refresh_only_reads_the_pool_state(self):
+        previous = read_uniswap_liquidity(self.web3, POOL, tick_words=1)
+        self.pool["liquidity"] = L
+
+        pool = read_uniswap_liquidity(self.web3, POOL, previous, tick_words=1)
+        self.assertEqual(self.node.calls["eth_call"], 4)
+        self.assertEqual(pool.liquidity, L)
+        self.assertEqual(pool.ticks, previous.ticks)
+
+    def test_price_moving_into_new_words(self):
+        previous = read_uniswap_liquidity(self.web3, POOL, tick_words=1)
+        self.pool.update(tick=19000, sqrt_price_x96=sqrt_ratio_at_tick(19000))
+
+        pool = read_uniswap_liquidity(self.web3, POOL, previous, tick_words=1)
+        # words 6 and 8 are new (word 7 too, but it has ticks to read)
+        self.assertIn(20000, pool.ticks)
+        self.assertNotIn(-600, pool.ticks)
+        self.assertEqual(pool.tick_range, (15360, 23039))
+
+
+class FakeExchangesTestCase(APITestCase):
+    """A pair with a Uniswap pool on a fake Ethereum node and a Hyperion pool on a fake Aptos node."""
+
+    def setUp(self):
+        liquidity_cache.clear()
+        self.addCleanup(liquidity_cache.clear)
+        self.eth = FakeEthereumNode(
+            {
+                POOL: {
+                    "sqrt_price_x96": 2**96,
+                    "tick": 0,
+                    "liquidity": 2 * L,
+                    "fee": 3000,
+                    "tick_spacing": 60,
+                    "ticks": TWO_POSITIONS,
+                }
+            }
+        ).start()
+        self.aptos = FakeAptosNode(
+            {
+                HYPERION_POOL: {
+                    "sqrt_price": 2**64,
+                    "liquidity": 10 * L,
+                    "tick": 0,
+                    "fee_rate": 500,
+                }
+            }
+        ).start()
+        self.addCleanup(self.eth.stop)
+        self.addCleanup(self.aptos.stop)
+        clients = {
+            Network.ETHEREUM: NetworkClient(Network.ETHEREUM, self.eth.url),
+            Network.APTOS: NetworkClient(Network.APTOS, self.aptos.url),
+        }
+        patcher = mock.patch("core.quotes.get_client", side_effect=clients.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        Pair.objects.create(
+            uid=1,
+            pair_id="AAABBB",
+            base_token="AAA",
+            quote_token="BBB",
+            active_exchanges=["uniswap", "hyperion"],
+            pool_contracts={"uniswap": POOL, "hyperion": HYPERION_POOL},
+        )
+
+    def assert_single_exchange_failure_is_unavailable(self, name: str):
+        """A pair on one exchange whose liquidity can't be read gets a 503, whatever failed."""
+        Pair.objects.create(
+            uid=2,
+            pair_id="CCCDDD",
+            base_token="CCC",
+            quote_token="DDD",
+            active_exchanges=["uniswap"],
+            pool_contracts={"uniswap": POOL},
+        )
+        for error in (requests.ConnectionError("RPC down"), ValueError("bad answer")):
+            with mock.patch.object(
+                get_adapter("uniswap"), "fetch_liquidity", side_effect=error
+            ), mock.patch("builtins.print"):
+                response = self.client.get(
+                    reverse(name, args=["CCCDDD"]), {"amount": "1"}
+                )
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("error", response.json())
+
+
+class QuoteAPITest(FakeExchangesTestCase):
+    """The /quote/ endpoint simulates the trade on every exchange of the pair."""
+
+    def test_quote(self):
+        response = self.client.get(
+            reverse("quote", args=["AAABBB"]), {"amount": "0.01"}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        uniswap, hyperion = data["quotes"]["uniswap"], data["quotes"]["hyperion"]
+        self.assertEqual(uniswap["ticks_crossed"], 1)
+        self.assertFalse(uniswap["in_range_only"])
+        self.assertTrue(hyperion["in_range_only"])
+        self.assertLess(uniswap["price"], uniswap["spot_price"])
+        self.assertAlmostEqual(uniswap["fee"], 0.00003)
+        self.assertGreater(uniswap["price_impact"], 0)
+        # hyperion has the lower fee and the deeper book for this size
+        self.assertEqual(data["best_exchange"], "hyperion")
+        self.assertEqual(data["amount_out"], hyperion["amount_out"])
+
+    def test_liquidity_is_cached(self):
+        self.client.get(reverse("quote", args=["AAABBB"]), {"amount": "1"})
+        calls = self.eth.calls["eth_call"]
+        response = self.client.get(
+            reverse("quote", args=["AAABBB"]), {"amount": "2", "side": "buy"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.eth.calls["eth_call"], calls)
+        self.assertEqual(response.json()["side"], "buy")
+
+    def test_precision(self):
+        response = self.client.get(
+            reverse("quote", args=["AAABBB"]), {"amount": "0.01", "precision": 4}
+        )
+        self.assertIsInstance(response.json()["amount_out"], str)
+
+    def test_invalid_requests(self):
+        url = reverse("quote", args=["AAABBB"])
+        for params in [{}, {"amount": "-1"}, {"amount": "abc"}, {"amount": "NaN"}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {"amount": "1", "side": "swap"}).status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("quote", args=["XXXYYY"]), {"amount": "1"}
+            ).status_code,
+            404,
+        )
+
+    def test_single_exchange_failure(self):
+        self.assert_single_exchange_failure_is_unavailable("quote")
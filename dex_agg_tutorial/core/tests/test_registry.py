@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.test import APITestCase
+
+from core.imports import PAIR_FIELDS, save_pairs
+from core.models import Pair
+from core.registry import pair_registry
+
+from .fake_chain import make_pair
+
+
+class PairRegistryTest(APITestCase):
+    """Pairs are read from memory and reloaded when they change."""
+
+    def setUp(self):
+        make_pair("AAA", "BBB", uid=1).save()
+        make_pair("CCC", "DDD", (), uid=2).save()
+        pair_registry.current()
+
+    def test_reads_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(pair_registry.get("AAABBB").uid, 1)
+            self.assertEqual(
+                [pair.pair_id for pair in pair_registry.active()], ["AAABBB"]
+            )
+            self.assertEqual(
+                [pair.pair_id for pair in pair_registry.get_many(["CCCDDD", "AAABBB"])],
+                ["AAABBB", "CCCDDD"],
+            )
+
+    def test_signals_and_bulk_writes_invalidate(self):
+        pair = Pair.objects.get(pair_id="CCCDDD")
+        pair.active_exchanges = ["uniswap"]
+        pair.save()
+        self.assertEqual(len(pair_registry.active()), 2)
+
+        save_pairs([make_pair("EEE", "FFF")], PAIR_FIELDS)
+        self.assertIsNotNone(pair_registry.get("EEEFFF"))
+
+        Pair.objects.get(pair_id="AAABBB").delete()
+        self.assertIsNone(pair_registry.get("AAABBB"))
+
+    def test_changes_of_other_workers(self):
+        # written without signals, the way another process would show up
+        Pair.objects.bulk_create([make_pair("EEE", "FFF", uid=3)])
+        loads = pair_registry.loads
+
+        # an unknown pair is looked up right away, the registry reloads on the next read
+        self.assertEqual(pair_registry.get("EEEFFF").uid, 3)
+        self.assertEqual(pair_registry.loads, loads)
+        self.assertEqual(len(pair_registry.active()), 2)
+
+        # changes to known pairs show up once the fingerprint is checked
+        Pair.objects.filter(pair_id="EEEFFF").update(
+            active_exchanges=[], is_active=False, updated_at=timezone.now()
+        )
+        self.assertEqual(len(pair_registry.active()), 2)
+        with mock.patch.object(pair_registry, "ttl", 0):
+            self.assertEqual(len(pair_registry.active()), 1)
+
+    def test_pairs_conditional_get(self):
+        response = self.client.get("/pairs/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([pair["pair_id"] for pair in response.json()], ["AAABBB"])
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/pairs/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/pairs/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        make_pair("EEE", "FFF", uid=3).save()
+        response = self.client.get("/pairs/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_delete_moves_last_modified_forward(self):
+        last_modified = self.client.get("/pairs/")["Last-Modified"]
+
+        Pair.objects.get(pair_id="AAABBB").delete()
+        response = self.client.get("/pairs/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        self.assertGreater(
+            parse_http_date(response["Last-Modified"]), parse_http_date(last_modified)
+        )
@@ -0,0 +1,74 @@
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from core.routing import split_route
+from core.swapmath import PoolLiquidity, simulate_swap
+
+from .test_quotes import L, FakeExchangesTestCase
+
+
+def pool(liquidity: int, fee: int = 3000) -> PoolLiquidity:
+    return PoolLiquidity(2**96, 0, liquidity, fee=fee, tick_spacing=60)
+
+
+class SplitRouteTest(SimpleTestCase):
+    """The greedy split gives every slice to the pool that pays most for it."""
+
+    def test_equal_pools_split_evenly(self):
+        pools = {"a": pool(L), "b": pool(L)}
+        route = split_route(pools, 10**17, zero_for_one=True, granularity=20)
+
+        self.assertEqual(route.amounts_in, {"a": 5 * 10**16, "b": 5 * 10**16})
+        single = simulate_swap(pools["a"], 10**17, zero_for_one=True)
+        self.assertGreater(route.amount_out, single.amount_out)
+
+    def test_deeper_pool_takes_the_larger_share(self):
+        pools = {"shallow": pool(L), "deep": pool(3 * L)}
+        route = split_route(pools, 10**17, zero_for_one=False, granularity=40)
+
+        self.assertAlmostEqual(
+            route.amounts_in["deep"] / route.amount_in, 0.75, delta=0.025
+        )
+
+    def test_small_orders_go_to_the_cheapest_pool(self):
+        pools = {"expensive": pool(L, fee=10000), "cheap": pool(L, fee=500)}
+        route = split_route(pools, 10**12, zero_for_one=True)
+        self.assertEqual(list(route.amounts_in), ["cheap"])
+
+    def test_remainder_is_routed(self):
+        pools = {"a": pool(L), "b": pool(2 * L)}
+        route = split_route(pools, 10**17 + 7, zero_for_one=True, granularity=10)
+        self.assertEqual(route.amount_in, 10**17 + 7)
+
+    def test_granularity_one_is_the_best_single_pool(self):
+        pools = {"a": pool(L), "b": pool(2 * L)}
+        route = split_route(pools, 10**17, zero_for_one=True, granularity=1)
+        self.assertEqual(list(route.amounts_in), ["b"])
+
+
+class RouteAPITest(FakeExchangesTestCase):
+    """/route/ splits the order over the pair's Uniswap and Hyperion pools."""
+
+    def test_route(self):
+        response = self.client.get(
+            reverse("route", args=["AAABBB"]), {"amount": "0.05"}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(set(data["splits"]), {"uniswap", "hyperion"})
+        self.assertAlmostEqual(sum(s["share"] for s in data["splits"].values()), 1)
+        self.assertEqual(data["best_single"]["exchange"], "hyperion")
+        self.assertGreater(data["improvement"], 0)
+        self.assertGreater(data["amount_out"], data["best_single"]["amount_out"])
+
+    def test_invalid_granularity(self):
+        for granularity in ["0", "abc", "100000"]:
+            response = self.client.get(
+                reverse("route", args=["AAABBB"]),
+                {"amount": "1", "granularity": granularity},
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_single_exchange_failure(self):
+        self.assert_single_exchange_failure_is_unavailable("route")
@@ -0,0 +1,313 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.async_queries import cached_query_exchange_async
+from core.cache import PriceCache, price_cache
+from core.clients import close_async_clients
+from core.models import Pair
+from core.poller import PricePoller
+from core.queries import fetch_many_exchange_prices
+from core.shared import MmapBook, RedisBook, decode_price, encode_price
+from core.validation import Network
+
+from .fake_chain import fake_adapters
+from .fake_redis import FakeRedis
+
+KEY = ("WBTCUSDC", "uniswap")
+
+
+def worker(book, name: str):
+    """The book as seen from another worker process."""
+    book.owner = lambda: name
+    return book
+
+
+class BookContract:
+    """What both backends do, `book()` returns a new handle on the same shared book."""
+
+    def test_read_and_write(self):
+        book = self.book()
+        self.assertIsNone(book.read(KEY))
+        book.write(KEY, Decimal("63123.123456789012345678901"), 1000.5, 17)
+        book.write(("APTUSDC", "hyperion"), 5.25, 1001.0, None)
+
+        other = self.book()
+        self.assertEqual(
+            other.read(KEY), (Decimal("63123.123456789012345678901"), 1000.5, 17)
+        )
+        self.assertEqual(
+            other.read_many([KEY, ("APTUSDC", "hyperion"), ("NOPE", "uniswap")]),
+            {
+                KEY: (Decimal("63123.123456789012345678901"), 1000.5, 17),
+                ("APTUSDC", "hyperion"): (5.25, 1001.0, None),
+            },
+        )
+
+    def test_leases(self):
+        first, second = worker(self.book(), "first"), worker(self.book(), "second")
+        self.assertTrue(first.acquire("poller:ethereum", 10))
+        self.assertFalse(second.acquire("poller:ethereum", 10))
+        self.assertTrue(first.acquire("poller:ethereum", 10))  # renewed
+
+        second.release("poller:ethereum")  # not theirs to give up
+        self.assertFalse(second.acquire("poller:ethereum", 10))
+        first.release("poller:ethereum")
+        self.assertTrue(second.acquire("poller:ethereum", 0.05))
+
+        time.sleep(0.1)
+        self.assertTrue(first.acquire("poller:ethereum", 10))
+
+    def test_one_fetch_for_all_workers(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return Decimal("42.5")
+
+        caches = [
+            PriceCache(shared=worker(self.book(), f"worker{i}")) for i in range(8)
+        ]
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda cache=cache: results.append(
+                    cache.get_or_fetch(KEY, 10, fetch)
+                )
+            )
+            for cache in caches
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.price for r in results], [Decimal("42.5")] * 8)
+        self.assertEqual(sum(cache.shared_hits for cache in caches), 7)
+        # the fetching worker gave up its lease, the next stale read can take it right away
+        self.assertTrue(worker(self.book(), "late").acquire("WBTCUSDC/uniswap", 10))
+
+    def test_failed_fetch_hands_over_the_lease(self):
+        fetching, waiting = (
+            PriceCache(shared=worker(self.book(), name)) for name in ("a", "b")
+        )
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            return None
+
+        thread = threading.Thread(target=lambda: fetching.get_or_fetch(KEY, 10, fail))
+        thread.start()
+        started.wait()
+        entry = waiting.get_or_fetch(KEY, 10, lambda: Decimal(7))
+        thread.join()
+        self.assertFalse(entry.hit)
+        self.assertEqual(entry.price, 7)
+
+
+class MmapBookTest(BookContract, SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "book")
+
+    def book(self) -> MmapBook:
+        return MmapBook(self.path, slots=64)
+
+    def test_size_is_set_by_the_first_worker(self):
+        self.book().write(KEY, Decimal(1), 1.0, None)
+        other = MmapBook(self.path, slots=1024)
+        self.assertEqual(other.read(KEY), (Decimal(1), 1.0, None))
+        self.assertEqual(other.slots, 64)
+
+    def test_full_table_is_not_shared(self):
+        book = MmapBook(self.path, slots=2)
+        for i in range(3):
+            book.write((f"P{i}", "uniswap"), Decimal(i), 1.0, None)
+        self.assertEqual(
+            len(book.read_many([(f"P{i}", "uniswap") for i in range(3)])), 2
+        )
+        self.assertTrue(book.acquire("poller:aptosMainnet", 10))
+
+    def test_worker_processes(self):
+        """Forked workers, as gunicorn starts them, fetch every price once between them."""
+        log = os.path.join(os.path.dirname(self.path), "fetches")
+        book = self.book()
+        # mapped before the fork, like a book opened when the app loads
+        book.write(("warmup", "uniswap"), Decimal(0), 1.0, None)
+
+        def run():
+            cache = PriceCache(shared=book)
+            for pair in range(5):
+                cache.get_or_fetch((f"P{pair}", "uniswap"), 10, lambda: fetch(pair))
+
+        def fetch(pair):
+            with open(log, "a") as f:
+                f.write(f"{pair}\n")
+            time.sleep(0.05)
+            return Decimal(pair)
+
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=run) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(10)
+            self.assertEqual(process.exitcode, 0)
+
+        with open(log) as f:
+            self.assertEqual(sorted(f.read().split()), ["0", "1", "2", "3", "4"])
+        self.assertEqual(book.read(("P3", "uniswap"))[0], 3)
+
+
+class RedisBookTest(BookContract, SimpleTestCase):
+    def setUp(self):
+        self.server = FakeRedis().start()
+        self.addCleanup(self.server.stop)
+
+    def book(self) -> RedisBook:
+        return RedisBook(self.server.url)
+
+    def test_prices_expire(self):
+        RedisBook(self.server.url, retention=60).write(KEY, Decimal(1), 1.0, None)
+        value, expires = self.server.data["dexagg:price:WBTCUSDC/uniswap"]
+        self.assertEqual(value, "1 1.0 -")
+        self.assertAlmostEqual(expires - time.monotonic(), 60, delta=1)
+
+    def test_clear_only_removes_the_book(self):
+        self.server.data["other:key"] = ("kept", None)
+        book = self.book()
+        for i in range(25):
+            book.write((f"P{i}", "uniswap"), Decimal(i), 1.0, None)
+        book.clear()
+        self.assertEqual(list(self.server.data), ["other:key"])
+
+    def test_unavailable_server_is_empty(self):
+        book = RedisBook(self.server.url)
+        self.server.stop()
+        with mock.patch("builtins.print"):
+            self.assertIsNone(book.read(KEY))
+            self.assertTrue(book.acquire("poller:ethereum", 10))
+            cache = PriceCache(shared=book)
+            self.assertEqual(cache.get_or_fetch(KEY, 10, lambda: Decimal(3)).price, 3)
+
+
+class ClearTest(SimpleTestCase):
+    def test_clear_keeps_the_shared_book(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        book = MmapBook(os.path.join(directory.name, "book"), slots=16)
+        cache = PriceCache(shared=book)
+        cache.put(KEY, Decimal(1))
+
+        cache.clear()
+        self.assertIsNone(cache.get(KEY))
+        self.assertEqual(book.read(KEY)[0], 1)
+
+        cache.clear_shared()
+        self.assertIsNone(book.read(KEY))
+
+
+class AsyncPathTest(SimpleTestCase):
+    async def test_shared_book_is_used_off_the_event_loop(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        book = MmapBook(os.path.join(directory.name, "book"), slots=16)
+        loop_thread = threading.current_thread()
+        threads = []
+        for method in ("read_many", "write", "acquire", "release"):
+            original = getattr(book, method)
+
+            def record(*args, original=original):
+                threads.append(threading.current_thread())
+                return original(*args)
+
+            setattr(book, method, record)
+
+        pair = Pair(pair_id="APTUSDC", active_exchanges=["hyperion"])
+        with mock.patch.object(price_cache, "shared", book), fake_adapters(
+            fetch_one_async={"hyperion": mock.AsyncMock(return_value=Decimal(2))}
+        ):
+            entry = await cached_query_exchange_async(pair, "hyperion")
+        await close_async_clients()
+        price_cache.clear()
+        self.assertEqual(entry.price, 2)
+        self.assertEqual(book.read(("APTUSDC", "hyperion"))[0], 2)
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+
+class DeadlineTest(SimpleTestCase):
+    def test_waiting_on_other_workers_keeps_the_deadline(self):
+        """A worker sitting on the leases can't hold the prices up past the exchange deadline."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "book")
+        book = MmapBook(path, slots=16)
+        pairs = [
+            Pair(pair_id=pair_id, active_exchanges=["uniswap"])
+            for pair_id in ("WBTCUSDC", "WETHUSDC")
+        ]
+        for pair in pairs:
+            worker(MmapBook(path, slots=16), "stuck").acquire(
+                f"{pair.pair_id}/uniswap", 10
+            )
+
+        fetch = mock.Mock(return_value={"WBTCUSDC": Decimal(1), "WETHUSDC": Decimal(2)})
+        with mock.patch.object(price_cache, "shared", book), mock.patch.dict(
+            os.environ, {"UNISWAP_QUERY_DEADLINE": "0.3"}
+        ), fake_adapters(fetch_many={"uniswap": fetch}):
+            started = time.monotonic()
+            fetch_many_exchange_prices(pairs)
+            elapsed = time.monotonic() - started
+        price_cache.clear()
+        self.assertLess(elapsed, 1)
+
+
+class EncodingTest(SimpleTestCase):
+    def test_prices_keep_their_type(self):
+        for price in (Decimal("1.000000000000000000000000001"), Decimal("1E-30"), 0.1):
+            decoded = decode_price(encode_price(price))
+            self.assertEqual(decoded, price)
+            self.assertIs(type(decoded), type(price))
+
+
+class SharedPollerTest(SimpleTestCase):
+    """One poller per network polls, the pollers of the other workers follow it."""
+
+    def setUp(self):
+        self.server = FakeRedis().start()
+        self.addCleanup(self.server.stop)
+
+    def test_only_the_lease_holder_polls(self):
+        pair = Pair(
+            pair_id="APTUSDC",
+            active_exchanges=["hyperion"],
+            pool_contracts={"hyperion": "0x3"},
+        )
+        calls = mock.Mock(return_value=Decimal("8.5"))
+        pollers = [
+            PricePoller(PriceCache(shared=worker(RedisBook(self.server.url), name)))
+            for name in ("leader", "follower")
+        ]
+        with fake_adapters(fetch_one={"hyperion": calls}):
+            for poller in pollers:
+                poller.refresh_network(Network.APTOS, [(pair, "hyperion")])
+
+        self.assertEqual(calls.call_count, 1)
+        for poller in pollers:
+            self.assertEqual(
+                poller.book.get(("APTUSDC", "hyperion")).price, Decimal("8.5")
+            )
+        follower = pollers[1].book.get(("APTUSDC", "hyperion"))
+        self.assertTrue(follower.shared)
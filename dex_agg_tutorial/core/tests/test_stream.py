@@ -0,0 +1,140 @@
+import asyncio
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+
+from core.cache import PriceCache, price_cache
+from core.clients import close_async_clients
+from core.stream import PriceBroadcaster, price_broadcaster
+
+from .fake_chain import fake_adapters, make_pair
+
+
+class BroadcasterTest(SimpleTestCase):
+    """Prices put in the book reach the subscribers of their pair, once per change."""
+
+    def setUp(self):
+        self.book = PriceCache()
+        self.book.warm = True  # keeps the refresher away from the chain
+        self.broadcaster = PriceBroadcaster(self.book, interval=60)
+
+    async def test_only_changes_are_sent(self):
+        loop = asyncio.get_running_loop()
+        first = self.broadcaster.subscribe([make_pair("AAA", "BBB")], loop)
+        second = self.broadcaster.subscribe([make_pair("AAA", "BBB")], loop)
+        other = self.broadcaster.subscribe([make_pair("CCC", "DDD")], loop)
+
+        self.book.put(("AAABBB", "uniswap"), Decimal("1.5"))
+        self.book.put(("AAABBB", "uniswap"), Decimal("1.5"))
+        for subscription in (first, second):
+            updates = await subscription.updates(1)
+            self.assertEqual(updates["AAABBB"]["uniswap"].price, Decimal("1.5"))
+        self.assertEqual(await first.updates(0.05), {})
+        self.assertEqual(await other.updates(0.05), {})
+
+        self.book.put(("AAABBB", "uniswap"), Decimal("1.6"))
+        self.assertEqual(
+            (await first.updates(1))["AAABBB"]["uniswap"].price, Decimal("1.6")
+        )
+
+    async def test_slow_subscriber_gets_the_latest_price(self):
+        subscription = self.broadcaster.subscribe(
+            [make_pair("AAA", "BBB")], asyncio.get_running_loop()
+        )
+        for i in range(100):
+            self.book.put(("AAABBB", "uniswap"), Decimal(i))
+            self.book.put(("AAABBB", "hyperion"), Decimal(-i))
+        updates = await subscription.updates(1)
+        self.assertEqual(updates["AAABBB"]["uniswap"].price, 99)
+        self.assertEqual(updates["AAABBB"]["hyperion"].price, -99)
+
+    async def test_known_prices_come_first(self):
+        self.book.put(("AAABBB", "uniswap"), Decimal(2))
+        self.book.put(("CCCDDD", "uniswap"), Decimal(3))
+        subscription = self.broadcaster.subscribe(
+            [make_pair("AAA", "BBB")], asyncio.get_running_loop()
+        )
+        updates = await subscription.updates(1)
+        self.assertEqual(list(updates), ["AAABBB"])
+
+    async def test_last_unsubscribe_detaches_from_the_book(self):
+        loop = asyncio.get_running_loop()
+        first = self.broadcaster.subscribe([make_pair("AAA", "BBB")], loop)
+        second = self.broadcaster.subscribe([make_pair("AAA", "BBB")], loop)
+        self.assertEqual(self.broadcaster.subscribers, 2)
+        self.broadcaster.unsubscribe(first)
+        self.assertEqual(self.book._subscribers, [self.broadcaster.publish])
+        self.broadcaster.unsubscribe(second)
+        self.assertEqual(self.book._subscribers, [])
+        self.assertEqual(self.broadcaster.subscribers, 0)
+
+
+class RefreshTest(SimpleTestCase):
+    """Without the poller the subscribed pairs are read once, however many clients watch."""
+
+    def setUp(self):
+        price_cache.clear()
+        self.addCleanup(price_cache.clear)
+
+    async def test_one_upstream_read_for_all_subscribers(self):
+        calls = []
+
+        def fetch_one(pair, client):
+            calls.append(pair.pair_id)
+            return Decimal(7)
+
+        broadcaster = PriceBroadcaster(price_cache, interval=0.05)
+        loop = asyncio.get_running_loop()
+        with fake_adapters(fetch_one={"uniswap": fetch_one}):
+            subscriptions = [
+                broadcaster.subscribe([make_pair("AAA", "BBB")], loop)
+                for _ in range(20)
+            ]
+            for subscription in subscriptions:
+                updates = await subscription.updates(2)
+                self.assertEqual(updates["AAABBB"]["uniswap"].price, 7)
+            for subscription in subscriptions:
+                broadcaster.unsubscribe(subscription)
+        await close_async_clients()
+        self.assertEqual(calls, ["AAABBB"])
+
+
+class StreamViewTest(TestCase):
+    def setUp(self):
+        price_cache.clear()
+        self.addCleanup(price_cache.clear)
+        pair = make_pair("AAA", "BBB")
+        pair.uid = 1
+        pair.save()
+        price_cache.put(("AAABBB", "uniswap"), Decimal("1.25"))
+
+    async def test_stream(self):
+        with fake_adapters(fetch_one={"uniswap": lambda pair, client: Decimal("1.25")}):
+            response = await self.async_client.get("/stream/?pairs=aaabbb&precision=3")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            events = aiter(response.streaming_content)
+            event = await anext(events)
+            self.assertEqual(price_broadcaster.subscribers, 1)
+
+            # the ASGI handler cancels the response when the client goes away
+            waiting = asyncio.ensure_future(anext(events))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+        await close_async_clients()
+        self.assertEqual(
+            event,
+            b'event: price\ndata: {"token_pair": "AAABBB", "prices": {"uniswap": "1.25"}}\n\n',
+        )
+        self.assertEqual(price_broadcaster.subscribers, 0)
+
+    async def test_bad_requests(self):
+        response = await self.async_client.get("/stream/")
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get("/stream/?pairs=AAABBB,NOPE")
+        self.assertEqual(response.status_code, 404)
+
+    def test_needs_asgi(self):
+        self.assertEqual(self.client.get("/stream/?pairs=AAABBB").status_code, 501)
@@ -0,0 +1,222 @@
+import copy
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from eth_abi import encode
+
+from core.adapters.hyperion import HyperionTransactionSync
+from core.adapters.uniswap import UniswapLogSync
+from core.cache import PriceCache
+from core.clients import NetworkClient
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.models import Pair
+from core.poller import PricePoller
+from core.swapmath import sqrt_ratio_at_tick
+from core.sync import SYNC_CONFIRMATIONS
+from core.validation import Network
+
+from .fake_chain import load_fixture
+from .test_quotes import HYPERION_POOL, L, POOL, TWO_POSITIONS
+
+BLOCK = 20_000_000
+
+
+def uniswap_pool() -> dict:
+    return {
+        "sqrt_price_x96": 2**96,
+        "tick": 0,
+        "liquidity": 2 * L,
+        "fee": 3000,
+        "tick_spacing": 60,
+        "ticks": dict(TWO_POSITIONS),
+    }
+
+
+def hyperion_pool() -> dict:
+    return {"sqrt_price": 2**64, "liquidity": 10 * L, "tick": 0, "fee_rate": 500}
+
+
+def swap_log(template: dict, block: int, tick: int) -> dict:
+    """Copy of a recorded Swap log moved to another block and tick."""
+    log = copy.deepcopy(template)
+    data = encode(
+        ["int256", "int256", "uint160", "uint128", "int24"],
+        [10**15, -(10**15), sqrt_ratio_at_tick(tick), 2 * L, tick],
+    )
+    log.update(blockNumber=hex(block), logIndex="0x0", data="0x" + data.hex())
+    return log
+
+
+class UniswapLogSyncTest(SimpleTestCase):
+    """Pool state follows recorded Swap, Mint and Burn logs without reading the pool again."""
+
+    def setUp(self):
+        self.node = FakeEthereumNode({POOL: uniswap_pool()}).start()
+        self.addCleanup(self.node.stop)
+        # the head is SYNC_CONFIRMATIONS blocks ahead of the last block synced
+        self.node.block_number = BLOCK + SYNC_CONFIRMATIONS
+        self.sync = UniswapLogSync(
+            [Pair(pair_id="AAABBB", pool_contracts={"uniswap": POOL})],
+            NetworkClient(Network.ETHEREUM, self.node.url),
+        )
+        self.sync.bootstrap()
+        self.node.logs = load_fixture("uniswap_pool_logs.json")
+
+    def test_replays_recorded_logs(self):
+        self.node.block_number = BLOCK + 3 + SYNC_CONFIRMATIONS
+        calls = self.node.calls["eth_call"]
+
+        changed = self.sync.sync()
+        pool = changed["AAABBB"]
+        self.assertEqual(pool.tick, -100)
+        self.assertEqual(pool.sqrt_price, sqrt_ratio_at_tick(-100) + 12345)
+        # the -120/120 position was minted and the -60/60 one burned while both were in range
+        self.assertEqual(pool.liquidity, 2 * L)
+        self.assertEqual(
+            pool.ticks, {-600: L, -120: L, -60: 0, 60: 0, 120: -L, 600: -L}
+        )
+        self.assertEqual(self.sync.cursor, BLOCK + 3)
+        self.assertEqual(self.node.calls["eth_getLogs"], 1)
+        self.assertEqual(self.node.calls["eth_call"], calls)
+
+    def test_mint_in_range_adds_liquidity(self):
+        self.node.block_number = BLOCK + 1 + SYNC_CONFIRMATIONS
+        # swap to -30 and mint L over [-120, 120]
+        self.assertEqual(self.sync.sync()["AAABBB"].liquidity, 3 * L)
+
+    def test_unconfirmed_blocks_wait(self):
+        self.node.block_number = BLOCK + 2
+        with mock.patch("core.adapters.uniswap.SYNC_CONFIRMATIONS", 1):
+            self.sync.sync()
+        self.assertEqual(self.sync.cursor, BLOCK + 1)
+        self.assertEqual(self.sync.pools["AAABBB"].tick, -30)
+
+    def test_nothing_to_do_without_new_blocks(self):
+        self.assertEqual(self.sync.sync(), {})
+        self.assertNotIn("eth_getLogs", self.node.calls)
+
+    def test_block_range_is_split(self):
+        self.node.block_number = BLOCK + 3 + SYNC_CONFIRMATIONS
+        with mock.patch("core.adapters.uniswap.SYNC_BLOCK_RANGE", 2):
+            self.sync.sync()
+        self.assertEqual(self.node.calls["eth_getLogs"], 2)
+        self.assertEqual(self.sync.pools["AAABBB"].tick, -100)
+
+    def test_price_moving_to_the_edge_of_the_known_ticks(self):
+        self.node.logs = [swap_log(self.node.logs[0], BLOCK + 1, 40020)]
+        self.node.block_number = BLOCK + 1 + SYNC_CONFIRMATIONS
+        self.node.pools[POOL].update(
+            tick=40020, sqrt_price_x96=sqrt_ratio_at_tick(40020)
+        )
+        self.node.pools[POOL]["ticks"][50040] = 5  # in word 3, not loaded yet
+        calls = self.node.calls["eth_call"]
+
+        pool = self.sync.sync()["AAABBB"]
+        self.assertGreater(self.node.calls["eth_call"], calls)
+        self.assertIn(50040, pool.ticks)
+
+
+class HyperionTransactionSyncTest(SimpleTestCase):
+    """Pool state follows resource writes in recorded Aptos transactions."""
+
+    def setUp(self):
+        self.node = FakeAptosNode({HYPERION_POOL: hyperion_pool()}).start()
+        self.addCleanup(self.node.stop)
+        self.sync = HyperionTransactionSync(
+            [Pair(pair_id="AAABBB", pool_contracts={"hyperion": HYPERION_POOL})],
+            NetworkClient(Network.APTOS, self.node.url),
+        )
+        self.sync.bootstrap()
+        self.node.transactions = load_fixture("hyperion_transactions.json")
+
+    def test_replays_recorded_transactions(self):
+        requests = self.node.requests
+        pool = self.sync.sync()["AAABBB"]
+
+        self.assertEqual((pool.tick, pool.liquidity), (-100, 12 * L))
+        self.assertEqual(pool.sqrt_price, sqrt_ratio_at_tick(-100, bits=64))
+        self.assertEqual(self.sync.cursor, self.node.ledger_version)
+        # the ledger version, then one page
+        self.assertEqual(self.node.requests - requests, 2)
+        self.assertEqual(self.sync.sync(), {})
+
+    def test_polls_when_too_far_behind(self):
+        self.node.pools[HYPERION_POOL]["tick"] = 7
+        requests = self.node.requests
+        with mock.patch("core.adapters.hyperion.SYNC_PAGE_SIZE", 2), mock.patch(
+            "core.adapters.hyperion.SYNC_MAX_PAGES", 2
+        ):
+            changed = self.sync.sync()
+        # the ledger version and the pool, no pages of the transaction stream
+        self.assertEqual(self.node.requests - requests, 2)
+        # the pool resource is served as it is in `pools`, not as of the transactions
+        self.assertEqual(changed["AAABBB"].tick, 7)
+        self.assertEqual(self.sync.cursor, self.node.ledger_version)
+        # an unchanged pool isn't reported again
+        self.node.transactions.append({"version": "3000000100", "changes": []})
+        with mock.patch("core.adapters.hyperion.SYNC_PAGE_SIZE", 2):
+            self.assertEqual(self.sync.sync(), {})
+
+    def test_pages_stop_at_the_ledger_version(self):
+        with mock.patch("core.adapters.hyperion.SYNC_PAGE_SIZE", 2):
+            self.assertEqual(self.sync.sync()["AAABBB"].tick, -100)
+        self.assertEqual(self.sync.cursor, self.node.ledger_version)
+
+
+class EventSyncPollerTest(TestCase):
+    """With sync="events" the poller writes pools that changed and marks the rest as current."""
+
+    def setUp(self):
+        self.eth = FakeEthereumNode({POOL: uniswap_pool()}).start()
+        self.aptos = FakeAptosNode({HYPERION_POOL: hyperion_pool()}).start()
+        self.addCleanup(self.eth.stop)
+        self.addCleanup(self.aptos.stop)
+        clients = {
+            Network.ETHEREUM: NetworkClient(Network.ETHEREUM, self.eth.url),
+            Network.APTOS: NetworkClient(Network.APTOS, self.aptos.url),
+        }
+        patcher = mock.patch("core.poller.get_client", side_effect=clients.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Pair.objects.create(
+            uid=1,
+            pair_id="AAABBB",
+            base_token="AAA",
+            quote_token="BBB",
+            active_exchanges=["uniswap", "hyperion"],
+            pool_contracts={"uniswap": POOL, "hyperion": HYPERION_POOL},
+        )
+        self.book, self.liquidity = PriceCache(), PriceCache()
+        self.poller = PricePoller(self.book, sync="events", liquidity=self.liquidity)
+
+    def test_refresh_from_events(self):
+        self.poller.refresh_all()
+        self.assertEqual(self.book.get(("AAABBB", "uniswap")).price, 1)
+        self.assertEqual(self.book.get(("AAABBB", "hyperion")).price, 1)
+
+        self.eth.logs = load_fixture("uniswap_pool_logs.json")
+        self.eth.block_number = BLOCK + 3 + SYNC_CONFIRMATIONS
+        hyperion = self.book.get(("AAABBB", "hyperion"))
+        self.poller.refresh_all()
+
+        uniswap = self.book.get(("AAABBB", "uniswap"))
+        self.assertLess(uniswap.price, 1)
+        self.assertEqual(self.liquidity.get(("AAABBB", "uniswap")).price.tick, -100)
+        # no hyperion transactions, same price but confirmed as of this pass
+        touched = self.book.get(("AAABBB", "hyperion"))
+        self.assertEqual(touched.price, hyperion.price)
+        self.assertGreaterEqual(touched.fetched_at, hyperion.fetched_at)
+
+    def test_new_pairs_bootstrap_again(self):
+        self.poller.refresh_all()
+        self.aptos.pools["0x" + "c" * 64] = hyperion_pool()
+        Pair.objects.create(
+            uid=2,
+            pair_id="CCCBBB",
+            base_token="CCC",
+            quote_token="BBB",
+            active_exchanges=["hyperion"],
+            pool_contracts={"hyperion": "0x" + "c" * 64},
+        )
+        self.poller.refresh_all()
+        self.assertEqual(self.poller._syncs["hyperion"].pair_ids, {"AAABBB", "CCCBBB"})
@@ -0,0 +1,188 @@
+from decimal import Decimal
+from functools import partial
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APITestCase
+from web3 import Web3
+
+from core.adapters.uniswap import query_uniswap_prices, uniswap_price_from_sqrt
+from core.clients import NetworkClient
+from core.fakes import FakeAptosNode, FakeEthereumNode
+from core.models import Pair, Token
+from core.tokens import DECIMALS_ERROR, orient_pairs, token_registry
+from core.validation import Network
+
+from .fake_chain import make_pair
+from .test_quotes import HYPERION_POOL
+
+USDC = Web3.to_checksum_address("0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48")
+WETH = Web3.to_checksum_address("0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2")
+WBTC = Web3.to_checksum_address("0x2260fac5e5542a773aa44fbcfedf7c193bc2c599")
+USDC_WETH_POOL = Web3.to_checksum_address("0x88e6a0c2ddd26feeb64f039a2c41296fcb3f5640")
+WBTC_USDC_POOL = Web3.to_checksum_address("0x99ac8ca7087fa4a2a1fb6357269965a2014abc35")
+APT = "0x" + "0" * 63 + "a"
+APTOS_USDC = "0x" + "b" * 64
+
+# pairs as submitted, before their tokens are read from chain
+unread_pair = partial(
+    make_pair, exchanges=(), base_token_decimals=None, quote_token_decimals=None
+)
+
+# 1 WETH = 2500 USDC: the pool price is raw WETH per raw USDC, 10^12 / 2500 = 4 * 10^8
+SQRT_PRICE_X96 = 20000 * 2**96
+
+
+class TokenNodesMixin:
+    """A fake Ethereum node with two pools and their tokens, a fake Aptos node with one pool."""
+
+    def setUp(self):
+        token_registry.clear()
+        self.addCleanup(token_registry.clear)
+        self.eth = FakeEthereumNode(
+            {
+                USDC_WETH_POOL: {
+                    "sqrt_price_x96": SQRT_PRICE_X96,
+                    "token0": USDC,
+                    "token1": WETH,
+                },
+                WBTC_USDC_POOL: {
+                    "sqrt_price_x96": 2**96,
+                    "token0": WBTC,
+                    "token1": USDC,
+                },
+            }
+        ).start()
+        self.eth.tokens = {
+            USDC: {"symbol": "USDC", "decimals": 6},
+            WETH: {"symbol": "WETH", "decimals": 18},
+            WBTC: {"symbol": "WBTC", "decimals": 8},
+        }
+        self.aptos = FakeAptosNode(
+            {
+                HYPERION_POOL: {
+                    "sqrt_price": 2**64,
+                    "token_a": {"inner": APT},
+                    "token_b": {"inner": APTOS_USDC},
+                }
+            }
+        ).start()
+        self.aptos.tokens = {
+            APT: {"symbol": "APT", "decimals": 8},
+            APTOS_USDC: {"symbol": "USDC", "decimals": 6},
+        }
+        self.addCleanup(self.eth.stop)
+        self.addCleanup(self.aptos.stop)
+        self.clients = {
+            Network.ETHEREUM: NetworkClient(Network.ETHEREUM, self.eth.url),
+            Network.APTOS: NetworkClient(Network.APTOS, self.aptos.url),
+        }
+        patcher = mock.patch("core.tokens.get_client", side_effect=self.clients.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class OrientPairsTest(TokenNodesMixin, TestCase):
+    """Token order and decimals come from chain, a batch per exchange."""
+
+    def test_orients_both_ways(self):
+        pairs = [
+            unread_pair("WETH", "USDC", pool_contracts={"uniswap": USDC_WETH_POOL}),
+            unread_pair(
+                "USDC", "WETH", pool_contracts={"uniswap": USDC_WETH_POOL.lower()}
+            ),
+            unread_pair("WBTC", "USDC", pool_contracts={"uniswap": WBTC_USDC_POOL}),
+        ]
+        self.assertEqual(orient_pairs(pairs), {})
+        weth, usdc, wbtc = pairs
+
+        self.assertEqual(weth.inverted_pools, {"uniswap": True})
+        self.assertEqual((weth.base_token_decimals, weth.quote_token_decimals), (18, 6))
+        self.assertEqual(usdc.inverted_pools, {"uniswap": False})
+        self.assertEqual(wbtc.inverted_pools, {"uniswap": False})
+        # pool tokens in one eth_call, metadata of the three new tokens in another
+        self.assertEqual(self.eth.calls["eth_call"], 2)
+        self.assertEqual(Token.objects.filter(network="mainnet").count(), 3)
+
+        # known tokens are not read again, not even after a restart
+        token_registry.clear()
+        orient_pairs(
+            [unread_pair("WETH", "USDC", pool_contracts={"uniswap": USDC_WETH_POOL})]
+        )
+        self.assertEqual(self.eth.calls["eth_call"], 3)
+
+    def test_prices_follow_the_orientation(self):
+        pairs = [
+            unread_pair("WETH", "USDC", pool_contracts={"uniswap": USDC_WETH_POOL}),
+            unread_pair("USDC", "WETH", pool_contracts={"uniswap": USDC_WETH_POOL}),
+        ]
+        orient_pairs(pairs)
+        self.assertEqual(uniswap_price_from_sqrt(pairs[0], SQRT_PRICE_X96), 2500)
+        self.assertEqual(
+            uniswap_price_from_sqrt(pairs[1], SQRT_PRICE_X96), Decimal("0.0004")
+        )
+
+        prices = query_uniswap_prices(pairs, self.clients[Network.ETHEREUM])
+        self.assertEqual(prices, {"WETHUSDC": 2500, "USDCWETH": Decimal("0.0004")})
+
+    def test_hyperion_pools(self):
+        pair = unread_pair("USDC", "APT", pool_contracts={"hyperion": HYPERION_POOL})
+        self.assertEqual(orient_pairs([pair]), {})
+        self.assertEqual(pair.inverted_pools, {"hyperion": True})
+        self.assertEqual((pair.base_token_decimals, pair.quote_token_decimals), (6, 8))
+
+    def test_errors(self):
+        wrong_tokens = unread_pair(
+            "LINK", "DAI", pool_contracts={"uniswap": USDC_WETH_POOL}
+        )
+        wrong_decimals = unread_pair(
+            "WETH", "USDC", pool_contracts={"uniswap": USDC_WETH_POOL}
+        )
+        wrong_decimals.base_token_decimals = 8
+        no_pool = unread_pair("LINK", "USDC", pool_contracts={})
+        errors = orient_pairs([wrong_tokens, wrong_decimals, no_pool])
+
+        self.assertIn("USDC/WETH", errors["LINKDAI"])
+        self.assertIn("WETH has 18 decimals", errors["WETHUSDC"])
+        self.assertEqual(errors["LINKUSDC"], DECIMALS_ERROR)
+
+    def test_unreadable_pools_are_left_as_given(self):
+        pair = unread_pair("LINK", "USDC", pool_contracts={"uniswap": "0x" + "1" * 40})
+        pair.base_token_decimals, pair.quote_token_decimals = 18, 6
+        self.assertEqual(orient_pairs([pair]), {})
+        self.assertEqual(pair.inverted_pools, {})
+
+
+class CreatePairTest(TokenNodesMixin, APITestCase):
+    """POST /pairs/ reads decimals and token order instead of assuming 18 and token0."""
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user("admin", password="admin", is_staff=True)
+        self.client.force_authenticate(user=admin)
+
+    def post(self, **data):
+        return self.client.post("/pairs/", data, format="json")
+
+    def test_decimals_and_orientation_from_chain(self):
+        response = self.post(
+            pair_id="WETHUSDC",
+            base_token="WETH",
+            quote_token="USDC",
+            active_exchanges=["uniswap"],
+            pool_contracts={"uniswap": USDC_WETH_POOL},
+        )
+        self.assertEqual(response.status_code, 201)
+        pair = Pair.objects.get(pair_id="WETHUSDC")
+        self.assertEqual((pair.base_token_decimals, pair.quote_token_decimals), (18, 6))
+        self.assertTrue(pair.is_inverted("uniswap"))
+
+    def test_rejected_pairs(self):
+        for data in [
+            {"base_token": "LINK", "pool_contracts": {"uniswap": USDC_WETH_POOL}},
+            {"base_token": "LINK", "pool_contracts": {}},
+        ]:
+            response = self.post(pair_id="LINKUSDC", quote_token="USDC", **data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(Pair.objects.filter(pair_id="LINKUSDC").exists())
@@ -0,0 +1,144 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.adapters import get_adapter
+from core.cache import PriceCache
+from core.clients import NetworkClient
+from core.fakes import FakeEthereumNode
+from core.history import HistoryRecorder, history_twap
+from core.models import Pair
+from core.queries import twap_cache
+from core.swapmath import sqrt_ratio_at_tick
+from core.twap import mean_tick, time_weighted_average
+from core.validation import Network
+
+from .test_quotes import POOL
+
+NOW = 1735689600
+
+
+def oracle_pool() -> dict:
+    # tick -100 for the first five minutes, 500 since then
+    return {
+        "sqrt_price_x96": sqrt_ratio_at_tick(500),
+        "tick": 500,
+        "observations": [(NOW - 600, 0), (NOW - 300, -100 * 300)],
+    }
+
+
+def price_at_tick(tick: int) -> float:
+    return (sqrt_ratio_at_tick(tick) / 2**96) ** 2
+
+
+class TwapMathTest(SimpleTestCase):
+    def test_mean_tick_rounds_down(self):
+        self.assertEqual(mean_tick([0, 301], 300), 1)
+        self.assertEqual(mean_tick([0, -301], 300), -2)
+        self.assertEqual(mean_tick([1000, 1000 - 300], 300), -1)
+
+    def test_time_weighted_average(self):
+        # 1.0 for the first half of the window, 4.0 for the second half
+        self.assertAlmostEqual(time_weighted_average([0, 100], [1.0, 4.0], 0, 200), 2.0)
+        # points before the window only give the starting price
+        self.assertAlmostEqual(
+            time_weighted_average([-50, -10, 100], [9.0, 1.0, 4.0], 0, 200), 2.0
+        )
+        self.assertIsNone(time_weighted_average([10, 100], [1.0, 4.0], 0, 200))
+
+
+class UniswapTwapTest(SimpleTestCase):
+    """observe() on the pool oracle, read with the block it was read at."""
+
+    def setUp(self):
+        self.node = FakeEthereumNode({POOL: oracle_pool()}).start()
+        self.node.timestamp = NOW
+        self.addCleanup(self.node.stop)
+        self.client = NetworkClient(Network.ETHEREUM, self.node.url)
+        self.pair = Pair(pair_id="AAABBB", pool_contracts={"uniswap": POOL})
+
+    def test_mean_tick_over_the_window(self):
+        twap = get_adapter("uniswap").fetch_twap(self.pair, self.client, 600)
+        # (-100 * 300 + 500 * 300) / 600
+        self.assertEqual(twap.tick, 200)
+        self.assertAlmostEqual(float(twap.price), price_at_tick(200))
+        self.assertEqual((twap.block, twap.end), (self.node.block_number, NOW))
+        self.assertEqual(self.node.calls["eth_call"], 1)
+
+        twap = get_adapter("uniswap").fetch_twap(self.pair, self.client, 300)
+        self.assertEqual(twap.tick, 500)
+
+    def test_window_older_than_the_oracle(self):
+        self.assertIsNone(
+            get_adapter("uniswap").fetch_twap(self.pair, self.client, 900)
+        )
+
+
+class HistoryTwapTest(TestCase):
+    """The Hyperion equivalent, averaged from recorded and still buffered prices."""
+
+    def test_recorded_and_buffered_points(self):
+        book = PriceCache()
+        recorder = HistoryRecorder(book)
+        book.subscribe(recorder.record)
+        key = ("AAABBB", "hyperion")
+        book.put(key, 9.0, fetched_at=NOW - 900)
+        book.put(key, 1.0, fetched_at=NOW - 700)
+        recorder.flush()
+        book.put(key, 4.0, fetched_at=NOW - 300)
+
+        price = history_twap("AAABBB", "hyperion", NOW - 600, NOW, recorder)
+        self.assertAlmostEqual(price, 2.0)
+        self.assertIsNone(history_twap("AAABBB", "hyperion", NOW - 1200, NOW, recorder))
+        self.assertIsNone(history_twap("AAABBB", "uniswap", NOW - 600, NOW, recorder))
+
+
+class TwapAPITest(APITestCase):
+    """?twap= on /price/, shared between requests until the next block."""
+
+    def setUp(self):
+        twap_cache.clear()
+        self.addCleanup(twap_cache.clear)
+        self.node = FakeEthereumNode({POOL: oracle_pool()}).start()
+        self.addCleanup(self.node.stop)
+        client = NetworkClient(Network.ETHEREUM, self.node.url)
+        patcher = mock.patch("core.queries.get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Pair.objects.create(
+            uid=1,
+            pair_id="AAABBB",
+            base_token="AAA",
+            quote_token="BBB",
+            active_exchanges=["uniswap"],
+            pool_contracts={"uniswap": POOL},
+        )
+
+    def get(self, twap):
+        return self.client.get(reverse("price", args=["AAABBB"]), {"twap": twap})
+
+    def test_twap(self):
+        # blocks at wall clock time, so the result is still fresh for the second request
+        self.node.timestamp = None
+        self.node.pools[POOL]["observations"] = [(self.node.now() - 3600, 0)]
+
+        response = self.get(600)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertAlmostEqual(data["best_price"], price_at_tick(500), places=12)
+        self.assertEqual(data["twap"]["window"], 600)
+        self.assertEqual(data["twap"]["exchanges"]["uniswap"]["tick"], 500)
+        self.assertFalse(data["cache"]["uniswap"]["hit"])
+
+        self.assertTrue(self.get(600).json()["cache"]["uniswap"]["hit"])
+        self.assertEqual(self.node.calls["eth_call"], 1)
+
+    def test_invalid_window(self):
+        for window in ["0", "abc", "100000"]:
+            self.assertEqual(self.get(window).status_code, 400, window)
+
+    def test_window_past_the_oracle(self):
+        self.node.timestamp = NOW
+        self.assertEqual(self.get(3600).status_code, 503)
@@ -0,0 +1,197 @@
+"""
+Token metadata and pool orientation.
+
+Pools order their two tokens by address, not by which one a pair calls its base token. The
+USDC/WETH pool on Uniswap holds USDC as token0, so its price is WETH per USDC whether the pair
+is USDCWETH or WETHUSDC. When pairs are created we read the tokens of their pools, with symbols
+and decimals, for all pairs of an exchange at once:
+
+    pool tokens     one Multicall3 call per MULTICALL_BATCH_SIZE calls (Uniswap), concurrent
+                    resource reads (Hyperion, the Aptos REST API can't batch)
+    token metadata  only for tokens we haven't seen before, batched the same way
+
+Tokens are stored in the Token table and memoized in process. Which pools hold the base token as
+token1 is stored on the pair (inverted_pools), so pricing never looks anything up per request.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .adapters import TokenInfo, get_adapter, get_adapters
+from .clients import get_client
+from .models import Pair, Token
+
+DECIMALS_ERROR = (
+    "Token decimals could not be read from chain, "
+    "pass base_token_decimals and quote_token_decimals"
+)
+
+
+class TokenRegistry:
+    """Tokens keyed by (network, address), kept in memory in front of the Token table."""
+
+    def __init__(self):
+        self._tokens: Dict[Tuple[str, str], TokenInfo] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, network: str, addresses: Iterable[str]) -> Dict[str, TokenInfo]:
+        """Known tokens among `addresses`, from memory or one database query for the rest."""
+        addresses = list(addresses)
+        with self._lock:
+            found = {
+                address: self._tokens[(network, address)]
+                for address in addresses
+                if (network, address) in self._tokens
+            }
+        missing = [address for address in addresses if address not in found]
+        if missing:
+            loaded = [
+                TokenInfo(token.address, token.symbol, token.decimals)
+                for token in Token.objects.filter(network=network, address__in=missing)
+            ]
+            self._remember(network, loaded)
+            found.update((token.address, token) for token in loaded)
+        return found
+
+    def add(self, network: str, tokens: List[TokenInfo]):
+        """Store tokens read from chain, tokens already in the table are left alone."""
+        Token.objects.bulk_create(
+            [
+                Token(
+                    network=network,
+                    address=token.address,
+                    symbol=token.symbol[:32],
+                    decimals=token.decimals,
+                )
+                for token in tokens
+            ],
+            ignore_conflicts=True,
+        )
+        self._remember(network, tokens)
+
+    def _remember(self, network: str, tokens: Iterable[TokenInfo]):
+        with self._lock:
+            self._tokens.update(((network, token.address), token) for token in tokens)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+token_registry = TokenRegistry()
+
+
+def read_pool_tokens(
+    exchange_id: str, pool_addresses: List[str]
+) -> Dict[str, Optional[Tuple[TokenInfo, TokenInfo]]]:
+    """
+    (token0, token1) of many pools of one exchange keyed by pool address as given, None for pools
+    that could not be read. Metadata is only fetched for tokens the registry doesn't know yet.
+    """
+    adapter = get_adapter(exchange_id)
+    client = get_client(adapter.network)
+    network = adapter.network.value
+
+    pool_tokens = adapter.fetch_pool_tokens(pool_addresses, client)
+    addresses = sorted({a for pair in pool_tokens.values() if pair for a in pair})
+    tokens = token_registry.get_many(network, addresses)
+    missing = [address for address in addresses if address not in tokens]
+    if missing:
+        fetched = [
+            token
+            for token in adapter.fetch_tokens(missing, client).values()
+            if token is not None
+        ]
+        token_registry.add(network, fetched)
+        tokens.update((token.address, token) for token in fetched)
+
+    return {
+        pool: (
+            (tokens[pair[0]], tokens[pair[1]])
+            if pair and pair[0] in tokens and pair[1] in tokens
+            else None
+        )
+        for pool, pair in pool_tokens.items()
+    }
+
+
+def same_symbol(a: str, b: str) -> bool:
+    """Symbols of the same token, a wrapped token stands in for the native one (WETH, ETH)."""
+    a, b = a.strip().upper(), b.strip().upper()
+    return a == b or a == "W" + b or b == "W" + a
+
+
+def orient_pool(
+    pair: Pair, exchange_id: str, token0: TokenInfo, token1: TokenInfo
+) -> Optional[str]:
+    """
+    Work out which of the pool's tokens is the base token of the pair and fill in the decimals.
+    Returns an error message when the pool doesn't hold the pair's tokens, None otherwise.
+    """
+    base, quote = pair.base_token, pair.quote_token
+    base_first = same_symbol(token0.symbol, base) and same_symbol(token1.symbol, quote)
+    base_second = same_symbol(token1.symbol, base) and same_symbol(token0.symbol, quote)
+    if base_first == base_second:
+        return (
+            f"The {exchange_id} pool holds {token0.symbol}/{token1.symbol}, "
+            f"not {base}/{quote}"
+        )
+
+    base_token, quote_token = (token1, token0) if base_second else (token0, token1)
+    for field, token in [
+        ("base_token_decimals", base_token),
+        ("quote_token_decimals", quote_token),
+    ]:
+        given = getattr(pair, field)
+        if given is None:
+            setattr(pair, field, token.decimals)
+        elif given != token.decimals:
+            return (
+                f"{field} is {given} but {token.symbol} has {token.decimals} "
+                f"decimals on {exchange_id}"
+            )
+    pair.inverted_pools = {**pair.inverted_pools, exchange_id: base_second}
+    return None
+
+
+def orient_pairs(pairs: List[Pair]) -> Dict[str, str]:
+    """
+    Read the pool tokens of `pairs`, a batch per exchange, mark the pools that hold the base token
+    as token1 and fill in decimals that weren't given (None). Pairs are updated, not saved.
+
+    Returns an error message per pair_id of pairs that can't be used as given: pools holding other
+    tokens, decimals that contradict the chain, or decimals nobody knows. Pools that can't be read
+    (not a pool, RPC down) leave their pair as it was given.
+    """
+    adapters = get_adapters()
+    pools = defaultdict(list)  # exchange_id: [(pair, pool address)]
+    for pair in pairs:
+        for exchange_id, pool_address in pair.pool_contracts.items():
+            adapter = adapters.get(exchange_id)
+            if pool_address and adapter is not None and adapter.supports_tokens:
+                pools[exchange_id].append((pair, pool_address))
+
+    errors: Dict[str, str] = {}
+    for exchange_id, exchange_pools in pools.items():
+        addresses = list(dict.fromkeys(address for _, address in exchange_pools))
+        try:
+            tokens = read_pool_tokens(exchange_id, addresses)
+        except Exception as e:
+            print(f"Error reading {exchange_id} pool tokens: {e}")
+            continue
+        for pair, pool_address in exchange_pools:
+            pool_tokens = tokens.get(pool_address)
+            if pair.pair_id in errors or pool_tokens is None:
+                continue
+            error = orient_pool(pair, exchange_id, *pool_tokens)
+            if error:
+                errors[pair.pair_id] = error
+
+    for pair in pairs:
+        if pair.pair_id not in errors and None in (
+            pair.base_token_decimals,
+            pair.quote_token_decimals,
+        ):
+            errors[pair.pair_id] = DECIMALS_ERROR
+    return errors
@@ -0,0 +1,75 @@
+"""
+Time weighted average prices.
+
+A spot price (Uniswap slot0) can be pushed anywhere for the length of one block by whoever is
+willing to trade against the pool and back. An average over a few minutes costs holding the price
+there for minutes, so consumers that act on a price should ask for a TWAP (?twap=300 on /price/).
+
+Uniswap pools keep an oracle of tick cumulatives, the running sum of the tick over every second.
+observe([window, 0]) returns the cumulative `window` seconds ago and now, their difference divided
+by the window is the mean tick, rounded down like OracleLibrary.consult does on chain, and the
+price at that tick comes from the same integer TickMath the pool uses.
+
+Exchanges without an oracle (Hyperion) compute the equivalent from the recorded price history:
+the mean of the log prices weighted by how long each one held, which is what a mean tick is.
+
+Results are cached per (pair, exchange, window) for one block time of the exchange, a TWAP only
+changes when a block adds to it, so every client asking for the same window shares one read.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from .fixedpoint import Price
+
+# Window (seconds) when ?twap is given without a value, and the longest window we accept. Uniswap
+# pools only remember as many observations as their cardinality, and Hyperion only as far back as
+# the raw price history goes.
+TWAP_WINDOW = int(os.getenv("TWAP_WINDOW", "300"))
+TWAP_MAX_WINDOW = int(os.getenv("TWAP_MAX_WINDOW", "3600"))
+
+
+@dataclass(frozen=True)
+class Twap:
+    """Average price of a pair over `window` seconds ending at `end` (unix time)."""
+
+    price: Price
+    window: int
+    end: float
+    block: Optional[int] = None  # block the window ends in, when read from chain
+    tick: Optional[int] = None  # mean tick, for oracle based averages
+
+
+def mean_tick(tick_cumulatives: Sequence[int], window: int) -> int:
+    """
+    Arithmetic mean tick from the tick cumulatives of observe([window, 0]).
+    Rounds towards negative infinity, same as OracleLibrary.consult.
+    """
+    return (tick_cumulatives[1] - tick_cumulatives[0]) // window
+
+
+def time_weighted_average(
+    times: Sequence[float], prices: Sequence[float], start: float, end: float
+) -> Optional[float]:
+    """
+    Geometric time weighted average of a price series between `start` and `end`. Every price
+    holds until the next one, `times` must be sorted. None when there is no price at `start` yet,
+    averaging only the part of the window we know about would overweight the latest prices.
+    """
+    total = 0.0
+    current = None
+    at = start
+    for time, price in zip(times, prices):
+        if time > end:
+            break
+        if time > start and current is not None:
+            total += math.log(current) * (time - at)
+            at = time
+        if price > 0:
+            current = price
+    if current is None or (times and times[0] > start):
+        return None
+    total += math.log(current) * (end - at)
+    return math.exp(total / (end - start))
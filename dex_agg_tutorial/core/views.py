@@ -1,9 +1,61 @@
-from django.db import models
+import math
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .queries import get_token_price
+from .adapters import get_adapter
+from .async_queries import get_token_price_async
+from .fixedpoint import serialize_price
+from .graph import PATH_MAX_HOPS, get_path_price, token_graph
+from .history import get_history, parse_interval
+from .imports import PAIR_FIELDS, import_pairs, save_pairs
+from .metrics import registry, timed_stage
+from .queries import (
+    PRICES_MAX_PAIRS,
+    get_token_price,
+    get_token_prices,
+    get_token_twap,
+)
+from .quotes import SIDES, get_quote, get_route
+from .registry import pair_registry
+from .routing import ROUTE_GRANULARITY
+from .stream import STREAM_MAX_PAIRS, price_events
+from .tokens import orient_pairs
+from .twap import TWAP_MAX_WINDOW, TWAP_WINDOW
 from .models import Pair
 
+# Upper bound of ?precision=, well past what any pool price is accurate to
+MAX_PRICE_PRECISION = 78
+PRECISION_ERROR = (
+    f"precision must be between 1 and {MAX_PRICE_PRECISION} significant digits"
+)
+# Upper bound of ?granularity=, solve time grows linearly with it
+MAX_ROUTE_GRANULARITY = 1000
+# Default and maximum number of buckets of /history/
+HISTORY_LIMIT = 500
+MAX_HISTORY_BUCKETS = 5000
+
+
+def get_precision(params) -> Optional[int]:
+    """
+    Read ?precision= (significant digits) from the query parameters, None when not given.
+    Raises ValueError for anything but a number between 1 and MAX_PRICE_PRECISION.
+    """
+    precision = params.get("precision")
+    if precision is None:
+        return None
+    precision = int(precision)
+    if not 1 <= precision <= MAX_PRICE_PRECISION:
+        raise ValueError(precision)
+    return precision
+
 
 class DefaultView(APIView):
     def get(self, request):
@@ -21,22 +73,43 @@ class PriceView(APIView):
     def get(self, request, token_pair: str):
         """
         Return the price for a given token pair.
+        With ?precision=N the prices are strings rounded to N significant digits.
+        With ?twap=N the prices are time weighted averages over the last N seconds.
         """
-        # Check if token pair exists in database and has active exchanges
         try:
-            pair = Pair.objects.get(pair_id=token_pair.upper())
-            if not pair.active_exchanges:
+            precision = get_precision(request.query_params)
+        except ValueError:
+            return Response({"error": PRECISION_ERROR}, status=400)
+        twap = request.query_params.get("twap")
+        if twap is not None:
+            try:
+                twap = int(twap or TWAP_WINDOW)
+                if not 1 <= twap <= TWAP_MAX_WINDOW:
+                    raise ValueError(twap)
+            except ValueError:
                 return Response(
-                    {"error": f"Token pair {token_pair} is not active on any exchange"},
+                    {"error": f"twap must be between 1 and {TWAP_MAX_WINDOW} seconds"},
                     status=400,
                 )
-        except Pair.DoesNotExist:
+
+        # Check if token pair exists and has active exchanges
+        with timed_stage("db"):
+            pair = pair_registry.get(token_pair.upper())
+        if pair is None:
             return Response(
                 {"error": f"Token pair {token_pair} is not supported"}, status=404
             )
+        if not pair.active_exchanges:
+            return Response(
+                {"error": f"Token pair {token_pair} is not active on any exchange"},
+                status=400,
+            )
 
-        # Get price if pair is valid
-        price_data = get_token_price(token_pair)
+        # Get price if pair is valid, passing the pair along saves a second database lookup
+        if twap is not None:
+            price_data = get_token_twap(pair, twap, precision=precision)
+        else:
+            price_data = get_token_price(pair, precision=precision)
 
         # Check if we got an error (no prices available)
         if "error" in price_data:
@@ -45,6 +118,339 @@ class PriceView(APIView):
         return Response(price_data, status=200)
 
 
+class AsyncPriceView(View):
+    """
+    Async version of PriceView, run it under the ASGI server so waiting on the chain
+    doesn't tie up a worker thread. Plain Django view as DRF's APIView is sync only.
+
+    * no authentication
+    """
+
+    async def get(self, request, token_pair: str):
+        """
+        Return the price for a given token pair.
+        With ?precision=N the prices are strings rounded to N significant digits.
+        """
+        try:
+            precision = get_precision(request.GET)
+        except ValueError:
+            return JsonResponse({"error": PRECISION_ERROR}, status=400)
+
+        with timed_stage("db"):
+            pair = await pair_registry.aget(token_pair.upper())
+        if pair is None:
+            return JsonResponse(
+                {"error": f"Token pair {token_pair} is not supported"}, status=404
+            )
+        if not pair.active_exchanges:
+            return JsonResponse(
+                {"error": f"Token pair {token_pair} is not active on any exchange"},
+                status=400,
+            )
+
+        price_data = await get_token_price_async(pair, precision=precision)
+        if "error" in price_data:
+            return JsonResponse(price_data, status=503)  # Service Unavailable
+
+        return JsonResponse(price_data, status=200)
+
+
+class StreamView(View):
+    """
+    Server-Sent Events stream of the price changes of some pairs, run it under the ASGI server.
+    Plain Django view as DRF's APIView is sync only.
+
+    * no authentication
+    """
+
+    async def get(self, request):
+        """
+        Stream the prices of a comma separated list of pairs (?pairs=WBTCUSDC,APTUSDC), first
+        the ones known, then whenever the price of an exchange changes.
+        ?precision=N works as on the price endpoint.
+        """
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"error": "Streaming is only served by the ASGI server"}, status=501
+            )
+        try:
+            precision = get_precision(request.GET)
+        except ValueError:
+            return JsonResponse({"error": PRECISION_ERROR}, status=400)
+
+        pair_ids = list(
+            dict.fromkeys(
+                p.strip().upper()
+                for p in request.GET.get("pairs", "").split(",")
+                if p.strip()
+            )
+        )
+        if not 1 <= len(pair_ids) <= STREAM_MAX_PAIRS:
+            return JsonResponse(
+                {"error": f"Give between 1 and {STREAM_MAX_PAIRS} pairs"}, status=400
+            )
+        with timed_stage("db"):
+            pairs = await pair_registry.aget_many(pair_ids)
+        unknown = set(pair_ids) - {pair.pair_id for pair in pairs}
+        if unknown:
+            return JsonResponse(
+                {
+                    "error": f"Token pairs {', '.join(sorted(unknown))} are not supported"
+                },
+                status=404,
+            )
+
+        response = StreamingHttpResponse(
+            price_events(pairs, precision), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # don't let nginx buffer the events
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class QuoteView(APIView):
+    """
+    View to see what a trade of a given size gets on every exchange, fees and slippage included.
+
+    * no authentication
+    """
+
+    def get(self, request, token_pair: str):
+        """
+        Quote selling ?amount= base tokens (or with ?side=buy spending ?amount= quote tokens).
+        """
+        try:
+            amount = Decimal(request.query_params.get("amount", ""))
+            if not amount.is_finite() or amount <= 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            return Response({"error": "amount must be a positive number"}, status=400)
+
+        side = request.query_params.get("side", "sell").lower()
+        if side not in SIDES:
+            return Response(
+                {"error": f"side must be one of {', '.join(SIDES)}"}, status=400
+            )
+
+        try:
+            precision = get_precision(request.query_params)
+        except ValueError:
+            return Response({"error": PRECISION_ERROR}, status=400)
+
+        pair = pair_registry.get(token_pair.upper())
+        if pair is None:
+            return Response(
+                {"error": f"Token pair {token_pair} is not supported"}, status=404
+            )
+        if not pair.active_exchanges:
+            return Response(
+                {"error": f"Token pair {token_pair} is not active on any exchange"},
+                status=400,
+            )
+
+        try:
+            quote_data = self.get_quote(pair, amount, side, precision, request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if "error" in quote_data:
+            return Response(quote_data, status=503)  # Service Unavailable
+
+        return Response(quote_data, status=200)
+
+    def get_quote(self, pair, amount, side, precision, request):
+        return get_quote(pair, amount, side, precision)
+
+
+class RouteView(QuoteView):
+    """
+    View to see how a large trade is best split over the exchanges of a pair.
+    Takes the same parameters as QuoteView plus ?granularity= (number of slices).
+
+    * no authentication
+    """
+
+    def get_quote(self, pair, amount, side, precision, request):
+        try:
+            granularity = int(
+                request.query_params.get("granularity", ROUTE_GRANULARITY)
+            )
+        except ValueError:
+            granularity = 0
+        if not 1 <= granularity <= MAX_ROUTE_GRANULARITY:
+            raise ValueError(
+                f"granularity must be between 1 and {MAX_ROUTE_GRANULARITY}"
+            )
+        return get_route(pair, amount, side, precision, granularity)
+
+
+class PathView(APIView):
+    """
+    View to price a token in another one when there is no pair for them, by chaining pairs
+    (APT -> USDC -> WETH). ?max_hops= limits the number of pairs in the chain.
+
+    * no authentication
+    """
+
+    def get(self, request, from_token: str, to_token: str):
+        """
+        Return the best rate from `from_token` to `to_token` and the pairs it goes over.
+        """
+        try:
+            precision = get_precision(request.query_params)
+        except ValueError:
+            return Response({"error": PRECISION_ERROR}, status=400)
+
+        try:
+            max_hops = int(request.query_params.get("max_hops", PATH_MAX_HOPS))
+        except ValueError:
+            max_hops = 0
+        if not 1 <= max_hops <= PATH_MAX_HOPS:
+            return Response(
+                {"error": f"max_hops must be between 1 and {PATH_MAX_HOPS}"},
+                status=400,
+            )
+
+        from_token, to_token = from_token.upper(), to_token.upper()
+        if from_token == to_token:
+            return Response({"error": "from and to token are the same"}, status=400)
+
+        path_data = get_path_price(from_token, to_token, max_hops, precision)
+        if "error" in path_data:
+            return Response(path_data, status=404)
+
+        return Response(path_data, status=200)
+
+
+class HistoryView(APIView):
+    """
+    View to access OHLC price history of a pair, recorded while PRICE_HISTORY is on.
+
+    * no authentication
+    """
+
+    def get(self, request, token_pair: str):
+        """
+        Return ?limit= (default HISTORY_LIMIT) buckets of ?interval= (30s, 1m, 1h, 1d, ...) up to
+        ?end= (unix seconds, default now), or all buckets between ?start= and ?end=.
+        ?exchange= limits the history to one exchange, ?precision=N works as on /price/.
+        """
+        params = request.query_params
+        try:
+            precision = get_precision(params)
+        except ValueError:
+            return Response({"error": PRECISION_ERROR}, status=400)
+
+        try:
+            interval = parse_interval(params.get("interval", "1m"))
+        except ValueError:
+            return Response(
+                {"error": "interval must look like 30s, 1m, 4h or 1d"}, status=400
+            )
+
+        try:
+            limit = int(params.get("limit", HISTORY_LIMIT))
+            end = float(params.get("end", time.time()))
+            start = float(params.get("start", end - interval * limit))
+            if not (math.isfinite(start) and math.isfinite(end)):
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": "limit, start and end must be numbers"}, status=400
+            )
+        if not 1 <= limit <= MAX_HISTORY_BUCKETS or start >= end:
+            return Response(
+                {
+                    "error": f"limit must be between 1 and {MAX_HISTORY_BUCKETS}, start before end"
+                },
+                status=400,
+            )
+        if (end - start) / interval > MAX_HISTORY_BUCKETS:
+            return Response(
+                {"error": f"More than {MAX_HISTORY_BUCKETS} buckets requested"},
+                status=400,
+            )
+
+        exchange_id = params.get("exchange")
+        if exchange_id:
+            try:
+                get_adapter(exchange_id)
+            except KeyError:
+                return Response(
+                    {"error": f"Unknown exchange {exchange_id}"}, status=400
+                )
+
+        pair_id = token_pair.upper()
+        if pair_registry.get(pair_id) is None:
+            return Response(
+                {"error": f"Token pair {token_pair} is not supported"}, status=404
+            )
+
+        bars = get_history(pair_id, interval, start, end, exchange_id)
+        first = max(len(bars) - limit, 0)
+        return Response(
+            {
+                "token_pair": pair_id,
+                "exchange": exchange_id or "all",
+                "interval": interval,
+                "start": start,
+                "end": end,
+                "buckets": [
+                    {
+                        "time": bars.times[i],
+                        "open": serialize_price(bars.opens[i], precision),
+                        "high": serialize_price(bars.highs[i], precision),
+                        "low": serialize_price(bars.lows[i], precision),
+                        "close": serialize_price(bars.closes[i], precision),
+                        "count": bars.counts[i],
+                        # last block (or ledger version) in the bucket, None when not known
+                        "block": bars.blocks[i] if bars.blocks[i] >= 0 else None,
+                    }
+                    for i in range(first, len(bars))
+                ],
+            },
+            status=200,
+        )
+
+
+class PricesView(APIView):
+    """
+    View to access the prices of many tokenpairs in one request.
+
+    * no authentication
+    """
+
+    def get(self, request):
+        """
+        Return the prices for a comma separated list of up to PRICES_MAX_PAIRS pairs
+        (?pairs=WBTCUSDC,APTUSDC) or for every active pair when no pairs are given (or
+        ?pairs=all). All pairs come from the price book while the poller keeps it warm, otherwise
+        in pages of PRICES_MAX_PAIRS pairs, ?page=N picks one.
+        ?precision=N works as on the single pair endpoint.
+        """
+        try:
+            precision = get_precision(request.query_params)
+        except ValueError:
+            return Response({"error": PRECISION_ERROR}, status=400)
+
+        requested = request.query_params.get("pairs", "all")
+        if requested.lower() == "all":
+            page = request.query_params.get("page", "1")
+            if not page.isdigit() or int(page) < 1:
+                return Response({"error": "page must be a number from 1"}, status=400)
+            return Response(get_token_prices(None, precision, int(page)), status=200)
+
+        token_pairs = list(
+            dict.fromkeys(p.strip().upper() for p in requested.split(",") if p.strip())
+        )
+        if not 1 <= len(token_pairs) <= PRICES_MAX_PAIRS:
+            return Response(
+                {"error": f"Give between 1 and {PRICES_MAX_PAIRS} pairs"}, status=400
+            )
+
+        return Response(get_token_prices(token_pairs, precision), status=200)
+
+
 class PairsView(APIView):
     """
     View to see the supported tokenpairs for the dex aggregator
@@ -56,10 +462,24 @@ class PairsView(APIView):
     def get(self, request, format=None):
         """
         Return a list of all available token pairs to query.
+        The list is serialized once per change, clients sending If-None-Match or
+        If-Modified-Since get a 304 while it hasn't changed.
         """
-        # Get pairs that have at least one active exchange
-        pairs = Pair.objects.exclude(active_exchanges=[]).values()
-        return Response(pairs, status=200)
+        # Pairs that have at least one active exchange
+        state = pair_registry.current()
+        # whole seconds, as precise as the HTTP date it's compared with
+        last_modified = (
+            int(state.last_modified.timestamp()) if state.last_modified else None
+        )
+        response = get_conditional_response(
+            request, etag=state.etag, last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(state.payload, content_type="application/json")
+        response["ETag"] = state.etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
 
     def post(self, request, format=None):
         """
@@ -77,22 +497,32 @@ class PairsView(APIView):
             if Pair.objects.filter(pair_id=pair_id).exists():
                 return Response({"error": f"Pair {pair_id} already exists"}, status=400)
 
-            # Generate uid automatically (max existing + 1)
-            max_uid = Pair.objects.aggregate(models.Max("uid"))["uid__max"]
-            next_uid = (max_uid or 0) + 1
+            # Decimals we don't get are read from chain together with the pool token order
+            base_decimals = data.get("base_token_decimals")
+            quote_decimals = data.get("quote_token_decimals")
 
             # Create new pair
             pair = Pair(
-                uid=next_uid,
                 pair_id=pair_id,
                 pool_contracts=data.get("pool_contracts", {}),
                 base_token=data.get("base_token"),
                 quote_token=data.get("quote_token"),
-                base_token_decimals=data.get("base_token_decimals", 18),
-                quote_token_decimals=data.get("quote_token_decimals", 18),
+                base_token_decimals=(
+                    int(base_decimals) if base_decimals is not None else None
+                ),
+                quote_token_decimals=(
+                    int(quote_decimals) if quote_decimals is not None else None
+                ),
                 active_exchanges=data.get("active_exchanges", []),
             )
-            pair.save()
+            errors = orient_pairs([pair])
+            if errors:
+                return Response({"error": errors[pair.pair_id]}, status=400)
+            # the uid is the next free one, taken in the same transaction as the insert
+            save_pairs([pair], PAIR_FIELDS + ["inverted_pools"])
+            # new pairs are chainable right away, no need to wait for a graph rebuild
+            if pair.is_active:
+                token_graph.add_pair(pair)
 
             return Response(
                 {"message": f"Created pair {pair.pair_id}", "pair_id": pair.pair_id},
@@ -101,3 +531,36 @@ class PairsView(APIView):
 
         except Exception as e:
             return Response({"error": str(e)}, status=400)
+
+
+class PairImportView(APIView):
+    """
+    Bulk import of token pairs from a JSON array or JSON lines (application/x-ndjson) body.
+
+    * Admin authentication
+    * ?orient=0 skips reading pool tokens from chain, decimals must then be given
+    """
+
+    def post(self, request, format=None):
+        if not request.user.is_staff:
+            return Response({"error": "Admin access required"}, status=403)
+        orient = request.query_params.get("orient", "1") not in ("0", "false")
+        # read the body as it comes in instead of parsing it whole through request.data
+        try:
+            result = import_pairs(request.stream or [], orient=orient)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(result.as_dict(), status=200)
+
+
+class MetricsView(View):
+    """
+    Counters and latency histograms of this process in the Prometheus text format.
+
+    * no authentication
+    """
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )